@@ -14,7 +14,7 @@ The class is responsible for:
 
 import os, sys, gc
 
-import time, atexit, weakref
+import time, atexit, weakref, threading
 from acq4.pyqtgraph.Qt import QtCore, QtGui
 import acq4.util.reload as reload
 
@@ -632,6 +632,23 @@ class Manager(QtCore.QObject):
         self.sigTaskCreated.emit(cmd, t)
         return t
 
+    def prepareTask(self, cmd, task=None):
+        """
+        Return a Task for the specified command structure, reusing *task* if
+        possible.
+
+        *task* should be a Task previously returned by createTask() or
+        prepareTask() that is not currently running. This is intended for
+        modules that execute the same protocol repeatedly (for example, test
+        pulses or task sequences); devices that support it keep their
+        configuration between runs and only update what has changed in the
+        command (see Task.update). If *task* is None, a new Task is created.
+        """
+        if task is None:
+            return self.createTask(cmd)
+        task.update(cmd)
+        return task
+
     def showGUI(self):
         """Show the Manager GUI"""
         if self.gui is None:
@@ -859,21 +876,31 @@ class Task:
         self.startedDevs = []
         self.startTime = None
         self.stopTime = None
+        self.failed = False  # set if execution failed; device tasks will not be reused
+        self.configureTimes = []  # [(devName, seconds), ...] from the last execute()
+        self.phaseTimes = OrderedDict()  # {phase: seconds} from the last execute() and stop()
 
         #self.reserved = False
+        self.cfg = self._getConfig(command)
+        self.id = Task.id
+        Task.id += 1
+        
+        ## TODO:  set up data storage with cfg['storeData'] and ['writeLocation']
+        #print "Task command", command
+        self._createDeviceTasks()
+
+    @staticmethod
+    def _getConfig(command):
         try:
-            self.cfg = command['protocol']
+            return command['protocol']
         except:
             print "================== Manager Task.__init__ command: ================="
             print command
             print "==========================================================="
             raise Exception("Command specified for task is invalid. (Must be dictionary with 'protocol' key)")
-        self.id = Task.id
-        Task.id += 1
-        
-        ## TODO:  set up data storage with cfg['storeData'] and ['writeLocation']
-        #print "Task command", command
-        self.devNames = command.keys()
+
+    def _createDeviceTasks(self):
+        self.devNames = self.command.keys()
         self.devNames.remove('protocol')
         self.devs = {devName: self.dm.getDevice(devName) for devName in self.devNames}
         
@@ -888,6 +915,42 @@ class Task:
                 continue
             self.tasks[devName] = task
 
+    def update(self, command):
+        """Replace the command structure for this task so that it may be
+        executed again.
+
+        If the new command uses the same devices, each DeviceTask is asked to
+        accept its new command (see DeviceTask.update) so that device
+        configuration can be kept between runs. Since devices may share
+        resources that were configured together (for example, channels on a
+        DAQ task), all DeviceTasks are recreated if any of them can not be
+        reused.
+
+        Return True if the existing DeviceTasks were reused.
+        """
+        with self.taskLock:
+            if len(self.startedDevs) > 0 or len(self.lockedDevs) > 0:
+                raise Exception("Cannot update a task while it is running.")
+            cfg = self._getConfig(command)
+            devNames = command.keys()
+            devNames.remove('protocol')
+            self.command = command
+            self.cfg = cfg
+            self.result = None
+            self.startTime = None
+            self.stopTime = None
+
+            reuse = not self.failed and set(devNames) == set(self.devNames)
+            self.failed = False
+            if reuse:
+                for devName in self.tasks:
+                    if not self.tasks[devName].update(command[devName]):
+                        reuse = False
+                        break
+            if not reuse:
+                self._createDeviceTasks()
+            return reuse
+
     @staticmethod
     def getDevName(obj):
         if isinstance(obj, basestring):
@@ -901,6 +964,15 @@ class Task:
         ## determine the order in which tasks must be configured
         ## This is determined by tasks having called Task.addConfigDependency()
         ## when they were initialized.
+        deps, cost = self._getConfigDeps()
+        
+        #return sorted order
+        order = self.toposort(deps, cost)
+        return order
+        
+    def _getConfigDeps(self):
+        ## return (deps, cost) describing the configuration dependencies
+        ## between devices (see toposort)
             
         # request config order dependencies from devices
         deps = {devName: set() for devName in self.devNames}
@@ -916,10 +988,93 @@ class Task:
         
         # convert sets to lists
         deps = dict([(k, list(deps[k])) for k in deps.keys()])
+        return deps, cost
         
-        #return sorted order
+    def _configureDevices(self):
+        """Call configure() on all device tasks and return a list of
+        (devName, configure time) in the order configuration finished.
+        
+        By default, devices are configured one at a time in the calling thread,
+        in the order given by getConfigOrder(). If 'parallelConfigure' is True
+        in the task's protocol config, devices are instead configured 
+        concurrently by a pool of threads, each device starting as soon as all
+        devices it depends on have been configured. When several devices are
+        ready, those with the longest preparation times go first. Worker 
+        threads use the device reservations held by the calling thread (see
+        Device.delegateReservations), but only one thread at a time may use
+        each device; a device is also held for the duration of its own 
+        configure(). Enable this only for rigs whose device configure() methods
+        do not share other state between devices.
+        """
+        deps, cost = self._getConfigDeps()
         order = self.toposort(deps, cost)
-        return order
+        deps = dict([(k, set(deps.get(k, [])) & set(self.tasks.keys())) for k in order if k in self.tasks])
+        order = [k for k in order if k in self.tasks]
+        times = []
+        
+        def configure(devName):
+            start = ptime.time()
+            self.tasks[devName].configure()
+            times.append((devName, ptime.time() - start))
+            
+        nWorkers = min(self.cfg.get('configureThreads', 8), len(order))
+        if not self.cfg.get('parallelConfigure', False) or nWorkers < 2:
+            for devName in order:
+                configure(devName)
+            return times
+            
+        from acq4.devices.Device import Device
+        cond = threading.Condition()
+        pending = order[:]
+        done = set()
+        running = set()
+        error = []
+        owner = threading.current_thread().ident
+        
+        def worker(delegate):
+            if delegate:
+                Device.delegateReservations(owner)
+            while True:
+                with cond:
+                    while True:
+                        if len(error) > 0 or len(pending) == 0:
+                            return
+                        ready = [d for d in pending if deps[d] <= done]
+                        if len(ready) > 0:
+                            devName = ready[0]
+                            pending.remove(devName)
+                            running.add(devName)
+                            break
+                        cond.wait()
+                try:
+                    ## hold the device while it is configured so that no other
+                    ## thread (including the calling thread) can use it meanwhile
+                    dev = self.devs[devName]
+                    dev.reserve(block=True)
+                    try:
+                        configure(devName)
+                    finally:
+                        dev.release()
+                except:
+                    with cond:
+                        error.append(sys.exc_info())
+                        cond.notify_all()
+                    return
+                with cond:
+                    running.remove(devName)
+                    done.add(devName)
+                    cond.notify_all()
+        
+        threads = [threading.Thread(target=worker, args=(True,), name='Task %d configure' % self.id) for i in range(nWorkers-1)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        worker(False)
+        for t in threads:
+            t.join()
+        if len(error) > 0:
+            raise error[0][0], error[0][1], error[0][2]
+        return times
         
     def getStartOrder(self):
         ## determine the order in which tasks must be started
@@ -950,6 +1105,7 @@ class Task:
             self.stopped = False  # whether sub-tasks have been stopped yet
             self.abortRequested = False
             self._done = False  # cached output of isDone()
+            self.phaseTimes = OrderedDict()
 
             #print "======  Executing task %d:" % self.id
             #print self.cfg
@@ -962,6 +1118,7 @@ class Task:
             
                 #print self.id, "Task.execute:", self.tasks
                 ## Reserve all hardware
+                phaseStart = ptime.time()
                 self.dm.lockReserv()
                 try:
                     for devName in self.tasks:
@@ -976,18 +1133,18 @@ class Task:
                     self.dm.unlockReserv()
                     
                 prof.mark('reserve')
-
-                ## Determine order of device configuration.
-                configOrder = self.getConfigOrder()
-                    
+                phaseStart = self._markPhase('reserve', phaseStart)
 
                 ## Configure all subtasks. Some devices may need access to other tasks, so we make all available here.
                 ## This is how we allow multiple devices to communicate and decide how to operate together.
                 ## Each task may modify the startOrder list to suit its needs.
+                ## Devices that do not depend on each other are configured concurrently.
                 #print "Configuring subtasks.."
-                for devName in configOrder:
-                    self.tasks[devName].configure()
-                    prof.mark('configure %s' % devName)
+                self.configureTimes = self._configureDevices()
+                prof.mark('configure')
+                phaseStart = self._markPhase('configure', phaseStart)
+                for devName, dt in self.configureTimes:
+                    prof.mark('  configure %s took %0.4f ms' % (devName, dt*1000))
                     
                 startOrder = self.getStartOrder()
                 #print "done"
@@ -996,6 +1153,7 @@ class Task:
                     time.sleep(self.cfg['leadTime'])
                     
                 prof.mark('leadSleep')
+                phaseStart = ptime.time()
 
                 self.result = None
                 
@@ -1012,6 +1170,7 @@ class Task:
                         raise HelpfulException("Error starting device '%s'; aborting task." % devName)
                     prof.mark('start %s' % devName)
                 self.startTime = ptime.time()
+                self._markPhase('start', phaseStart)
                 
                 #print "  %d Task started" % self.id
                     
@@ -1041,11 +1200,13 @@ class Task:
                     #print "sleep for", sleep
                     time.sleep(sleep)
                 #print "all tasks finshed."
+                self._markPhase('wait', self.startTime)
                 
                 self.stop()
                 #print "  %d execute complete" % self.id
             except: 
                 #printExc("==========  Error in task execution:  ==============")
+                self.failed = True
                 self.abort()
                 self._releaseAll()
                 raise
@@ -1129,6 +1290,7 @@ class Task:
 
             prof = Profiler("Manager.Task.stop", disabled=True)
             self.abortRequested = abort
+            phaseStart = ptime.time()
             try:
                 if not self.stopped:
                     ## Stop all device tasks
@@ -1140,6 +1302,7 @@ class Task:
                             printExc("Error while stopping task %s:" % t)
                         prof.mark("   ..task "+ t+ " stopped")
                     self.stopped = True
+                    phaseStart = self._markPhase('stop', phaseStart)
                 
                 if not abort and not self._tasksDone():
                     raise Exception("Cannot get result; task is still running.")
@@ -1157,6 +1320,7 @@ class Task:
                             result[devName] = None
                         prof.mark("get result: "+devName)
                     self.result = result
+                    phaseStart = self._markPhase('getResult', phaseStart)
                     #print "RESULT 1:", self.result
                     
                     ## Store data if requested
@@ -1164,6 +1328,7 @@ class Task:
                         self.cfg['storageDir'].setInfo(result['protocol'])
                         for t in self.tasks:
                             self.tasks[t].storeResult(self.cfg['storageDir'])
+                        self._markPhase('storeResult', phaseStart)
                     prof.mark("store data")
             finally:   
                 ## Regardless of any other problems, at least make sure we 
@@ -1185,6 +1350,13 @@ class Task:
             self.stop()
             return self.result
 
+    def _markPhase(self, phase, start):
+        ## record the time since *start* for *phase* in self.phaseTimes;
+        ## return the current time
+        now = ptime.time()
+        self.phaseTimes[phase] = now - start
+        return now
+
     def _releaseAll(self):
         with self.taskLock:
             #print self.id,"Task.releaseAll:"
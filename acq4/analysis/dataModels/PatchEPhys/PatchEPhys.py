@@ -3,6 +3,7 @@ import acq4.util.DataManager as DataManager
 import acq4.util.SequenceRunner as SequenceRunner
 from collections import OrderedDict
 import functools
+import sys, threading, Queue
 from acq4.util.metaarray import *
 import numpy as np
 
@@ -116,6 +117,10 @@ def buildSequenceArray(*args, **kargs):
         truncate: If join=True and some elements differ in shape, truncate to the smallest shape
         fill:    If join=True, pre-fill the empty array with this value. Any points in the
                  parameter space with no data will be left with this value.
+        workers: If greater than 1, call func on this many protocol directories at a time
+                 (in a pool of threads). func must then be safe to call from several threads,
+                 as reading files through DataManager handles is. Useful when loading is
+                 limited by file access latency (large sequences, network drives).
         
     Example: Return an array of all primary-channel clamp recordings across a sequence 
         buildSequenceArray(seqDir, lambda protoDir: getClampFile(protoDir).read()['primary'])"""
@@ -124,7 +129,7 @@ def buildSequenceArray(*args, **kargs):
         if m is None:
             return i
         
-def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None):
+def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None, workers=None):
     """Iterator for buildSequenceArray that yields progress updates."""
         
     if func is None:
@@ -170,39 +175,104 @@ def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None):
         data = MetaArray(np.empty(shape, object), info=info)
 
     ## fill data
+    inds = sequenceIndices(dh, subDirs, params)
+    if workers is not None and workers > 1:
+        results = _runSequenceThreaded(dh, subDirs, func, workers)
+    else:
+        results = ((n, func(dh[name])) for n, name in enumerate(subDirs))
     i = 0
     if join and truncate:
         minShape = first.shape
-        for name in subDirs:
-            subd = dh[name]
-            d = func(subd)
+        for n, d in results:
             minShape = [min(d.shape[j], minShape[j]) for j in range(d.ndim)]
-            dhInfo = subd.info()
-            ind = []
-            for k in params:
-                ind.append(dhInfo[k])
             sl = [slice(0,m) for m in minShape]
-            ind += sl
-            data[tuple(ind)] = d[sl]
+            data[inds[n] + tuple(sl)] = d[tuple(sl)]
             i += 1
             yield i, len(subDirs)
         sl = [slice(None)] * len(seqShape)
         sl += [slice(0,m) for m in minShape]
         data = data[sl]
     else:
-        for name in subDirs:
-            subd = dh[name]
-            d = func(subd)
-            dhInfo = subd.info()
-            ind = []
-            for k in params:
-                ind.append(dhInfo[k])
-            data[tuple(ind)] = d
+        for n, d in results:
+            data[inds[n]] = d
             i += 1
             yield i, len(subDirs)
 
     yield data, None
 
+def sequenceIndices(dh, subDirs, params=None):
+    """Return the sequence index (a tuple, one value per sequence parameter) of each
+    protocol directory in subDirs.
+    
+    TaskRunner names each directory after its index ('002_013' for index (2, 13)), so the
+    indices are read from the directory names. This is checked against the meta-info of
+    the last directory and of the first directory whose indices are all different (so
+    that names listing the parameters in a different order than *params* are detected);
+    if the names do not match, the meta-info of every directory is read."""
+    if params is None:
+        params = listSequenceParams(dh)
+    try:
+        inds = []
+        for name in subDirs:
+            ind = tuple([int(x) for x in name.split('_')])
+            if len(ind) != len(params):
+                raise ValueError(name)
+            inds.append(ind)
+        check = set([len(subDirs) - 1])
+        for n, ind in enumerate(inds):
+            if len(set(ind)) == len(ind):
+                check.add(n)
+                break
+        for n in check:
+            if n < 0:
+                continue
+            dhInfo = dh[subDirs[n]].info()
+            if tuple([dhInfo[k] for k in params]) != inds[n]:
+                raise ValueError(subDirs[n])
+        return inds
+    except (ValueError, KeyError):
+        inds = []
+        for name in subDirs:
+            dhInfo = dh[name].info()
+            inds.append(tuple([dhInfo[k] for k in params]))
+        return inds
+
+def _runSequenceThreaded(dh, subDirs, func, workers):
+    """Generate (n, func(dh[subDirs[n]])) for every protocol directory, in the order the
+    results are ready, calling func in a pool of threads. An exception raised by func
+    is re-raised here once the running calls have finished."""
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+    for n, name in enumerate(subDirs):
+        tasks.put((n, name))
+    stop = threading.Event()
+    
+    def worker():
+        while not stop.is_set():
+            try:
+                n, name = tasks.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                results.put((n, func(dh[name]), None))
+            except Exception:
+                results.put((n, None, sys.exc_info()))
+    
+    threads = [threading.Thread(target=worker) for i in range(min(workers, len(subDirs)))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    try:
+        for i in range(len(subDirs)):
+            n, d, exc = results.get()
+            if exc is not None:
+                raise exc[0], exc[1], exc[2]
+            yield n, d
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
 def getParent(child, parentType):
     """Return the (grand)parent of child that matches parentType"""
     if dirType(child) == parentType:
@@ -0,0 +1,44 @@
+import tempfile, shutil, atexit
+from collections import OrderedDict
+import numpy as np
+import acq4.util.DataManager as DataManager
+from acq4.analysis.dataModels.PatchEPhys import PatchEPhys
+
+root = tempfile.mkdtemp()
+def remove_tempdir():
+    shutil.rmtree(root)
+atexit.register(remove_tempdir)
+
+A = ('Clamp1', 'amp')
+B = ('Laser', 'power')
+
+
+def makeSequence(name, nameOrder):
+    ## 2 x 3 sequence over (A, B); directory names list the parameters in nameOrder
+    params = OrderedDict([(A, [0.1, 0.2]), (B, [1., 2., 3.])])
+    seqDir = DataManager.getDirHandle(root).mkdir(name, info={'sequenceParams': params})
+    for i in range(2):
+        for j in range(3):
+            ind = {A: i, B: j}
+            dirName = '_'.join(['%03d' % ind[k] for k in nameOrder])
+            seqDir.mkdir(dirName, info={A: i, B: j})
+    return seqDir
+
+
+def value(dh):
+    info = dh.info()
+    return np.array([info[A] * 10 + info[B]])
+
+
+def test_sequenceIndices():
+    for name, nameOrder in [('seq_AB', [A, B]), ('seq_BA', [B, A])]:
+        seqDir = makeSequence(name, nameOrder)
+        subDirs = seqDir.subDirs()
+        inds = PatchEPhys.sequenceIndices(seqDir, subDirs)
+        for dirName, ind in zip(subDirs, inds):
+            info = seqDir[dirName].info()
+            assert ind == (info[A], info[B])
+        
+        data = PatchEPhys.buildSequenceArray(seqDir, value)
+        assert data.shape == (2, 3, 1)
+        assert data.asarray()[:, :, 0].tolist() == [[0, 1, 2], [10, 11, 12]]
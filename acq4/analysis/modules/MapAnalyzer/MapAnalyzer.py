@@ -571,13 +571,7 @@ class SpontRateAnalyzer:
         events = events[events['fitTime'] < stimTime]
         
         ## measure spont. rate for each handle
-        spontRate = []
-        amps = []
-        for site in sites:
-            ev = events[events['ProtocolDir'] == site['ProtocolDir']]
-            spontRate.append(len(ev) / stimTime)
-            amps.extend(ev['fitAmplitude'])
-        spontRate = np.array(spontRate)
+        spontRate, amps = self.measureSpontRate(sites, events, stimTime)
         
         self.spontRatePlot.setData(x=sites['start'], y=spontRate)
         
@@ -595,20 +589,7 @@ class SpontRateAnalyzer:
             filtered = [rate] * len(spontRate)
             self.params['Constant Rate'] = rate
         else:
-            filtered = np.empty(len(spontRate))
-            for i in xrange(len(spontRate)):
-                now = sites['start'][i]
-                window = self.params['Filter Window']
-                start = now - window
-                stop = now + window
-                if method == 'Median Window':
-                    mask = (sites['start'] > start) & (sites['start'] < stop)
-                    filtered[i] = np.median(spontRate[mask])
-                if method == 'Mean Window':
-                    mask = (sites['start'] > start) & (sites['start'] < stop)
-                    filtered[i] = np.mean(spontRate[mask])
-                if method == 'Gaussian Window':
-                    filtered[i] = self.gauss(spontRate, sites['start'], now, window)
+            filtered = self.windowFilter(spontRate, sites['start'], method, self.params['Filter Window'])
         
         self.filterPlot.setData(x=sites['start'], y=filtered)
         if len(amps) == 0:
@@ -624,6 +605,77 @@ class SpontRateAnalyzer:
         weights = np.exp(-((times-mean)**2) / (2 * sigma**2))
         weights /= weights.sum()
         return (weights * values).sum()
+
+    @staticmethod
+    def measureSpontRate(sites, events, stimTime):
+        """Return the spontaneous rate at each site (the number of events in its
+        ProtocolDir divided by stimTime) and the amplitudes of those events, listed
+        site by site.
+        
+        Events are sorted by site once and each site's events are found with
+        searchsorted, rather than comparing every event against every site."""
+        ## number the distinct protocol dirs in order of their first site
+        codes = {}
+        siteCodes = np.array([codes.setdefault(pd, len(codes)) for pd in sites['ProtocolDir']], dtype=int)
+        eventCodes = np.array([codes.get(pd, -1) for pd in events['ProtocolDir']], dtype=int)
+        
+        ## stable sort keeps the events for each site in their original order
+        order = np.argsort(eventCodes, kind='mergesort')
+        sortedCodes = eventCodes[order]
+        sortedAmps = events['fitAmplitude'][order]
+        bounds = np.searchsorted(sortedCodes, np.arange(len(codes)+1))
+        
+        counts = np.diff(bounds)[siteCodes]
+        spontRate = counts / float(stimTime)
+        if len(siteCodes) == 0:
+            amps = np.empty(0)
+        elif len(codes) == len(siteCodes):  ## each site has its own protocol dir
+            amps = sortedAmps[bounds[0]:bounds[-1]]
+        else:
+            amps = np.concatenate([sortedAmps[bounds[c]:bounds[c+1]] for c in siteCodes])
+        return spontRate, amps
+        
+    @staticmethod
+    def windowFilter(values, times, method, window, chunk=16):
+        """Filter values (sampled at times) with a sliding window of the given width:
+        'Mean Window' and 'Median Window' use all values with times within +/- window
+        (exclusive), 'Gaussian Window' is a gaussian-weighted mean (see gauss()).
+        If times are sorted, results are identical to filtering each point separately.
+        
+        The window limits are found with searchsorted. Gaussian weights are computed
+        for chunk points at a time, and only for times where they do not underflow to 0."""
+        if np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind='mergesort')
+            filtered = np.empty(len(values))
+            filtered[order] = SpontRateAnalyzer.windowFilter(values[order], times[order], method, window, chunk)
+            return filtered
+            
+        filtered = np.empty(len(values))
+        if method == 'Gaussian Window':
+            ## exp(-x) is exactly 0 for x > 745.2
+            reach = window * (2 * 750.)**0.5
+            starts = np.searchsorted(times, times - reach, side='left')
+            stops = np.searchsorted(times, times + reach, side='right')
+            for i in xrange(0, len(values), chunk):
+                j = slice(i, i+chunk)
+                cols = slice(starts[j].min(), stops[j].max())
+                weights = np.zeros((len(times[j]), len(times)))
+                weights[:, cols] = np.exp(-((times[np.newaxis, cols]-times[j, np.newaxis])**2) / (2 * window**2))
+                weights /= weights.sum(axis=1)[:, np.newaxis]
+                filtered[j] = (weights * values[np.newaxis, :]).sum(axis=1)
+            return filtered
+        
+        starts = np.searchsorted(times, times - window, side='right')
+        stops = np.searchsorted(times, times + window, side='left')
+        if method == 'Median Window':
+            fn = np.median
+        elif method == 'Mean Window':
+            fn = np.mean
+        else:
+            raise ValueError("Unknown filter method '%s'" % method)
+        for i in xrange(len(values)):
+            filtered[i] = fn(values[starts[i]:stops[i]])
+        return filtered
         
 
 class EventStatisticsAnalyzer:
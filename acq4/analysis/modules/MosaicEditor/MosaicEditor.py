@@ -248,64 +248,34 @@ class MosaicEditor(AnalysisModule):
 
     def rescaleImages(self):
         """
-        Apply corrections to the images and rescale the data.
-        This does the following:
-        1. compute mean image over entire selected group
-        2. smooth the mean image heavily.
-        3. rescale the images and correct for field flatness from the average image
-        4. apply the scale.
+        Rescale the display levels of the selected images so that the mode of 
+        each image's histogram matches the mode of the histogram of the
+        entire selected group (keeps the apparent gain constant across tiles).
+        Histograms are computed from low-resolution copies of each image, so
+        the full-resolution data does not need to be loaded.
         Use the min/max mosaic button to readjust the display scale after this
         automatic operation if the scaling is not to your liking.
         """
-        nsel =  len(self.canvas.selectedItems())
-        if nsel == 0:
+        selected = [item for item in self.canvas.selectedItems() if hasattr(item, 'statsData')]
+        stats = [item.statsData() for item in selected]
+        selected = [item for item, d in zip(selected, stats) if d is not None]
+        stats = [d for d in stats if d is not None]
+        if len(selected) == 0:
             return
-       # print dir(self.selectedItems()[0].data)
-        nxm = self.canvas.selectedItems()[0].data.shape
-        meanImage = np.zeros((nxm[0], nxm[1]))
         nhistbins = 100
         # generate a histogram of the global levels in the image (all images selected)
-        hm = np.histogram(np.dstack([x.data for x in self.canvas.selectedItems()]), nhistbins)
-        print hm
-        #$meanImage = np.mean(self.selectedItems().asarray(), axis=0)
-        n = 0
-        self.imageMax = 0.0
-        print 'nsel: ', nsel
-        for i in range(nsel):
-            try:
-                meanImage = meanImage + np.array(self.canvas.selectedItems()[i].data)
-                imagemax = np.amax(np.amax(meanImage, axis=1), axis=0)
-                if imagemax > self.imageMax:
-                    self.imageMax = imagemax
-                n = n + 1
-            except:
-                print 'image i = %d failed' % i
-                print 'file name: ', self.canvas.selectedItems()[i].name
-                print 'expected shape of nxm: ', nxm
-                print ' but got data shape: ', self.canvas.selectedItems()[i].data.shape
-
-        meanImage = meanImage/n # np.mean(meanImage[0:n], axis=0)
-        filtwidth = np.floor(nxm[0]/10+1)
-        blimg = scipy.ndimage.filters.gaussian_filter(meanImage, filtwidth, order = 0, mode='reflect')
-        #pg.image(blimg)
-        
+        hm = np.histogram(np.concatenate([d.ravel() for d in stats]), nhistbins)
         m = np.argmax(hm[0]) # returns the index of the max count
-        print 'm = ', m
+        self.imageMax = max([d.max() for d in stats])
+
         # now rescale each individually
         # rescaling is done against the global histogram, to keep the gain constant.
-        for i in range(nsel):
-            d = np.array(self.canvas.selectedItems()[i].data)
-#            hmd = np.histogram(d, 512) # return (count, bins)
-            xh = d.shape # capture shape just in case it is not right (have data that is NOT !!)
-            # flatten the illumination using the blimg average illumination pattern
-            newImage = d # / blimg[0:xh[0], 0:xh[1]] # (d - imin)/(blimg - imin) # rescale image.
-            hn = np.histogram(newImage, bins = hm[1]) # use bins from global image
+        for item, d in zip(selected, stats):
+            hn = np.histogram(d, bins=hm[1]) # use bins from global image
             n = np.argmax(hn[0])
-            newImage = (hm[1][m]/hn[1][n])*newImage # rescale to the global max.
-            self.canvas.selectedItems()[i].updateImage(newImage)
-         #   self.canvas.selectedItems()[i].levelRgn.setRegion([0, 2.0])
-            self.canvas.selectedItems()[i].levelRgn.setRegion([0., self.imageMax])
-        print "MosaicEditor::self imageMax: ", self.imageMax
+            scale = 1.0 if hn[1][n] == 0 else hm[1][m] / hn[1][n]
+            # scaling the display levels by 1/scale is equivalent to scaling the data
+            item.histogram.setLevels(0., self.imageMax / scale)
 
     def normalizeImages(self):
         self.canvas.view.autoRange()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+batchFlowchart: Run a saved analysis flowchart (.fc) headlessly over every clamp
+file found in a DataManager subtree.
+
+This is intended for the event detection charts used by Photostim and
+EventDetector, but works with any chart that has a single input terminal
+accepting a FileHandle and an output terminal generating a record array.
+
+Files are split into chunks and distributed across a pool of worker processes
+(using pyqtgraph.multiprocess.Parallelize; runs serially where fork() is not
+available). Results can be stored to a table in an AnalysisDatabase, or written
+as one .npy file per column to an output directory.
+
+Example::
+
+    python -m acq4.analysis.scripts.batchFlowchart detector.fc /data/2015.01.01 \\
+        --db analysis.sqlite --table Photostim_events --workers 4
+
+    # measure throughput for 1, 2, 4 and 8 workers
+    python -m acq4.analysis.scripts.batchFlowchart detector.fc /data/2015.01.01 --scaling 1,2,4,8
+"""
+import os, sys, time
+import argparse
+import numpy as np
+
+from acq4.analysis.dataModels import PatchEPhys
+from acq4.util import DataManager
+import acq4.pyqtgraph as pg
+import acq4.pyqtgraph.multiprocess as mp
+import acq4.util.flowchart as flowchart
+from acq4.util.database import AnalysisDatabase
+
+
+def findClampFiles(dh):
+    """Return a list of handles for all clamp files in the subtree beneath *dh*."""
+    files = []
+    for name in dh.ls():
+        if name.startswith('.'):
+            continue
+        fh = dh[name]
+        if fh.isDir():
+            files.extend(findClampFiles(fh))
+        elif PatchEPhys.isClampFile(fh):
+            files.append(fh)
+    return files
+
+
+def loadFlowchart(fcFile):
+    """Create a new Flowchart and restore its state from *fcFile*."""
+    pg.mkQApp()  ## Flowchart creates its control widget even when it is not shown
+    fc = flowchart.Flowchart()
+    fc.restoreState(pg.configfile.readConfigFile(fcFile), clear=True)
+    return fc
+
+
+def handlesToPaths(data):
+    """Return a copy of record array *data* with FileHandles in object columns
+    replaced by their path names, and the list of columns that were changed.
+    FileHandles can not be pickled, so worker processes return paths instead."""
+    if not isinstance(data, np.ndarray) or data.dtype.names is None:
+        return data, []
+    cols = []
+    for col in data.dtype.names:
+        if data.dtype[col].kind == 'O' and any(isinstance(v, DataManager.FileHandle) for v in data[col]):
+            cols.append(col)
+    if len(cols) == 0:
+        return data, []
+    data = data.copy()
+    for col in cols:
+        data[col] = [v.name() if isinstance(v, DataManager.FileHandle) else v for v in data[col]]
+    return data, cols
+
+
+def pathsToHandles(data, cols):
+    """Reverse handlesToPaths: replace the path names in columns *cols* of
+    *data* with FileHandles (in place)."""
+    for col in cols:
+        data[col] = [DataManager.getHandle(v) if isinstance(v, basestring) else v for v in data[col]]
+    return data
+
+
+def runBatch(fcFile, files, workers=None, chunkSize=10, inputName='dataIn', outputName='events', progress=True):
+    """Process each file through the flowchart in *fcFile*.
+
+    ============  ================================================================
+    **Arguments:**
+    fcFile        Path to a saved flowchart
+    files         List of FileHandles to process (see findClampFiles)
+    workers       Number of worker processes (None uses the number of CPU cores)
+    chunkSize     Number of files handed to a worker at a time. Larger chunks
+                  reduce communication overhead; smaller chunks balance better.
+    inputName     Name of the chart input terminal that receives each file
+    outputName    Name of the chart output terminal to collect
+    progress      If True, print a status line as chunks complete
+    ============  ================================================================
+
+    Returns a tuple (results, stats), where *results* is a list of
+    (FileHandle, output) pairs in the same order as *files* and *stats* is a dict
+    with keys 'files', 'errors', 'workers', 'time', and 'filesPerSecond'.
+    Files that raise an exception during processing are reported and omitted
+    from the results.
+    """
+    fc = loadFlowchart(fcFile)
+    fc.setMemoization(False)  ## every file is new input; don't hold on to results
+
+    chunks = [list(range(i, min(i+chunkSize, len(files)))) for i in range(0, len(files), chunkSize)]
+    if workers is None:
+        workers = mp.Parallelize.suggestedWorkerCount()
+    workers = max(1, min(workers, len(chunks)))
+
+    results = []
+    errors = []
+    start = time.time()
+    ## forked workers inherit the loaded flowchart
+    with mp.Parallelize(tasks=chunks, workers=workers, results=results, errors=errors) as tasker:
+        for chunk in tasker:
+            for i in chunk:
+                try:
+                    out = fc.process(**{inputName: files[i]})[outputName]
+                    out, handleCols = handlesToPaths(out)
+                    tasker.results.append((i, out, handleCols))
+                except Exception as exc:
+                    tasker.errors.append((i, str(exc)))
+            if progress:
+                print("  processed files %d-%d (pid %d)" % (chunk[0], chunk[-1], os.getpid()))
+    dt = time.time() - start
+
+    for i, err in errors:
+        print("Error processing %s: %s" % (files[i].name(), err))
+
+    results.sort(key=lambda r: r[0])
+    results = [(i, pathsToHandles(out, cols)) for i, out, cols in results]
+    stats = {
+        'files': len(files),
+        'errors': len(errors),
+        'workers': workers,
+        'time': dt,
+        'filesPerSecond': len(files) / dt if dt > 0 else np.inf,
+    }
+    return [(files[i], out) for i, out in results], stats
+
+
+def joinResults(results):
+    """Concatenate the record arrays in *results* (as returned by runBatch) 
+    into a single array."""
+    arrs = [out for fh, out in results if out is not None and len(out) > 0]
+    if len(arrs) == 0:
+        return None
+    return np.concatenate(arrs)
+
+
+def storeToDb(db, table, data, owner='batchFlowchart'):
+    """Store record array *data* to *table* in AnalysisDatabase *db*.
+
+    *data* must have a 'SourceFile' column containing FileHandles (as generated
+    by the detector flowcharts). As with EventDetector.storeToDB, any previous
+    records for the same source files are replaced.
+    """
+    dataModel = db.dataModel()
+    columns = db.describeData(data)
+    columns.update({
+        'ProtocolSequenceDir': 'directory:ProtocolSequence',
+        'ProtocolDir': 'directory:Protocol',
+    })
+    with db.transaction():
+        db.checkTable(table, owner=owner, columns=columns, create=True, addUnknownColumns=True, indexes=[['SourceFile'], ['ProtocolSequenceDir']])
+        sourceFiles = set(data['SourceFile'])
+        prots = {}
+        seqs = {}
+        for fh in sourceFiles:
+            prots[fh] = fh.parent()
+            seqs[fh] = dataModel.getParent(fh, 'ProtocolSequence')
+            db.delete(table, where={'SourceFile': fh})
+        records = {}
+        for col in data.dtype.names:
+            records[col] = data[col]
+        records['ProtocolSequenceDir'] = map(seqs.get, data['SourceFile'])
+        records['ProtocolDir'] = map(prots.get, data['SourceFile'])
+        db.insert(table, records)
+
+
+def storeToFiles(outputDir, data):
+    """Write each column of record array *data* to <outputDir>/<column>.npy.
+    FileHandle columns are written as arrays of path strings."""
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    for col in data.dtype.names:
+        vals = data[col]
+        if vals.dtype.kind == 'O':
+            vals = np.array([v.name() if isinstance(v, DataManager.FileHandle) else v for v in vals])
+        np.save(os.path.join(outputDir, col + '.npy'), vals)
+
+
+def measureScaling(fcFile, files, workerCounts, chunkSize=10, **kwds):
+    """Run the batch once for each worker count and print throughput and
+    speedup relative to the first run. Returns the list of stats dicts."""
+    allStats = []
+    for n in workerCounts:
+        res, stats = runBatch(fcFile, files, workers=n, chunkSize=chunkSize, progress=False, **kwds)
+        allStats.append(stats)
+        speedup = stats['filesPerSecond'] / allStats[0]['filesPerSecond']
+        print("workers: %2d   files: %5d   time: %7.2f s   %7.2f files/s   speedup: %0.2fx" % (
+            stats['workers'], stats['files'], stats['time'], stats['filesPerSecond'], speedup))
+    return allStats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run an analysis flowchart over every clamp file in a directory tree.")
+    parser.add_argument('flowchart', help="saved flowchart (.fc) file")
+    parser.add_argument('basedir', help="root of the data tree to search for clamp files")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="number of worker processes (default: number of CPU cores)")
+    parser.add_argument('-c', '--chunk', type=int, default=10, help="number of files handed to a worker at a time")
+    parser.add_argument('--input', default='dataIn', help="name of the flowchart input terminal")
+    parser.add_argument('--output', default='events', help="name of the flowchart output terminal")
+    parser.add_argument('--db', default=None, help="AnalysisDatabase file to store results to")
+    parser.add_argument('--table', default=None, help="table name for results stored to --db")
+    parser.add_argument('--outdir', default=None, help="directory to write one .npy file per result column")
+    parser.add_argument('--scaling', default=None, help="comma-separated worker counts to benchmark (no results are stored)")
+    args = parser.parse_args()
+
+    baseDir = DataManager.getDirHandle(args.basedir)
+    files = findClampFiles(baseDir)
+    print("Found %d clamp files under %s" % (len(files), baseDir.name()))
+
+    if args.scaling is not None:
+        counts = [int(n) for n in args.scaling.split(',')]
+        measureScaling(args.flowchart, files, counts, chunkSize=args.chunk, inputName=args.input, outputName=args.output)
+        sys.exit(0)
+
+    results, stats = runBatch(args.flowchart, files, workers=args.workers, chunkSize=args.chunk, inputName=args.input, outputName=args.output)
+    print("Processed %d files (%d errors) with %d workers in %0.2f s (%0.2f files/s)" % (
+        stats['files'], stats['errors'], stats['workers'], stats['time'], stats['filesPerSecond']))
+
+    data = joinResults(results)
+    if data is None:
+        print("No results generated.")
+    else:
+        if args.db is not None:
+            if args.table is None:
+                raise Exception("Must specify --table when storing results to a database.")
+            db = AnalysisDatabase(args.db, dataModel=PatchEPhys, baseDir=baseDir)
+            storeToDb(db, args.table, data)
+            print("Stored %d records to %s:%s" % (len(data), args.db, args.table))
+        if args.outdir is not None:
+            storeToFiles(args.outdir, data)
+            print("Wrote %d records to %s" % (len(data), args.outdir))
@@ -0,0 +1,362 @@
+"""
+dataCatalog: an on-disk (SQLite) catalog of the metadata that dataSummary reads from a data directory.
+
+Summarizing a multi-year data directory requires reading every .index file and the header of
+every clamp file, which can take hours. DataCatalog stores what dataSummary needs in a single
+SQLite file:
+    - for each day, slice and cell directory: its type, .index metadata, and the names of the
+      subdirectories and files it contains
+    - for each protocol directory: its sequence parameters, recording mode, and the number of
+      runs, non-empty runs and runs with a clamp file
+    - for each clamp file: recording mode, holding level, sample rate and whole-cell
+      compensation settings
+
+Every directory is stored with the modification times of the directory and its .index file
+(and, for protocols, the latest modification time of its runs). DataCatalog.update() only reads
+directories whose modification times have changed since the last update; days are scanned in
+parallel worker processes. The catalog follows the layout assumed by dataSummary:
+[days, slices, cells, protocols], with one directory per run in each protocol.
+
+Usage:
+    python dataCatalog.py basedir [catalogFile]
+
+The catalog can then be used by dataSummary (see dataSummary.py --catalog).
+"""
+import sys
+import os
+import re
+import gc
+import time
+import pickle
+import sqlite3
+
+from acq4.analysis.dataModels import PatchEPhys
+from acq4.util import DataManager
+from acq4.util.SequenceContainer import SequenceContainer
+from acq4.util.debug import printExc
+from acq4.pyqtgraph.multiprocess import Parallelize
+
+# directory names for each level of the hierarchy, as used by dataSummary
+dayType = re.compile("(\d{4,4}).(\d{2,2}).(\d{2,2})_(\d{3,3})")
+sliceType = re.compile("(slice\_)(\d{3,3})")
+cellType = re.compile("(cell_)(\d{3,3})")
+
+# .index keys stored for protocol directories (their 'devices' entries are large)
+protocolInfoKeys = ['dirType', '__timestamp__', 'sequenceParams', ('Temperature', 'BathTemp')]
+
+
+def defaultCatalogFile(basedir):
+    """Return the default catalog file for basedir (stored with the dataSummary output files)."""
+    name = basedir.replace('/', '_').replace('\\', '_').replace(':', '_').strip('_')
+    return os.path.join(os.path.expanduser("~"), 'Desktop/acq4_scripts', name + '.catalog.sqlite')
+
+
+class DataCatalog(object):
+    """
+    SQLite catalog of the days, slices, cells and protocols in *basedir*.
+
+    Paths in the catalog are relative to basedir; basedir itself is ''.
+    If *fileName* is not given, the catalog is stored as described in defaultCatalogFile().
+    """
+    def __init__(self, basedir, fileName=None):
+        self.basedir = os.path.abspath(basedir)
+        if fileName is None:
+            fileName = defaultCatalogFile(self.basedir)
+        if not os.path.isdir(os.path.dirname(os.path.abspath(fileName))):
+            os.makedirs(os.path.dirname(os.path.abspath(fileName)))
+        self.fileName = fileName
+        self.db = sqlite3.connect(fileName)
+        self.db.row_factory = sqlite3.Row
+        self._known = {}
+        self._createTables()
+
+    def _createTables(self):
+        with self.db:
+            self.db.execute("""CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY, parent TEXT, name TEXT, level TEXT, dirType TEXT,
+                mtime REAL, indexMtime REAL, contentMtime REAL, info BLOB, subdirs BLOB, files BLOB)""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS protocols (
+                path TEXT PRIMARY KEY, hasDevices INTEGER, clampDevice TEXT, mode TEXT,
+                sequenceParams BLOB, nRuns INTEGER, nNonEmpty INTEGER, nClamp INTEGER)""")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS clampFiles (
+                path TEXT PRIMARY KEY, protocol TEXT, mode TEXT, holding REAL, sampleRate REAL, wcComp BLOB)""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS clampFiles_protocol ON clampFiles (protocol)")
+
+    def close(self):
+        self.db.close()
+
+    def relPath(self, path):
+        """Return the catalog path for a directory given by its full path."""
+        path = os.path.relpath(os.path.abspath(path), self.basedir)
+        return '' if path == '.' else path
+
+    ## Updating
+
+    def update(self, workers=None):
+        """
+        Scan basedir and bring the catalog up to date. Directories whose modification times
+        are unchanged are not read again, and entries for directories that no longer exist
+        are removed. Days are divided between *workers* processes (default is one per CPU).
+        Entries of a day whose scan did not complete are left in place.
+        Return the number of directories that were read.
+        """
+        self._known = {}
+        for row in self.db.execute("SELECT path, mtime, indexMtime, contentMtime, subdirs, files FROM dirs"):
+            self._known[row['path']] = tuple(row)[1:]
+
+        days = sorted([d for d in os.listdir(self.basedir) if dayType.match(d) is not None and
+                       os.path.isdir(os.path.join(self.basedir, d))])
+        results = []
+        with Parallelize(tasks=days, workers=workers, results=results) as tasker:
+            for day in tasker:
+                rows = []
+                seen = []
+                self._scanDir(day, 'day', rows, seen)
+                DataManager.cleanup()
+                gc.collect()
+                tasker.results.append((day, rows, seen))
+
+        nRead = 0
+        seen = set()
+        completed = set()
+        with self.db:
+            for day, dayRows, daySeen in results:
+                completed.add(day)
+                seen.update(daySeen)
+                for table, row in dayRows:
+                    if table == 'dirs':
+                        nRead += 1
+                    elif table == 'protocols':
+                        self.db.execute("DELETE FROM clampFiles WHERE protocol=?", (row['path'],))
+                    self._insert(table, row)
+            failed = set(days) - completed
+            for path in set(self._known) - seen:
+                if path.split(os.sep)[0] in failed:
+                    continue  ## day was not scanned; its directories may still exist
+                self.db.execute("DELETE FROM dirs WHERE path=?", (path,))
+                self.db.execute("DELETE FROM protocols WHERE path=?", (path,))
+                self.db.execute("DELETE FROM clampFiles WHERE protocol=?", (path,))
+        self._known = {}
+        return nRead
+
+    def _insert(self, table, row):
+        keys = row.keys()
+        values = [sqlite3.Binary(pickle.dumps(row[k], 2)) if k in self._blobColumns else row[k] for k in keys]
+        self.db.execute("INSERT OR REPLACE INTO %s (%s) VALUES (%s)" % (table, ', '.join(keys), ', '.join('?' * len(keys))), values)
+
+    _blobColumns = ['info', 'subdirs', 'files', 'sequenceParams', 'wcComp']
+
+    def _stat(self, path):
+        """Return modification times of a directory and its .index file (None if there is no index)."""
+        fullPath = os.path.join(self.basedir, path)
+        mtime = os.stat(fullPath).st_mtime
+        try:
+            indexMtime = os.stat(os.path.join(fullPath, '.index')).st_mtime
+        except OSError:
+            indexMtime = None
+        return mtime, indexMtime
+
+    def _listDir(self, path, mtime):
+        """Return (subdirs, files) for a directory, from the catalog if the directory is unchanged."""
+        known = self._known.get(path)
+        if known is not None and known[0] == mtime:
+            return pickle.loads(str(known[3])), pickle.loads(str(known[4]))
+        fullPath = os.path.join(self.basedir, path)
+        subdirs = []
+        files = []
+        for name in sorted(os.listdir(fullPath)):
+            if os.path.isdir(os.path.join(fullPath, name)):
+                subdirs.append(name)
+            elif name not in ['.index', '.log']:
+                files.append(name)
+        return subdirs, files
+
+    def _scanDir(self, path, level, rows, seen):
+        ## scan a day, slice or cell directory and everything below it
+        seen.append(path)
+        mtime, indexMtime = self._stat(path)
+        subdirs, files = self._listDir(path, mtime)
+        known = self._known.get(path)
+        if known is None or known[:2] != (mtime, indexMtime):
+            try:
+                dh = DataManager.getDirHandle(os.path.join(self.basedir, path), create=False)
+                rows.append(('dirs', self._dirRow(path, level, dh, mtime, indexMtime, None, dh.info().deepcopy(), subdirs, files)))
+            except Exception:
+                printExc("Error reading %s:" % path)
+
+        if level == 'day':
+            for name in subdirs:
+                if sliceType.match(name) is not None:
+                    self._scanDir(os.path.join(path, name), 'slice', rows, seen)
+        elif level == 'slice':
+            for name in subdirs:
+                if cellType.match(name) is not None:
+                    self._scanDir(os.path.join(path, name), 'cell', rows, seen)
+        elif level == 'cell':
+            for name in subdirs:
+                self._scanProtocol(os.path.join(path, name), rows, seen)
+
+    def _dirRow(self, path, level, dh, mtime, indexMtime, contentMtime, info, subdirs, files):
+        dirType = PatchEPhys.dirType(dh)
+        if dirType is not None:
+            info.setdefault('dirType', dirType)
+        return dict(path=path, parent=os.path.dirname(path), name=os.path.basename(path), level=level,
+                    dirType=dirType, mtime=mtime, indexMtime=indexMtime, contentMtime=contentMtime,
+                    info=info, subdirs=subdirs, files=files)
+
+    def _scanProtocol(self, path, rows, seen):
+        seen.append(path)
+        mtime, indexMtime = self._stat(path)
+        runs, files = self._listDir(path, mtime)
+
+        ## a protocol changes when any of its runs (or their .index files) change
+        times = [0]
+        for name in runs:
+            times.extend([t for t in self._stat(os.path.join(path, name)) if t is not None])
+        if SequenceContainer.fileName in files:
+            times.append(os.stat(os.path.join(self.basedir, path, SequenceContainer.fileName)).st_mtime)
+        contentMtime = max(times)
+        known = self._known.get(path)
+        if known is not None and known[:3] == (mtime, indexMtime, contentMtime):
+            return
+
+        try:
+            dh = DataManager.getDirHandle(os.path.join(self.basedir, path), create=False)
+            info = dh.info().deepcopy()
+            rows.append(('dirs', self._dirRow(path, 'protocol', dh, mtime, indexMtime, contentMtime,
+                                              dict([(k, info[k]) for k in protocolInfoKeys if k in info]), runs, files)))
+
+            ## recording mode, determined as in DataSummary.doProtocols
+            devices = info.get('devices', {})
+            clampDevices = PatchEPhys.getClampDeviceNames(dh)
+            if clampDevices is None:
+                clampDevices = [name for name in PatchEPhys.knownClampNames() if name in devices]
+            clampDevice = clampDevices[0] if len(clampDevices) > 0 else None
+            mode = devices.get(clampDevice, {}).get('mode', None)
+
+            protocol = dict(path=path, hasDevices=int('devices' in info or len(clampDevices) > 0),
+                            clampDevice=clampDevice, mode=mode, sequenceParams=info.get('sequenceParams', None),
+                            nRuns=0, nNonEmpty=0, nClamp=0)
+            clampRows = []
+            for name in dh.subDirs():
+                rh = dh[name]
+                protocol['nRuns'] += 1
+                if len(rh.ls()) > 0:
+                    protocol['nNonEmpty'] += 1
+                try:
+                    fh = PatchEPhys.getClampFile(rh)
+                except Exception:
+                    fh = None
+                if fh is None:
+                    continue
+                protocol['nClamp'] += 1
+                clampRows.append(('clampFiles', self._clampRow(path, fh)))
+            rows.append(('protocols', protocol))
+            rows.extend(clampRows)
+        except Exception:
+            printExc("Error reading %s:" % path)
+
+    def _clampRow(self, protocol, fh):
+        row = dict(path=self.relPath(fh.name()), protocol=protocol, mode=None, holding=None, sampleRate=None, wcComp=None)
+        for key, fn in [('mode', PatchEPhys.getClampMode), ('holding', PatchEPhys.getClampHoldingLevel),
+                        ('sampleRate', PatchEPhys.getSampleRate), ('wcComp', PatchEPhys.getWCCompSettings)]:
+            try:
+                row[key] = fn(fh)
+            except Exception:
+                pass
+        return row
+
+    ## Queries
+
+    def _toDict(self, row):
+        if row is None:
+            return None
+        d = dict(zip(row.keys(), tuple(row)))
+        for k in self._blobColumns:
+            if d.get(k, None) is not None:
+                d[k] = pickle.loads(str(d[k]))
+        return d
+
+    def get(self, path):
+        """Return the catalog entry for a directory as a dict, or None if it is not in the catalog."""
+        return self._toDict(self.db.execute("SELECT * FROM dirs WHERE path=?", (path,)).fetchone())
+
+    def children(self, path):
+        """Return the catalog entries for all subdirectories of *path*, sorted by name."""
+        return [self._toDict(r) for r in self.db.execute("SELECT * FROM dirs WHERE parent=? ORDER BY name", (path,))]
+
+    def days(self):
+        """Return the names of all day directories in the catalog."""
+        return [r['name'] for r in self.db.execute("SELECT name FROM dirs WHERE level='day' ORDER BY name")]
+
+    def protocol(self, path):
+        """Return the summary of a protocol directory, or None if it is not in the catalog."""
+        return self._toDict(self.db.execute("SELECT * FROM protocols WHERE path=?", (path,)).fetchone())
+
+    def clampFiles(self, protocol):
+        """Return the summaries of all clamp files in a protocol directory."""
+        return [self._toDict(r) for r in self.db.execute("SELECT * FROM clampFiles WHERE protocol=? ORDER BY path", (protocol,))]
+
+    def dirHandle(self, path):
+        """Return a CatalogDirHandle for a directory (given by catalog path)."""
+        return CatalogDirHandle(self, path)
+
+
+class CatalogDirHandle(object):
+    """
+    Read-only stand-in for a DataManager.DirHandle that answers from the catalog.
+    It supports the methods used by the PatchEPhys metadata functions (dirType, getDayInfo,
+    getSliceInfo, getCellInfo, getTemp, ...).
+    """
+    def __init__(self, catalog, path):
+        self.catalog = catalog
+        self.path = path
+        self._entry = catalog.get(path)
+
+    def name(self):
+        return os.path.join(self.catalog.basedir, self.path) if self.path != '' else self.catalog.basedir
+
+    def shortName(self):
+        return os.path.basename(self.name())
+
+    def info(self):
+        if self._entry is None:
+            return {}
+        return self._entry['info']
+
+    def parent(self):
+        if self.path == '':
+            return self
+        return CatalogDirHandle(self.catalog, os.path.dirname(self.path))
+
+    def isFile(self):
+        return False
+
+    def isDir(self):
+        return True
+
+    def subDirs(self):
+        if self.path == '':
+            return self.catalog.days()
+        if self._entry is None:
+            return []
+        return self._entry['subdirs']
+
+    def ls(self):
+        if self._entry is None:
+            return self.subDirs()
+        return self._entry['subdirs'] + self._entry['files']
+
+    def __getitem__(self, item):
+        return CatalogDirHandle(self.catalog, os.path.join(self.path, item))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python dataCatalog.py basedir [catalogFile]")
+        sys.exit(1)
+    catalog = DataCatalog(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    start = time.time()
+    n = catalog.update()
+    print("Catalog %s: read %d directories in %0.1f s" % (catalog.fileName, n, time.time() - start))
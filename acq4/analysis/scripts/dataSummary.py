@@ -17,6 +17,13 @@ mode =  full (f) : do a full investigation of the data files. Makes processing v
 debug (d) : debug monitoring of progress
 output (o) : define output file (tab delimited file for import to other programs)
 
+Oct 2026:
+catalog (c) : read directory listings, metadata and protocol status from a DataCatalog (dataCatalog.py)
+        instead of walking the data directory. The catalog is updated before the summary is generated;
+        only directories that changed since the last update are read again, so repeated full and
+        partial summaries of a large data directory become fast.
+workers (w) : number of processes used to update the catalog (default: one per CPU)
+
 Future:
     Provide interface
 """
@@ -36,13 +43,15 @@ from collections import OrderedDict
 from acq4.util.metaarray import MetaArray
 from acq4.analysis.dataModels import PatchEPhys
 from acq4.util import DataManager
+from acq4.analysis.scripts.dataCatalog import DataCatalog
 
 
 
 
 class DataSummary():
-    def __init__(self, basedir=None, daylistfile=None):
+    def __init__(self, basedir=None, daylistfile=None, catalog=None):
         self.monitor = False
+        self.catalog = catalog  # DataCatalog for basedir; if None, the directories are read directly
         self.analysis_summary = {}
         self.dataModel = PatchEPhys
         self.basedir = basedir
@@ -84,6 +93,7 @@ class DataSummary():
         self.video_re = re.compile('^[Vv]ideo_(\d{3,3}).ma')
 
         self.reportIncompleteProtocols = False  # do include incomplete protocol runs in print
+        self.mode = 'quick'
         
         # look for names that match the acq4 "day" template:
         # example: 2013.03.28_000
@@ -133,19 +143,25 @@ class DataSummary():
         """
         mode =  full (f) : do a full investigation of the data files. Makes processing very slow. (reports incomplete protocols)
         """
-        pass
+        self.mode = 'full'
+        self.InvestigateProtocols = True
+        self.reportIncompleteProtocols = True
     
     def setModePartial(self):
         """
         partial (p) : do a partial investiagion of protocols: is there anything in every protocol directory? (reports incomplete protocols) - slow
         """
-        pass
+        self.mode = 'partial'
+        self.InvestigateProtocols = True
+        self.reportIncompleteProtocols = True
     
     def setModeQuick(self):
         """
         quick (q) : do a quick scan : does not run through protocols to find incomplete protocols. Default (over full and partial)
         """
-        pass
+        self.mode = 'quick'
+        self.InvestigateProtocols = False
+        self.reportIncompleteProtocols = False
     
     def setDebug(self):
         """
@@ -158,13 +174,42 @@ class DataSummary():
         output (o) : define output file (tab delimited file for import to other programs)
         """
         pass
-        
+
+    def listDir(self, path):
+        """
+        return (subdirectories, files) in path, from the catalog if there is one
+        """
+        if self.catalog is not None:
+            rel = self.catalog.relPath(path)
+            if rel == '':
+                return self.catalog.days(), []
+            entry = self.catalog.get(rel)
+            if entry is None:
+                return [], []
+            return entry['subdirs'], entry['files']
+        subdirs = []
+        files = []
+        for thisfile in os.listdir(path):
+            if os.path.isdir(os.path.join(path, thisfile)):
+                subdirs.append(thisfile)
+            else:
+                files.append(thisfile)
+        return subdirs, files
+
+    def getDirHandle(self, path):
+        """
+        return a handle for the directory at path (a CatalogDirHandle if there is a catalog)
+        """
+        if self.catalog is not None:
+            return self.catalog.dirHandle(self.catalog.relPath(path))
+        return DataManager.getDirHandle(path, create=False)
+
     def getSummary(self):
         """
         getSummary is the entry point for scanning through all the data files in a given directory,
         returning information about those within the date range, with details as specified by the options
         """
-        allfiles = os.listdir(self.basedir)
+        allfiles = self.listDir(self.basedir)[0]
         
         days = []
         for thisfile in allfiles:
@@ -194,7 +239,7 @@ class DataSummary():
             if self.monitor:
                 print 'processing day: %s' % day
             self.daystring = '%s \t' % (day)
-            dh = DataManager.getDirHandle(os.path.join(self.basedir, day), create=False)
+            dh = self.getDirHandle(os.path.join(self.basedir, day))
             dx = self.dataModel.getDayInfo(dh)
             if dx is not None and 'description' in dx.keys() and len(dx['description']) > 0:
                 l = self.twd['day'].wrap(dx['description'])
@@ -223,7 +268,7 @@ class DataSummary():
         :return nothing:
         """
 
-        allfiles = os.listdir(day)
+        allfiles = self.listDir(day)[0]
         slicetype = re.compile("(slice\_)(\d{3,3})")
         slices = []
         for thisfile in allfiles:
@@ -234,7 +279,7 @@ class DataSummary():
                 slices.append(thisfile)
         for slice in slices:
             self.slicestring = '%s \t' % (slice)
-            dh = DataManager.getDirHandle(os.path.join(day, slice), create=False)
+            dh = self.getDirHandle(os.path.join(day, slice))
             sl = self.dataModel.getSliceInfo(dh)
 
             # if sl is not None and 'description' in sl.keys() and len(sl['description']) > 0:
@@ -264,7 +309,7 @@ class DataSummary():
         :param slice:
         :return nothing:
         """
-        allfiles = os.listdir(slice)
+        allfiles = self.listDir(slice)[0]
         celltype = re.compile("(cell_)(\d{3,3})")
         cells = []
         for thisfile in allfiles:
@@ -275,7 +320,7 @@ class DataSummary():
                 cells.append(thisfile)
         for cell in cells:
             self.cellstring = '%s\t' % (cell)
-            dh = DataManager.getDirHandle(os.path.join(slice, cell), create=False)
+            dh = self.getDirHandle(os.path.join(slice, cell))
             cl = self.dataModel.getCellInfo(dh)
             if cl is not None and 'notes' in cl.keys() and len(cl['notes']) > 0:
                 l = self.tw['cell'].wrap(cl['notes'])
@@ -309,84 +354,30 @@ class DataSummary():
         :param cell:
         :return nothing:
         """
-        allfiles = os.listdir(cell)
         #celltype = re.compile("(Cell_)(\d{3,3})")
-        protocols = []
-        nonprotocols = []
+        protocols, nonprotocols = self.listDir(cell)
         anyprotocols = False
         images = []  # tiff
         stacks2p = []
         images2p = []
         videos = []
         endmatch = re.compile("[\_(\d{3,3})]$")  # look for _lmn at end of directory name
-        for thisfile in allfiles:
-            if os.path.isdir(os.path.join(cell, thisfile)):
-                protocols.append(thisfile)
-            else:
-                nonprotocols.append(thisfile)
 
         self.protocolstring = ''
         if self.InvestigateProtocols is True:
             self.summarystring = 'NaN \t'*6
             for np, protocol in enumerate(protocols):
-                dh = DataManager.getDirHandle(os.path.join(cell, protocol), create=False)
+                dh = self.getDirHandle(os.path.join(cell, protocol))
                 if np == 0:
                     self.cell_summary(dh)
                 if self.monitor:
                     print 'Investigating Protocol: %s', dh.name()
-                dirs = dh.subDirs()
+                status = self.protocolStatus(dh)
+                if status is None:  # can't parse protocol device...
+                    continue
+                data_mode, nexpected, ncomplete = status
                 protocolok = True  # assume that protocol is ok
-                modes = []
-                nexpected = len(dirs)  # acq4 writes dirs before, so this is the expected fill
-                ncomplete = 0  # count number actually done
-                clampDevices = self.dataModel.getClampDeviceNames(dh)
-                # must handle multiple data formats, even in one experiment...
-                if clampDevices is not None:
-                    data_mode = dh.info()['devices'][clampDevices[0]]['mode']  # get mode from top of protocol information
-                else:  # try to set a data mode indirectly
-                    if 'devices' not in dh.info().keys():
-                        protocolok = False  # can't parse protocol device...
-                        continue
-                    devices = dh.info()['devices'].keys()  # try to get clamp devices from another location
-                    #print dir(self.dataModel)
-                    for kc in self.dataModel.knownClampNames():
-                        if kc in devices:
-                            clampDevices = [kc]
-                    try:
-                        data_mode = dh.info()['devices'][clampDevices[0]]['mode']
-                    except:
-                        data_mode = 'Unknown'
-                        # protocolok = False
-                        # print '<<cannot read protocol data mode>>'
-                if data_mode not in modes:
-                    modes.append(data_mode)
-                for i, directory_name in enumerate(dirs):  # dirs has the names of the runs within the protocol
-                    data_dir_handle = dh[directory_name]  # get the directory within the protocol
-                    try:
-                        data_file_handle = self.dataModel.getClampFile(data_dir_handle)  # get pointer to clamp data
-                    except:
-                        data_file_handle = None
-                    if data_file_handle is not None:  # no clamp file found - skip
-                        ncomplete += 1
-                        # Check if there is no clamp file for this iteration of the protocol
-                        # Usually this indicates that the protocol was stopped early.
-                        # data_file = data_file_handle.read()
-                        try:
-                            self.holding = self.dataModel.getClampHoldingLevel(data_file_handle)
-                        except:
-                            self.holding = 0.
-                        try:
-                            self.amp_settings = self.dataModel.getWCCompSettings(data_file_handle)
-                        except:
-                            self.amp_settings = None
-                            #raise ValueError('complete = %d when failed' % ncomplete)
-                    #else:
-                    #    break  # do not keep looking if the file is not found
-                    DataManager.cleanup()  # close all opened files
-                    # del dh
-                    gc.collect()  # and force garbage collection of freed objects inside the loop
-                if modes == []:
-                    modes = ['Unknown mode']
+                modes = [data_mode]
                 if protocolok and ncomplete == nexpected:  # accumulate protocols
                     self.protocolstring += '[{:<s}: {:s} {:d}], '.format(protocol, modes[0][0], ncomplete)
                     anyprotocols = True  # indicate that ANY protocol ran to completion
@@ -394,9 +385,10 @@ class DataSummary():
                     if self.reportIncompleteProtocols:
                         self.protocolstring += '[{:<s}, ({:s}, {:d}/{:d}, Incomplete)], '.format(protocol, modes[0][0], ncomplete, nexpected)
 
-                DataManager.cleanup()
+                if self.catalog is None:
+                    DataManager.cleanup()
+                    gc.collect()
                 del dh
-                gc.collect()
         else:
             self.protocolstring += 'Protocols: '
             anyprotocols = True
@@ -453,6 +445,77 @@ class DataSummary():
             ostring = self.daystring + self.summarystring + self.slicestring + self.cellstring + '<No complete protocols> \t' + self.imagestring + ' \t'
         self.outputString(ostring)
 
+    def protocolStatus(self, dh):
+        """
+        Find out how much of a protocol was run.
+        In full mode, a run is complete if it has a clamp data file; in partial mode,
+        if its directory is not empty.
+        :param dh: the directory handle for the protocol
+        :return (data mode, number of runs expected, number of runs complete), or None
+            if the protocol devices cannot be determined:
+        """
+        if self.catalog is not None:
+            prot = self.catalog.protocol(self.catalog.relPath(dh.name()))
+            if prot is None or not prot['hasDevices']:
+                return None
+            data_mode = prot['mode'] if prot['mode'] is not None else 'Unknown'
+            if self.mode == 'full':
+                clampFiles = self.catalog.clampFiles(prot['path'])
+                if len(clampFiles) > 0:
+                    self.holding = clampFiles[-1]['holding'] if clampFiles[-1]['holding'] is not None else 0.
+                    self.amp_settings = clampFiles[-1]['wcComp']
+                return data_mode, prot['nRuns'], prot['nClamp']
+            return data_mode, prot['nRuns'], prot['nNonEmpty']
+
+        dirs = dh.subDirs()
+        nexpected = len(dirs)  # acq4 writes dirs before, so this is the expected fill
+        ncomplete = 0  # count number actually done
+        clampDevices = self.dataModel.getClampDeviceNames(dh)
+        # must handle multiple data formats, even in one experiment...
+        if clampDevices is not None:
+            data_mode = dh.info()['devices'][clampDevices[0]]['mode']  # get mode from top of protocol information
+        else:  # try to set a data mode indirectly
+            if 'devices' not in dh.info().keys():
+                return None
+            devices = dh.info()['devices'].keys()  # try to get clamp devices from another location
+            #print dir(self.dataModel)
+            for kc in self.dataModel.knownClampNames():
+                if kc in devices:
+                    clampDevices = [kc]
+            try:
+                data_mode = dh.info()['devices'][clampDevices[0]]['mode']
+            except:
+                data_mode = 'Unknown'
+        for i, directory_name in enumerate(dirs):  # dirs has the names of the runs within the protocol
+            data_dir_handle = dh[directory_name]  # get the directory within the protocol
+            if self.mode == 'partial':
+                if len(data_dir_handle.ls()) > 0:
+                    ncomplete += 1
+                continue
+            try:
+                data_file_handle = self.dataModel.getClampFile(data_dir_handle)  # get pointer to clamp data
+            except:
+                data_file_handle = None
+            if data_file_handle is not None:  # no clamp file found - skip
+                ncomplete += 1
+                # Check if there is no clamp file for this iteration of the protocol
+                # Usually this indicates that the protocol was stopped early.
+                # data_file = data_file_handle.read()
+                try:
+                    self.holding = self.dataModel.getClampHoldingLevel(data_file_handle)
+                except:
+                    self.holding = 0.
+                try:
+                    self.amp_settings = self.dataModel.getWCCompSettings(data_file_handle)
+                except:
+                    self.amp_settings = None
+                    #raise ValueError('complete = %d when failed' % ncomplete)
+            #else:
+            #    break  # do not keep looking if the file is not found
+            DataManager.cleanup()  # close all opened files
+            gc.collect()  # and force garbage collection of freed objects inside the loop
+        return data_mode, nexpected, ncomplete
+
     def outputString(self, ostring):
         if self.outputMode == 'terminal':
             print ostring
@@ -552,8 +615,21 @@ class DataSummary():
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        ds = DataSummary(basedir=sys.argv[1])
-    if len(sys.argv) == 3:
-        ds = DataSummary(basedir=sys.argv[1], daylistfile=sys.argv[2])
+    parser = argparse.ArgumentParser(description='Summarize the data in an acq4 data directory')
+    parser.add_argument('basedir', help='data directory')
+    parser.add_argument('daylistfile', nargs='?', default=None, help='file listing the days to summarize')
+    parser.add_argument('-m', '--mode', choices=['quick', 'q', 'partial', 'p', 'full', 'f'], default='quick',
+                        help='how much of each protocol to investigate (default: quick)')
+    parser.add_argument('-c', '--catalog', nargs='?', const='', default=None, metavar='FILE',
+                        help='use a DataCatalog (stored in FILE, or in the default location)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of processes used to update the catalog')
+    args = parser.parse_args()
+
+    catalog = None
+    if args.catalog is not None:
+        catalog = DataCatalog(args.basedir, args.catalog or None)
+        catalog.update(workers=args.workers)
+    ds = DataSummary(basedir=args.basedir, daylistfile=args.daylistfile, catalog=catalog)
+    {'q': ds.setModeQuick, 'p': ds.setModePartial, 'f': ds.setModeFull}[args.mode[0]]()
     ds.getSummary()
\ No newline at end of file
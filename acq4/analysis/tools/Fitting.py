@@ -114,7 +114,18 @@ class Fitting():
                     [-150., 50., 1.], [0.0, 237.0, 60.0, 12.0, 17.0, 60.0, 14.0],  
                     ['DC', 'a1', 'v1', 'k1', 'a2', 'v2', 'k2'],  None, self.taucurveder),
         }
+        # analytic partial derivatives with respect to the parameters, used by FitRegionBatch.
+        # Functions not listed here use a finite-difference Jacobian.
+        self.fitjacmap = {
+        'exp0'    : self.exp0jac,
+        'exp1'    : self.expjac,
+        'exptau'  : self.exptaujac,
+        'expsum'  : self.expsumjac,
+        'expsum2' : self.expsum2jac,
+        'exp2'    : self.exp2jac,
+        }
         self.fitSum2Err = 0
+        self.fitSum2Errs = None
 
     def getFunctions(self):
         return(self.fitfuncmap.keys())
@@ -230,7 +241,7 @@ class Fitting():
         For fit to activation currents...
         """
         yd = p[0] + (p[1] * (1.0 - numpy.exp(-x/p[2]))**2.0 ) + (p[3] * (1.0 - numpy.exp(-x/p[4])))
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -257,7 +268,7 @@ class Fitting():
         yd[m1] = amp*(1-numpy.exp(-(x1-t0)/tau1))+yOffset
         amp2 = amp*(1-numpy.exp(-width/tau1)) ## y-value at start of decay
         yd[m2] = ((amp2)*numpy.exp(-(x2-(width+t0))/tau2))+yOffset
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -268,7 +279,7 @@ class Fitting():
 
     def boltzeval(self,p, x, y=None, C = None, sumsq = False, weights=None):
         yd = p[0] + (p[1]-p[0])/(1.0 + numpy.exp((x-p[2])/p[3]))
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -278,7 +289,7 @@ class Fitting():
 
     def boltzeval2(self,p, x, y=None, C = None, sumsq = False, weights=None):
         yd = p[0] + p[1]/(1 + numpy.exp((x-p[2])/p[3])) + p[4]/(1 + numpy.exp((x-p[5])/p[6]))
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -288,7 +299,7 @@ class Fitting():
 
     def gausseval(self,p, x, y=None, C = None, sumsq = False, weights=None):
         yd = (p[0]/(p[2]*numpy.sqrt(2.0*numpy.pi)))*numpy.exp(-((x - p[1])**2.0)/(2.0*(p[2]**2.0)))
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -298,7 +309,7 @@ class Fitting():
 
     def lineeval(self, p, x, y=None, C = None, sumsq = False, weights=None):
         yd = p[0]*x + p[1]
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -308,7 +319,7 @@ class Fitting():
 
     def poly2eval(self, p, x, y=None, C = None, sumsq = False, weights=None):
         yd = p[0]*x**2.0 + p[1]*x + p[2]
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -318,7 +329,7 @@ class Fitting():
 
     def poly3eval(self, p, x, y=None, C = None, sumsq = False, weights=None):
         yd = p[0]*x**3.0 + p[1]*x**2.0 + p[2]*x +p[3]
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -328,7 +339,7 @@ class Fitting():
 
     def poly4eval(self, p, x, y=None, C = None, sumsq = False, weights=None):
         yd = p[0]*x**4.0 + p[1]*x**3.0 + p[2]*x**2.0 + p[3]*x +p[4]
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -338,7 +349,7 @@ class Fitting():
 
     def sineeval(self, p, x, y=None, C = None, sumsq = False, weights=None):
         yd =  p[0] + p[1]*numpy.sin((x*2.0*numpy.pi/p[2])+p[3])
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -352,7 +363,7 @@ class Fitting():
         'DC', 'a1', 'v1', 'k1', 'a2', 'v2', 'k2'
         """
         yd = p[0] + 1.0/(p[1]*numpy.exp((x+p[2])/p[3]) +p[4]*numpy.exp(-(x+p[5])/p[6]))
-        if y == None:
+        if y is None:
             return yd
         else:
             if sumsq is True:
@@ -370,6 +381,38 @@ p[4]*numpy.exp(-(p[5] + x)/p[6]))**2.0
       #  print 'dy: ', y
         return y
 
+    # Jacobians for the exponential families. p may hold one column of values per
+    # trace, so that all traces in a batch are evaluated at once. Each returns a list
+    # with the partial derivative of the function with respect to each parameter.
+
+    def exp0jac(self, p, x, C=None):
+        e = numpy.exp(-x/p[1])
+        return [e, p[0]*e*x/p[1]**2]
+
+    def expjac(self, p, x, C=None):
+        e = numpy.exp(-x/p[2])
+        return [numpy.ones_like(e), e, p[1]*e*x/p[2]**2]
+
+    def exptaujac(self, p, x, C=None):
+        e = numpy.exp(-x/p[2])
+        return [numpy.ones_like(e), 1.0 - e, -p[1]*e*x/p[2]**2]
+
+    def expsumjac(self, p, x, C=None):
+        e1 = numpy.exp(-x/p[2])
+        e2 = numpy.exp(-x/p[4])
+        return [numpy.ones_like(e1), e1, p[1]*e1*x/p[2]**2, e2, p[3]*e2*x/p[4]**2]
+
+    def expsum2jac(self, p, x, C=None):
+        e1 = numpy.exp(-x/C[0])
+        e2 = numpy.exp(-x/C[1])
+        return [numpy.ones_like(e1), e1, e2]
+
+    def exp2jac(self, p, x, C=None):
+        e1 = numpy.exp(-x/p[2])
+        e2 = numpy.exp(-x/p[4])
+        return [numpy.ones_like(e1), (1.0 - e1)**2.0, -2.0*p[1]*(1.0 - e1)*e1*x/p[2]**2,
+                1.0 - e2, -p[3]*e2*x/p[4]**2]
+
 
     def getClipData(self, x, y, t0, t1):
         """
@@ -404,7 +447,8 @@ p[4]*numpy.exp(-(p[5] + x)/p[6]))**2.0
         fitPlot       (optional) default=None
         plotInstance  (optional) default=None
         dataType      (optional) Options are ['xy', 'blocks']. Default='xy'
-        method        (optional) Options are ['curve_fit', 'fmin', 'simplex', 'Nelder-Mead', 'bfgs', 'TNC', 'SLSQP', 'COBYLA', 'L-BFGS-B', 'openopt']. Default='leastsq'
+        method        (optional) Options are ['curve_fit', 'fmin', 'simplex', 'Nelder-Mead', 'bfgs', 'TNC', 'SLSQP', 'COBYLA', 'L-BFGS-B', 'openopt', 'batch']. Default='leastsq'
+                      'batch' fits all traces together (see FitRegionBatch).
         bounds        (optional) default=None
         weights       (optional) default=None
         constraints   (optional) default=()
@@ -414,6 +458,9 @@ p[4]*numpy.exp(-(p[5] + x)/p[6]))**2.0
         FitRegion(1, 0, tdat, ydat, FitFunc = 'exp1')
         e.g., the first argument should be 1, but this axis is ignored if datatype is 'xy'
         """
+        if method == 'batch':
+            return self.FitRegionBatch(whichdata, thisaxis, tdat, ydat, t0=t0, t1=t1, fitFunc=fitFunc,
+                                       fitPars=fitPars, fixedPars=fixedPars, dataType=dataType, bounds=bounds)
         self.fitSum2Err = 0.0
         if t0 == t1:
             if plotInstance is not None and usingMPlot:
@@ -539,6 +586,253 @@ p[4]*numpy.exp(-(p[5] + x)/p[6]))**2.0
 #        print len(xp)
         return(xp, xf, yf, yn) # includes names with yn and range of tx
 
+    def FitRegionBatch(self, whichdata, thisaxis, tdat, ydat, t0 = None, t1 = None,
+                       fitFunc = 'exp1', fitPars = None, fixedPars = None, dataType = 'xy',
+                       bounds = None, warmStart = True, workers = 1, batchSize = 500,
+                       ftol = 1.49012e-8, xtol = 1.49012e-8):
+        """
+        Fit all traces selected by whichdata at once. The arguments and return value
+        are the same as for FitRegion, but rather than calling leastsq for each trace,
+        the traces are stacked (shorter ones are zero-weighted past their end) and
+        solved together by a vectorized Levenberg-Marquardt loop. Each iteration
+        evaluates the function and its Jacobian for every trace in one call.
+        The Jacobian is analytic for the functions in self.fitjacmap and is computed
+        by forward differences otherwise. Bounds are enforced by clipping the
+        parameters after each step. 'exppulse' cannot be evaluated for several traces
+        at once, so it is passed on to FitRegion.
+
+        **Additional arguments**
+        ============= ===================================================
+        warmStart     (optional) If True, after the first solve every trace is
+                      re-fit starting from the parameters of a neighbouring trace
+                      (in the order given by whichdata), and the better of the two
+                      fits is kept. This avoids most of the local minima that
+                      leastsq can fall into for a single trace. Default=True
+        workers       (optional) Number of processes to distribute batches across,
+                      using pyqtgraph.multiprocess.Parallelize. Default=1
+        batchSize     (optional) Maximum number of traces solved together. Default=500
+        ftol, xtol    (optional) Relative tolerances for the sum of squares and for the
+                      parameters, as for leastsq.
+        ============= ===================================================
+
+        The sum of squared errors for every trace is stored in self.fitSum2Errs.
+        """
+        if fitFunc == 'exppulse':
+            return self.FitRegion(whichdata, thisaxis, tdat, ydat, t0=t0, t1=t1, fitFunc=fitFunc,
+                                  fitPars=fitPars, fixedPars=fixedPars, dataType=dataType, bounds=bounds,
+                                  method=None if bounds is None else 'SLSQP')
+        if t1 is None:
+            t1 = numpy.max(tdat)
+        if t0 is None:
+            t0 = numpy.min(tdat)
+        func = self.fitfuncmap[fitFunc]
+        jac = self.fitjacmap.get(fitFunc, None)
+        names = func[6]
+        if fitPars is None:
+            fpars = func[1]
+        else:
+            fpars = fitPars
+        if ydat.ndim == 1 or dataType == 'xy' or dataType == '2d':
+            nblock = 1
+        else:
+            nblock = ydat.shape[0]
+
+        # collect the traces exactly as FitRegion does
+        txs = []
+        dys = []
+        yn = []
+        for block in range(nblock):
+            for record in whichdata:
+                if dataType == 'blocks':
+                    (tx, dy) = self.getClipData(tdat[block], ydat[block][record, thisaxis, :], t0, t1)
+                elif ydat.ndim == 1:
+                    (tx, dy) = self.getClipData(tdat, ydat, t0, t1)
+                else:
+                    (tx, dy) = self.getClipData(tdat, ydat[record,:], t0, t1)
+                tx = numpy.array(tx)-t0
+                yn.append(names)
+                if not any(tx):
+                    continue # no data in the window...
+                txs.append(tx)
+                dys.append(numpy.array(dy, dtype=float))
+
+        nFit = len(txs)
+        nPar = len(fpars)
+        fits = numpy.empty((nFit, nPar))
+        errs = numpy.empty(nFit)
+        if nFit == 0:
+            self.fitSum2Errs = errs
+            self.fitSum2Err = 0.0
+            return ([], [], [], yn)
+        lower = numpy.empty(nPar)
+        upper = numpy.empty(nPar)
+        lower[:] = -numpy.inf
+        upper[:] = numpy.inf
+        if bounds is not None:
+            for j, b in enumerate(bounds):
+                if b[0] is not None:
+                    lower[j] = b[0]
+                if b[1] is not None:
+                    upper[j] = b[1]
+        guess = numpy.tile(numpy.array(fpars, dtype=float), (nFit, 1))
+        maxIter = max(1, func[2] // (nPar + 1))  # func[2] is the leastsq maxfev
+        lengths = numpy.array([len(tx) for tx in txs])
+        batches = [numpy.arange(i, min(i+batchSize, nFit)) for i in range(0, nFit, batchSize)]
+
+        def runBatch(inds):
+            nPts = lengths[inds].max()
+            x = numpy.zeros((len(inds), nPts))
+            y = numpy.zeros((len(inds), nPts))
+            w = numpy.zeros((len(inds), nPts))
+            for j, i in enumerate(inds):
+                n = lengths[i]
+                x[j, :n] = txs[i]
+                x[j, n:] = txs[i][-1]
+                y[j, :n] = dys[i]
+                w[j, :n] = 1
+            lb = numpy.tile(lower, (len(inds), 1))
+            ub = numpy.tile(upper, (len(inds), 1))
+            fit, err = self._lmBatch(func[0], jac, x, y, w, guess[inds], lb, ub, fixedPars, ftol, xtol, maxIter)
+            if warmStart and len(inds) > 1:
+                # re-fit each trace starting from whichever neighbour's fit describes it
+                # better, keeping the result if it improves on the trace's own fit
+                redo = numpy.arange(len(inds))
+                for n in range(3):
+                    cand = numpy.empty((2,) + fit.shape)
+                    cand[0, 1:] = fit[:-1]
+                    cand[0, 0] = fit[1]
+                    cand[1, :-1] = fit[1:]
+                    cand[1, -1] = fit[-2]
+                    candErr = numpy.array([self._batchCost(func[0], c[redo], x[redo], y[redo], w[redo], fixedPars)
+                                           for c in cand])
+                    pick = numpy.argmin(numpy.where(numpy.isfinite(candErr), candErr, numpy.inf), axis=0)
+                    fit2, err2 = self._lmBatch(func[0], jac, x[redo], y[redo], w[redo], cand[pick, redo],
+                                               lb[redo], ub[redo], fixedPars, ftol, xtol, maxIter)
+                    better = err2 < err[redo] * (1.0 - 1e-6)
+                    improved = redo[better]
+                    fit[improved] = fit2[better]
+                    err[improved] = err2[better]
+                    # only the neighbours of traces that changed need another try
+                    redo = numpy.union1d(improved - 1, improved + 1)
+                    redo = redo[(redo >= 0) & (redo < len(inds))]
+                    if len(redo) == 0:
+                        break
+            return fit, err
+
+        if workers > 1 and len(batches) > 1:
+            from acq4.pyqtgraph.multiprocess import Parallelize
+            results = []
+            with Parallelize(tasks=range(len(batches)), workers=workers, results=results) as tasker:
+                for i in tasker:
+                    tasker.results.append((i, runBatch(batches[i])))
+            for i, (fit, err) in results:
+                fits[batches[i]] = fit
+                errs[batches[i]] = err
+        else:
+            for inds in batches:
+                fits[inds], errs[inds] = runBatch(inds)
+
+        xp = []
+        xf = []
+        yf = []
+        for i in range(nFit):
+            tx = txs[i]
+            xfit = numpy.arange(tx.min(), tx.max(), (tx.max()-tx.min())/100.0)
+            yfit = func[0](fits[i], xfit, C=fixedPars)
+            xp.append(fits[i])
+            xf.append(xfit)
+            yf.append(yfit)
+        self.fitSum2Errs = errs
+        self.fitSum2Err = errs[-1]
+        return(xp, xf, yf, yn)
+
+    def _batchEval(self, f, v, x, C):
+        """ evaluate f for every row of parameters in v against the matching row of x """
+        return f([v[:, k:k+1] for k in range(v.shape[1])], x, C=C)
+
+    def _batchCost(self, f, v, x, y, w, C):
+        return (((y - self._batchEval(f, v, x, C)) * w)**2).sum(axis=1)
+
+    def _lmBatch(self, f, jac, x, y, w, guess, lower, upper, C, ftol, xtol, maxIter):
+        """
+        Levenberg-Marquardt solver for many independent fits of the function f.
+        Rows of x, y and w (1 for valid samples, 0 for padding) belong to the
+        matching row of guess. Returns the fit parameters and the sum of squared
+        errors for each row.
+        """
+        nFit, nPar = guess.shape
+        v = numpy.clip(guess, lower, upper)
+        # solve for parameters scaled by the magnitude of the initial guess
+        scale = numpy.abs(guess)
+        scale[scale == 0] = 1.0
+        res = (y - self._batchEval(f, v, x, C)) * w
+        cost = (res**2).sum(axis=1)
+        lam = numpy.ones(nFit) * 1e-3
+        nu = numpy.ones(nFit) * 2.0
+        active = numpy.isfinite(cost)
+        diagInds = numpy.arange(nPar)
+        eps = numpy.sqrt(numpy.finfo(float).eps)
+
+        for i in range(maxIter):
+            idx = numpy.argwhere(active)[:, 0]
+            if len(idx) == 0:
+                break
+            vi = v[idx]
+            xi = x[idx]
+            if jac is not None:
+                J = jac([vi[:, k:k+1] for k in range(nPar)], xi, C=C)
+            else:
+                f0 = y[idx] - res[idx]  # function values (padding is masked out below)
+                J = []
+                for k in range(nPar):
+                    h = eps * numpy.abs(vi[:, k:k+1])
+                    h[h == 0] = eps
+                    v2 = vi.copy()
+                    v2[:, k:k+1] += h
+                    J.append((self._batchEval(f, v2, xi, C) - f0) / h)
+            J = numpy.array(numpy.broadcast_arrays(*J)) * (w[idx] * scale[idx].T[:, :, numpy.newaxis])
+            A = numpy.einsum('ien,jen->eij', J, J)
+            g = numpy.einsum('ien,en->ei', J, res[idx])
+            diag = A[:, diagInds, diagInds]
+            diag = numpy.maximum(diag, diag.max(axis=1)[:, numpy.newaxis] * 1e-12 + 1e-300)
+            damped = A.copy()
+            damped[:, diagInds, diagInds] += lam[idx, numpy.newaxis] * diag
+            try:
+                step = numpy.linalg.solve(damped, g[..., numpy.newaxis])[..., 0]
+            except numpy.linalg.LinAlgError:
+                step = numpy.array([numpy.linalg.lstsq(damped[j], g[j], rcond=None)[0] for j in range(len(idx))])
+            predicted = 2 * (step * g).sum(axis=1) - numpy.einsum('ei,eij,ej->e', step, A, step)
+            vNew = numpy.clip(vi + step * scale[idx], lower[idx], upper[idx])
+            resNew = (y[idx] - self._batchEval(f, vNew, xi, C)) * w[idx]
+            costNew = (resNew**2).sum(axis=1)
+
+            better = costNew < cost[idx]
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                reduction = (cost[idx] - costNew) / cost[idx]
+                predicted /= cost[idx]
+                stepSize = numpy.sqrt((((vNew - vi) / scale[idx])**2).sum(axis=1))
+                size = numpy.sqrt(((vi / scale[idx])**2).sum(axis=1))
+            acc = idx[better]
+            v[acc] = vNew[better]
+            res[acc] = resNew[better]
+            cost[acc] = costNew[better]
+            # adjust damping by how well the linear model predicted the reduction (Nielsen, 1999)
+            rho = numpy.clip(reduction[better] / predicted[better], 0, 1)
+            lam[acc] *= numpy.maximum(1.0/3.0, 1.0 - (2.0*rho - 1.0)**3)
+            nu[acc] = 2.0
+            rej = idx[~better]
+            lam[rej] *= nu[rej]
+            nu[rej] *= 2.0
+
+            # converged when the relative reduction in cost (actual and predicted), or
+            # the relative step, is small, as in leastsq
+            fdone = ~(reduction > ftol) & ~(predicted > ftol)
+            xdone = stepSize <= xtol * size
+            done = (better & (fdone | xdone)) | (cost[idx] == 0) | (lam[idx] > 1e10)
+            active[idx[done]] = False
+
+        return v, cost
+
     def FitPlot(self, xFit = None, yFit = None, fitFunc = 'exp1',
                 fitPars = None, fixedPars = None, fitPlot=None, plotInstance = None, 
                 color=None):
@@ -42,6 +42,27 @@ class DataMapping:
         scale = self.scale[chan]
         offset = self.offset[chan]
         return (data + offset) * scale
+        
+    def _isLinear(self):
+        return getattr(self.__class__.mapFromDaq, 'im_func', None) is DataMapping.__dict__['mapFromDaq']
+        
+    def mapFromDaqType(self, chan, data):
+        """Return the dtype of the array that mapFromDaq(chan, data) would return,
+        or None if it cannot be determined without doing the mapping (subclasses
+        that override mapFromDaq)."""
+        if not self._isLinear():
+            return None
+        return np.result_type(data, self.offset[chan], self.scale[chan])
+        
+    def mapFromDaqInto(self, chan, data, out):
+        """Write mapFromDaq(chan, data) into the array *out*. The default linear
+        mapping is applied in place without allocating temporary arrays."""
+        if not self._isLinear():
+            out[...] = self.mapFromDaq(chan, data)
+            return out
+        np.add(data, self.offset[chan], out=out)
+        out *= self.scale[chan]
+        return out
             
 
 class ChannelHandle(object):
@@ -261,14 +282,52 @@ class DAQGeneric(Device):
             
             
 
+_timeValuesCache = [None, None]
+
+def timeValues(nPts, rate):
+    """Return the time values for an acquisition of *nPts* samples at *rate*.
+    Consecutive trials nearly always share the same values, so the most recent
+    array is reused; it is read-only since it is shared between results."""
+    key, vals = _timeValuesCache
+    if key != (nPts, rate):
+        vals = np.linspace(0, float(nPts-1) / float(rate), nPts)
+        vals.flags.writeable = False
+        _timeValuesCache[:] = [(nPts, rate), vals]
+    return vals
+
+
 class DAQGenericTask(DeviceTask):
     def __init__(self, dev, cmd, parentTask):
         DeviceTask.__init__(self, dev, cmd, parentTask)
         self.daqTasks = {}
         self.initialState = {}
         self._DAQCmd = cmd
+        self._structure = self._channelStructure(cmd)
         ## Stores the list of channels that will generate or acquire buffered samples
         self.bufferedChannels = []
+        ## Last waveform (in DAQ units) written to each output channel
+        self._waveforms = {}
+
+    @staticmethod
+    def _channelStructure(cmd):
+        ## the parts of a command that determine which DAQ channels are created
+        return dict([(ch, (cmd[ch].get('record', False), cmd[ch].get('command', None) is not None, cmd[ch].get('lowLevelConf', {}))) for ch in cmd])
+
+    def update(self, cmd):
+        ## Subclasses that build their DAQ command from a device-specific
+        ## command must override this method and call updateDAQCommand().
+        if type(self) is not DAQGenericTask:
+            return False
+        return self.updateDAQCommand(cmd)
+
+    def updateDAQCommand(self, cmd):
+        """Accept a new DAQ command for this task (see DeviceTask.update).
+        The command must create the same DAQ channels as the previous one;
+        only waveforms and holding values may differ."""
+        if self._channelStructure(cmd) != self._structure:
+            return False
+        self._DAQCmd = cmd
+        return True
         
     def getConfigOrder(self):
         """return lists of devices that should be configured (before, after) this device"""
@@ -350,27 +409,17 @@ class DAQGenericTask(DeviceTask):
             self.bufferedChannels.append(ch)
             #_DAQCmd[ch]['task'] = daqTask  ## ALSO DON't FORGET TO DELETE IT, ASS.
             if chConf['type'] in ['ao', 'do']:
-                #scale = self.getChanScale(ch)
-                cmdData = self._DAQCmd[ch]['command']
+                cmdData = self._daqWaveform(ch, chConf['type'])
                 if cmdData is None:
                     #print "No command for channel %s, skipping." % ch
                     continue
-                #cmdData = cmdData * scale
-                    
-                ## apply scale, offset or inversion for output lines
-                cmdData = self.mapping.mapToDaq(ch, cmdData)
-                #print "channel", chConf['channel'][1], cmdData
-                
-                if chConf['type'] == 'do':
-                    cmdData = cmdData.astype(np.uint32)
-                    cmdData[cmdData<=0] = 0
-                    cmdData[cmdData>0] = 0xFFFFFFFF
                 
                 #print "channel", self._DAQCmd[ch]
                 #print "LOW LEVEL:", self._DAQCmd[ch].get('lowLevelConf', {})
                 daqTask.addChannel(chConf['channel'], chConf['type'], **self._DAQCmd[ch].get('lowLevelConf', {}))
                 self.daqTasks[ch] = daqTask  ## remember task so we can stop it later on
                 daqTask.setWaveform(chConf['channel'], cmdData)
+                self._waveforms[ch] = cmdData
                 #print "DO task %s has type" % ch, cmdData.dtype
             elif chConf['type'] == 'ai':
                 mode = chConf.get('mode', None)
@@ -383,7 +432,37 @@ class DAQGenericTask(DeviceTask):
                 daqTask.addChannel(chConf['channel'], chConf['type'], **self._DAQCmd[ch].get('lowLevelConf', {}))
                 self.daqTasks[ch] = daqTask  ## remember task so we can stop it later on
                 
+    def updateChannels(self, daqTask):
+        """Called instead of createChannels when *daqTask* is being reused
+        for a new command. Only output waveforms that differ from those
+        previously written are sent to the DAQ."""
+        chans = self.dev.listChannels()
+        for ch, task in self.daqTasks.items():
+            if task is not daqTask or ch not in self._waveforms:
+                continue
+            cmdData = self._daqWaveform(ch, chans[ch]['type'])
+            if cmdData is None or np.array_equal(cmdData, self._waveforms[ch]):
+                continue
+            daqTask.setWaveform(chans[ch]['channel'], cmdData)
+            self._waveforms[ch] = cmdData
+
+    def _daqWaveform(self, ch, chanType):
+        ## Return the command waveform for an output channel, in DAQ units
+        #scale = self.getChanScale(ch)
+        cmdData = self._DAQCmd[ch]['command']
+        if cmdData is None:
+            return None
+        #cmdData = cmdData * scale
+            
+        ## apply scale, offset or inversion for output lines
+        cmdData = self.mapping.mapToDaq(ch, cmdData)
+        #print "channel", chConf['channel'][1], cmdData
         
+        if chanType == 'do':
+            cmdData = cmdData.astype(np.uint32)
+            cmdData[cmdData<=0] = 0
+            cmdData[cmdData>0] = 0xFFFFFFFF
+        return cmdData
         
     def getChanUnits(self, chan):
         if 'units' in self._DAQCmd[chan]:
@@ -427,26 +506,35 @@ class DAQGenericTask(DeviceTask):
         result = {}
         for ch in self.bufferedChannels:
             result[ch] = self.daqTasks[ch].getData(self.dev._DGConfig[ch]['channel'])
-            result[ch]['data'] = self.mapping.mapFromDaq(ch, result[ch]['data']) ## scale/offset/invert
             result[ch]['units'] = self.getChanUnits(ch)
         
         if len(result) > 0:
             meta = result[result.keys()[0]]['info']
             rate = meta['rate']
             nPts = meta['numPts']
-            ## Create an array of time values
-            timeVals = np.linspace(0, float(nPts-1) / float(rate), nPts)
+            timeVals = timeValues(nPts, rate)
             
-            ## Concatenate all channels together into a single array, generate MetaArray info
-            chanList = [np.atleast_2d(result[x]['data']) for x in result]
+            ## Scale/offset/invert each channel directly into its row of a single
+            ## preallocated array rather than concatenating mapped copies.
+            ## Mappings that can't report their output type are applied up front.
+            mapped = {}
+            dtypes = []
+            for ch in result:
+                data = result[ch]['data']
+                if data.shape != (nPts,):
+                    raise Exception("Data for channel %s has shape %s; expected (%d,)" % (ch, str(data.shape), nPts))
+                dtype = self.mapping.mapFromDaqType(ch, data)
+                if dtype is None:
+                    mapped[ch] = self.mapping.mapFromDaq(ch, data)
+                    dtype = mapped[ch].dtype
+                dtypes.append(dtype)
+            arr = np.empty((len(result), nPts), dtype=np.result_type(*dtypes))
+            for i, ch in enumerate(result):
+                if ch in mapped:
+                    arr[i] = mapped.pop(ch)
+                else:
+                    self.mapping.mapFromDaqInto(ch, result[ch]['data'], arr[i])
             cols = [(x, result[x]['units']) for x in result]
-            # print cols
-            try:
-                arr = np.concatenate(chanList)
-            except:
-                print chanList
-                print [a.shape for a in chanList]
-                raise
             
             daqState = OrderedDict()
             for ch in self.dev._DGConfig:
@@ -463,8 +551,11 @@ class DAQGenericTask(DeviceTask):
             info = [axis(name='Channel', cols=cols), axis(name='Time', units='s', values=timeVals)] + [{'DAQ': daqState}]
             
             
-            protInfo = self._DAQCmd.copy()  ## copy everything but the command arrays and low-level configuration info
+            ## copy everything but the command arrays and low-level configuration info
+            ## (channel commands are copied as well, since the command may be reused)
+            protInfo = self._DAQCmd.copy()
             for ch in protInfo:
+                protInfo[ch] = protInfo[ch].copy()
                 protInfo[ch].pop('command', None)
                 protInfo[ch].pop('lowLevelConf', None)
             info[-1]['Protocol'] = protInfo
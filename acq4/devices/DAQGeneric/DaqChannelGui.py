@@ -2,7 +2,6 @@
 
 from PyQt4 import QtGui, QtCore
 import AOChannelTemplate, DOChannelTemplate, InputChannelTemplate
-from acq4.util.SequenceRunner import *
 import numpy
 import weakref
 from acq4.pyqtgraph import siFormat, SpinBox, WidgetGroup
@@ -215,12 +214,9 @@ class OutputChannelGui(DaqChannelGui):
         self.clearPlots()
         
         ## display sequence waves
-        params = {}
-        ps = self.ui.waveGeneratorWidget.listSequences()
-        for k in ps:
-            params[k] = range(len(ps[k]))
-        waves = []
-        runSequence(lambda p: waves.append(self.getSingleWave(p)), params, params.keys()) ## appends waveforms for the entire parameter space to waves
+        waves = self.getSequenceWaves()
+        if waves is None:
+            waves = []
 
         autoRange = self.plot.getViewBox().autoRangeEnabled()
         self.plot.enableAutoRange(x=False, y=False)
@@ -265,6 +261,15 @@ class OutputChannelGui(DaqChannelGui):
         wave = self.ui.waveGeneratorWidget.getSingle(self.rate, self.numPts, params)
         
         return wave
+
+    def getSequenceWaves(self):
+        """Return an array (nSeq, nPts) of the waveforms for the entire parameter space,
+        or None if no waveform is generated."""
+        h = self.getHoldingValue()
+        if h is not None:
+            self.ui.waveGeneratorWidget.setOffset(h)
+        
+        return self.ui.waveGeneratorWidget.getSequenceArray(self.rate, self.numPts)
         
     def holdingCheckChanged(self, *v):
         self.ui.holdingSpin.setEnabled(self.ui.holdingCheck.isChecked())
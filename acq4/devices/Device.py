@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
-import time, traceback, sys, weakref
+import time, traceback, sys, weakref, threading
 from PyQt4 import QtCore, QtGui
 from acq4.util.Mutex import Mutex
 from acq4.util.debug import *
 
 class Device(QtCore.QObject):
     """Abstract class defining the standard interface for Device subclasses."""
+    
+    ## per-thread record of reservations borrowed from another thread (see delegateReservations)
+    _delegation = threading.local()
+    
     def __init__(self, deviceManager, config, name):
         QtCore.QObject.__init__(self)
 
@@ -16,6 +20,13 @@ class Device(QtCore.QObject):
         # don't have a good solution for this problem at present..
         self._lock_ = Mutex(QtCore.QMutex.Recursive)
         self._lock_tb_ = None
+        self._lock_state_ = threading.Lock()  # protects _lock_owner_ and _lock_depth_
+        self._lock_owner_ = None  # ident of the thread holding the reservation
+        self._lock_depth_ = 0
+        # Nested reservations by the owner and reservations used by delegate threads 
+        # (see delegateReservations) acquire this lock as well, so that only one of
+        # these threads uses the device at a time.
+        self._use_lock_ = Mutex(QtCore.QMutex.Recursive)
         self.dm = deviceManager
         self.dm.declareInterface(name, ['device'], self)
         self._name = name
@@ -70,8 +81,33 @@ class Device(QtCore.QObject):
         fileName = os.path.join(self.configPath(), filename)
         return self.dm.appendConfigFile(data, fileName)
 
+    @staticmethod
+    def delegateReservations(owner):
+        """Allow the calling thread to use all device reservations held by the
+        thread with ident *owner*. 
+        
+        This is used by Task to configure devices from worker threads while
+        the thread executing the task holds the reservations; the owner must
+        not release its reservations while the calling thread uses them.
+        The delegate threads and the owner still use each device one at a
+        time: reserve() blocks while another of these threads has reserved
+        the same device.
+        """
+        Device._delegation.owner = owner
+        Device._delegation.held = {}
+    
     def reserve(self, block=True, timeout=20):
         #print "Device %s attempting lock.." % self.name()
+        delegation = Device._delegation
+        if getattr(delegation, 'owner', None) is not None:
+            with self._lock_state_:
+                delegated = delegation.owner == self._lock_owner_
+            if delegated:
+                if not self._reserveUse(block, timeout):
+                    return False
+                delegation.held[self] = delegation.held.get(self, 0) + 1
+                return True
+        
         if block:
             l = self._lock_.tryLock(int(timeout*1000))
             if not l:
@@ -87,14 +123,54 @@ class Device(QtCore.QObject):
                 #print "  Device is currently locked from:"
                 #print self._lock_tb_
                 #raise Exception("Could not acquire lock", 1)  ## 1 indicates failed non-blocking attempt
+        with self._lock_state_:
+            nested = self._lock_depth_ > 0
+            self._lock_owner_ = threading.current_thread().ident
+            self._lock_depth_ += 1
+        if nested:
+            ## the owner may share this reservation with delegate threads
+            try:
+                ok = self._reserveUse(block, timeout)
+            except:
+                self._releaseReservation()
+                raise
+            if not ok:
+                self._releaseReservation()
+                return False
         self._lock_tb_ = ''.join(traceback.format_stack()[:-1])
         #print "Device %s lock ok" % self.name()
         return True
         
+    def _reserveUse(self, block, timeout):
+        if block:
+            if not self._use_lock_.tryLock(int(timeout*1000)):
+                raise Exception("Timed out waiting for device lock for %s" % self.name())
+            return True
+        return self._use_lock_.tryLock()
+        
+    def _releaseReservation(self):
+        ## Release one level of the reservation held by the calling thread.
+        ## Return True if the reservation is still held (the released level was nested).
+        nested = False
+        with self._lock_state_:
+            if self._lock_owner_ == threading.current_thread().ident:
+                self._lock_depth_ -= 1
+                nested = self._lock_depth_ > 0
+                if not nested:
+                    self._lock_owner_ = None
+        self._lock_.unlock()
+        self._lock_tb_ = None
+        return nested
+        
     def release(self):
+        held = getattr(Device._delegation, 'held', {})
+        if held.get(self, 0) > 0:
+            held[self] -= 1
+            self._use_lock_.unlock()
+            return
         try:
-            self._lock_.unlock()
-            self._lock_tb_ = None
+            if self._releaseReservation():
+                self._use_lock_.unlock()
         except:
             printExc("WARNING: Failed to release device lock for %s" % self.name())
             
@@ -129,7 +205,23 @@ class DeviceTask(object):
         
     def parentTask(self):
         return self.__parentTask()
-    
+
+    def update(self, cmd):
+        """
+        Called by the parent task when it is about to be executed again with
+        a new command (see Task.update). Return True if this DeviceTask has
+        accepted *cmd* and can be reused, or False if a new DeviceTask must
+        be created for it.
+
+        Reusing a DeviceTask allows devices to keep their configuration (for
+        example, DAQ channels and sample clocks) between repeated runs of the
+        same protocol and only update what has changed. Reused tasks will have
+        configure() called again before each run.
+
+        By default, this method returns False.
+        """
+        return False
+
     def getConfigOrder(self):
         """
         This method is called by the parent task before configuration and allows 
@@ -182,11 +182,13 @@ class LaserTaskGui(DAQGenericTaskGui):
     
     def getChannelCmds(self, powerWave, rate):
         key = id(powerWave)
-        if key in self.cache:
-            rawCmds = self.cache[key]
+        ## keep a reference to powerWave with its commands; otherwise its id may be 
+        ## reused by a new waveform after the stim generator discards it from its cache
+        if key in self.cache and self.cache[key][0] is powerWave:
+            rawCmds = self.cache[key][1]
         else:
             rawCmds = self.dev.getChannelCmds({'powerWaveform':powerWave}, rate) ## returns {'shutter': array(...), 'qSwitch':array(..), 'pCell':array(...)}
-            self.cache[key] = rawCmds
+            self.cache[key] = (powerWave, rawCmds)
         return rawCmds
         
     
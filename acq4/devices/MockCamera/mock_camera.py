@@ -19,7 +19,8 @@ class MockCamera(Camera):
         self.camLock = Mutex(Mutex.Recursive)  ## Lock to protect access to camera
         self.ringSize = 100
         self.frameId = 0
-        self.noise = np.random.normal(size=10000000, loc=100, scale=10)  ## pre-generate noise for use in images
+        sensorSize = tuple(config.get('sensorSize', (512, 512)))
+        w, h = sensorSize
         
         if 'images' in config:
             self.bgData = {}
@@ -45,10 +46,10 @@ class MockCamera(Camera):
             ('binningY',        1),
             ('regionX',         0),
             ('regionY',         0),
-            ('regionW',         512),
-            ('regionH',         512),
+            ('regionW',         w),
+            ('regionH',         h),
             ('gain',            1.0),
-            ('sensorSize',      (512, 512)),
+            ('sensorSize',      sensorSize),
             ('bitDepth',        16),
         ])
             
@@ -59,10 +60,10 @@ class MockCamera(Camera):
             #('region',          ([(0, 511), (0, 511), (1, 512), (1, 512)], True, True, [])),
             ('binningX',        (range(1,10), True, True, [])),
             ('binningY',        (range(1,10), True, True, [])),
-            ('regionX',         ((0, 511), True, True, ['regionW'])),
-            ('regionY',         ((0, 511), True, True, ['regionH'])),
-            ('regionW',         ((1, 512), True, True, ['regionX'])),
-            ('regionH',         ((1, 512), True, True, ['regionY'])),
+            ('regionX',         ((0, w-1), True, True, ['regionW'])),
+            ('regionY',         ((0, h-1), True, True, ['regionH'])),
+            ('regionW',         ((1, w), True, True, ['regionX'])),
+            ('regionH',         ((1, h), True, True, ['regionY'])),
             ('gain',            ((0.1, 10.0), True, True, [])),
             ('sensorSize',      (None, False, True, [])),
             ('bitDepth',        (None, False, True, [])),
@@ -89,14 +90,10 @@ class MockCamera(Camera):
         self.sigGlobalTransformChanged.connect(self.globalTransformChanged)
         
         ## generate list of mock cells
-        cells = np.zeros(20, dtype=[('x', float), ('y', float), ('size', float), ('value', float), ('rate', float), ('intensity', float), ('decayTau', float)])
-        cells['x'] = np.random.normal(size=cells.shape, scale=100e-6, loc=-1.5e-3)
-        cells['y'] = np.random.normal(size=cells.shape, scale=100e-6, loc=4.4e-3)
-        cells['size'] = np.random.normal(size=cells.shape, scale=2e-6, loc=10e-6)
-        cells['rate'] = np.random.lognormal(size=cells.shape, mean=0, sigma=1) * 1.0
-        cells['intensity'] = np.random.uniform(size=cells.shape, low=1000, high=10000)
-        cells['decayTau'] = np.random.uniform(size=cells.shape, low=15e-3, high=500e-3)
-        self.cells = cells
+        self.cells = mockCells(20, center=(-1.5e-3, 4.4e-3))
+        
+        ## renders frames; noise, background and cell footprints are precomputed
+        self.frameGen = MockFrameGenerator(self.cells, ringSize=self.ringSize)
         
     def setupCamera(self):
         pass
@@ -106,17 +103,32 @@ class MockCamera(Camera):
     
     def startCamera(self):
         self.cameraStarted = True
+        params = self.getParams(['region', 'binning', 'exposure'])
+        self.frameGen.configure(params['region'], params['binning'], params['exposure'], self.frameRate())
         self.lastFrameTime = ptime.time()
+        self.frameGen.start(self.lastFrameTime)
         
     def stopCamera(self):
         self.cameraStopped = True
         
-    def getNoise(self, shape):
-        n = shape[0] * shape[1]
-        s = np.random.randint(len(self.noise)-n)
-        d = self.noise[s:s+n]
-        d.shape = shape
-        return np.abs(d)
+    def frameRate(self):
+        """Return the rate at which frames are generated with the current exposure and binning.
+        
+        By default this simulates a camera with 40 ms readout time (reduced by binning). 
+        If *frameRate* is given in the device configuration, frames are generated at that 
+        rate instead (limited only by the exposure time).
+        """
+        exp = self.getParam('exposure')
+        rate = self.camConfig.get('frameRate', None)
+        if rate is not None:
+            return min(rate, 1.0 / exp)
+        bin = self.getParam('binning')
+        return 1.0 / (exp+(40e-3/(bin[0]*bin[1])))
+        
+    def sensorTransform(self):
+        """Return the affine matrix (2x3) that maps from global coordinates to sensor pixels."""
+        tr = pg.SRTTransform(pg.SRTTransform3D(self.inverseGlobalTransform()))
+        return np.array([[tr.m11(), tr.m21(), tr.dx()], [tr.m12(), tr.m22(), tr.dy()]])
         
     def getBackground(self):
         if self.background is None:
@@ -197,72 +209,10 @@ class MockCamera(Camera):
         
     def newFrames(self):
         """Return a list of all frames acquired since the last call to newFrames."""
-        prof = pg.debug.Profiler(disabled=True)
-        
-        now = ptime.time()
-        dt = now - self.lastFrameTime
-        exp = self.getParam('exposure')
-        bin = self.getParam('binning')
-        fps = 1.0 / (exp+(40e-3/(bin[0]*bin[1])))
-        nf = int(dt * fps)
-        if nf == 0:
-            return []
-        self.lastFrameTime = now + exp
-        
-        prof()
-        region = self.getParam('region') 
-        prof()
-        bg = self.getBackground()[region[0]:region[0]+region[2], region[1]:region[1]+region[3]]
-        prof()
-        
-        # Start with noise
-        shape = region[2:]
-        data = self.getNoise(shape)
-        #data = np.zeros(shape, dtype=float)
-        prof()
-        
-        # Add specimen
-        data += bg * (exp * 10)
-        prof()
-        
-        ## update cells
-        spikes = np.random.poisson(min(dt, 0.4) * self.cells['rate'])
-        self.cells['value'] *= np.exp(-dt / self.cells['decayTau'])
-        self.cells['value'] = np.clip(self.cells['value'] + spikes * 0.2, 0, 1)
-        data[data<0] = 0
-        
-        # draw cells
-        px = (self.pixelVectors()[0]**2).sum() ** 0.5
-        
-        # Generate transform that maps grom global coordinates to image coordinates
-        cameraTr = pg.SRTTransform3D(self.inverseGlobalTransform())
-        # note we use binning=(1,1) here because the image is downsampled later.
-        frameTr = self.makeFrameTransform(region, [1, 1]).inverted()[0]
-        tr = pg.SRTTransform(frameTr * cameraTr)
-        
-        for cell in self.cells:
-            w = cell['size'] / px
-            pos = pg.Point(cell['x'], cell['y'])
-            imgPos = tr.map(pos)
-            start = (int(imgPos.x()), int(imgPos.y()))
-            stop = (int(start[0]+w), int(start[1]+w))
-            val = cell['intensity'] * cell['value'] * self.getParam('exposure')
-            data[max(0,start[0]):max(0,stop[0]), max(0,start[1]):max(0,stop[1])] += val
-        
-        # Binning
-        if bin[0] > 1:
-            data = fn.downsample(data, bin[0], axis=0)
-        if bin[1] > 1:
-            data = fn.downsample(data, bin[1], axis=1)
-        data = data.astype(np.uint16)
-        prof()
-        
-        self.frameId += 1
-        frames = []
-        for i in range(nf):
-            frames.append({'data': data, 'time': now + (i / fps), 'id': self.frameId})
-        prof()
-        return frames
+        if self.background is None:
+            ## stage or objective moved; regenerate the specimen background
+            self.frameGen.setBackground(self.getBackground(), self.sensorTransform())
+        return self.frameGen.newFrames(ptime.time())
             
                 
     def quit(self):
@@ -349,6 +299,168 @@ class MockCameraTask(CameraTask):
         return data
         
 
+def mockCells(n=20, center=(0, 0)):
+    """Return a record array of *n* randomly placed mock cells scattered around *center* 
+    (in global coordinates)."""
+    cells = np.zeros(n, dtype=[('x', float), ('y', float), ('size', float), ('value', float), ('rate', float), ('intensity', float), ('decayTau', float)])
+    cells['x'] = np.random.normal(size=cells.shape, scale=100e-6, loc=center[0])
+    cells['y'] = np.random.normal(size=cells.shape, scale=100e-6, loc=center[1])
+    cells['size'] = np.random.normal(size=cells.shape, scale=2e-6, loc=10e-6)
+    cells['rate'] = np.random.lognormal(size=cells.shape, mean=0, sigma=1) * 1.0
+    cells['intensity'] = np.random.uniform(size=cells.shape, low=1000, high=10000)
+    cells['decayTau'] = np.random.uniform(size=cells.shape, low=15e-3, high=500e-3)
+    return cells
+
+
+def makeNoise(n):
+    """Return *n* samples of camera noise (uint16)."""
+    return np.round(np.abs(np.random.normal(size=n, loc=100, scale=10))).astype(np.uint16)
+
+
+class MockFrameGenerator(object):
+    """Generates synthetic frames for MockCamera.
+    
+    Frames are exposed by a free-running clock at a fixed rate; newFrames() renders 
+    every frame completed since the previous call. Like the ring buffer of a real camera,
+    at most *ringSize* frames are held; older frames are dropped and their ids skipped.
+    
+    Each frame is the sum of the specimen background (cropped, binned and scaled once per
+    configuration), a window into a precomputed bank of noise, and the mock cells, which 
+    are added in one pass from pixel footprints computed when the background or 
+    configuration changes. 
+    """
+    def __init__(self, cells, ringSize=100, noiseSize=4000000):
+        self.cells = cells
+        self.ringSize = ringSize
+        self.noise = makeNoise(noiseSize)
+        self.background = None
+        self.transform = None
+        self.region = None
+        self.binning = (1, 1)
+        self.exposure = 1e-3
+        self.fps = 1.0
+        self.frameId = 0
+        self.startTime = 0
+        self.lastIndex = -1
+        self.frameBg = None
+        
+    def setBackground(self, background, transform):
+        """Set the whole-sensor specimen image and the affine matrix (2x3) that maps 
+        from global coordinates to sensor pixels."""
+        self.background = background
+        self.transform = np.asarray(transform, dtype=float)
+        self.frameBg = None
+        
+    def configure(self, region, binning, exposure, fps):
+        self.region = tuple(region)
+        self.binning = tuple(binning)
+        self.exposure = exposure
+        self.fps = fps
+        self.frameBg = None
+        
+    def start(self, now):
+        """Start the frame clock."""
+        self.startTime = now
+        self.lastIndex = -1
+        
+    def newFrames(self, now):
+        """Return a list of all frames completed since the last call to newFrames.
+        
+        Each frame is a dict with keys 'data', 'time' (start of exposure) and 'id'."""
+        dt = 1.0 / self.fps
+        index = int((now - self.startTime) * self.fps) - 1   ## last completed frame
+        n = index - self.lastIndex
+        if n <= 0:
+            return []
+        
+        if self.frameBg is None:
+            self.prepare()
+            
+        ## frames that did not fit in the ring buffer are lost
+        drop = max(0, n - self.ringSize)
+        if drop > 0:
+            self.frameId += drop
+            self.updateCells(drop * dt)
+            
+        frames = []
+        for i in range(self.lastIndex + 1 + drop, index + 1):
+            self.updateCells(dt)
+            frames.append({'data': self.render(), 'time': self.startTime + i * dt, 'id': self.frameId})
+            self.frameId += 1
+        self.lastIndex = index
+        return frames
+    
+    def prepare(self):
+        """Compute the frame background and cell footprints for the current 
+        background and configuration."""
+        rgn = self.region
+        bin = self.binning
+        bg = self.background
+        if rgn is None:
+            rgn = (0, 0) + bg.shape[:2]
+        bg = bg[rgn[0]:rgn[0]+rgn[2], rgn[1]:rgn[1]+rgn[3]].astype(np.float32)
+        if bin[0] > 1:
+            bg = fn.downsample(bg, bin[0], axis=0)
+        if bin[1] > 1:
+            bg = fn.downsample(bg, bin[1], axis=1)
+        if len(self.noise) < 2 * bg.size:
+            self.noise = makeNoise(2 * bg.size)
+        
+        ## frames are summed as integers; clip so that background plus noise cannot overflow
+        bg *= self.exposure * 10
+        bg = np.clip(np.round(bg), 0, 65535 - int(self.noise.max()))
+        self.frameBg = np.ascontiguousarray(bg, dtype=np.uint16)
+        
+        ## map cells from global to frame coordinates
+        tr = self.transform.copy()
+        tr[:, 2] -= rgn[:2]
+        tr /= np.array(bin, dtype=float)[:, np.newaxis]
+        pos = np.dot(tr[:, :2], np.vstack([self.cells['x'], self.cells['y']])) + tr[:, 2:]
+        start = pos.astype(int)
+        ppm = (tr[:, :2]**2).sum(axis=1) ** 0.5   ## frame pixels per meter along each axis
+        stop = (start + self.cells['size'][np.newaxis, :] * ppm[:, np.newaxis]).astype(int)
+        shape = np.array(self.frameBg.shape)[:, np.newaxis]
+        start = np.clip(start, 0, shape)
+        stop = np.clip(stop, 0, shape)
+        
+        ## list the (pixel, cell) pairs covered by each cell
+        pix = []
+        cell = []
+        w = self.frameBg.shape[1]
+        for i in np.argwhere(((stop - start) > 0).all(axis=0))[:, 0]:
+            x, y = np.mgrid[start[0,i]:stop[0,i], start[1,i]:stop[1,i]]
+            pix.append((x * w + y).ravel())
+            cell.append(np.empty(pix[-1].shape, dtype=int))
+            cell[-1][:] = i
+        if len(pix) == 0:
+            self.cellPix = None
+            return
+        self.cellPix, self.cellPixIndex = np.unique(np.concatenate(pix), return_inverse=True)
+        self.cellPixCell = np.concatenate(cell)
+        
+    def updateCells(self, dt):
+        cells = self.cells
+        spikes = np.random.poisson(min(dt, 0.4) * cells['rate'])
+        cells['value'] *= np.exp(-dt / cells['decayTau'])
+        cells['value'] = np.clip(cells['value'] + spikes * 0.2, 0, 1)
+        
+    def render(self):
+        # Start with background plus noise 
+        bg = self.frameBg
+        n = bg.size
+        s = np.random.randint(len(self.noise)-n)
+        data = np.add(bg, self.noise[s:s+n].reshape(bg.shape))
+        
+        # draw cells
+        if self.cellPix is not None:
+            val = self.cells['intensity'] * self.cells['value'] * self.exposure
+            add = np.bincount(self.cellPixIndex, weights=val[self.cellPixCell], minlength=len(self.cellPix))
+            flat = data.reshape(n)
+            flat[self.cellPix] = np.minimum(flat[self.cellPix] + add, 65535)
+        
+        return data
+        
+        
 def mandelbrot(w=500, h=None, maxIter=20, xRange=(-2.0, 1.0), yRange=(-1.2, 1.2)):
     x0,x1 = xRange
     y0,y1 = yRange
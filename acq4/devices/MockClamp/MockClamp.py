@@ -163,6 +163,11 @@ class MockClamp(DAQGeneric):
         
 class MockClampTask(DAQGenericTask):
     def __init__(self, dev, cmd, parentTask):
+        DAQGenericTask.__init__(self, dev, self.daqCommand(cmd), parentTask)
+        
+        self.cmd = cmd
+
+    def daqCommand(self, cmd):
         ## make a few changes for compatibility with multiclamp        
         if 'daqProtocol' not in cmd:
             cmd['daqProtocol'] = {}
@@ -178,12 +183,13 @@ class MockClampTask(DAQGenericTask):
         
         
         cmd['daqProtocol']['primary'] = {'record': True, 'lowLevelConf': {'mockFunc': self.read}}
-        DAQGenericTask.__init__(self, dev, cmd['daqProtocol'], parentTask)
-        
-        self.cmd = cmd
+        return daqP
 
-        modPath = os.path.abspath(os.path.split(__file__)[0])
-        
+    def update(self, cmd):
+        if not self.updateDAQCommand(self.daqCommand(cmd)):
+            return False
+        self.cmd = cmd
+        return True
 
     def configure(self):
         ### Record initial state or set initial value
@@ -203,7 +209,8 @@ class MockClampTask(DAQGenericTask):
 
     def write(self, data, dt):
         ## Called by DAQGeneric to simulate a write-to-DAQ
-        self.job = self.dev.simulator.run({'data': data, 'dt': dt, 'mode': self.cmd['mode']}, _callSync='async')
+        cmd = {'data': data, 'dt': dt, 'mode': self.cmd['mode'], 'integrator': self.dev.config.get('integrator', 'fast')}
+        self.job = self.dev.simulator.run(cmd, _callSync='async')
 
     def isDone(self):
         ## check on neuron process
@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 """
-Simple Hodgkin-Huxley simulator for Python. VERY slow.
+Simple Hodgkin-Huxley simulator for Python.
 Includes Ih from Destexhe 1993 [disabled]
 Also simulates voltage clamp and current clamp with access resistance.
 
+Two integrators are provided with the same inputs and outputs:
+runSim() uses scipy.integrate.odeint (accurate, VERY slow) and runSimFast()
+uses fixed-step exponential Euler and can simulate many cells or sweeps at once.
+
 Luke Campagnola 2013
 """
 
+import math
 import numpy as np
 import scipy.integrate
 from PyQt4 import QtGui, QtCore
@@ -152,8 +157,170 @@ def runSim(initState, mode='ic', cmd=None, dt=0.1, dur=100, **args):
     return result  ## result is array with dims: [npts, (time, Ie, Ve, Vm, Im, m, h, n, f, s)]
 
 
+_gatingTables = {}
+
+def gatingTables(vmin=-150., vmax=150., res=50.):
+    """Return arrays [mInf, mRate, hInf, hRate, nInf, nRate] tabulated for
+    membrane potentials (in mV relative to rest) from vmin to vmax with *res*
+    points per mV. Rates are 1/tau in 1/ms."""
+    key = (vmin, vmax, res)
+    if key not in _gatingTables:
+        V = np.arange(int((vmax-vmin)*res)+1) / res + vmin
+        with np.errstate(invalid='ignore', divide='ignore'):
+            am = (2.5-0.1*V) / (np.exp(2.5-0.1*V) - 1.0)
+            an = (0.1 - 0.01*(V-gKShift)) / (np.exp(1.0 - 0.1*(V-gKShift)) - 1.0)
+        am[~np.isfinite(am)] = 1.0  ## limits at the removable singularities
+        an[~np.isfinite(an)] = 0.1
+        bm = 4. * np.exp(-V / 18.)
+        ah = 0.07 * np.exp(-V / 20.)
+        bh = 1.0 / (np.exp(3.0 - 0.1 * V) + 1.0)
+        bn = 0.125 * np.exp(-V / 80.)
+        _gatingTables[key] = [am/(am+bm), am+bm, ah/(ah+bh), ah+bh, an/(an+bn), an+bn]
+    return _gatingTables[key]
+
+
+def runSimFast(initState, mode='ic', cmd=None, dt=0.1, dur=100, step=0.05):
+    """Fixed-step alternative to runSim() with the same arguments and output.
+    
+    *step* is the maximum integration step in ms. Gating variables are updated
+    exactly for the current membrane potential (exponential Euler, using
+    tabulated rates), and the membrane potential is updated exactly for the
+    resulting conductances and a linearly changing command. The pipette
+    potential (time constant Raccess*Cpip, far below any practical step) is
+    assumed to follow the membrane at steady state; pipette capacitance is
+    still accounted for in the membrane and access currents.
+    
+    Several cells or sweeps may be simulated in one call by giving
+    *initState* with shape (N, 7) and/or *cmd* with shape (N, npts); the
+    result then has shape (N, npts, 9).
+    """
+    npts = int(dur/dt)
+    t = np.linspace(0, dur, npts)
+    if cmd is None:
+        mode = 'ic'
+        cmd = np.zeros(1)
+    cmd = np.asarray(cmd, dtype=float)
+    state = np.asarray(initState, dtype=float)
+    batch = cmd.ndim > 1 or state.ndim > 1
+    if batch:
+        nb = max([len(x) for x in (cmd, state) if x.ndim > 1])
+        cmd = np.broadcast_to(cmd, (nb, cmd.shape[-1])).T    # [time, cell]
+        state = np.broadcast_to(state, (nb, 7)).T            # [variable, cell]
+    
+    ## Integration substeps: split the output sample intervals at command samples
+    ## (the command is linearly interpolated between samples, as in hh()) and
+    ## then into pieces no longer than *step*.
+    cmdTimes = np.arange(int(dur / dt) + 1) * dt
+    bounds = np.union1d(t, cmdTimes[(cmdTimes > 0) & (cmdTimes < dur)])
+    bounds = bounds[np.concatenate([[True], np.diff(bounds) > 1e-9 * dt])]
+    nsub = np.maximum(1, np.ceil(np.diff(bounds) / step - 1e-9).astype(int))
+    hs = np.repeat(np.diff(bounds) / nsub, nsub)
+    ts = np.repeat(bounds[:-1], nsub) + (np.arange(len(hs)) - np.repeat(np.cumsum(nsub) - nsub, nsub)) * hs
+    ## record after the last substep that ends on each output sample
+    ends = np.cumsum(nsub) - 1
+    record = np.zeros(len(hs), dtype=bool)
+    record[ends[np.in1d(bounds[1:], t)]] = True
+    
+    def command(ti):
+        fInd = ti / dt
+        ind = np.minimum(len(cmd)-1, np.floor(fInd)).astype(int)
+        ind2 = np.minimum(len(cmd)-1, ind+1)
+        a = (fInd - ind)[(slice(None),) + (None,) * (cmd.ndim-1)]
+        return cmd[ind] * (1-a) + cmd[ind2] * a
+    cStart = command(ts)
+    slope = (command(ts + hs) - cStart) / (hs * 1e-3)[(slice(None),) + (None,) * (cmd.ndim-1)]   ## per second
+    
+    ## alpha-function synaptic conductance at the middle of each substep
+    tn = ts + 0.5 * hs - Alpha_t0
+    gAlphaT = np.where((tn >= 0) & (tn <= 10.0 * Alpha_tau), gAlpha * (tn/Alpha_tau) * np.exp(-(tn-Alpha_tau)/Alpha_tau), 0.)
+    
+    if mode == 'vc':
+        G = 50e-6  # arbitrary VC gain
+        k = (1./Raccess) / (G + 1./Raccess)  # fraction of pipette potential change due to membrane
+        gS = 1. / (Raccess + 1./G)           # conductance from clamp command to membrane
+        src = gS * cStart - Cpip * k * (1-k) * slope
+        dsrc = gS * slope
+    else:
+        k = 1.
+        gS = 0.
+        src = cStart
+        dsrc = slope
+    Ceff = C + Cpip * k**2
+    cEnd = cStart + slope * (hs * 1e-3)[(slice(None),) + (None,) * (cmd.ndim-1)]
+    
+    ## Inputs and state are plain floats for a single cell (much faster than
+    ## numpy scalars) or arrays over cells in batch mode
+    vmin, vmax, res = -150., 150., 50.
+    nTab = int((vmax-vmin)*res)
+    if batch:
+        exp = np.exp
+        tables = gatingTables(vmin, vmax, res)
+        Vm, m, h, n, f, s = [state[i].copy() for i in range(1, 7)]
+        def index(V):
+            return np.clip(((V + 65e-3) * 1000. - vmin) * res + 0.5, 0, nTab).astype(int)
+    else:
+        exp = math.exp
+        tables = [tb.tolist() for tb in gatingTables(vmin, vmax, res)]
+        src, dsrc, cEnd, slope = src.tolist(), dsrc.tolist(), cEnd.tolist(), slope.tolist()
+        Vm, m, h, n, f, s = [float(x) for x in state[1:]]
+        def index(V):
+            return min(nTab, max(0, int(((V + 65e-3) * 1000. - vmin) * res + 0.5)))
+    mInf, mRate, hInf, hRate, nInf, nRate = tables
+    gHfs = gH * f * s
+    gFixed = gL + gHfs + gS
+    gEFixed = gL * EL + gHfs * EH
+    
+    out = []
+    Vold = Vm
+    for i, (hsi, srci, dsrci, ga, rec) in enumerate(zip(hs.tolist(), src, dsrc, gAlphaT.tolist(), record.tolist())):
+        ## gating: exact update for the current membrane potential
+        x = index(Vm)
+        mi = mInf[x]; hi = hInf[x]; ni = nInf[x]
+        m = mi + (m - mi) * exp(-mRate[x] * hsi)
+        h = hi + (h - hi) * exp(-hRate[x] * hsi)
+        n = ni + (n - ni) * exp(-nRate[x] * hsi)
+        
+        ## membrane: exact update for constant conductances and a linearly changing source
+        gna = gNa * m*m*m * h
+        n2 = n*n
+        gk = gK * n2*n2
+        gtot = gna + gk + gFixed + ga
+        Vinf = (gna*ENa + gk*EK + gEFixed + ga*EAlpha + srci) / gtot
+        dVinf = dsrci / gtot
+        tau = Ceff / gtot
+        H = hsi * 1e-3
+        Vold = Vm
+        Vm = Vinf + dVinf * (H - tau) + (Vm - Vinf + dVinf * tau) * exp(-H / tau)
+        
+        if rec:
+            ## Compute electrode current sans pipette capacitance current
+            dVm = (Vm - Vold) / H
+            c = cEnd[i]
+            if mode == 'vc':
+                Iacc = gS * (c - Vm) - Cpip * k * (k * dVm + (1-k) * slope[i])
+            else:
+                Iacc = c - Cpip * dVm
+            out.append((Iacc, Vm + Raccess * Iacc, Vm, m, h, n, f, s))
+    
+    ## initial state is reported at t=0, with the access current at steady state
+    c0 = command(np.zeros(1))[0]
+    Vm0, m0, h0, n0 = state[1:5]
+    I0 = gS * (c0 - Vm0) if mode == 'vc' else c0 + np.zeros_like(Vm0)
+    out.insert(0, (I0, Vm0 + Raccess * I0, Vm0, m0, h0, n0, f, s))
+    
+    result = np.empty((npts,) + np.shape(Vm0) + (9,))
+    result[..., 1:] = np.array(out).reshape((npts, 8) + np.shape(Vm0)).transpose(*([0] + range(2, 2+np.ndim(Vm0)) + [1]))
+    result[..., 0] = t.reshape((npts,) + (1,) * np.ndim(Vm0))
+    if batch:
+        result = result.transpose(1, 0, 2)
+    return result  ## result is array with dims: [(cell,) npts, (time, Ie, Ve, Vm, m, h, n, f, s)]
+
+
 initState = [-65e-3, -65e-3, 0.05, 0.6, 0.3, 0.0, 0.0]
 
+## 'fast' (runSimFast) or 'odeint' (runSim); may be overridden per command
+integrator = 'fast'
+
 def run(cmd):
     """
     Accept command like 
@@ -162,6 +329,7 @@ def run(cmd):
             'dt': 1e-4,
             'mode': 'ic',
             'data': np.array([...]),
+            'integrator': 'fast',  # optional; 'fast' or 'odeint'
         }
         
     Return array of Vm or Im values.        
@@ -173,7 +341,10 @@ def run(cmd):
     data = cmd['data']
     mode = cmd['mode']
     
-    result = runSim(initState, cmd=data, mode=mode, dt=dt, dur=dt*len(data))
+    if cmd.get('integrator', integrator) == 'odeint':
+        result = runSim(initState, cmd=data, mode=mode, dt=dt, dur=dt*len(data))
+    else:
+        result = runSimFast(initState, cmd=data, mode=mode, dt=dt, dur=dt*len(data))
     
     initState = result[-1, 2:]
     if mode == 'ic':
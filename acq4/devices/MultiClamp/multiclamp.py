@@ -292,26 +292,39 @@ class MultiClampTask(DeviceTask):
         with self.dev.lock:
             self.usedChannels = None
             self.daqTasks = {}
+            self.cmdWaveform = None
+            self.checkCommand(self.cmd)
 
-            ## Sanity checks and default values for command:
-            
-            if ('mode' not in self.cmd) or (type(self.cmd['mode']) is not str) or (self.cmd['mode'].upper() not in ['IC', 'VC', 'I=0']):
-                raise Exception("Multiclamp command must specify clamp mode (IC, VC, or I=0)")
-            self.cmd['mode'] = self.cmd['mode'].upper()
-            
-            ## If primary and secondary modes are not specified, use default values
-            #### Disabled this -- just use whatever is currently in use.
-            #defaultModes = {
-                #'VC': {'primarySignal': 'Membrane Current', 'secondarySignal': 'Pipette Potential'},  ## MC700A does not have MembranePotential signal
-                #'IC': {'primarySignal': 'Membrane Potential', 'secondarySignal': 'Membrane Current'},
-                #'I=0': {'primarySignal': 'Membrane Potential', 'secondarySignal': None},
-            #}
-            for ch in ['primary', 'secondary']:
-                if ch not in self.cmd:
-                    self.cmd[ch] = None # defaultModes[self.cmd['mode']][ch]
-
-            #if 'command' not in self.cmd:
-                #self.cmd['command'] = None
+    @staticmethod
+    def checkCommand(cmd):
+        ## Sanity checks and default values for command:
+        
+        if ('mode' not in cmd) or (type(cmd['mode']) is not str) or (cmd['mode'].upper() not in ['IC', 'VC', 'I=0']):
+            raise Exception("Multiclamp command must specify clamp mode (IC, VC, or I=0)")
+        cmd['mode'] = cmd['mode'].upper()
+        
+        ## If primary and secondary modes are not specified, use default values
+        #### Disabled this -- just use whatever is currently in use.
+        #defaultModes = {
+            #'VC': {'primarySignal': 'Membrane Current', 'secondarySignal': 'Pipette Potential'},  ## MC700A does not have MembranePotential signal
+            #'IC': {'primarySignal': 'Membrane Potential', 'secondarySignal': 'Membrane Current'},
+            #'I=0': {'primarySignal': 'Membrane Potential', 'secondarySignal': None},
+        #}
+        for ch in ['primary', 'secondary']:
+            if ch not in cmd:
+                cmd[ch] = None # defaultModes[self.cmd['mode']][ch]
+
+        #if 'command' not in self.cmd:
+            #self.cmd['command'] = None
+
+    def update(self, cmd):
+        ## reuse this task (and its DAQ channels) if the new command uses the same channels
+        self.checkCommand(cmd)
+        with self.dev.lock:
+            if cmd.get('recordSecondary', True) != self.cmd.get('recordSecondary', True) or ('command' in cmd) != ('command' in self.cmd):
+                return False
+            self.cmd = cmd
+        return True
 
     def getConfigOrder(self):
         """return lists of devices that should be configured (before, after) this device"""
@@ -406,17 +419,31 @@ class MultiClampTask(DeviceTask):
                 if chConf['device'] == daqTask.devName():
                     if ch == 'command':
                         daqTask.addChannel(chConf['channel'], chConf['type'])
-                        scale = self.state['extCmdScale']
-                        #scale = self.dev.config['cmdScale'][self.cmd['mode']]
-                        if scale == 0.:
-                            raise Exception('Can not execute command--external command sensitivity is disabled by MultiClamp commander!', 'ExtCmdSensOff')  ## The second string is a hint for modules that don't care when this happens.
-                        cmdData = self.cmd['command'] / scale
-                        daqTask.setWaveform(chConf['channel'], cmdData)
+                        self.cmdWaveform = self.getCommandWaveform()
+                        daqTask.setWaveform(chConf['channel'], self.cmdWaveform)
                     else:
                         mode = chConf.get('mode', None)
                         daqTask.addChannel(chConf['channel'], chConf['type'], mode)
                     self.daqTasks[ch] = daqTask
         
+    def updateChannels(self, daqTask):
+        ## DAQ task is being reused; rewrite the command waveform only if it has changed
+        with self.dev.lock:
+            if self.daqTasks.get('command', None) is not daqTask:
+                return
+            cmdData = self.getCommandWaveform()
+            if not array_equal(cmdData, self.cmdWaveform):
+                daqTask.setWaveform(self.dev.config['commandChannel']['channel'], cmdData)
+                self.cmdWaveform = cmdData
+
+    def getCommandWaveform(self):
+        """Return the command waveform scaled for output to the DAQ."""
+        scale = self.state['extCmdScale']
+        #scale = self.dev.config['cmdScale'][self.cmd['mode']]
+        if scale == 0.:
+            raise Exception('Can not execute command--external command sensitivity is disabled by MultiClamp commander!', 'ExtCmdSensOff')  ## The second string is a hint for modules that don't care when this happens.
+        return self.cmd['command'] / scale
+        
     def start(self):
         ## possibly nothing required here, DAQ will start recording.
         pass
@@ -2,7 +2,6 @@
 from PyQt4 import QtCore, QtGui
 import sys
 from acq4.devices.Device import TaskGui
-from acq4.util.SequenceRunner import *
 from acq4.pyqtgraph.WidgetGroup import WidgetGroup
 import numpy
 from TaskTemplate import *
@@ -145,12 +144,9 @@ class MultiClampTaskGui(TaskGui):
         self.clearCmdPlots()
         
         ## compute sequence waves
-        params = {}
-        ps = self.ui.waveGeneratorWidget.listSequences()
-        for k in ps:
-            params[k] = range(len(ps[k]))
-        waves = []
-        runSequence(lambda p: waves.append(self.getSingleWave(p)), params, params.keys())
+        waves = self.getSequenceWaves()
+        if waves is None:
+            waves = []
 
         # Plot all waves but disable auto-range first to improve performance.
         autoRange = self.ui.bottomPlotWidget.getViewBox().autoRangeEnabled()
@@ -239,6 +235,12 @@ class MultiClampTaskGui(TaskGui):
         if wave is None:
             return None
         return wave
+
+    def getSequenceWaves(self):
+        ## return an array (nSeq, nPts) of the waveforms for the entire parameter space
+        h = self.stateGroup.state()['holdingSpin']
+        self.ui.waveGeneratorWidget.setOffset(h)
+        return self.ui.waveGeneratorWidget.getSequenceArray(self.rate, self.numPts)
         
         
     def getMode(self):
@@ -232,6 +232,24 @@ class Task(DeviceTask):
         
         ## Create supertask from nidaq driver
         self.st = self.dev.n.createSuperTask()
+        ## Input data is read into buffers owned by the driver tasks, which are
+        ## reused when this task is run again (see update()). Devices copy the
+        ## data out in getResult before the next run starts.
+        self.st.setReuseReadBuffers(self.dev.config.get('reuseReadBuffers', True))
+        self.channelsCreated = False
+
+    ## command keys that determine how the supertask is configured
+    configKeys = ['rate', 'numPts', 'triggerChan', 'triggerDevice']
+
+    def update(self, cmd):
+        ## The supertask (channels, clock and trigger) can be reused as long as
+        ## the timing and triggering are unchanged; devices update their own
+        ## waveforms in configure().
+        for k in self.configKeys:
+            if self.cmd.get(k, None) != cmd.get(k, None):
+                return False
+        self.cmd = cmd
+        return True
 
     def getChanSampleRate(self, ch):
         """Return the sample rate that will be used for ch"""
@@ -245,10 +263,19 @@ class Task(DeviceTask):
         
         ## Request to all devices that they create the channels they use on this task
         tasks = self.parentTask().tasks
+        if self.channelsCreated:
+            ## this task is being reused; channels, clock and trigger are
+            ## already configured, so only updated waveforms need to be set
+            for dName in tasks:
+                if hasattr(tasks[dName], 'updateChannels'):
+                    tasks[dName].updateChannels(self)
+            return
+        
         for dName in tasks:
             #print "Requesting %s create channels" % dName
             if hasattr(tasks[dName], 'createChannels'):
                 tasks[dName].createChannels(self)
+        self.channelsCreated = True
         
         ## If no devices requested buffered operations, then do not configure clock.
         ## This might eventually cause some triggering issues..
@@ -321,6 +348,8 @@ class Task(DeviceTask):
           'data': ndarray,
           'info': {'rate': xx, 'numPts': xx, ...}
         }
+        Unless the data was filtered or downsampled, it refers to the driver's
+        read buffer and is overwritten when this task runs again.
         """
         #prof = Profiler("    NiDAQ.getData")
         res = self.st.getResult(channel)
@@ -0,0 +1,76 @@
+import threading, time
+from acq4.Manager import Task
+from acq4.devices.Device import Device, DeviceTask
+
+
+class MockManager(object):
+    def __init__(self):
+        self.devices = {}
+
+    def declareInterface(self, *args):
+        pass
+
+    def getDevice(self, name):
+        return self.devices[name]
+
+    def lockReserv(self):
+        pass
+
+    def unlockReserv(self):
+        pass
+
+
+class MockDevice(Device):
+    """Device that records how many threads are using it at once."""
+    def __init__(self, dm, name, usesDaq):
+        Device.__init__(self, dm, {}, name)
+        self.usesDaq = usesDaq
+        self.active = 0
+        self.maxActive = 0
+        self.activeLock = threading.Lock()
+
+    def createTask(self, cmd, parentTask):
+        return MockDeviceTask(self, cmd, parentTask)
+
+    def use(self, duration):
+        with self.activeLock:
+            self.active += 1
+            self.maxActive = max(self.maxActive, self.active)
+        time.sleep(duration)
+        with self.activeLock:
+            self.active -= 1
+
+    def setChannelValue(self, value):
+        self.reserve(block=True)
+        try:
+            self.use(5e-3)
+        finally:
+            self.release()
+
+
+class MockDeviceTask(DeviceTask):
+    def getPrepTimeEstimate(self):
+        return 0
+
+    def configure(self):
+        if self.dev.usesDaq:
+            self.dev.dm.getDevice('DAQ').setChannelValue(0.0)
+        else:
+            self.dev.use(20e-3)
+
+
+def test_parallelConfigure():
+    ## The DAQ is configured at the same time as two devices that set values
+    ## on it; its own configure() must not overlap with their use of it.
+    dm = MockManager()
+    dm.devices['DAQ'] = MockDevice(dm, 'DAQ', False)
+    for name in ['Clamp1', 'Clamp2']:
+        dm.devices[name] = MockDevice(dm, name, True)
+    cmd = dict([(name, {}) for name in dm.devices])
+    cmd['protocol'] = {'duration': 0, 'parallelConfigure': True}
+    task = Task(dm, cmd)
+    for i in range(5):
+        task.execute(block=False)
+        task.stop()
+        assert len(task.configureTimes) == 3
+    assert dm.devices['DAQ'].maxActive == 1
@@ -12,7 +12,7 @@ if DEBUG:
 __all__ = ['MultiClampTelegraph', 'wmlib']
 
 ## Load windows definitions
-windowsDefs = winDefs() #verbose=True)
+windowsDefs = winDefs(lazy=True) #verbose=True)
 
 d = os.path.dirname(__file__)
 
@@ -21,7 +21,8 @@ teleDefs = CParser(
     #os.path.join(d, 'MultiClampBroadcastMsg.hpp'),
     copyFrom=windowsDefs,
     cache=os.path.join(d, 'MultiClampBroadcastMsg.hpp.cache'),
-    verbose=DEBUG
+    verbose=DEBUG,
+    lazy=True,  ## definitions are loaded on first use
 ) 
 
 ##  Windows Messaging API 
@@ -34,7 +35,8 @@ ax700ADefs = CParser(
     #os.path.join(d, 'MCTelegraphs.hpp'),
     copyFrom=windowsDefs,
     cache=os.path.join(d, 'MCTelegraphs.hpp.cache'),
-    verbose=DEBUG
+    verbose=DEBUG,
+    lazy=True,
 )
 
 class MultiClampTelegraph:
@@ -210,6 +212,7 @@ class MultiClampTelegraph:
                 if data.uHardwareType == wmlib.MCTG_HW_TYPE_MC700A:
                     if self.debug:
                         print "  processing MC700A mode", mode
+                    ax700ADefs.resolve()
                     if mode == 'VC':
                         priSignal = ax700ADefs.defs['values']['MCTG_OUT_MUX_VC_LONG_NAMES'][data.uScaledOutSignal]
                         secSignal = ax700ADefs.defs['values']['MCTG_OUT_MUX_VC_LONG_NAMES_RAW'][data.uRawOutSignal]
@@ -13,7 +13,7 @@ if DEBUG:
 __all__ = ['MultiClamp', 'axlib', 'getAxlib', 'wmlib']
 
 ## Load windows definitions
-windowsDefs = winDefs()  #verbose=True)
+windowsDefs = winDefs(lazy=True)  #verbose=True)
 
 # Load AxMultiClampMsg header
 d = os.path.dirname(__file__)
@@ -21,7 +21,8 @@ axonDefs = CParser(
     copyFrom=windowsDefs,
     cache=os.path.join(d, 'AxMultiClampMsg.h.cache'),
     macros={'EXPORT':''}, ## needed for reading version 2.2.0.x headers (64bit)
-    verbose=DEBUG
+    verbose=DEBUG,
+    lazy=True,  ## definitions are loaded on first use
 )
 
 ### the 700B software default location is C:/ProgramFiles or ProgramFiles(x86)/Molecular Devices
@@ -18,6 +18,7 @@ class SuperTask:
         self.devs = daq.listDevices()
         self.triggerChannel = None
         self.result = None
+        self.reuseReadBuffers = False
         
     def absChanName(self, chan):
         parts = chan.lstrip('/').split('/')
@@ -123,6 +124,7 @@ class SuperTask:
             self.channelInfo[chan]['clipped'] = False
             
         key = self.getTaskKey(chan)
+        self.taskInfo[key]['cache'] = None
         self.taskInfo[key]['dataWritten'] = False
 
         # if info is not None:
@@ -218,6 +220,26 @@ class SuperTask:
                 #print "%s CfgSampClkTiming('', %f, Val_Rising, Val_FiniteSamps, %d)" % (str(k), rate, nPts)
                 self.tasks[k].CfgSampClkTiming("", rate, self.daq.Val_Rising, self.daq.Val_FiniteSamps, nPts)
 
+        if self.reuseReadBuffers:
+            self.allocateReadBuffers()
+
+    def setReuseReadBuffers(self, reuse):
+        """If True, each input task reads into one buffer that is allocated when
+        the clocks are configured and reused for every run. Result data then
+        refers to that buffer and is overwritten by the next run, so callers
+        must copy any data they keep past the start of the next run.
+        """
+        self.reuseReadBuffers = reuse
+        if not reuse:
+            for t in self.tasks.values():
+                t.clearReadBuffer()
+        elif hasattr(self, 'numPts'):
+            self.allocateReadBuffers()
+
+    def allocateReadBuffers(self):
+        for t in self.tasks.values():
+            if t.isInputTask():
+                t.setReadBuffer(self.numPts)
         
     def setTrigger(self, trig):
         #self.tasks[self.clockSource].CfgDigEdgeStartTrig(trig, Val_Rising)
@@ -302,6 +324,8 @@ class SuperTask:
                 finally:
                     # unreserve hardware
                     self.tasks[t].TaskControl(self.daq.Val_Task_Unreserve)
+                    # output buffers must be written again if the task is restarted
+                    self.taskInfo[t]['dataWritten'] = False
         #print "ST stop complete."
 
     def getResult(self, channel=None):
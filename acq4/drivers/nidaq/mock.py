@@ -7,7 +7,7 @@ modDir = os.path.dirname(__file__)
 headerFiles = [os.path.join(modDir, "NIDAQmx.h")]
 cacheFile = os.path.join(modDir, 'NIDAQmx_headers_%s.cache' % sys.platform)   
 
-DEFS = clibrary.CParser(headerFiles, cache=cacheFile, types={'__int64': ('long long')}, verbose=False)
+DEFS = clibrary.CParser(headerFiles, cache=cacheFile, types={'__int64': ('long long')}, verbose=False, lazy=True)  ## definitions are loaded on first use
 
 import SuperTask
 
@@ -173,6 +173,7 @@ class Task:
         self.nativeClock = None
         self.data = None
         self.mode = None
+        self.readBuffer = None
         
     #def __getattr__(self, attr):
         #return lambda *args: self
@@ -227,20 +228,48 @@ class Task:
         
         return len(data)
         
-    def read(self):
-        dur = self.nPts / self.rate
-        tVals = np.linspace(0, dur, self.nPts)
+    def readDtype(self, dtype=None):
+        if dtype is not None:
+            return np.dtype(dtype)
         if 'd' in self.mode:
-            data = np.empty((len(self.chans), self.nPts), dtype=np.int32)
-        else:
-            data = np.empty((len(self.chans), self.nPts))
+            return np.dtype(np.int32)
+        return np.dtype(np.float64)
+
+    def setReadBuffer(self, samples=None, dtype=None, buf=None):
+        """Set the buffer filled by read(); see nidaq.Task.setReadBuffer."""
+        if buf is None:
+            if samples is None:
+                samples = self.nPts
+            shape = (len(self.chans), samples)
+            dtype = self.readDtype(dtype)
+            if self.readBuffer is not None and self.readBuffer.shape == shape and self.readBuffer.dtype == dtype:
+                return self.readBuffer
+            buf = np.empty(shape, dtype=dtype)
+        elif buf.ndim != 2 or buf.shape[0] != len(self.chans) or not buf.flags['C_CONTIGUOUS']:
+            raise ValueError("Read buffer must be a C-contiguous array of shape (%d, samples); got %s" % (len(self.chans), str(buf.shape)))
+        self.readBuffer = buf
+        return buf
+
+    def clearReadBuffer(self):
+        self.readBuffer = None
+
+    def read(self, samples=None, timeout=10., dtype=None, out=None):
+        data = out
+        if data is None:
+            rb = self.readBuffer
+            if rb is not None and samples in (None, rb.shape[1]) and (dtype is None or np.dtype(dtype) == rb.dtype):
+                data = rb
+            else:
+                if samples is None:
+                    samples = self.nPts
+                data = np.empty((len(self.chans), samples), dtype=self.readDtype(dtype))
             
         for i in range(len(self.chOpts)):
             if 'mockFunc' in self.chOpts[i]:
                 data[i] = self.chOpts[i]['mockFunc']()
             else:
                 data[i] = 0
-        return (data, self.nPts)
+        return (data, data.shape[1])
 
     def start(self):
         ## only start clock if it matches the native clock for this channel
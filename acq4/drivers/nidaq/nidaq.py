@@ -39,7 +39,7 @@ def init():
     cacheFile = os.path.join(modDir, 'NIDAQmx_headers_%s.cache' % sys.platform)   
     
     global DEFS
-    DEFS = clibrary.CParser(headerFiles, cache=cacheFile, types={'__int64': ('long long')}, verbose=False)
+    DEFS = clibrary.CParser(headerFiles, cache=cacheFile, types={'__int64': ('long long')}, verbose=False, lazy=True)  ## definitions are loaded on first use
     global LIB
     LIB = clibrary.CLibrary(ctypes.windll.nicaiu, DEFS, prefix=['DAQmx', 'DAQmx_'])
     
@@ -225,14 +225,21 @@ class _NIDAQ:
 
 init()
 
-chTypes = {
-    LIB.Val_AI: 'AI',
-    LIB.Val_AO: 'AO',
-    LIB.Val_DI: 'DI',
-    LIB.Val_DO: 'DO',
-    LIB.Val_CI: 'CI',
-    LIB.Val_CO: 'CO',
-}
+_chTypes = None
+def chTypeName(tt):
+    """Return the name ('AI', 'AO', ...) of a task type value. The names are
+    looked up on first use so that importing this module does not load DEFS."""
+    global _chTypes
+    if _chTypes is None:
+        _chTypes = {
+            LIB.Val_AI: 'AI',
+            LIB.Val_AO: 'AO',
+            LIB.Val_DI: 'DI',
+            LIB.Val_DO: 'DO',
+            LIB.Val_CI: 'CI',
+            LIB.Val_CO: 'CO',
+        }
+    return _chTypes[tt]
 
 
         
@@ -243,6 +250,7 @@ class Task:
     def __init__(self, nidaq, taskName=""):
         self.nidaq = nidaq
         self.handle = self.nidaq.CreateTask(taskName)
+        self._readBuffer = None  ## (buf, fName, cbuf) set by setReadBuffer()
 
     def __del__(self):
         self.nidaq.ClearTask(self.handle)
@@ -263,34 +271,21 @@ class Task:
     def isDone(self):
         return self.IsTaskDone()
 
-    def read(self, samples=None, timeout=10., dtype=None):
-        #reqSamps = samples
-        #if samples is None:
-        #    samples = self.GetSampQuantSampPerChan()
-        #    reqSamps = -1
-        if samples is None:
-            samples = self.GetSampQuantSampPerChan()
-        reqSamps = samples
-        
-        numChans = self.GetTaskNumChans()
-        
-        shape = (numChans, samples)
-        #print "Shape: ", shape
-        
-        ## Determine the default dtype based on the task type
+    def readDtype(self, dtype=None):
+        """Return the dtype read() uses for this task when none is requested."""
+        if dtype is not None:
+            return np.dtype(dtype)
         tt = self.taskType()
-        if dtype is None:
-            if tt in [LIB.Val_AI, LIB.Val_AO]:
-                dtype = float64
-            elif tt in [LIB.Val_DI, LIB.Val_DO]:
-                dtype = uint32  ## uint8 / 16 might be sufficient, but don't seem to work anyway.
-            else:
-                raise Exception("No default dtype for %s tasks." % chTypes[tt])
+        if tt in [LIB.Val_AI, LIB.Val_AO]:
+            return np.dtype(float64)
+        elif tt in [LIB.Val_DI, LIB.Val_DO]:
+            return np.dtype(uint32)  ## uint8 / 16 might be sufficient, but don't seem to work anyway.
+        else:
+            raise Exception("No default dtype for %s tasks." % chTypeName(tt))
 
-        buf = empty(shape, dtype=dtype)
-        #samplesRead = ctypes.c_long()
-        
-        ## Determine the correct function name to call based on the dtype requested
+    def readFunction(self, dtype):
+        """Return the name of the DAQmx function that reads this task into an array of *dtype*."""
+        tt = self.taskType()
         fName = 'Read'
         if tt == LIB.Val_AI:
             if dtype == float64:
@@ -307,16 +302,86 @@ class Task:
         elif tt == LIB.Val_CI:
             fName += 'Counter'
         else:
-            raise Exception("read() not allowed for this task type (%s)" % chTypes(tt))
-            
-        fName += dtypes[np.dtype(dtype).descr[0][1]]
-        
-        self.SetReadRelativeTo(LIB.Val_FirstSample)
-        self.SetReadOffset(0)
-        
+            raise Exception("read() not allowed for this task type (%s)" % chTypeName(tt))
+        return fName + dtypes[np.dtype(dtype).descr[0][1]]
+
+    def _readTarget(self, buf):
+        ## Check that buf can be filled by a grouped-by-channel read and return
+        ## (buf, fName, cbuf) for it.
+        numChans = self.GetTaskNumChans()
+        if buf.ndim != 2 or buf.shape[0] != numChans or not buf.flags['C_CONTIGUOUS'] or not buf.flags['WRITEABLE']:
+            raise ValueError("Read buffer must be a writeable, C-contiguous array of shape (%d, samples); got %s" % (numChans, str(buf.shape)))
+        fName = self.readFunction(buf.dtype)
         ## buf.ctypes is a c_void_p, but the function requires a specific pointer type so we are forced to recast the pointer:
         fn = LIB('functions', fName)
         cbuf = ctypes.cast(buf.ctypes, fn.argCType('readArray'))
+        return (buf, fName, cbuf)
+
+    def setReadBuffer(self, samples=None, dtype=None, buf=None):
+        """Set the buffer that read() fills when it is called without *samples*,
+        *dtype* or *out* arguments (or with values that match the buffer).
+        
+        If *buf* is given it must be a writeable, C-contiguous array of shape
+        (numChans, samples); otherwise a buffer is allocated for *samples*
+        (default: the number of samples per channel configured for the task).
+        The buffer is reused by every later read, so data returned by read()
+        is overwritten by the next read and must be copied if it is kept.
+        Call with no arguments after changing the timing to resize the buffer,
+        or use clearReadBuffer() to return to allocating on each read.
+        Returns the buffer.
+        """
+        if buf is None:
+            if samples is None:
+                samples = self.GetSampQuantSampPerChan()
+            dtype = self.readDtype(dtype)
+            rb = self._readBuffer
+            if rb is not None and rb[0].shape == (self.GetTaskNumChans(), samples) and rb[0].dtype == dtype:
+                return rb[0]
+            buf = empty((self.GetTaskNumChans(), samples), dtype=dtype)
+        self._readBuffer = self._readTarget(buf)
+        return buf
+
+    def clearReadBuffer(self):
+        self._readBuffer = None
+
+    def read(self, samples=None, timeout=10., dtype=None, out=None):
+        """Read *samples* per channel (default: the configured number) from the task.
+        
+        Returns (data, nPts) where data has shape (numChans, samples). Data is
+        read into *out* if it is given, or into the buffer set by
+        setReadBuffer() if its shape and dtype match the request; otherwise a
+        new array is allocated.
+        """
+        #reqSamps = samples
+        #if samples is None:
+        #    samples = self.GetSampQuantSampPerChan()
+        #    reqSamps = -1
+        rb = self._readBuffer
+        if out is not None:
+            if samples is not None and samples != out.shape[-1]:
+                raise ValueError("out has %d samples per channel; %d requested" % (out.shape[-1], samples))
+            if dtype is not None and np.dtype(dtype) != out.dtype:
+                raise ValueError("out has dtype %s; %s requested" % (out.dtype, np.dtype(dtype)))
+            if rb is not None and rb[0] is out:
+                target = rb
+            else:
+                target = self._readTarget(out)
+        elif (rb is not None and 
+              (samples is None or samples == rb[0].shape[1]) and 
+              (dtype is None or np.dtype(dtype) == rb[0].dtype)):
+            target = rb
+        else:
+            if samples is None:
+                samples = self.GetSampQuantSampPerChan()
+            numChans = self.GetTaskNumChans()
+            buf = empty((numChans, samples), dtype=self.readDtype(dtype))
+            target = self._readTarget(buf)
+        
+        buf, fName, cbuf = target
+        reqSamps = buf.shape[1]
+        
+        self.SetReadRelativeTo(LIB.Val_FirstSample)
+        self.SetReadOffset(0)
         
         nPts = getattr(self, fName)(reqSamps, timeout, LIB.Val_GroupByChannel, cbuf, buf.size)
         return (buf, nPts)
@@ -341,7 +406,7 @@ class Task:
             else:
                 raise Exception('dtype %s not allowed for DO channels (must be uint8, uint16, or uint32)' % str(data.dtype))
         else:
-            raise Exception("write() not implemented for this task type (%s)" % chTypes[tt])
+            raise Exception("write() not implemented for this task type (%s)" % chTypeName(tt))
             
         fName += dtypes[data.dtype.descr[0][1]]
         
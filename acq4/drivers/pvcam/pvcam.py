@@ -19,7 +19,7 @@ headerFiles = [
     os.path.join(modDir, "master.h"),
     os.path.join(modDir, "pvcam.h")
 ]
-HEADERS = CParser(headerFiles, cache=os.path.join(modDir, 'pvcam_headers.cache'), copyFrom=winDefs())
+HEADERS = CParser(headerFiles, cache=os.path.join(modDir, 'pvcam_headers.cache'), copyFrom=winDefs(lazy=True), lazy=True)  ## definitions are loaded on first use
 
 if platform.architecture()[0] == '64bit':
     LIB = CLibrary(windll.Pvcam64, HEADERS, prefix='pl_')
@@ -35,6 +35,15 @@ class FileType:
         """Read a file, return a data object"""
         raise Exception("Function must be implemented in subclass")
         
+    @classmethod
+    def readPartial(cls, fileHandle, maxPoints=None, abort=None):
+        """Read a file for display, reading at most about *maxPoints* values if the
+        file type allows it. Return (data, complete), where *complete* is False if
+        only a subset of the data was read. *abort* may be a function that returns
+        True if reading should stop; readPartial then returns None.
+        The default implementation reads the entire file."""
+        return cls.read(fileHandle), True
+        
     @classmethod
     def acceptsFile(cls, fileHandle):
         """Return priority value if the file can be read by this class.
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from acq4.util.metaarray import MetaArray as MA
+import numpy as np
 from numpy import ndarray
 from FileType import *
 
@@ -42,3 +43,80 @@ class MetaArray(FileType):
     def read(cls, fileHandle, *args, **kargs):
         """Read a file, return a data object"""
         return MA(file=fileHandle.name(), *args, **kargs)
+
+    @classmethod
+    def readPartial(cls, fileHandle, maxPoints=None, abort=None, blockSize=2**22):
+        """Read metadata and a bounded subset of the data in a file.
+        
+        HDF5 files are opened without reading their data, and older files are
+        memory-mapped where possible, so only the requested subset is read from
+        disk. If the array has more than *maxPoints* values we return:
+        
+        * for images (more than 2 dimensions, or 2 without columns), the first
+          frame, decimated if it is still too large
+        * otherwise every Nth sample along the axes that have no columns
+        
+        With maxPoints=None all data is read. Data is read in blocks of about
+        *blockSize* bytes and *abort* is called between blocks. Axis values
+        stored in the file are always read in full.
+        """
+        fileName = fileHandle.name()
+        ma = MA(file=fileName, readAllData=False)
+        if not ma._isHDF:
+            try:
+                ma = MA(file=fileName, mmap=True)
+            except Exception:
+                ## dynamic-axis and object arrays can not be mapped; read everything
+                return MA(file=fileName), True
+        try:
+            shape = ma.shape
+            size = int(np.prod(shape))
+            index = [slice(None)] * ma.ndim
+            if maxPoints is not None and size > maxPoints:
+                image = ma.ndim > 2 or (ma.ndim == 2 and not ma.axisHasColumns(0) and not ma.axisHasColumns(1))
+                if ma.ndim > 2:
+                    index[0] = slice(0, 1)
+                    size //= shape[0]
+                    axes = range(1, ma.ndim)
+                elif image:
+                    axes = range(ma.ndim)
+                else:
+                    axes = [i for i in range(ma.ndim) if not ma.axisHasColumns(i)]
+                if size > maxPoints and len(axes) > 0:
+                    ds = int(np.ceil((float(size) / maxPoints) ** (1. / len(axes))))
+                    for i in axes:
+                        index[i] = slice(None, None, ds)
+            
+            data = cls._readBlocks(ma._data, index, blockSize, abort)
+            if data is None:
+                return None
+            info = [ma._axisSlice(i, index[i]) for i in range(ma.ndim)] + ma._info[ma.ndim:]
+            return MA(data, info=info), data.shape == shape
+        finally:
+            if getattr(ma, '_openFile', None) is not None:
+                ma._openFile.close()
+            
+    @staticmethod
+    def _readBlocks(arr, index, blockSize, abort):
+        ## Return arr[index] for a tuple of slices, reading contiguous blocks along
+        ## the longest axis and applying steps in memory (strided selections are
+        ## very slow with h5py). Return None if abort() returns True.
+        ranges = [sl.indices(n) for sl, n in zip(index, arr.shape)]
+        outShape = [len(xrange(*r)) for r in ranges]
+        out = np.empty(outShape, dtype=arr.dtype)
+        if out.size == 0:
+            return out
+        ax = int(np.argmax(outShape))
+        start, stop, step = ranges[ax]
+        readIndex = [slice(r[0], r[1]) for r in ranges]
+        memIndex = [slice(None, None, r[2]) for r in ranges]
+        outIndex = [slice(None)] * len(ranges)
+        rowBytes = out.dtype.itemsize * step * int(np.prod([r[1] - r[0] for i, r in enumerate(ranges) if i != ax]))
+        n = max(1, blockSize // rowBytes)
+        for i in range(0, outShape[ax], n):
+            if abort is not None and abort():
+                return None
+            readIndex[ax] = slice(start + i * step, min(stop, start + (i + n) * step))
+            outIndex[ax] = slice(i, i + n)
+            out[tuple(outIndex)] = arr[tuple(readIndex)][tuple(memIndex)]
+        return out
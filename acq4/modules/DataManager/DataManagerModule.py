@@ -258,6 +258,7 @@ class DataManager(Module):
         #print "      module quitting.."
         self.ui.fileTreeWidget.quit()
         self.ui.analysisWidget.quit()
+        self.ui.dataViewWidget.quit()
         #print "      deleted dialog, calling superclass quit.."
         Module.quit(self)
         #print "      module quit done"
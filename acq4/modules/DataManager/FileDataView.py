@@ -8,10 +8,79 @@ import acq4.pyqtgraph as pg
 #from acq4.pyqtgraph.ImageView import ImageView
 from acq4.util.DictView import *
 import acq4.util.metaarray as metaarray
-import weakref
+import acq4.filetypes as filetypes
+from acq4.util.Thread import Thread
+from acq4.util.debug import printExc
+import weakref, threading
+
+
+class FileLoadThread(Thread):
+    """Reads files for FileDataView in a background thread.
+    
+    Only the most recent request is kept. A request that is replaced while it
+    is being read is aborted between blocks (see FileType.readPartial) and
+    its result is discarded.
+    """
+    sigLoaded = QtCore.Signal(object, object, object)  ## request, data, complete
+    sigFailed = QtCore.Signal(object)  ## request
+    
+    def __init__(self):
+        Thread.__init__(self)
+        self.cond = threading.Condition()
+        self.pending = None
+        self.latest = None
+        self.stopThread = False
+        
+    def load(self, fh, typ, maxPoints=None):
+        """Request that *fh* be read with at most *maxPoints* values (None reads
+        all data). Return the request, which is passed to sigLoaded/sigFailed."""
+        req = (fh, typ, maxPoints)
+        with self.cond:
+            self.pending = req
+            self.latest = req
+            self.cond.notify()
+        return req
+    
+    def cancel(self):
+        with self.cond:
+            self.pending = None
+            self.latest = None
+            
+    def isAborted(self, req):
+        with self.cond:
+            return self.stopThread or req is not self.latest
+        
+    def stop(self, block=False):
+        with self.cond:
+            self.stopThread = True
+            self.cond.notify()
+        if block:
+            self.wait()
+        
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.stopThread:
+                    self.cond.wait()
+                if self.stopThread:
+                    break
+                req = self.pending
+                self.pending = None
+            fh, typ, maxPoints = req
+            try:
+                ret = filetypes.getFileType(typ).readPartial(fh, maxPoints, abort=lambda: self.isAborted(req))
+            except:
+                if not self.isAborted(req):
+                    printExc("Error loading file %s:" % fh.name())
+                    self.sigFailed.emit(req)
+                continue
+            if ret is None or self.isAborted(req):
+                continue
+            self.sigLoaded.emit(req, ret[0], ret[1])
+
 
 class FileDataView(QtGui.QSplitter):
-    def __init__(self, parent):
+    def __init__(self, parent, maxPreviewPoints=2**22):
         QtGui.QSplitter.__init__(self, parent)
         #self.manager = Manager.getManager()
         self.setOrientation(QtCore.Qt.Vertical)
@@ -20,6 +89,28 @@ class FileDataView(QtGui.QSplitter):
         self.widgets = []
         self.dictWidget = None
         #self.plots = []
+        
+        ## Files are loaded in a background thread. Large files are first shown
+        ## as a preview of at most maxPreviewPoints values; all data is loaded
+        ## only when requested.
+        self.maxPreviewPoints = maxPreviewPoints
+        self.currentFileType = None
+        self.request = None
+        self.previewBar = QtGui.QWidget()
+        layout = QtGui.QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.previewBar.setLayout(layout)
+        self.previewLabel = QtGui.QLabel()
+        self.loadFullBtn = QtGui.QPushButton('Load full data')
+        layout.addWidget(self.previewLabel)
+        layout.addWidget(self.loadFullBtn)
+        self.addWidget(self.previewBar)
+        self.loadFullBtn.clicked.connect(self.loadFullData)
+        
+        self.loader = FileLoadThread()
+        self.loader.sigLoaded.connect(self.fileLoaded)
+        self.loader.sigFailed.connect(self.fileLoadFailed)
+        self.loader.start()
 
     def setCurrentFile(self, file):
         #print "=============== set current file ============"
@@ -29,8 +120,13 @@ class FileDataView(QtGui.QSplitter):
         ## What if we just want to update the data display?
         #self.clear()
         
+        ## cancel any load still in progress for the previous file
+        self.request = None
+        self.loader.cancel()
+        self.previewBar.hide()
+        self.current = None
+        
         if file is None:
-            self.current = None
             return
             
         if file.isDir():
@@ -38,22 +134,49 @@ class FileDataView(QtGui.QSplitter):
             return
         else:
             typ = file.fileType()
-            if typ is None:
+            if typ not in ['ImageFile', 'MetaArray']:
                 return
-            else:
-                image = False
-                with pg.BusyCursor():
-                    data = file.read()
-                if typ == 'ImageFile': 
-                    image = True
-                elif typ == 'MetaArray':
-                    if data.ndim == 2 and not data.axisHasColumns(0) and not data.axisHasColumns(1):
-                        image = True
-                    elif data.ndim > 2:
-                        image = True
-                else:
-                    return
-                        
+            self.current = file
+            self.currentFileType = typ
+            self.load(self.maxPreviewPoints)
+            
+    def loadFullData(self):
+        """Load all data from the current file, replacing the preview."""
+        if self.current is not None:
+            self.load(None)
+        
+    def load(self, maxPoints):
+        self.request = self.loader.load(self.current, self.currentFileType, maxPoints)
+        self.previewLabel.setText('Loading...')
+        self.loadFullBtn.setEnabled(False)
+        self.previewBar.show()
+        
+    def fileLoadFailed(self, req):
+        if req is not self.request:
+            return
+        self.request = None
+        self.previewLabel.setText('Error loading file (see console).')
+        
+    def fileLoaded(self, req, data, complete):
+        if req is not self.request:  ## a newer file was selected while this one was loading
+            return
+        self.request = None
+        if complete:
+            self.previewBar.hide()
+        else:
+            self.previewLabel.setText('Showing preview %s; not all data was loaded.' % str(data.shape))
+            self.loadFullBtn.setEnabled(True)
+        self.showData(data, req[1])
+        
+    def showData(self, data, typ):
+        image = False
+        if typ == 'ImageFile': 
+            image = True
+        elif typ == 'MetaArray':
+            if data.ndim == 2 and not data.axisHasColumns(0) and not data.axisHasColumns(1):
+                image = True
+            elif data.ndim > 2:
+                image = True
         
         with pg.BusyCursor():
             if image:
@@ -91,7 +214,7 @@ class FileDataView(QtGui.QSplitter):
                 self.addWidget(w)
                 self.widgets.append(w)
                 h = self.size().height()
-                self.setSizes([h*0.8, h*0.2])
+                self.setSizes([self.previewBar.sizeHint().height(), h*0.8, h*0.2])
             else:
                 self.dictWidget.setData(data._info)
             
@@ -102,4 +225,6 @@ class FileDataView(QtGui.QSplitter):
             w.setParent(None)
         self.widgets = []
         self.dictWidget = None
-                
+        
+    def quit(self):
+        self.loader.stop(block=True)
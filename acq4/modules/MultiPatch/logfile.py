@@ -1,4 +1,5 @@
-import re, json
+import re, json, bisect
+import numpy as np
 
 
 class MultiPatchLog(object):
@@ -11,56 +12,81 @@ class MultiPatchLog(object):
             self.read(filename)
 
     def read(self, file):
-        for line in open(file, 'rb').readlines():
-            # parse line
-            if line.startswith('{'):
-                # json format
-                event = json.loads(line.rstrip(',\r\n'))
-
-                # just to cover a bug; remove after updating legacy log files
-                if isinstance(event['event_time'], basestring):
-                    event['event_time'] = float(event['event_time'].rstrip(','))
-            else:
-                # this covers the original multipatch log format; remove after updating all legacy log files
-                fields = re.split(r',\s*', line.strip())
-                time, eventType, device = [eval(v) for v in fields[:3]]
-                data = fields[3:]
-                time = float(time)
-
-                event = {
-                    'event_time': time,
-                    'device': device,
-                    'event': eventType,
-                }
-                if eventType == 'move_stop':
-                    event['position'] = list(map(float, data))
-
-            # keep track of min/max time values
-            time = event['event_time']
-            if self._minTime is None:
-                self._minTime = time
-                self._maxTime = time
-            else:
-                self._minTime = min(self._minTime, time)
-                self._maxTime = max(self._maxTime, time)
+        lines = open(file, 'rb').read().splitlines()
+        lines = [line for line in lines if line.strip() != '']
+        if all([line.startswith('{') for line in lines]):
+            # json format; parse all events at once
+            events = json.loads('[' + ','.join([line.rstrip(', \r\n') for line in lines]) + ']')
+        else:
+            events = [self._parseLine(line) for line in lines]
+        if len(events) == 0:
+            return
 
-            # initialize irregular time series if needed
+        # just to cover a bug; remove after updating legacy log files
+        for event in events:
+            if isinstance(event['event_time'], basestring):
+                event['event_time'] = float(event['event_time'].rstrip(','))
+
+        # keep track of min/max time values
+        times = np.array([event['event_time'] for event in events], dtype=float)
+        if self._minTime is None:
+            self._minTime = times.min()
+            self._maxTime = times.max()
+        else:
+            self._minTime = min(self._minTime, times.min())
+            self._maxTime = max(self._maxTime, times.max())
+
+        # group position events by device
+        positions = {}
+        for event in events:
             device = event['device']
+            if device not in positions:
+                positions[device] = []
+            if event['event'] == 'move_stop':
+                positions[device].append((event['event_time'], event['position']))
+            elif event['event'] == 'move_start':
+                # the last position is held until the move starts
+                positions[device].append((event['event_time'], None))
+
+        # Record events into irregular time series
+        for device, posEvents in positions.items():
+            # initialize irregular time series if needed
             if device not in self._devices:
                 self._devices[device] = {
                     'position': IrregularTimeSeries(interpolate=True)
                 }
-            
-            # Record event into irregular time series
-            dev = self._devices[device]
-            time = event['event_time']
-            if event['event'] == 'move_start':
-                posSeries = dev['position']
-                lastPos = posSeries.lastValue()
-                if lastPos is not None:
-                    posSeries[time] = lastPos
-            elif event['event'] == 'move_stop':
-                dev['position'][time] = event['position']
+            posSeries = self._devices[device]['position']
+            lastPos = posSeries.lastValue()
+            data = []
+            for time, pos in posEvents:
+                if pos is None:
+                    if lastPos is None:
+                        continue
+                    pos = lastPos
+                data.append((time, pos))
+                lastPos = pos
+            posSeries.extend(data)
+
+    @staticmethod
+    def _parseLine(line):
+        if line.startswith('{'):
+            # json format
+            return json.loads(line.rstrip(', \r\n'))
+
+        # this covers the original multipatch log format; remove after updating all legacy log files
+        fields = re.split(r',\s*', line.strip())
+        time, eventType, device = [eval(v) for v in fields[:3]]
+        data = fields[3:]
+        time = float(time)
+
+        event = {
+            'event_time': time,
+            'device': device,
+            'event': eventType,
+        }
+        if eventType == 'move_stop':
+            event['position'] = list(map(float, data))
+        return event
 
     def devices(self):
         return list(self._devices.keys())
@@ -71,6 +97,15 @@ class MultiPatchLog(object):
             state[dev] = {'position': self._devices[dev]['position'][time]}
         return state
 
+    def positions(self, times, devices=None):
+        """Return a dict containing an array of the (interpolated) position of
+        each device at each of the given *times*. Positions are NaN where a
+        device has no position recorded.
+        """
+        if devices is None:
+            devices = self.devices()
+        return dict([(dev, self._devices[dev]['position'].lookup(times)) for dev in devices])
+
     def firstTime(self):
         return self._minTime
 
@@ -82,13 +117,13 @@ class MultiPatchLog(object):
 class IrregularTimeSeries(object):
     """An irregularly-sampled time series.
     
-    Allows efficient retrieval of the series value at any time using a lookup table.
-    Intended for cases where the lookup table would be reasonably-sized (for example,
-    an hour of events indexed at 1-second resolution). For larger data sets, a 
-    b-tree would be a more reasonable approach.
+    Times are stored in a sorted numpy array, so the series value at any time
+    is found by binary search. Many time points may be looked up at once
+    with lookup(), which returns an array of (optionally interpolated) values.
     
     If enabled, values are interpolated linearly. Values may be of any type,
-    but only scalar, array, and tuple-of-scalar types may be interpolated.
+    but only scalar, array, and tuple-of-scalar types may be interpolated
+    (and only these may be used with lookup()).
 
     Example::
 
@@ -101,17 +136,22 @@ class IrregularTimeSeries(object):
         ], interpolate=True)
 
         # Look up the series value at any arbitrary time
-        series[5.0]   # returns None because the series begins at 10.0
+        series[5.0]   # returns None because the series begins at 10.5
         series[14.0]  # returns 0.6; interpolated between 2nd and 3rd timepoints
         series[50]    # returns 1.2; the last value in the time series
+        
+        # Look up many values at once
+        series.lookup([5.0, 14.0, 50])   # returns array([nan, 0.6, 1.2])
     """
-    def __init__(self, data=None, interpolate=False, resolution=1.0):
+    def __init__(self, data=None, interpolate=False, resolution=None):
+        # *resolution* is accepted for backward compatibility; it is no longer used.
         self.interpolate = interpolate
-        self._resolution = resolution
         
-        self.events = []
-        self.index = []  # each value maps a time in seconds to the index of the value recorded immediately after the time
-        self._startTime = None
+        self._times = np.empty(16)  # grows by doubling; only the first _n values are used
+        self._n = 0
+        self._values = []
+        self._valueArray = None  # numeric copy of _values, created as needed by lookup()
+        self._timeList = None    # list copy of times for fast single lookups
         
         if data is not None:
             self.extend(data)
@@ -122,60 +162,92 @@ class IrregularTimeSeries(object):
         Points in the series must be added in increasing chronological order.
         It is allowed to add multiple values for the same time point.
         """
-        if len(self.events) > 0 and time < self.events[-1][0]:
+        self.extend([(time, value)])
+       
+    def extend(self, data):
+        """Append a sequence of (time, value) pairs to the series."""
+        data = list(data)
+        if len(data) == 0:
+            return
+        times = np.array([t for t, v in data], dtype=float)
+        if np.any(np.diff(times) < 0) or (self._n > 0 and times[0] < self._times[self._n-1]):
             raise ValueError("Time points must be added in increasing order.")
 
-        if self._startTime is None:
-            self._startTime = time
-        i = self._getIndex(time)
-
-        # Extend index
-        dif = i + 1 - len(self.index)
-        if dif > 0:
-            self.index.extend([len(self.events)] * dif)
-        self.index[i] = len(self.events)
-        
-        self.events.append((float(time), value))
+        n = self._n + len(times)
+        if n > len(self._times):
+            self._times = np.resize(self._times, max(n, len(self._times) * 2))
+        self._times[self._n:n] = times
+        self._n = n
+        self._values.extend([v for t, v in data])
+        self._valueArray = None
+        self._timeList = None
        
-    def extend(self, data):
-        for t,v in data:
-            self[t] = v
+    @property
+    def events(self):
+        """List of (time, value) tuples for all points in the series."""
+        return list(zip(self.times(), self._values))
        
     def __getitem__(self, time):
         """Return the value of this series at the given time.
         """
-        events = self.events
-        if len(events) == 0:
-            return None
-        if time <= self._startTime:
+        # index of the last event at or before the requested time
+        # (bisect on a list is much faster than numpy for a single value)
+        time = float(time)
+        if self._timeList is None:
+            self._timeList = self.times()
+        times = self._timeList
+        i = bisect.bisect_right(times, time) - 1
+        if i < 0:
             return None
-        if time >= events[-1][0]:
-            return events[-1][1]
-        
-        # Use index to find a nearby event
-        i = self.index[min(self._getIndex(time), len(self.index)-1)]
-        
-        if events[i][0] > time:
-            # walk backward to the requested event
-            while self.events[i][0] > time:
-                i -= 1
-        elif events[i][0] < time:
-            # walk forward to the requested event
-            while i+1 < len(self.events) and self.events[i+1][0] <= time:
-                i += 1
-        else:
-            return events[i][1]
+        if i == self._n - 1 or not self.interpolate:
+            return self._values[i]
         
         # interpolate if requested
-        if self.interpolate:
-            t1, v1 = events[i]
-            t2, v2 = events[i+1]
-            return self._interpolate(time, v1, v2, t1, t2)
-        else:
-            return events[i][1]
+        return self._interpolate(time, self._values[i], self._values[i+1], times[i], times[i+1])
+
+    def lookup(self, times):
+        """Return an array of the values of this series at each of the given
+        *times*. Values are NaN for times before the start of the series.
+
+        All values in the series must be numeric (scalars or fixed-length
+        sequences of scalars). The returned array has the shape of *times*
+        followed by the shape of each value.
+        """
+        times = np.asarray(times, dtype=float)
+        shape = times.shape
+        times = times.ravel()
+        values = self.valueArray()
+        out = np.empty(times.shape + values.shape[1:])
+        out[:] = np.nan
+        if self._n > 0:
+            i = np.searchsorted(self._times[:self._n], times, side='right') - 1
+            valid = i >= 0
+            iv = i[valid]
+            if not self.interpolate:
+                out[valid] = values[iv]
+            else:
+                # interpolate between each event and the next (the last event is held)
+                j = np.minimum(iv + 1, self._n - 1)
+                t1 = self._times[iv]
+                t2 = self._times[j]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    s = np.where(j > iv, (times[valid] - t1) / (t2 - t1), 0.0)
+                s = s.reshape(s.shape + (1,) * (values.ndim - 1))
+                out[valid] = values[iv] * (1.0 - s) + values[j] * s
+        return out.reshape(shape + values.shape[1:])
 
-    def _getIndex(self, t):
-        return int((t - self._startTime) / self._resolution)
+    def valueArray(self):
+        """Return an array of all values in the series.
+        Raises TypeError if the values can not be converted to a numeric array."""
+        if self._valueArray is None:
+            try:
+                arr = np.array(self._values, dtype=float)
+            except (TypeError, ValueError):
+                raise TypeError("Series values must be numeric scalars or sequences of equal length.")
+            if arr.ndim == 0 or arr.shape[0] != self._n:
+                raise TypeError("Series values must be numeric scalars or sequences of equal length.")
+            self._valueArray = arr
+        return self._valueArray
 
     def _interpolate(self, t, v1, v2, t1, t2):
         s = (t - t1) / (t2 - t1)
@@ -188,36 +260,36 @@ class IrregularTimeSeries(object):
     def times(self):
         """Return a list of the time points in the series.
         """
-        return [ev[0] for ev in self.events]
+        return self._times[:self._n].tolist()
 
     def values(self):
         """Return a list of the values at each point in the series.
         """
-        return [ev[1] for ev in self.events]
+        return list(self._values)
 
     def firstValue(self):
-        if len(self.events) == 0:
+        if self._n == 0:
             return None
         else:
-            return self.events[0][1]
+            return self._values[0]
 
     def lastValue(self):
-        if len(self.events) == 0:
+        if self._n == 0:
             return None
         else:
-            return self.events[-1][1]
+            return self._values[-1]
 
     def firstTime(self):
-        if len(self.events) == 0:
+        if self._n == 0:
             return None
         else:
-            return self.events[0][0]
+            return float(self._times[0])
 
     def lastTime(self):
-        if len(self.events) == 0:
+        if self._n == 0:
             return None
         else:
-            return self.events[-1][0]
+            return float(self._times[self._n-1])
 
     def __len__(self):
-        return len(self.events)
+        return self._n
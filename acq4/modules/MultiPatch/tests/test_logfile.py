@@ -66,4 +66,52 @@ def test_timeseries_index():
                     ts[t] = v
                 for t in np.arange(-1, 40, 0.05):
                     assert ts[t] == lookup(t, ts)
-    
\ No newline at end of file
+    
+
+def test_timeseries_lookup():
+    data = [
+        (10, (0.5, 13.4)),
+        (12, (13.4, 5)),
+        (29.8, (5, 0)),
+        (29.8, (5.5, 1)),
+        (30.0, (7, 23.)),
+        (35, (0, 0)),
+    ]
+    times = np.arange(-1, 40, 0.05)
+    for interp in (True, False):
+        ts = IrregularTimeSeries(data=data, interpolate=interp)
+        vals = ts.lookup(times)
+        assert vals.shape == (len(times), 2)
+        for t, v in zip(times, vals):
+            expect = ts[t]
+            if expect is None:
+                assert np.all(np.isnan(v))
+            else:
+                assert np.allclose(v, expect)
+
+
+def test_read_log(tmpdir):
+    log = tmpdir.join('MultiPatch_000.log')
+    lines = [
+        '{"device": "Pipette1", "event": "move_start", "event_time": 100.0},',
+        '{"device": "Pipette1", "event": "move_stop", "event_time": 101.0, "position": [0.0, 0.0, 0.0]},',
+        '{"device": "Pipette2", "event": "move_stop", "event_time": 102.0, "position": [1.0, 2.0, 3.0]},',
+        '{"device": "Pipette1", "event": "move_start", "event_time": 110.0},',
+        '{"device": "Pipette1", "event": "move_stop", "event_time": 112.0, "position": [2.0, 4.0, 6.0]},',
+        '{"device": "Microscope", "event": "surface_depth_changed", "event_time": "120.0,", "surface_depth": 0.001},',
+    ]
+    log.write('\n'.join(lines) + '\n')
+    mp = MultiPatchLog(str(log))
+    assert sorted(mp.devices()) == ['Microscope', 'Pipette1', 'Pipette2']
+    assert mp.firstTime() == 100.0
+    assert mp.lastTime() == 120.0
+    
+    state = mp.state(111.0)
+    assert np.allclose(state['Pipette1']['position'], (1.0, 2.0, 3.0))
+    assert np.allclose(state['Pipette2']['position'], (1.0, 2.0, 3.0))
+    assert state['Microscope']['position'] is None
+    assert mp.state(100.5)['Pipette1']['position'] is None
+
+    pos = mp.positions([100.5, 105.0, 111.0, 200.0], devices=['Pipette1'])
+    assert np.all(np.isnan(pos['Pipette1'][0]))
+    assert np.allclose(pos['Pipette1'][1:], [[0, 0, 0], [1, 2, 3], [2, 4, 6]])
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import with_statement
+import time
+import numpy as np
+from acq4.util.metaarray import MetaArray
+from acq4.util.Mutex import Mutex
+from acq4.util.Thread import Thread
+from acq4.util.debug import printExc
+
+
+class AnalysisBuffer(object):
+    """Growable, numpy-backed storage for the time series of test pulse
+    analysis values collected by the Patch module.
+
+    Rows are appended one at a time; the underlying arrays double in size as
+    needed, so appending is O(1) and time() / column() return views without
+    copying. Rows are only appended (never modified), so arrays returned by
+    time() and column() remain valid after later appends.
+    """
+    def __init__(self, columns, units=None, size=1024):
+        self.columns = list(columns)
+        self.units = {} if units is None else units
+        self._colIndex = dict([(c, i) for i, c in enumerate(self.columns)])
+        self.lock = Mutex(recursive=True)
+        self._initSize = size
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self._time = np.empty(self._initSize)
+            self._data = np.empty((self._initSize, len(self.columns)))
+            self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def append(self, t, values):
+        """Append one row at time *t*. *values* is a dict containing a value
+        for each column; missing values are stored as NaN."""
+        with self.lock:
+            if self._n == len(self._time):
+                self._time = np.resize(self._time, len(self._time) * 2)
+                self._data = np.resize(self._data, (len(self._time), len(self.columns)))
+            self._time[self._n] = t
+            row = self._data[self._n]
+            for i, c in enumerate(self.columns):
+                v = values.get(c, None)
+                row[i] = np.nan if v is None else v
+            self._n += 1
+
+    def time(self):
+        return self._time[:self._n]
+
+    def column(self, name):
+        return self._data[:self._n, self._colIndex[name]]
+
+    def makeArray(self, start=0, stop=None):
+        """Return a MetaArray containing rows *start* through *stop*, with a
+        'Time' axis and one 'Value' column per analysis value."""
+        with self.lock:
+            sl = slice(*slice(start, stop).indices(self._n))
+            times = self._time[sl].copy()
+            data = self._data[sl].copy()
+        info = [
+            {'name': 'Time', 'values': times, 'units': 's'},
+            {'name': 'Value', 'cols': [{'name': c, 'units': self.units.get(c, '')} for c in self.columns]},
+        ]
+        return MetaArray(data, info=info)
+
+
+class AnalysisWriter(Thread):
+    """Appends rows from an AnalysisBuffer to a MetaArray file in a background
+    thread.
+
+    New rows are collected and written in one batch every *flushInterval*
+    seconds, rather than re-opening the file once per test pulse in the GUI
+    thread. The file is closed between batches, so it can still be read while
+    recording. Rows before *start* are assumed to have been written already.
+    """
+    def __init__(self, buffer, fileName, start=0, flushInterval=1.0):
+        Thread.__init__(self)
+        self.buffer = buffer
+        self.fileName = fileName
+        self.written = start
+        self.flushInterval = flushInterval
+        self.lock = Mutex()
+        self.stopThread = False
+
+    def run(self):
+        lastFlush = time.time()
+        while True:
+            with self.lock:
+                stop = self.stopThread
+            if stop or time.time() - lastFlush >= self.flushInterval:
+                self.flush()
+                lastFlush = time.time()
+            if stop:
+                break
+            time.sleep(min(50e-3, self.flushInterval))
+
+    def flush(self):
+        """Write all rows that have been appended since the last flush."""
+        n = len(self.buffer)
+        if n <= self.written:
+            return
+        try:
+            arr = self.buffer.makeArray(self.written, n)
+            arr.write(self.fileName, appendAxis='Time')
+            self.written = n
+        except:
+            printExc("Error writing patch analysis data to %s:" % self.fileName)
+
+    def stop(self, block=False):
+        """Stop the thread after writing any remaining rows."""
+        with self.lock:
+            self.stopThread = True
+        if block:
+            self.wait()
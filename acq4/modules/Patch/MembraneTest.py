@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Membrane test (test pulse) analysis for the Patch module.
+
+MembraneTestAnalyzer computes input/access resistance, capacitance, and
+holding values from test pulse sweeps. Index ranges for the baseline and
+pulse segments are computed once for each time base, and the exponential
+fitted to the pulse response is solved by variable projection. For a given
+time constant the offset and amplitude are linear and have a closed-form
+least-squares solution, which leaves a 1-D search over tau. Several
+sweeps (for example, from multiple clamps) can be analyzed in one call.
+"""
+from __future__ import division
+import numpy as np
+from acq4.util.metaarray import MetaArray
+
+
+## time excluded from either side of each pulse edge
+NUDGE = 50e-6
+
+
+def expFn(v, t):
+    """Exponential fit to the pulse response.
+    v[0] is offset to start of exp, v[1] is amplitude of exp, v[2] is tau."""
+    return (v[0]-v[1]) + v[1] * np.exp(-t / v[2])
+
+
+def _bridge(data):
+    try:
+        cp = data._info[-1]['ClampState']['ClampParams']
+        return cp['BridgeBalResist'] if cp['BridgeBalEnabled'] else 0.0
+    except:
+        return 0.0
+
+
+class MembraneTestAnalyzer(object):
+    """Analyzes test pulse sweeps recorded with the Patch module parameters
+    *params* (uses 'mode', 'delayTime', 'pulseTime' and 'drawFit').
+
+    Sweeps are MetaArrays with 'primary' and 'command' channels and a 'Time'
+    axis, as returned by the clamp device. Results have the same keys and
+    meaning as those of the original PatchThread.analyze.
+    """
+    ## number of log-spaced time constants in the initial search grid, and
+    ## number of iterations used to refine the best grid point
+    gridSize = 24
+    refineIterations = 6
+
+    ## The original analysis intended to refit the first 10 time constants of
+    ## the pulse, but tested the length of the channel axis, so the refit never
+    ## happened. It is disabled by default to keep results unchanged.
+    refitShort = False
+
+    def __init__(self, params):
+        self.params = params
+        self._ranges = {}   ## time base: index ranges and fit grid
+
+    def ranges(self, t):
+        """Return the index ranges of the baseline, pulse, and late pulse
+        segments for sweeps with time values *t*, and the time constant grid
+        used to fit the pulse.
+
+        These select the same samples as 'Time' value slices of the sweeps
+        (t >= start and t < stop)."""
+        key = (len(t), t[0], t[-1])
+        r = self._ranges.get(key, None)
+        if r is None:
+            delay = self.params['delayTime']
+            pulse = self.params['pulseTime']
+            ss = lambda x: int(np.searchsorted(t, x, side='left'))
+            r = {
+                'base': (ss(0.0), ss(delay-NUDGE)),
+                'pulse': (ss(delay+NUDGE), ss(delay+pulse-NUDGE)),
+                'pulseEnd': (ss(delay+(pulse*2./3.)), ss(delay+pulse-NUDGE)),
+            }
+            p0, p1 = r['pulse']
+            r['grid'] = expGrid(t[p0:p1] - delay, self.gridSize)
+            self._ranges[key] = r
+        return r
+
+    def analyze(self, data):
+        """Analyze a single sweep and return a dict of results."""
+        return self.analyzeBatch([data])[0]
+
+    def analyzeBatch(self, sweeps):
+        """Analyze a list of sweeps and return a list of result dicts.
+
+        Sweeps that share a time base are analyzed together."""
+        groups = {}
+        for i, data in enumerate(sweeps):
+            t = data.xvals('Time')
+            groups.setdefault((len(t), t[0], t[-1]), []).append(i)
+        results = [None] * len(sweeps)
+        for inds in groups.values():
+            for i, res in zip(inds, self._analyzeGroup([sweeps[i] for i in inds])):
+                results[i] = res
+        return results
+
+    def _analyzeGroup(self, sweeps):
+        params = self.params
+        mode = params['mode']
+        t = sweeps[0].xvals('Time')
+        r = self.ranges(t)
+        prim = np.vstack([s['Channel': 'primary'].view(np.ndarray) for s in sweeps])
+        cmd = np.vstack([s['Channel': 'command'].view(np.ndarray) for s in sweeps])
+        b0, b1 = r['base']
+        p0, p1 = r['pulse']
+        e0, e1 = r['pulseEnd']
+
+        primBase = prim[:, b0:b1]
+        cmdBase = cmd[:, b0:b1]
+        baseMean = primBase.mean(axis=1)
+        tPulse = t[p0:p1] - params['delayTime']
+        y = prim[:, p0:p1] - baseMean[:, None]
+
+        ## Fit exponential to the pulse, and optionally fit again using only
+        ## the first 10 time constants to avoid fitting against h-currents
+        fit, err = fitExpBatch(tPulse, y, iterations=self.refineIterations, grid=r['grid'])
+        if self.refitShort:
+            nShort = np.searchsorted(tPulse, tPulse[0] + fit[:, 2]*10, side='left')
+            refit = nShort > 10
+            if refit.any():
+                w = np.arange(len(tPulse))[None, :] < nShort[refit][:, None]
+                fit2, err2 = fitExpBatch(tPulse, y[refit], w, iterations=self.refineIterations, grid=r['grid'])
+                fit[refit] = fit2
+                err[refit] = err2
+        fitOffset, fitAmp, fitTau = fit.T
+
+        if mode == 'vc':
+            iBase, vBase = primBase, cmdBase
+            vStep = cmd[:, p0:p1].mean(axis=1) - vBase.mean(axis=1)
+            sign = np.where(vStep > 0, 1, -1)
+            iBaseMean = baseMean
+            iPulseEndMean = prim[:, e0:e1].mean(axis=1)
+            iStep = sign * np.maximum(1e-15, sign * (iPulseEndMean - iBaseMean))
+            iRes = vStep / iStep
+
+            ## From Santos-Sacchi 1993: compute the charge transfered during
+            ## the charging phase, using the fit to estimate how much charge
+            ## transfer there would have been if the charging curve had gone
+            ## all the way back to the beginning of the pulse. The fit is
+            ## summed over nCap evenly spaced points (a geometric series).
+            pTimes = t[p0:p1]
+            nCap = max(1, p1 - p0 - 1)
+            capSpan = pTimes[-1] - pTimes[0]
+            if nCap > 1:
+                ratio = np.exp(-(capSpan / (nCap - 1)) / fitTau)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    expSum = np.where(ratio < 1, (1 - ratio**nCap) / (1 - ratio), nCap)
+            else:
+                expSum = np.ones(len(sweeps))
+            Q = fitAmp * expSum * capSpan / nCap
+
+            Rin = iRes
+            Vc = vStep
+            with np.errstate(divide='ignore', invalid='ignore'):
+                Rs_denom = (Q * Rin + fitTau * Vc)
+                ok = Rs_denom != 0.0
+                Rs = np.where(ok, (Rin * fitTau * Vc) / Rs_denom, 0)
+                Rm = np.where(ok, Rin - Rs, 0)
+                Cm = np.where(ok, (Rin**2 * Q) / (Rm**2 * Vc), 0)
+            aRes = Rs
+            cap = Cm
+        else:
+            iBase, vBase = cmdBase, primBase
+            iStep = cmd[:, p0:p1].mean(axis=1) - iBase.mean(axis=1)
+            vStep = np.where(iStep >= 0, np.maximum(1e-5, -fitAmp), np.minimum(-1e-5, -fitAmp))
+            iStep = np.where(iStep == 0, 1e-14, iStep)
+            iRes = vStep / iStep
+            bridge = np.array([_bridge(s) for s in sweeps])
+            aRes = (fitOffset / iStep) + bridge
+            cap = fitTau / iRes
+
+        rmp = vBase.mean(axis=1)
+        rmps = vBase.std(axis=1)
+        rmc = iBase.mean(axis=1)
+        rmcs = iBase.std(axis=1)
+
+        results = []
+        for i in range(len(sweeps)):
+            ## Compute values for fit trace to be plotted over raw data
+            if params['drawFit']:
+                fitTrace = MetaArray((len(t),), info=[{'name': 'Time', 'values': t}])
+                fitTrace[:] = rmc[i] if mode == 'vc' else rmp[i]
+                fitTrace[p0:p1] = expFn(fit[i], tPulse) + baseMean[i]
+            else:
+                fitTrace = None
+            results.append({
+                'inputResistance': iRes[i],
+                'accessResistance': aRes[i],
+                'capacitance': cap[i],
+                'restingPotential': rmp[i], 'restingPotentialStd': rmps[i],
+                'restingCurrent': rmc[i], 'restingCurrentStd': rmcs[i],
+                'fitError': err[i],
+                'fitTrace': fitTrace,
+            })
+        return results
+
+
+def _linearExpFit(E, Y, W, sums):
+    """Given exponentials *E* = exp(-t/tau) (shape [nSweeps, k, nSamples]),
+    return the least-squares offset *a*, amplitude *b* and residual sum of
+    squares of a + b * E fitted to the rows of *Y* (already multiplied by the
+    0/1 mask *W*, which may be None). *sums* holds (S1, Sy, Syy) for each row.
+    """
+    S1, Sy, Syy = sums
+    WE = E if W is None else E * W[:, None, :]
+    Se = WE.sum(axis=2)
+    See = np.einsum('ikn,ikn->ik', WE, WE)
+    Sey = np.einsum('ikn,in->ik', WE, Y)
+    return _solveLinear(S1, Sy, Syy, Se, See, Sey)
+
+
+def _solveLinear(S1, Sy, Syy, Se, See, Sey):
+    det = S1 * See - Se**2
+    b = (S1 * Sey - Se * Sy) / det
+    a = (Sy - b * Se) / S1
+    ## residual at the least-squares solution
+    rss = Syy - a*Sy - b*Sey
+    rss[~(det > 1e-12 * S1 * See)] = np.inf
+    return a, b, rss
+
+
+def expGrid(t, gridSize=24):
+    """Return the log-spaced time constants searched by fitExpBatch for
+    sample times *t*, and the matrix exp(-t / tau) for each of them."""
+    dt = (t[-1] - t[0]) / max(1, len(t) - 1)
+    span = max(t[-1] - t[0], dt)
+    grid = np.logspace(np.log10(dt * 0.5), np.log10(span * 10), gridSize)
+    return grid, np.exp(-t[None, :] / grid[:, None])
+
+
+def fitExpBatch(t, Y, W=None, gridSize=24, iterations=6, grid=None):
+    """Fit (v[0]-v[1]) + v[1] * exp(-t / v[2]) (see expFn) to each row of *Y*.
+
+    *W* is an optional 0/1 mask selecting the samples of each row to fit.
+    Returns (fits, errors), where fits has shape [nSweeps, 3] and errors is
+    the sum of absolute residuals for each sweep.
+
+    The time constant is found by a search over a log-spaced grid between
+    the sample interval and 10x the fit window, refined by parabolic
+    interpolation on log(tau); offset and amplitude are solved in closed form.
+    *grid* may be given as returned by expGrid(t, gridSize) to avoid
+    recomputing it for every call.
+    """
+    Y = np.atleast_2d(Y)
+    if W is not None:
+        W = W.astype(float)
+        Y = Y * W
+        S1 = W.sum(axis=1)[:, None]
+    else:
+        S1 = np.empty((Y.shape[0], 1))
+        S1[:] = Y.shape[1]
+    sums = (S1, Y.sum(axis=1)[:, None], np.einsum('in,in->i', Y, Y)[:, None])
+    if grid is None:
+        grid = expGrid(t, gridSize)
+    taus, E = grid
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        ## coarse search; all sums are matrix products with the grid exponentials
+        if W is None:
+            Se = np.tile(E.sum(axis=1), (Y.shape[0], 1))
+            See = np.tile(np.einsum('kn,kn->k', E, E), (Y.shape[0], 1))
+        else:
+            Se = W.dot(E.T)
+            See = W.dot((E**2).T)
+        rss = _solveLinear(S1, sums[1], sums[2], Se, See, Y.dot(E.T))[2]
+        x = np.log(taus[np.argmin(rss, axis=1)])
+        h = np.ones(Y.shape[0]) * np.log(taus[1] / taus[0])
+
+        ## refine log(tau) by successive parabolic interpolation around the best
+        ## point; the step size shrinks once the minimum is bracketed
+        offsets = np.array([-1., 0., 1.])
+        for i in range(iterations):
+            tau = np.exp(x[:, None] + h[:, None] * offsets)
+            f = _linearExpFit(np.exp(-t / tau[..., None]), Y, W, sums)[2]
+            fm, f0, fp = f.T
+            curv = fm - 2*f0 + fp
+            step = np.where(curv > 0, 0.5 * h * (fm - fp) / curv, 0.)
+            step = np.where(np.isfinite(step), np.clip(step, -h, h), 0.)
+            x += step
+            h = np.where(np.abs(step) < h, h / 4., h)
+
+        tau = np.exp(x)
+        E = np.exp(-t[None, :] / tau[:, None])
+        a, b, rss = _linearExpFit(E[:, None, :], Y, W, sums)
+    a, b = a[:, 0], b[:, 0]
+    fits = np.column_stack([a + b, b, tau])
+    resid = Y - (a[:, None] + b[:, None] * E)
+    if W is not None:
+        resid *= W
+    return fits, np.abs(resid).sum(axis=1)
@@ -9,12 +9,13 @@ from acq4.util.Mutex import Mutex
 from acq4.util.Thread import Thread
 import traceback, sys, time
 from numpy import *
-import scipy.optimize
 from acq4.util.debug import *
 from acq4.pyqtgraph import siFormat
 import acq4.Manager as Manager
 import acq4.util.ptime as ptime
 from acq4.util.StatusBar import StatusBar
+from AnalysisBuffer import AnalysisBuffer, AnalysisWriter
+from MembraneTest import MembraneTestAnalyzer
 
 
 class PatchWindow(QtGui.QMainWindow):
@@ -27,6 +28,8 @@ class PatchWindow(QtGui.QMainWindow):
         self.setWindowTitle(clampName)
         self.startTime = None
         self.redrawCommand = 1
+        self.storageFile = None
+        self.writer = None
         
         self.analysisItems = {
             'inputResistance': u'Ω', 
@@ -141,14 +144,14 @@ class PatchWindow(QtGui.QMainWindow):
                 
         ## Configure analysis plots, curves, and data arrays
         self.analysisCurves = {}
-        self.analysisData = {'time': []}
+        self.analysisData = AnalysisBuffer(self.analysisItems.keys(), units=self.analysisItems)
         for n in self.analysisItems:
             w = getattr(self.ui, n+'Check')
             w.clicked.connect(self.showPlots)
             p = self.plots[n]
-            self.analysisCurves[n] = p.plot(pen=QtGui.QPen(QtGui.QColor(200, 200, 200)))
-            for suf in ['', 'Std']:
-                self.analysisData[n+suf] = []
+            ## long recordings are decimated to the plot resolution before drawing
+            self.analysisCurves[n] = p.plot(pen=QtGui.QPen(QtGui.QColor(200, 200, 200)), 
+                                            autoDownsample=True, downsampleMethod='peak', clipToView=True)
         self.showPlots()
         self.updateParams()
         self.show()
@@ -161,6 +164,7 @@ class PatchWindow(QtGui.QMainWindow):
         Manager.getManager().writeConfigFile(uiState, self.stateFile)
         
         self.thread.stop(block=True)
+        self.stopWriter()
         #print "Patch thread exited; module quitting."
         
     def closeEvent(self, ev):
@@ -231,13 +235,25 @@ class PatchWindow(QtGui.QMainWindow):
                 return
             self.newFile(data)
         else:
+            self.stopWriter()
             self.storageFile = None
             
     def newFile(self, data):
+        """Create a new storage file containing *data* (all rows recorded so 
+        far), then start a background writer that appends new rows to it."""
+        self.stopWriter()
         sd = self.storageDir()
         self.storageFile = sd.writeFile(data, self.clampName, autoIncrement=True, appendAxis='Time', newFile=True)
         if self.startTime is not None:
             self.storageFile.setInfo({'startTime': self.startTime})
+        self.writer = AnalysisWriter(self.analysisData, self.storageFile.name(), start=len(self.analysisData))
+        self.writer.start()
+        
+    def stopWriter(self):
+        """Write any remaining rows to the storage file and stop the writer."""
+        if self.writer is not None:
+            self.writer.stop(block=True)
+            self.writer = None
                 
     def storageDir(self):
         return self.manager.getCurrentDir().getDir('Patch', create=True)
@@ -250,8 +266,7 @@ class PatchWindow(QtGui.QMainWindow):
     def resetClicked(self):
         self.ui.recordBtn.setChecked(False)
         self.recordClicked()
-        for n in self.analysisData:
-            self.analysisData[n] = []
+        self.analysisData.clear()
         self.startTime = None
         
     def handleNewFrame(self, frame):
@@ -287,11 +302,6 @@ class PatchWindow(QtGui.QMainWindow):
             self.patchFitCurve.hide()
         prof.mark('4')
         
-        for k in self.analysisItems:
-            if k in frame['analysis']:
-                self.analysisData[k].append(frame['analysis'][k])
-        prof.mark('5')
-                
         for r in ['input', 'access']:
             res = r+'Resistance'
             label = getattr(self.ui, res+'Label')
@@ -309,68 +319,28 @@ class PatchWindow(QtGui.QMainWindow):
             self.startTime = start
             if self.ui.recordBtn.isChecked() and self.storageFile is not None:
                 self.storageFile.setInfo({'startTime': self.startTime})
-        self.analysisData['time'].append(start - self.startTime)
+        self.analysisData.append(start - self.startTime, frame['analysis'])
         prof.mark('8')
         self.updateAnalysisPlots()
         prof.mark('9')
         
-        ## Record to disk if requested.
-        if self.ui.recordBtn.isChecked():
-            
-            arr = self.makeAnalysisArray(lastOnly=True)
-            #print "appending array", arr.shape
-            if self.storageFile is None:
-                self.newFile(arr)
-            else:
-                arr.write(self.storageFile.name(), appendAxis='Time')
+        ## Record to disk if requested. Once the file is created, new rows
+        ## are appended by self.writer.
+        if self.ui.recordBtn.isChecked() and self.storageFile is None:
+            self.newFile(self.makeAnalysisArray(lastOnly=True))
         prof.mark('10')
         prof.finish()
         
     def makeAnalysisArray(self, lastOnly=False):
-        ## Determine how much of the data to include in this array
         if lastOnly:
-            sl = slice(-1, None)
-        else:
-            sl = slice(None)
-            
-        ## Generate the meta-info structure
-        info = [
-            {'name': 'Time', 'values': self.analysisData['time'][sl], 'units': 's'},
-            {'name': 'Value', 'cols': []}
-        ]
-        for k in self.analysisItems:
-            for s in ['', 'Std']:
-                if len(self.analysisData[k+s]) < 1:
-                    continue
-                info[1]['cols'].append({'name': k+s, 'units': self.analysisItems[k]})
-                
-        ## Create the blank MetaArray
-        data = MetaArray(
-            (len(info[0]['values']), len(info[1]['cols'])), 
-            dtype=float,
-            info=info
-        )
-        
-        ## Fill with data
-        for k in self.analysisItems:
-            for s in ['', 'Std']:
-                if len(self.analysisData[k+s]) < 1:
-                    continue
-                try:
-                    data[:, k+s] = self.analysisData[k+s][sl]
-                except:
-                    print data.shape, data[:, k+s].shape, len(self.analysisData[k+s][sl])
-                    raise
-                
-        return data
-            
-            
+            return self.analysisData.makeArray(-1)
+        return self.analysisData.makeArray()
         
     def updateAnalysisPlots(self):
         for n in self.analysisItems:
             p = self.plots[n]
             if p.isVisible():
-                self.analysisCurves[n].setData(self.analysisData['time'], self.analysisData[n])
+                self.analysisCurves[n].setData(self.analysisData.time(), self.analysisData.column(n))
                 #if len(self.analysisData[n+'Std']) > 0:
                     #self.analysisCurves[p+'Std'].setData(self.analysisData['time'], self.analysisData[n+'Std'])
                 #p.replot()
@@ -404,6 +374,8 @@ class PatchThread(Thread):
         self.lock = Mutex(QtCore.QMutex.Recursive)
         self.stopThread = True
         self.paramsUpdated = True
+        self.analyzer = None
+        self.task = None
     
     def updateParams(self):
         with self.lock:
@@ -418,6 +390,7 @@ class PatchThread(Thread):
                 daqName = clamp.listChannels().values()[0]['device']  ## Just guess the DAQ by checking one of the clamp's channels
                 clampName = self.clampName
                 self.paramsUpdated = True
+                self.task = None
             
             lastTime = None
             while True:
@@ -504,8 +477,8 @@ class PatchThread(Thread):
             while not exc:
                 count += 1
                 try:
-                    ## Create task
-                    task = self.manager.createTask(cmd)
+                    ## Create task, or reuse the task from the previous run
+                    task = self.task = self.manager.prepareTask(cmd, self.task)
                     ## Execute task
                     task.execute()
                     exc = True
@@ -551,196 +524,11 @@ class PatchThread(Thread):
             prof.finish()
             
     def analyze(self, data, params):
-        #print "\n\nAnalysis parameters:", params
-        ## Extract specific time segments
-        nudge = 50e-6
-        base = data['Time': 0.0:(params['delayTime']-nudge)]
-        pulse = data['Time': params['delayTime']+nudge:params['delayTime']+params['pulseTime']-nudge]
-        pulseEnd = data['Time': params['delayTime']+(params['pulseTime']*2./3.):params['delayTime']+params['pulseTime']-nudge]
-        end = data['Time':params['delayTime']+params['pulseTime']+nudge:]
-        #print "time ranges:", pulse.xvals('Time').min(),pulse.xvals('Time').max(),end.xvals('Time').min(),end.xvals('Time').max()
-        ## Exponential fit
-        #  v[0] is offset to start of exp
-        #  v[1] is amplitude of exp
-        #  v[2] is tau
-        def expFn(v, t):
-            return (v[0]-v[1]) + v[1] * exp(-t / v[2])
-        # predictions
-        ar = 10e6
-        ir = 200e6
-        if params['mode'] == 'vc':
-            ari = params['vcPulse'] / ar
-            iri = params['vcPulse'] / ir
-            pred1 = [ari, ari-iri, 1e-3]
-            pred2 = [iri-ari, iri-ari, 1e-3]
-        else:
-            #clamp = self.manager.getDevice(self.clampName)
-            try:
-                bridge = data._info[-1]['ClampState']['ClampParams']['BridgeBalResist']
-                bridgeOn = data._info[-1]['ClampState']['ClampParams']['BridgeBalEnabled']
-                #bridge = float(clamp.getParam('BridgeBalResist'))  ## pull this from the data instead.
-                #bridgeOn = clamp.getParam('BridgeBalEnable')
-                if not bridgeOn:
-                    bridge = 0.0
-            except:
-                bridge = 0.0
-            #print "bridge:", bridge
-            arv = params['icPulse'] * ar - bridge
-            irv = params['icPulse'] * ir
-            pred1 = [arv, -irv, 10e-3]
-            pred2 = [irv, irv, 50e-3]
-            
-        # Fit exponential to pulse and post-pulse traces
-        tVals1 = pulse.xvals('Time')-params['delayTime']
-        #tVals2 = end.xvals('Time')-end.xvals('Time').min()
-        
-        baseMean = base['primary'].mean()
-        fit1 = scipy.optimize.leastsq(
-            lambda v, t, y: y - expFn(v, t), pred1, 
-            args=(tVals1, pulse['primary'].view(np.ndarray) - baseMean),
-            maxfev=200, full_output=1)
-        
-        ## fit again using shorter data
-        ## this should help to avoid fitting against h-currents
-        tau4 = fit1[0][2]*10
-        t0 = pulse.xvals('Time')[0]
-        shortPulse = pulse['Time': t0:t0+tau4]
-        if shortPulse.shape[0] > 10:  ## but only if we can get enough samples from this
-            tVals2 = shortPulse.xvals('Time')-params['delayTime']
-            fit1 = scipy.optimize.leastsq(
-                lambda v, t, y: y - expFn(v, t), pred1, 
-                args=(tVals2, shortPulse['primary'].view(np.ndarray) - baseMean),
-                maxfev=200, full_output=1)
-        
-        
-        #fit2 = scipy.optimize.leastsq(
-            #lambda v, t, y: y - expFn(v, t), pred2, 
-            #args=(tVals2, end['primary'] - baseMean),
-            #maxfev=200, full_output=1, warning=False)
-            
-        
-        #err = max(abs(fit1[2]['fvec']).sum(), abs(fit2[2]['fvec']).sum())
-        err = abs(fit1[2]['fvec']).sum()
-        
-        
-        # Average fit1 with fit2 (needs massaging since fits have different starting points)
-        #print fit1
-        fit1 = fit1[0]
-        #fit2 = fit2[0]
-        #fitAvg = [   ## Let's just not do this.
-            #0.5 * (fit1[0] - (fit2[0] - (fit1[0] - fit1[1]))),
-            #0.5 * (fit1[1] - fit2[1]),
-            #0.5 * (fit1[2] + fit2[2])            
-        #]
-        fitAvg = fit1
-
-        (fitOffset, fitAmp, fitTau) = fit1
-        #print fit1
-        
-        fitTrace = empty(len(data))
-        
-        ## Handle analysis differently depenting on clamp mode
-        if params['mode'] == 'vc':
-            #global iBase, iPulse, iPulseEnd
-            iBase = base['Channel': 'primary'].asarray()
-            iPulse = pulse['Channel': 'primary']
-            iPulseEnd = pulseEnd['Channel': 'primary'] 
-            vBase = base['Channel': 'command'].asarray()
-            vPulse = pulse['Channel': 'command'] 
-            vStep = vPulse.mean() - vBase.mean()
-            sign = [-1, 1][vStep > 0]
-
-            iBaseMean = iBase.mean()
-            iPulseEndMean = iPulseEnd.asarray().mean()
-            iStep = sign * max(1e-15, sign * (iPulseEndMean - iBaseMean))
-            iRes = vStep / iStep
-            
-            ## From Santos-Sacchi 1993
-            
-            ## 1. compute charge transfered during the charging phase 
-            pTimes = pulse.xvals('Time')
-            iCapEnd = pTimes[-1]
-            iCap = iPulse['Time':pTimes[0]:iCapEnd] - iPulseEndMean
-            #self.iCap1 = iCap
-            ## Instead, we will use the fit to guess how much charge transfer there would have been 
-            ## if the charging curve had gone all the way back to the beginning of the pulse
-            iCap = expFn((fit1[1],fit1[1],fit1[2]), np.linspace(0, iCapEnd-pTimes[0], iCap.shape[0]))
-            #self.iCap2 = iCap
-            Q = sum(iCap) * (iCapEnd - pTimes[0]) / iCap.shape[0]
-            
-            
-            Rin = iRes
-            Vc = vStep
-            Rs_denom = (Q * Rin + fitTau * Vc)
-            if Rs_denom != 0.0:
-                Rs = (Rin * fitTau * Vc) / Rs_denom
-                Rm = Rin - Rs
-                Cm = (Rin**2 * Q) / (Rm**2 * Vc)
-            else:
-                Rs = 0
-                Rm = 0
-                Cm = 0
-            aRes = Rs
-            cap = Cm
-            
-        if params['mode'] == 'ic':
-            iBase = base['Channel': 'command'].asarray()
-            iPulse = pulse['Channel': 'command'] 
-            vBase = base['Channel': 'primary'].asarray()
-            vPulse = pulse['Channel': 'primary'] 
-            vPulseEnd = pulseEnd['Channel': 'primary'] 
-            iStep = iPulse.mean() - iBase.mean()
-            
-            if iStep >= 0:
-                vStep = max(1e-5, -fitAmp)
-            else:
-                vStep = min(-1e-5, -fitAmp)
-            #sign = [-1, 1][iStep >= 0]
-            #vStep = sign * max(1e-5, sign * (vPulseEnd.mean() - vBase.mean()))
-            #vStep = sign * max(1e-5, sign * fitAmp)
-            if iStep == 0:
-                iStep = 1e-14
-            iRes = (vStep / iStep)
-            #print iRes, vStep, iStep, bridge
-            #print "current step:", iStep
-            #print "bridge:", bridge
-            aRes = (fitOffset / iStep) + bridge
-            #iRes = (-fitAvg[1] / iStep) + bridge
-            cap = fitTau / iRes
-            
-            
-        rmp = vBase.mean()
-        rmps = vBase.std()
-        rmc = iBase.mean()
-        rmcs = iBase.std()
-        #print rmp, rmc
-        
-        ## Compute values for fit trace to be plotted over raw data
-        if params['drawFit']:
-            fitTrace = MetaArray((data.shape[1],), info=[{'name': 'Time', 'values': data.xvals('Time')}])
-            if params['mode'] == 'vc':
-                fitTrace[:] = rmc
-            else:
-                fitTrace[:] = rmp
-    #        print i1, i2, len(tVals1), len(tVals2), len(expFn(fit1, tVals2)), len(fitTrace[i2:])
-            ## slices from fitTrace must exactly match slices from data at the beginning of the function.
-            fitTrace['Time': params['delayTime']+nudge:params['delayTime']+params['pulseTime']-nudge] = expFn(fit1, tVals1)+baseMean
-            #fitTrace['Time':params['delayTime']+params['pulseTime']+nudge:] = expFn(fit2, tVals2)+baseMean
-        else:
-            fitTrace = None
-        
-        
-        
-            
-        return {
-            'inputResistance': iRes, 
-            'accessResistance': aRes,
-            'capacitance': cap,
-            'restingPotential': rmp, 'restingPotentialStd': rmps,
-            'restingCurrent': rmc, 'restingCurrentStd': rmcs,
-            'fitError': err,
-            'fitTrace': fitTrace
-        }
+        ## params is replaced by a new copy whenever the GUI changes, so the
+        ## analyzer (and its cached index ranges) only needs rebuilding then
+        if self.analyzer is None or self.analyzer.params is not params:
+            self.analyzer = MembraneTestAnalyzer(params)
+        return self.analyzer.analyze(data)
             
     def stop(self, block=False):
         with self.lock:
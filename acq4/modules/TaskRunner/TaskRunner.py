@@ -7,6 +7,7 @@ import acq4.util.configfile as configfile
 from collections import OrderedDict
 from acq4.util.SequenceRunner import *
 from acq4.util.Mutex import Mutex
+from acq4.util.SequenceContainer import SequenceContainer
 from acq4.util.Thread import Thread
 from acq4.Manager import getManager, logMsg, logExc
 from acq4.util.debug import *
@@ -112,6 +113,11 @@ class TaskRunner(Module):
         
         self.currentTask = None   ## pointer to current task object
         
+        ## 'directories' stores each trial of a sequence in its own directory;
+        ## 'hdf5' stores all trials in a single SequenceContainer file
+        self.sequenceStorage = config.get('sequenceStorage', 'directories')
+        self.sequenceContainer = None
+        
         for m in analysisModules.MODULES:
             item = QtGui.QListWidgetItem(m, self.ui.analysisList)
             item.setFlags(QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsUserCheckable )
@@ -606,6 +612,12 @@ class TaskRunner(Module):
                 dh = currentDir.mkdir(name, autoIncrement=True, info=info)
             else:
                 dh = None
+            
+            ## Trial directories are created through the container if all trials go into one file
+            trialParent = dh
+            if dh is not None and self.sequenceStorage == 'hdf5' and len(paramInds) > 0:
+                self.sequenceContainer = SequenceContainer.create(dh, paramInds.keys(), [len(v) for v in paramInds.values()])
+                trialParent = self.sequenceContainer
                 
             ## Tell devices to prepare for task start.
             for d in self.currentTask.devices:
@@ -616,7 +628,7 @@ class TaskRunner(Module):
             ## Generate the complete array of command structures. This can take a long time, so we start a progress dialog.
             with pg.ProgressDialog("Generating task commands..", 0, pLen) as progressDlg:
                 self.lastQtProcessTime = ptime.time()
-                prot = runSequence(lambda p: self.generateTask(dh, p, progressDlg), paramInds, paramInds.keys(), linkedParams=linkedParams)
+                prot = runSequence(lambda p: self.generateTask(trialParent, p, progressDlg), paramInds, paramInds.keys(), linkedParams=linkedParams)
             if dh is not None:
                 dh.flushSignals()  ## do this now rather than later when task is running
             
@@ -627,9 +639,14 @@ class TaskRunner(Module):
             
         except:
             self.enableStartBtns(True)
-
+            self.closeSequenceContainer()
             raise
         
+    def closeSequenceContainer(self):
+        if self.sequenceContainer is not None:
+            self.sequenceContainer.close()
+            self.sequenceContainer = None
+        
     def generateTask(self, dh, params=None, progressDlg=None):
         #prof = Profiler("Generate Task: %s" % str(params))
         ## Never put {} in the function signature
@@ -719,6 +736,7 @@ class TaskRunner(Module):
             b.setEnabled(v)
             
     def taskThreadStopped(self):
+        self.closeSequenceContainer()
         self.sigTaskFinished.emit()
         if not self.loopEnabled:   ## what if we quit due to error?
             self.enableStartBtns(True)
@@ -929,6 +947,7 @@ class TaskThread(Thread):
         self.abortThread = False
         self.paused = False
         self._currentTask = None
+        self._preparedTask = None
         self._systrace = None
                 
     def startTask(self, task, paramSpace=None):
@@ -939,6 +958,7 @@ class TaskThread(Thread):
             self.task = task
             self.paramSpace = paramSpace
             self.lastRunTime = None
+            self._preparedTask = None
             self.start() ### causes self.run() to be called from new thread
             logMsg("Task started.", importance=1)
     
@@ -970,6 +990,8 @@ class TaskThread(Thread):
             self.paramSpace = None
             printExc("Error in task thread, exiting.")
             self.sigExitFromError.emit()
+        finally:
+            self._preparedTask = None
                     
     def runOnce(self, params=None):
         # good time to collect garbage
@@ -1019,7 +1041,8 @@ class TaskThread(Thread):
             print "==========================="
             raise Exception("TaskRunner.runOnce failed to generate a proper command structure. Object type was '%s', should have been 'dict'." % type(cmd))
         
-        task = self.dm.createTask(cmd)
+        ## reuse the task from the previous run of this sequence if possible
+        task = self._preparedTask = self.dm.prepareTask(cmd, self._preparedTask)
         prof.mark('create task')
         
         self.lastRunTime = ptime.time()
@@ -18,6 +18,7 @@ else:
     
 from .Terminal import Terminal
 from numpy import ndarray
+import numpy as np
 from .library import LIBRARY
 from ..debug import printExc
 from .. import configfile as configfile
@@ -29,6 +30,50 @@ def strDict(d):
     return dict([(str(k), v) for k, v in d.items()])
 
 
+
+def sameInputs(args1, args2):
+    """Return True if two sets of node arguments (as generated in Flowchart.process) 
+    refer to identical objects."""
+    if len(args1) != len(args2):
+        return False
+    for k, v1 in args1.items():
+        if k not in args2:
+            return False
+        v2 = args2[k]
+        if isinstance(v1, dict) and isinstance(v2, dict):  ## multi-value inputs
+            if len(v1) != len(v2):
+                return False
+            for t, tv in v1.items():
+                if t not in v2 or v2[t] is not tv:
+                    return False
+        elif v1 is not v2:
+            return False
+    return True
+
+
+def _arrayData(v):
+    """Return the ndarray underlying *v* (an ndarray or MetaArray), or None."""
+    if isinstance(v, ndarray):
+        return v
+    if hasattr(v, 'implements') and v.implements('MetaArray'):
+        return v.view(ndarray)
+    return None
+
+
+def isFreshValue(value, args):
+    """Return True if *value* (a node output) is not one of the input values in
+    *args* and does not share memory with any of them."""
+    arr = _arrayData(value)
+    for v in args.values():
+        vals = v.values() if isinstance(v, dict) else [v]
+        for v2 in vals:
+            if v2 is value:
+                return False
+            if arr is not None:
+                arr2 = _arrayData(v2)
+                if arr2 is not None and np.may_share_memory(arr, arr2):
+                    return False
+    return True
         
 
 class Flowchart(Node):
@@ -60,6 +105,10 @@ class Flowchart(Node):
         self._widget = None
         self._scene = None
         self.processing = False ## flag that prevents recursive node updates
+        self._processPlan = None  ## compiled operation list used by process(); cleared when chart topology changes
+        self._memo = {}           ## {node: (inputs, stateKey, result)}; last output generated by each node in process()
+        self._memoize = False
+        self._exclusiveOutputs = set()  ## output terminals connected to exactly one input (see compileProcessPlan)
         
         self.widget()
         
@@ -200,6 +249,9 @@ class Flowchart(Node):
         node.sigClosed.connect(self.nodeClosed)
         node.sigRenamed.connect(self.nodeRenamed)
         node.sigOutputChanged.connect(self.nodeOutputChanged)
+        for signal in ['sigTerminalAdded', 'sigTerminalRemoved', 'sigTerminalRenamed', 'sigTerminalConnected', 'sigTerminalDisconnected']:
+            getattr(node, signal).connect(self.topologyChanged)
+        self.topologyChanged()
         self.sigChartChanged.emit(self, 'add', node)
         
     def removeNode(self, node):
@@ -215,6 +267,13 @@ class Flowchart(Node):
                 getattr(node, signal).disconnect(self.nodeClosed)
             except (TypeError, RuntimeError):
                 pass
+        for signal in ['sigTerminalAdded', 'sigTerminalRemoved', 'sigTerminalRenamed', 'sigTerminalConnected', 'sigTerminalDisconnected']:
+            try:
+                getattr(node, signal).disconnect(self.topologyChanged)
+            except (TypeError, RuntimeError):
+                pass
+        self.topologyChanged()
+        self._memo.pop(node, None)
         self.sigChartChanged.emit(self, 'remove', node)
         
     def nodeRenamed(self, node, oldName):
@@ -249,14 +308,21 @@ class Flowchart(Node):
         Keyword arguments must be the names of input terminals. 
         The return value is a dict with one key per output terminal.
         
+        The order of operations is compiled once and reused until the chart
+        topology changes. If memoization is enabled (see setMemoization), nodes 
+        that receive the same input objects as in the previous call and whose
+        stateKey() is unchanged are not re-processed; their previous output is
+        reused instead.
+        
+        If memoization is disabled, a node output that is connected only to a
+        single input and was newly generated by its node (it is not one of the
+        node's inputs and does not share memory with them) is marked as owned by
+        the receiving node, which may then modify it in place (see Node.ownsInput).
         """
         data = {}  ## Stores terminal:value pairs
         
-        ## determine order of operations
-        ## order should look like [('p', node1), ('p', node2), ('d', terminal1), ...] 
-        ## Each tuple specifies either (p)rocess this node or (d)elete the result from this terminal
-        order = self.processOrder()
-        #print "ORDER:", order
+        ## determine order of operations (see compileProcessPlan)
+        plan = self.compileProcessPlan()
         
         ## Record inputs given to process()
         for n, t in self.inputNode.outputs().items():
@@ -266,56 +332,127 @@ class Flowchart(Node):
                 data[t] = args[n]
         
         ret = {}
+        owned = set()  ## output terminals whose value may be modified by the (single) receiving node
             
         ## process all in order
-        for c, arg in order:
+        for op in plan:
             
-            if c == 'p':     ## Process a single node
-                #print "===> process:", arg
-                node = arg
-                if node is self.inputNode:
-                    continue  ## input node has already been processed.
-                
-                            
-                ## get input and output terminals for this node
-                outs = list(node.outputs().values())
-                ins = list(node.inputs().values())
+            if op[0] == 'p':     ## Process a single node
+                c, node, ins, outs = op
                 
                 ## construct input value dictionary
                 args = {}
-                for inp in ins:
-                    inputs = inp.inputTerminals()
-                    if len(inputs) == 0:
-                        continue
+                ownedInputs = set()
+                for inp, inputs, exclusive in ins:
                     if inp.isMultiValue():  ## multi-input terminals require a dict of all inputs
                         args[inp.name()] = dict([(i, data[i]) for i in inputs if i in data])
                     else:                   ## single-inputs terminals only need the single input value available
                         args[inp.name()] = data[inputs[0]]  
+                        if inputs[0] in owned:
+                            ownedInputs.add(inp.name())
                         
                 if node is self.outputNode:
                     ret = args  ## we now have the return value, but must keep processing in case there are other endpoint nodes in the chart
                 else:
-                    try:
-                        if node.isBypassed():
-                            result = node.processBypassed(args)
-                        else:
-                            result = node.process(display=False, **args)
-                    except:
-                        print("Error processing node %s. Args are: %s" % (str(node), str(args)))
-                        raise
+                    result = self._processNode(node, args, ownedInputs)
                     for out in outs:
-                        #print "    Output:", out, out.name()
-                        #print out.name()
                         try:
                             data[out] = result[out.name()]
                         except KeyError:
-                            pass
-            elif c == 'd':   ## delete a terminal result (no longer needed; may be holding a lot of memory)
-                #print "===> delete", arg
-                if arg in data:
-                    del data[arg]
+                            continue
+                        if not self._memoize and out in self._exclusiveOutputs and isFreshValue(data[out], args):
+                            owned.add(out)
+            else:   ## delete a terminal result (no longer needed; may be holding a lot of memory)
+                if op[1] in data:
+                    del data[op[1]]
+                owned.discard(op[1])
 
         return ret
+    
+    def _processNode(self, node, args, ownedInputs=()):
+        """Process a single node for process(), reusing its memoized output
+        if neither its inputs nor its state have changed since the last call.
+        *ownedInputs* names the inputs that the node may modify in place."""
+        bypassed = node.isBypassed()
+        key = None
+        if self._memoize:
+            key = 'bypass' if bypassed else node.stateKey()
+        if key is not None:
+            memo = self._memo.get(node, None)
+            if memo is not None and sameInputs(memo[0], args) and fn.eq(memo[1], key):
+                return memo[2]
+        
+        node._ownedInputs = ownedInputs
+        try:
+            if bypassed:
+                result = node.processBypassed(args)
+            else:
+                result = node.process(display=False, **args)
+        except:
+            self._memo.pop(node, None)
+            print("Error processing node %s. Args are: %s" % (str(node), str(args)))
+            raise
+        finally:
+            node._ownedInputs = ()
+            
+        if key is None:
+            self._memo.pop(node, None)
+        else:
+            self._memo[node] = (args, key, result)
+        return result
+        
+    def compileProcessPlan(self):
+        """Return the cached list of operations used by process(), generating 
+        it first if the chart topology has changed since the last call.
+        
+        The plan looks like [('p', node, inputs, outputs), ('d', terminal), ...]
+        where *inputs* is a list of (inputTerminal, [sourceTerminals], exclusive)
+        tuples for each connected input of the node and *outputs* is the list of
+        the node's output terminals. *exclusive* is True for single-value inputs
+        whose source is a node output connected to nothing else. See processOrder().
+        """
+        if self._processPlan is None:
+            plan = []
+            exclusive = set()
+            for c, arg in self.processOrder():
+                if c == 'p':
+                    if arg is self.inputNode:
+                        continue  ## input node is handled separately by process()
+                    ins = []
+                    for inp in arg.inputs().values():
+                        inputs = inp.inputTerminals()
+                        if len(inputs) > 0:
+                            excl = (not inp.isMultiValue() and inputs[0].node() is not self.inputNode 
+                                    and len(inputs[0].connections()) == 1)
+                            if excl:
+                                exclusive.add(inputs[0])
+                            ins.append((inp, inputs, excl))
+                    plan.append(('p', arg, ins, list(arg.outputs().values())))
+                else:
+                    plan.append((c, arg))
+            self._exclusiveOutputs = exclusive
+            self._processPlan = plan
+        return self._processPlan
+        
+    def topologyChanged(self, *args):
+        """Called whenever nodes, terminals, or connections are added to or
+        removed from the chart. Discards the compiled process plan."""
+        self._processPlan = None
+        
+    def setMemoization(self, memo):
+        """Set whether process() may reuse the previous output of nodes whose
+        inputs and state have not changed (see Node.stateKey). Memoization is 
+        disabled by default, since stored results keep node outputs alive after
+        they are no longer needed. Disabling memoization also discards all 
+        stored results."""
+        self._memoize = memo
+        if not memo:
+            self.clearMemo()
+            
+    def clearMemo(self):
+        """Discard all node outputs stored by process(). This forces every node
+        to be processed on the next call and releases any data held by the memo."""
+        self._memo = {}
         
     def processOrder(self):
         """Return the order of operations required to process this chart.
@@ -31,6 +31,8 @@ class Node(QtCore.QObject):
     sigTerminalRenamed = QtCore.Signal(object, object)  # term, oldName
     sigTerminalAdded = QtCore.Signal(object, object)  # self, term
     sigTerminalRemoved = QtCore.Signal(object, object)  # self, term
+    sigTerminalConnected = QtCore.Signal(object, object)  # localTerm, remoteTerm
+    sigTerminalDisconnected = QtCore.Signal(object, object)  # localTerm, remoteTerm
 
     
     def __init__(self, name, terminals=None, allowAddInput=False, allowAddOutput=False, allowRemove=True):
@@ -70,6 +72,7 @@ class Node(QtCore.QObject):
         self._allowAddInput = allowAddInput   ## flags to allow the user to add/remove terminals
         self._allowAddOutput = allowAddOutput
         self._allowRemove = allowRemove
+        self._ownedInputs = ()  ## set by Flowchart.process(); see ownsInput()
         
         self.exception = None
         if terminals is None:
@@ -179,6 +182,30 @@ class Node(QtCore.QObject):
         """
         return {}
     
+    def stateKey(self):
+        """Return an object describing all internal state that affects the output
+        of process(), or None if the output of this node may not be memoized.
+        
+        Flowchart.process() uses this value to decide whether a node must be 
+        re-processed: if the node receives the identical input objects it was
+        last given and its stateKey() compares equal to the previous value, the
+        previous output is reused. The default implementation returns None, which
+        causes the node to be processed every time.
+        """
+        return None
+    
+    def ownsInput(self, name):
+        """Return True if the value currently given to the input terminal *name*
+        is not used anywhere else, so that process() may modify it in place 
+        instead of allocating a new result.
+        
+        This is only True while Flowchart.process() is running with memoization
+        disabled, and only for values newly generated by an upstream node whose
+        output is connected to nothing but this input. Nodes that can work in 
+        place should check this first; all others may ignore it.
+        """
+        return name in self._ownedInputs
+    
     def graphicsItem(self):
         """Return the GraphicsItem for this node. Subclasses may re-implement
         this method to customize their appearance in the flowchart."""
@@ -93,6 +93,7 @@ class Terminal(object):
         if self.isOutput() and self.isMultiValue():
             self.node().update()
         self.node().connected(self, term)
+        self.node().sigTerminalConnected.emit(self, term)
         
     def disconnected(self, term):
         """Called whenever this terminal has been disconnected from another. (note--this function is called on both terminals)"""
@@ -103,6 +104,7 @@ class Terminal(object):
             if self.isInput():
                 self.setValue(None)
         self.node().disconnected(self, term)
+        self.node().sigTerminalDisconnected.emit(self, term)
 
     def inputChanged(self, term, process=True):
         """Called whenever there is a change to the input value to this terminal.
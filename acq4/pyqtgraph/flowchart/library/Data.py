@@ -37,6 +37,9 @@ class ColumnSelectNode(Node):
             
         return out
         
+    def stateKey(self):
+        return (self.axis, sorted(self.columns))
+        
     def ctrlWidget(self):
         return self.columnList
 
@@ -322,6 +325,9 @@ class ColumnJoinNode(Node):
     def order(self):
         return [str(self.tree.topLevelItem(i).text(0)) for i in range(self.tree.topLevelItemCount())]
 
+    def stateKey(self):
+        return self.order()
+
     def saveState(self):
         state = Node.saveState(self)
         state['order'] = self.order()
@@ -363,6 +369,7 @@ class Mean(CtrlNode):
     """Calculate the mean of an array across an axis.
     """
     nodeName = 'Mean'
+    memoizable = True
     uiTemplate = [
         ('axis', 'intSpin', {'value': 0, 'min': -1, 'max': 1000000}),
     ]
@@ -377,6 +384,7 @@ class Max(CtrlNode):
     """Calculate the maximum of an array across an axis.
     """
     nodeName = 'Max'
+    memoizable = True
     uiTemplate = [
         ('axis', 'intSpin', {'value': 0, 'min': -1, 'max': 1000000}),
     ]
@@ -391,6 +399,7 @@ class Min(CtrlNode):
     """Calculate the minimum of an array across an axis.
     """
     nodeName = 'Min'
+    memoizable = True
     uiTemplate = [
         ('axis', 'intSpin', {'value': 0, 'min': -1, 'max': 1000000}),
     ]
@@ -405,6 +414,7 @@ class Stdev(CtrlNode):
     """Calculate the standard deviation of an array across an axis.
     """
     nodeName = 'Stdev'
+    memoizable = True
     uiTemplate = [
         ('axis', 'intSpin', {'value': -0, 'min': -1, 'max': 1000000}),
     ]
@@ -419,6 +429,7 @@ class Index(CtrlNode):
     """Select an index from an array axis.
     """
     nodeName = 'Index'
+    memoizable = True
     uiTemplate = [
         ('axis', 'intSpin', {'value': 0, 'min': 0, 'max': 1000000}),
         ('index', 'intSpin', {'value': 0, 'min': 0, 'max': 1000000}),
@@ -439,6 +450,7 @@ class Slice(CtrlNode):
     """Select a slice from an array axis.
     """
     nodeName = 'Slice'
+    memoizable = True
     uiTemplate = [
         ('axis', 'intSpin', {'value': 0, 'min': 0, 'max': 1e6}),
         ('start', 'intSpin', {'value': 0, 'min': -1e6, 'max': 1e6}),
@@ -465,6 +477,7 @@ class AsType(CtrlNode):
     """Convert an array to a different dtype.
     """
     nodeName = 'AsType'
+    memoizable = True
     uiTemplate = [
         ('dtype', 'combo', {'values': ['float', 'int', 'float32', 'float64', 'float128', 'int8', 'int16', 'int32', 'int64', 'uint8', 'uint16', 'uint32', 'uint64'], 'index': 0}),
     ]
@@ -14,6 +14,7 @@ from ... import metaarray as metaarray
 class Downsample(CtrlNode):
     """Downsample by averaging samples together."""
     nodeName = 'Downsample'
+    memoizable = True
     uiTemplate = [
         ('n', 'intSpin', {'min': 1, 'max': 1000000})
     ]
@@ -25,6 +26,7 @@ class Downsample(CtrlNode):
 class Subsample(CtrlNode):
     """Downsample by selecting every Nth sample."""
     nodeName = 'Subsample'
+    memoizable = True
     uiTemplate = [
         ('n', 'intSpin', {'min': 1, 'max': 1000000})
     ]
@@ -36,6 +38,7 @@ class Subsample(CtrlNode):
 class Bessel(CtrlNode):
     """Bessel filter. Input data must have time values."""
     nodeName = 'BesselFilter'
+    memoizable = True
     uiTemplate = [
         ('band', 'combo', {'values': ['lowpass', 'highpass'], 'index': 0}),
         ('cutoff', 'spin', {'value': 1000., 'step': 1, 'dec': True, 'bounds': [0.0, None], 'suffix': 'Hz', 'siPrefix': True}),
@@ -55,6 +58,7 @@ class Bessel(CtrlNode):
 class Butterworth(CtrlNode):
     """Butterworth filter"""
     nodeName = 'ButterworthFilter'
+    memoizable = True
     uiTemplate = [
         ('band', 'combo', {'values': ['lowpass', 'highpass'], 'index': 0}),
         ('wPass', 'spin', {'value': 1000., 'step': 1, 'dec': True, 'bounds': [0.0, None], 'suffix': 'Hz', 'siPrefix': True}),
@@ -77,6 +81,7 @@ class Butterworth(CtrlNode):
 class ButterworthNotch(CtrlNode):
     """Butterworth notch filter"""
     nodeName = 'ButterworthNotchFilter'
+    memoizable = True
     uiTemplate = [
         ('low_wPass', 'spin', {'value': 1000., 'step': 1, 'dec': True, 'bounds': [0.0, None], 'suffix': 'Hz', 'siPrefix': True}),
         ('low_wStop', 'spin', {'value': 2000., 'step': 1, 'dec': True, 'bounds': [0.0, None], 'suffix': 'Hz', 'siPrefix': True}),
@@ -100,6 +105,7 @@ class ButterworthNotch(CtrlNode):
 class Mean(CtrlNode):
     """Filters data by taking the mean of a sliding window"""
     nodeName = 'MeanFilter'
+    memoizable = True
     uiTemplate = [
         ('n', 'intSpin', {'min': 1, 'max': 1000000})
     ]
@@ -113,6 +119,7 @@ class Mean(CtrlNode):
 class Median(CtrlNode):
     """Filters data by taking the median of a sliding window"""
     nodeName = 'MedianFilter'
+    memoizable = True
     uiTemplate = [
         ('n', 'intSpin', {'min': 1, 'max': 1000000})
     ]
@@ -128,6 +135,7 @@ class Median(CtrlNode):
 class Mode(CtrlNode):
     """Filters data by taking the mode (histogram-based) of a sliding window"""
     nodeName = 'ModeFilter'
+    memoizable = True
     uiTemplate = [
         ('window', 'intSpin', {'value': 500, 'min': 1, 'max': 1000000}),
     ]
@@ -140,6 +148,7 @@ class Mode(CtrlNode):
 class Denoise(CtrlNode):
     """Removes anomalous spikes from data, replacing with nearby values"""
     nodeName = 'DenoiseFilter'
+    memoizable = True
     uiTemplate = [
         ('radius', 'intSpin', {'value': 2, 'min': 0, 'max': 1000000}),
         ('threshold', 'doubleSpin', {'value': 4.0, 'min': 0, 'max': 1000})
@@ -154,6 +163,7 @@ class Denoise(CtrlNode):
 class Gaussian(CtrlNode):
     """Gaussian smoothing filter."""
     nodeName = 'GaussianFilter'
+    memoizable = True
     uiTemplate = [
         ('sigma', 'doubleSpin', {'min': 0, 'max': 1000000})
     ]
@@ -171,10 +181,11 @@ class Gaussian(CtrlNode):
 class Derivative(CtrlNode):
     """Returns the pointwise derivative of the input"""
     nodeName = 'DerivativeFilter'
+    memoizable = True
     
     def processData(self, data):
         if hasattr(data, 'implements') and data.implements('MetaArray'):
-            info = data.infoCopy()
+            info = data.infoCopy(deep=False)
             if 'values' in info[0]:
                 info[0]['values'] = info[0]['values'][:-1]
             return metaarray.MetaArray(data[1:] - data[:-1], info=info)
@@ -185,9 +196,12 @@ class Derivative(CtrlNode):
 class Integral(CtrlNode):
     """Returns the pointwise integral of the input"""
     nodeName = 'IntegralFilter'
+    memoizable = True
     
     @metaArrayWrapper
     def processData(self, data):
+        if not self.ownsInput('In'):
+            data = data.copy()
         data[1:] += data[:-1]
         return data
 
@@ -195,6 +209,7 @@ class Integral(CtrlNode):
 class Detrend(CtrlNode):
     """Removes linear trend from the data"""
     nodeName = 'DetrendFilter'
+    memoizable = True
     
     @metaArrayWrapper
     def processData(self, data):
@@ -274,16 +289,18 @@ class RemoveBaseline(PlottingCtrlNode):
 class AdaptiveDetrend(CtrlNode):
     """Removes baseline from data, ignoring anomalous events"""
     nodeName = 'AdaptiveDetrend'
+    memoizable = True
     uiTemplate = [
         ('threshold', 'doubleSpin', {'value': 3.0, 'min': 0, 'max': 1000000})
     ]
     
     def processData(self, data):
-        return functions.adaptiveDetrend(data, threshold=self.ctrls['threshold'].value())
+        return functions.adaptiveDetrend(data, threshold=self.ctrls['threshold'].value(), inPlace=self.ownsInput('In'))
 
 class HistogramDetrend(CtrlNode):
     """Removes baseline from data by computing mode (from histogram) of beginning and end of data."""
     nodeName = 'HistogramDetrend'
+    memoizable = True
     uiTemplate = [
         ('windowSize', 'intSpin', {'value': 500, 'min': 10, 'max': 1000000, 'suffix': 'pts'}),
         ('numBins', 'intSpin', {'value': 50, 'min': 3, 'max': 1000000}),
@@ -295,12 +312,13 @@ class HistogramDetrend(CtrlNode):
         #ws = self.ctrls['windowSize'].value()
         #bn = self.ctrls['numBins'].value()
         #offset = self.ctrls['offsetOnly'].checked()
-        return functions.histogramDetrend(data, window=s['windowSize'], bins=s['numBins'], offsetOnly=s['offsetOnly'])
+        return functions.histogramDetrend(data, window=s['windowSize'], bins=s['numBins'], offsetOnly=s['offsetOnly'], inPlace=self.ownsInput('In'))
 
 
     
 class RemovePeriodic(CtrlNode):
     nodeName = 'RemovePeriodic'
+    memoizable = True
     uiTemplate = [
         #('windowSize', 'intSpin', {'value': 500, 'min': 10, 'max': 1000000, 'suffix': 'pts'}),
         #('numBins', 'intSpin', {'value': 50, 'min': 3, 'max': 1000000})
@@ -340,12 +358,12 @@ class RemovePeriodic(CtrlNode):
                 
         data2 = np.fft.ifft(ft).real
         
-        ma = metaarray.MetaArray(data2, info=data.infoCopy())
-        return ma
+        return data.withData(data2)
         
         
 class TVDenoise(CtrlNode):
     nodeName = 'TVDenoise'
+    memoizable = True
     uiTemplate = [
         ('weight', 'spin', {'value': 50, 'min': None, 'max': None, 'step': 1.0}),
         ('epsilon', 'spin', {'value': 2.4e-4, 'min': 1e-16, 'max': None, 'step': 1e-4}),
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import numpy as np
 from ..Node import Node
 from .common import CtrlNode
 
@@ -37,6 +38,11 @@ class BinOpNode(CtrlNode):
         })
         
     def process(self, **args):
+        if self.ownsInput('A') and self.stateGroup.state()['outputType'] == 'no change':
+            out = self.processInPlace(args['A'], args['B'])
+            if out is not None:
+                return {'Out': out}
+            
         if isinstance(self.fn, tuple):
             for name in self.fn:
                 try:
@@ -64,6 +70,26 @@ class BinOpNode(CtrlNode):
         #print "     ", fn, out
         return {'Out': out}
 
+    def processInPlace(self, a, b):
+        """Apply the operation to the floating-point array (or MetaArray) *a* in
+        place and return it. Returns None if the result would not have the same
+        shape and dtype as *a*."""
+        arr = a.view(np.ndarray) if (hasattr(a, 'implements') and a.implements('MetaArray')) else a
+        if not isinstance(arr, np.ndarray) or arr.dtype.kind != 'f':
+            return None
+        if hasattr(b, 'implements') and b.implements('MetaArray'):
+            b = b.view(np.ndarray)
+        try:
+            if np.result_type(arr, b) != arr.dtype or np.broadcast(arr, b).shape != arr.shape:
+                return None
+        except (TypeError, ValueError):
+            return None
+        for name in (self.fn if isinstance(self.fn, tuple) else (self.fn,)):
+            fn = getattr(arr, '__i' + name[2:], None)
+            if fn is not None and fn(b) is not NotImplemented:
+                return a
+        return None
+
 
 class AbsNode(UniOpNode):
     """Returns abs(Inp). Does not check input types."""
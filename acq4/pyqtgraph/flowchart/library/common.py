@@ -88,6 +88,8 @@ def generateUi(opts):
 class CtrlNode(Node):
     """Abstract class for nodes with auto-generated control UI"""
     
+    memoizable = False  ## see stateKey()
+    
     sigStateChanged = QtCore.Signal(object)
     
     def __init__(self, name, ui=None, terminals=None):
@@ -114,6 +116,14 @@ class CtrlNode(Node):
         out = self.processData(In)
         return {'Out': out}
     
+    def stateKey(self):
+        ## Nodes whose output depends only on their inputs and the values in their
+        ## control widgets, and which never modify their inputs, may set 
+        ## memoizable = True to let Flowchart.process() reuse their output.
+        if not self.memoizable:
+            return None
+        return self.stateGroup.state()
+    
     def saveState(self):
         state = Node.saveState(self)
         state['ctrl'] = self.stateGroup.state()
@@ -178,7 +188,9 @@ def metaArrayWrapper(fn):
     def newFn(self, data, *args, **kargs):
         if HAVE_METAARRAY and (hasattr(data, 'implements') and data.implements('MetaArray')):
             d1 = fn(self, data.view(np.ndarray), *args, **kargs)
-            info = data.infoCopy()
+            if d1.shape == data.shape:
+                return data.withData(d1)
+            info = data.infoCopy(deep=False)
             if d1.shape != data.shape:
                 for i in range(data.ndim):
                     if 'values' in info[i]:
@@ -36,7 +36,7 @@ def downsample(data, n, axis=0, xvals='subsample'):
     if ma is None:
         return d2
     else:
-        info = ma.infoCopy()
+        info = ma.infoCopy(deep=False)
         if 'values' in info[axis]:
             if xvals == 'subsample':
                 info[axis]['values'] = info[axis]['values'][::n][:nPts]
@@ -67,7 +67,7 @@ def applyFilter(data, b, a, padding=100, bidir=True):
         d1 = d1[padding:-padding]
         
     if (hasattr(data, 'implements') and data.implements('MetaArray')):
-        return MetaArray(d1, info=data.infoCopy())
+        return data.withData(d1)
     else:
         return d1
     
@@ -159,7 +159,7 @@ def modeFilter(data, window=500, step=None, bins=None):
     d2 = np.hstack(chunks)
     
     if (hasattr(data, 'implements') and data.implements('MetaArray')):
-        return MetaArray(d2, info=data.infoCopy())
+        return data.withData(d2)
     return d2
 
 def denoise(data, radius=2, threshold=4):
@@ -186,11 +186,12 @@ def denoise(data, radius=2, threshold=4):
     d6[-radius:] = d1[-radius:]
     
     if (hasattr(data, 'implements') and data.implements('MetaArray')):
-        return MetaArray(d6, info=data.infoCopy())
+        return data.withData(d6)
     return d6
 
-def adaptiveDetrend(data, x=None, threshold=3.0):
-    """Return the signal with baseline removed. Discards outliers from baseline measurement."""
+def adaptiveDetrend(data, x=None, threshold=3.0, inPlace=False):
+    """Return the signal with baseline removed. Discards outliers from baseline measurement.
+    If inPlace is True, floating-point data is modified and returned rather than copied."""
     try:
         import scipy.signal
     except ImportError:
@@ -210,16 +211,20 @@ def adaptiveDetrend(data, x=None, threshold=3.0):
     
     lr = scipy.stats.linregress(x[mask], d[mask])
     base = lr[1] + lr[0]*x
+    if inPlace and d.dtype.kind == 'f':
+        d -= base
+        return data
     d4 = d - base
     
     if (hasattr(data, 'implements') and data.implements('MetaArray')):
-        return MetaArray(d4, info=data.infoCopy())
+        return data.withData(d4)
     return d4
     
 
-def histogramDetrend(data, window=500, bins=50, threshold=3.0, offsetOnly=False):
+def histogramDetrend(data, window=500, bins=50, threshold=3.0, offsetOnly=False, inPlace=False):
     """Linear detrend. Works by finding the most common value at the beginning and end of a trace, excluding outliers.
     If offsetOnly is True, then only the offset from the beginning of the trace is subtracted.
+    If inPlace is True, floating-point data is modified and returned rather than copied.
     """
     
     d1 = data.view(np.ndarray)
@@ -235,13 +240,16 @@ def histogramDetrend(data, window=500, bins=50, threshold=3.0, offsetOnly=False)
         v[i] = 0.5 * (x[ind] + x[ind+1])
         
     if offsetOnly:
-        d3 = data.view(np.ndarray) - v[0]
+        base = v[0]
     else:
         base = np.linspace(v[0], v[1], len(data))
-        d3 = data.view(np.ndarray) - base
+    if inPlace and d1.dtype.kind == 'f':
+        d1 -= base
+        return data
+    d3 = d1 - base
     
     if (hasattr(data, 'implements') and data.implements('MetaArray')):
-        return MetaArray(d3, info=data.infoCopy())
+        return data.withData(d3)
     return d3
     
 def concatenateColumns(data):
@@ -349,7 +357,7 @@ def removePeriodic(data, f0=60.0, dt=None, harmonics=10, samples=4):
     data2 = np.fft.ifft(ft).real
     
     if (hasattr(data, 'implements') and data.implements('MetaArray')):
-        return metaarray.MetaArray(data2, info=data.infoCopy())
+        return data.withData(data2)
     else:
         return data2
     
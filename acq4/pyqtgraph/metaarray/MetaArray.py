@@ -471,12 +471,32 @@ class MetaArray(object):
         axis = self._interpretAxis(axis)
         return MetaArray(np.concatenate(self, val, axis), info=self._info)
   
-    def infoCopy(self, axis=None):
-        """Return a deep copy of the axis meta info for this object"""
+    def infoCopy(self, axis=None, deep=True):
+        """Return a deep copy of the axis meta info for this object.
+        
+        If *deep* is False, only the list of axes and the axis dicts are copied.
+        Keys in the copied dicts may be set or replaced freely, but the values 
+        they contain (such as axis value arrays and column lists) are shared with
+        this array and must not be modified in place."""
         if axis is None:
-            return copy.deepcopy(self._info)
+            if deep:
+                return copy.deepcopy(self._info)
+            return [ax.copy() for ax in self._info]
         else:
-            return copy.deepcopy(self._info[self._interpretAxis(axis)])
+            ax = self._info[self._interpretAxis(axis)]
+            return copy.deepcopy(ax) if deep else ax.copy()
+  
+    def withData(self, data):
+        """Return a new MetaArray containing *data*, which must have the same 
+        shape as this array, and this array's meta info.
+        
+        The info is shared rather than copied, so this is much cheaper than
+        MetaArray(data, info=self.infoCopy()) when data is passed through a
+        series of filters. Shared info must be treated as read-only; use 
+        infoCopy() to obtain info that can be modified."""
+        if data.shape != self.shape:
+            raise Exception("Data shape %s does not match MetaArray shape %s" % (data.shape, self.shape))
+        return MetaArray(data, info=self._info)
   
     def copy(self):
         return MetaArray(self._data.copy(), info=self.infoCopy())
@@ -792,7 +812,7 @@ class MetaArray(object):
             return
         ## the remaining data is the actual array
         if mmap:
-            subarr = np.memmap(fd, dtype=meta['type'], mode='r', shape=meta['shape'])
+            subarr = np.memmap(fd, dtype=meta['type'], mode='r', shape=meta['shape'], offset=fd.tell())
         else:
             subarr = np.fromstring(fd.read(), dtype=meta['type'])
             subarr.shape = meta['shape']
@@ -829,7 +849,7 @@ class MetaArray(object):
                 subarr = pickle.loads(fd.read())
             else:
                 if mmap:
-                    subarr = np.memmap(fd, dtype=meta['type'], mode='r', shape=meta['shape'])
+                    subarr = np.memmap(fd, dtype=meta['type'], mode='r', shape=meta['shape'], offset=fd.tell())
                 else:
                     subarr = np.fromstring(fd.read(), dtype=meta['type'])
             #subarr = subarr.view(subtype)
@@ -0,0 +1,59 @@
+import numpy as np
+from acq4.pyqtgraph.metaarray import MetaArray
+
+
+def makeArray():
+    info = [
+        {'name': 'Channel', 'cols': [{'name': 'primary', 'units': 'A'}, {'name': 'secondary', 'units': 'V'}]},
+        {'name': 'Time', 'units': 's', 'values': np.linspace(0, 1, 100)},
+        {'note': 'test'},
+    ]
+    return MetaArray(np.random.normal(size=(2, 100)), info=info)
+
+
+def test_sliceCopiesInfo():
+    ma = makeArray()
+    sl = ma[:, 10:20]
+    assert np.all(sl.xvals('Time') == ma.xvals('Time')[10:20])
+    sl.xvals('Time')[:] = -1
+    assert np.all(ma.xvals('Time') == np.linspace(0, 1, 100))
+    
+    sl = ma[0:1]
+    sl._info[0]['cols'][0]['units'] = 'V'
+    assert ma._info[0]['cols'][0]['units'] == 'A'
+
+
+def test_binopCopiesInfo():
+    ma = makeArray()
+    out = ma * 2
+    assert np.all(out.asarray() == ma.asarray() * 2)
+    assert out._info[1] is not ma._info[1]
+    out._info[1]['values'][:] = 0
+    assert np.all(ma.xvals('Time') == np.linspace(0, 1, 100))
+
+
+def test_withData():
+    ma = makeArray()
+    out = ma.withData(ma.asarray() + 1)
+    assert out._info[1] is ma._info[1]
+    assert out.xvals('Time') is ma.xvals('Time')
+    assert np.all(out.asarray() == ma.asarray() + 1)
+    try:
+        ma.withData(np.zeros((2, 50)))
+        raise AssertionError("withData accepted data with a different shape")
+    except Exception as exc:
+        assert 'shape' in str(exc)
+
+
+def test_infoCopy():
+    ma = makeArray()
+    deep = ma.infoCopy()
+    deep[1]['values'][0] = 5
+    assert ma.xvals('Time')[0] == 0
+    
+    shallow = ma.infoCopy(deep=False)
+    shallow[1]['values'] = shallow[1]['values'][:-1]
+    shallow[2]['note'] = 'changed'
+    assert len(ma.xvals('Time')) == 100
+    assert ma._info[2]['note'] == 'test'
+    assert ma.infoCopy(1, deep=False)['values'] is ma._info[1]['values']
@@ -20,5 +20,5 @@ TODO:
 """
 
 from .processes import *
-from .parallelizer import Parallelize, CanceledError
+from .parallelizer import Parallelize, WorkerPool, CanceledError
 from .remoteproxy import proxy, ClosedError, NoResultError
@@ -1,4 +1,5 @@
-import os, sys, time, multiprocessing, re
+import os, sys, time, multiprocessing, re, select, errno, mmap
+import numpy as np
 from .processes import ForkedProcess
 from .remoteproxy import ClosedError
 from ..python2_3 import basestring, xrange
@@ -37,9 +38,32 @@ class Parallelize(object):
         
     The only major caveat is that *result* in the example above must be picklable,
     since it is automatically sent via pipe back to the parent process.
+    
+    Large array results are better written into an array created with
+    Parallelize.sharedArray(), which is shared with the workers rather than
+    being sent back through the pipe::
+    
+        out = Parallelize.sharedArray((len(tasks), 1000))
+        with Parallelize(tasks, out=out) as tasker:
+            for task in tasker:
+                tasker.out[tasker.index] = processTask(task)
+    
+    By default, tasks are handed out one at a time to whichever worker is free
+    (so tasks with uneven cost are balanced between workers). With
+    schedule='static', tasks are instead divided round-robin between the
+    workers before they start.
+
+    Workers are forked anew for each Parallelize block. Code that repeatedly
+    applies a function to many small task lists may instead use
+    Parallelize.map() with a WorkerPool, which keeps its workers running
+    between calls::
+
+        with WorkerPool(workers=4) as pool:
+            for tasks in taskLists:
+                results = Parallelize.map(processTask, tasks, pool=pool)
     """
 
-    def __init__(self, tasks=None, workers=None, block=True, progressDialog=None, randomReseed=True, **kwds):
+    def __init__(self, tasks=None, workers=None, block=True, progressDialog=None, randomReseed=True, schedule='dynamic', **kwds):
         """
         ===============  ===================================================================
         **Arguments:**
@@ -53,8 +77,12 @@ class Parallelize(object):
         randomReseed     If True, each forked process will reseed its random number generator
                          to ensure independent results. Works with the built-in random
                          and numpy.random.
+        schedule         'dynamic' (default) to give each task to the next free worker, or
+                         'static' to divide tasks round-robin between workers in advance.
+                         If *tasks* is unspecified, scheduling is always static.
         kwds             objects to be shared by proxy with child processes (they will 
-                         appear as attributes of the tasker)
+                         appear as attributes of the tasker). Arrays created by 
+                         sharedArray() are shared directly instead.
         ===============  ===================================================================
         """
         
@@ -73,11 +101,21 @@ class Parallelize(object):
         if not hasattr(os, 'fork'):
             workers = 1
         self.workers = workers
+        if schedule not in ('dynamic', 'static'):
+            raise ValueError("schedule must be 'dynamic' or 'static'")
         if tasks is None:
             tasks = range(workers)
+            schedule = 'static'
+        self.schedule = schedule
         self.tasks = list(tasks)
         self.reseed = randomReseed
-        self.kwds = kwds.copy()
+        self.kwds = {}
+        self.shared = {}
+        for k, v in kwds.items():
+            if isinstance(v, np.ndarray) and isinstance(_arrayBase(v), mmap.mmap):
+                self.shared[k] = v
+            else:
+                self.kwds[k] = v
         self.kwds['_taskStarted'] = self._taskStarted
         
     def __enter__(self):
@@ -111,25 +149,36 @@ class Parallelize(object):
             self.progressDlg.__enter__()
             self.progressDlg.setMaximum(len(self.tasks))
         self.progress = {os.getpid(): []}
-        return Tasker(self, None, self.tasks, self.kwds)
+        kwds = self.kwds.copy()
+        kwds.update(self.shared)
+        return Tasker(self, None, list(enumerate(self.tasks)), kwds)
 
     
     def runParallel(self):
         self.childs = []
         
-        ## break up tasks into one set per worker
+        ## break up tasks into one set per worker, or prepare a shared counter
+        ## from which workers claim the index of their next task
         workers = self.workers
-        chunks = [[] for i in xrange(workers)]
-        i = 0
-        for i in range(len(self.tasks)):
-            chunks[i%workers].append(self.tasks[i])
+        if self.schedule == 'static':
+            self.nextTask = None
+            chunks = [[] for i in xrange(workers)]
+            for i in range(len(self.tasks)):
+                chunks[i%workers].append((i, self.tasks[i]))
+        else:
+            self.nextTask = multiprocessing.Value('l', 0)
         
         ## fork and assign tasks to each worker
         for i in range(workers):
             proc = ForkedProcess(target=None, preProxy=self.kwds, randomReseed=self.reseed)
             if not proc.isParent:
                 self.proc = proc
-                return Tasker(self, proc, chunks[i], proc.forkedProxies)
+                kwds = dict(proc.forkedProxies)
+                kwds.update(self.shared)
+                if self.nextTask is None:
+                    return Tasker(self, proc, chunks[i], kwds)
+                else:
+                    return Tasker(self, proc, self.tasks, kwds, nextTask=self.nextTask)
             else:
                 self.childs.append(proc)
         
@@ -148,15 +197,19 @@ class Parallelize(object):
                 
             activeChilds = self.childs[:]
             self.exitCodes = []
-            pollInterval = 0.01
             while len(activeChilds) > 0:
-                waitingChildren = 0
+                ## wait for messages from any worker, waking periodically 
+                ## to check whether the progress dialog was canceled
+                try:
+                    select.select([ch.conn for ch in activeChilds], [], [], 0.1)
+                except (select.error, IOError, OSError) as ex:
+                    if ex.args[0] != errno.EINTR:
+                        raise
+                
                 rem = []
                 for ch in activeChilds:
                     try:
-                        n = ch.processRequests()
-                        if n > 0:
-                            waitingChildren += 1
+                        ch.processRequests()
                     except ClosedError:
                         #print ch.childPid, 'process finished'
                         rem.append(ch)
@@ -180,18 +233,10 @@ class Parallelize(object):
                     #print [ch.childPid for ch in activeChilds]
                     
                 if self.showProgress and self.progressDlg.wasCanceled():
+                    self.cancel()
                     for ch in activeChilds:
                         ch.kill()
                     raise CanceledError()
-                    
-                ## adjust polling interval--prefer to get exactly 1 event per poll cycle.
-                if waitingChildren > 1:
-                    pollInterval *= 0.7
-                elif waitingChildren == 0:
-                    pollInterval /= 0.7
-                pollInterval = max(min(pollInterval, 0.5), 0.0005) ## but keep it within reasonable limits
-                
-                time.sleep(pollInterval)
         finally:
             if self.showProgress:
                 self.progressDlg.__exit__(None, None, None)
@@ -205,6 +250,51 @@ class Parallelize(object):
         return []  ## no tasks for parent process.
     
     
+    def cancel(self):
+        """Prevent workers from starting any more tasks. 
+        
+        Tasks already in progress are allowed to finish. This is called when
+        the progress dialog is canceled, and may be called by a worker 
+        (as tasker.cancel()) to stop the other workers early. Only has an 
+        effect with dynamic scheduling.
+        """
+        if getattr(self, 'nextTask', None) is not None:
+            with self.nextTask.get_lock():
+                self.nextTask.value = len(self.tasks)
+    
+    @staticmethod
+    def map(func, tasks, workers=None, pool=None):
+        """Return [func(task) for task in tasks], computed in parallel.
+
+        If *pool* is a WorkerPool, its persistent workers are used; *func*, the
+        tasks, and the results must then be picklable (for example, *func*
+        must be defined at module level). Otherwise, workers are forked for
+        this call only, as with a Parallelize block, and only the results
+        need to be picklable.
+        """
+        tasks = list(tasks)
+        if pool is not None:
+            return pool.map(func, tasks)
+        results = []
+        with Parallelize(tasks=tasks, workers=workers, results=results) as tasker:
+            for task in tasker:
+                tasker.results.append((tasker.index, func(task)))
+        return [r for i, r in sorted(results, key=lambda r: r[0])]
+
+    @staticmethod
+    def sharedArray(shape, dtype=float):
+        """Return a zero-filled array in memory that will be shared with worker 
+        processes.
+        
+        The array must be created before entering the Parallelize block and passed
+        as a keyword argument. Values written to the array by workers are then 
+        visible to the parent process without being sent through a pipe.
+        """
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        buf = mmap.mmap(-1, max(size, 1))
+        return np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    
     @staticmethod
     def suggestedWorkerCount():
         if 'linux' in sys.platform:
@@ -241,16 +331,22 @@ class Parallelize(object):
     
     
 class Tasker(object):
-    def __init__(self, parallelizer, process, tasks, kwds):
+    """
+    Iterates over the tasks assigned to one worker. While iterating, 
+    *index* is the position of the current task in the original list of tasks.
+    """
+    def __init__(self, parallelizer, process, tasks, kwds, nextTask=None):
+        ## tasks is a list of (index, task) pairs, or with *nextTask* (a shared 
+        ## counter), the complete list of tasks from which to claim one at a time.
         self.proc = process
         self.par = parallelizer
         self.tasks = tasks
+        self._nextTask = nextTask
         for k, v in kwds.iteritems():
             setattr(self, k, v)
         
     def __iter__(self):
-        ## we could fix this up such that tasks are retrieved from the parent process one at a time..
-        for i, task in enumerate(self.tasks):
+        for i, task in self._iterTasks():
             self.index = i
             #print os.getpid(), 'starting task', i
             self._taskStarted(os.getpid(), i, _callSync='off')
@@ -259,6 +355,21 @@ class Tasker(object):
             #print os.getpid(), 'no more tasks'
             self.proc.close()
     
+    def _iterTasks(self):
+        ## yield (index, task) for each task this worker should process
+        if self._nextTask is None:
+            for i, task in self.tasks:
+                yield i, task
+            return
+        ## dynamic scheduling: claim the next unprocessed task from the shared counter
+        while True:
+            with self._nextTask.get_lock():
+                i = self._nextTask.value
+                self._nextTask.value = i + 1
+            if i >= len(self.tasks):
+                return
+            yield i, self.tasks[i]
+    
     def process(self):
         """
         Process requests from parent.
@@ -274,6 +385,60 @@ class Tasker(object):
         """
         return self.par.workers
     
+    def cancel(self):
+        """
+        Stop all workers from starting any more tasks (see Parallelize.cancel).
+        """
+        self.par.cancel()
+
+
+class WorkerPool(object):
+    """
+    Set of worker processes that persist between calls to Parallelize.map().
+
+    Workers are forked when the pool is created, so they see modules imported
+    and global state set up before that point. Use as a context manager, or
+    call close() when the pool is no longer needed.
+    """
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = Parallelize.suggestedWorkerCount()
+        if not hasattr(os, 'fork'):
+            workers = 1
+        self.workers = workers
+        self._pool = None
+        if workers > 1:
+            self._pool = multiprocessing.Pool(workers)
+
+    def map(self, func, tasks):
+        """Return [func(task) for task in tasks], with tasks handed out one at
+        a time to whichever worker is free."""
+        if self._pool is None:
+            return [func(task) for task in tasks]
+        ## map_async().get() with a timeout keeps the parent interruptible
+        return self._pool.map_async(func, tasks, chunksize=1).get(1e9)
+
+    def close(self):
+        """Stop all worker processes."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _arrayBase(arr):
+    ## return the object that ultimately owns the memory of arr
+    while isinstance(arr, np.ndarray) and arr.base is not None:
+        arr = arr.base
+    return arr
+    
+    
 #class Parallelizer:
     #"""
     #Use::
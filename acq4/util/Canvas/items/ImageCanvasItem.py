@@ -8,6 +8,7 @@ import acq4.pyqtgraph as pg
 import acq4.pyqtgraph.flowchart
 import acq4.util.DataManager as DataManager
 import acq4.util.debug as debug
+from acq4.util.imagePyramid import ImagePyramid
 from .itemtypes import registerItemType
 
 
@@ -19,8 +20,15 @@ class ImageCanvasItem(CanvasItem):
         image: May be a fileHandle, ndarray, or GraphicsItem.
         handle: May optionally be specified in place of image
 
+    Images loaded from files are displayed from a cached multi-resolution
+    pyramid (see acq4.util.imagePyramid); the full-resolution data is only
+    read when it is displayed at full zoom, or when the *data* attribute is
+    accessed (for example, to apply a filter).
     """
     _typeName = "Image"
+
+    ## set False to always read image files at full resolution
+    usePyramid = True
     
     def __init__(self, image=None, **opts):
 
@@ -29,16 +37,25 @@ class ImageCanvasItem(CanvasItem):
             image = opts.get('handle', None)
 
         item = None
-        self.data = None
+        self._data = None
+        self.pyramid = None
+        self._filterInputSet = False
         
         if isinstance(image, QtGui.QGraphicsItem):
             item = image
         elif isinstance(image, np.ndarray):
-            self.data = image
+            self._data = image
         elif isinstance(image, DataManager.FileHandle):
             opts['handle'] = image
             self.handle = image
-            self.data = self.handle.read()
+            if self.usePyramid:
+                try:
+                    self.pyramid = ImagePyramid(self.handle)
+                    item = PyramidImageItem()
+                except Exception:
+                    debug.printExc('Error generating image pyramid for %s; reading full image instead:' % image.name())
+            if self.pyramid is None:
+                self._data = self.handle.read()
 
             if 'name' not in opts:
                 opts['name'] = self.handle.shortName()
@@ -62,15 +79,18 @@ class ImageCanvasItem(CanvasItem):
                             m = self.handle.info()['microscope']
                             opts['pos'] = m['position'][0:2]
                         else:
-                            info = self.data._info[-1]
-                            opts['pos'] = info.get('imagePosition', None)
-                    elif hasattr(self.data, '_info'):
-                        info = self.data._info[-1]
-                        opts['scale'] = info.get('pixelSize', None)
-                        opts['pos'] = info.get('imagePosition', None)
+                            meta = self._metaData()
+                            if hasattr(meta, '_info'):
+                                opts['pos'] = meta._info[-1].get('imagePosition', None)
                     else:
-                        opts['defaultUserTransform'] = {'scale': (1e-5, 1e-5)}
-                        opts['scalable'] = True
+                        meta = self._metaData()
+                        if hasattr(meta, '_info'):
+                            info = meta._info[-1]
+                            opts['scale'] = info.get('pixelSize', None)
+                            opts['pos'] = info.get('imagePosition', None)
+                        else:
+                            opts['defaultUserTransform'] = {'scale': (1e-5, 1e-5)}
+                            opts['scalable'] = True
             except:
                 debug.printExc('Error reading transformation for image file %s:' % image.name())
 
@@ -115,11 +135,9 @@ class ImageCanvasItem(CanvasItem):
         # ## controls that only appear if there is a time axis
         self.timeControls = [self.timeSlider]
 
-        if self.data is not None:
-            if isinstance(self.data, pg.metaarray.MetaArray):
-                self.filter.setInput(self.data.asarray())
-            else:
-                self.filter.setInput(self.data)
+        if self._data is not None or self.pyramid is not None:
+            if self.pyramid is None:
+                self.setFilterInput()
             self.updateImage()
             
             # Needed to ensure selection box wraps the image properly
@@ -129,6 +147,50 @@ class ImageCanvasItem(CanvasItem):
             # Why doesn't this work?
             #self.selectBoxFromUser() ## move select box to match new bounds
             
+    @property
+    def data(self):
+        """The full-resolution image data (read from file on first access)."""
+        if self._data is None and self.pyramid is not None:
+            self._data = self.handle.read()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    def _metaData(self):
+        ## Return the image data if it has been read, otherwise read only the
+        ## meta info from MetaArray files. Other file types carry no meta info
+        ## beyond handle.info(), so None is returned rather than reading them.
+        if self._data is not None:
+            return self._data
+        if self.handle.ext().lower() == '.ma':
+            return self.handle.read(readAllData=False)
+        return None
+
+    def setFilterInput(self):
+        self._filterInputSet = True
+        if isinstance(self.data, pg.metaarray.MetaArray):
+            self.filter.setInput(self.data.asarray())
+        else:
+            self.filter.setInput(self.data)
+
+    def statsData(self, maxPixels=2**16):
+        """Return a downsampled copy of the image data (about *maxPixels* 
+        pixels per image) for computing histograms and other global statistics.
+        """
+        if self.pyramid is not None and not self.filter.isActive():
+            return self.pyramid.statsLevel(maxPixels)
+        data = self.filter.output()
+        if data is None:
+            data = self.data
+        if data is None:
+            return None
+        data = np.asarray(data)
+        while data.size > maxPixels:
+            data = data[::2, ::2] if data.ndim == 2 or data.shape[2] <= 4 else data[:, ::2, ::2]
+        return data
+
     @classmethod
     def checkFile(cls, fh):
         if not fh.isFile():
@@ -153,27 +215,41 @@ class ImageCanvasItem(CanvasItem):
     def updateImage(self):
         img = self.graphicsItem()
 
-        # Try running data through flowchart filter
-        data = self.filter.output()
-        if data is None:
-            data = self.data
+        if self.pyramid is not None and not self.filter.isActive():
+            # Unfiltered images are displayed directly from the pyramid
+            data = None
+            shape = self.pyramid.shape
+        else:
+            # Try running data through flowchart filter
+            if not self._filterInputSet:
+                self.setFilterInput()
+            data = self.filter.output()
+            if data is None:
+                data = self.data
+            shape = data.shape
 
-        if data.ndim == 4:
+        if len(shape) == 4:
             showTime = True
-        elif data.ndim == 3:
-            if data.shape[2] <= 4: ## assume last axis is color
+        elif len(shape) == 3:
+            if shape[2] <= 4: ## assume last axis is color
                 showTime = False
             else:
                 showTime = True
         else:
             showTime = False
 
+        frame = None
         if showTime:
             self.timeSlider.setMinimum(0)
-            self.timeSlider.setMaximum(data.shape[0]-1)
-            self.graphicsItem().setImage(data[self.timeSlider.value()], autoLevels=self.autoBtn.isChecked())
+            self.timeSlider.setMaximum(shape[0]-1)
+            frame = self.timeSlider.value()
+
+        if data is None:
+            img.setPyramid(self.pyramid, frame=frame, autoLevels=self.autoBtn.isChecked())
+        elif showTime:
+            img.setImage(data[frame], autoLevels=self.autoBtn.isChecked())
         else:
-            self.graphicsItem().setImage(data, autoLevels=self.autoBtn.isChecked())
+            img.setImage(data, autoLevels=self.autoBtn.isChecked())
 
         for widget in self.timeControls:
             widget.setVisible(showTime)
@@ -194,6 +270,118 @@ class ImageCanvasItem(CanvasItem):
 registerItemType(ImageCanvasItem)
 
 
+class PyramidImageItem(pg.ImageItem):
+    """ImageItem displaying the level of an ImagePyramid that best matches the
+    current zoom. Items that are hidden or outside the view fall back to the
+    coarsest level, and the full-resolution data is released whenever it is
+    not displayed.
+
+    Calling setImage() with an array displays that array instead, until
+    setPyramid() is called again.
+    """
+    def __init__(self, **kargs):
+        pg.ImageItem.__init__(self, **kargs)
+        self.pyramid = None
+        self.frame = None
+        self.currentLevel = None
+
+    def setPyramid(self, pyramid, frame=None, autoLevels=True):
+        """Display *pyramid*. For image stacks, *frame* selects the frame to 
+        display. If *autoLevels* is True, levels are set from the min/max of
+        a low-resolution level."""
+        self.prepareGeometryChange()
+        self.pyramid = pyramid
+        self.frame = frame
+        self.currentLevel = None
+        self.autoDownsample = False
+        self.informViewBoundsChanged()
+        self.updateLevel()
+        if autoLevels:
+            stats = pyramid.statsLevel()
+            if frame is not None:
+                stats = stats[frame]
+            mn, mx = np.nanmin(stats), np.nanmax(stats)
+            if mn == mx:
+                mn, mx = 0, 255
+            self.setLevels([mn, mx])
+        self.sigImageChanged.emit()
+
+    def setImage(self, image=None, autoLevels=None, **kargs):
+        if image is not None and self.pyramid is not None:
+            self.prepareGeometryChange()
+            self.pyramid = None
+            self.currentLevel = None
+            self.image = None
+        pg.ImageItem.setImage(self, image, autoLevels=autoLevels, **kargs)
+
+    def fullShape(self):
+        if self.pyramid is None:
+            return None
+        return self.pyramid.shape if self.frame is None else self.pyramid.shape[1:]
+
+    def width(self):
+        if self.pyramid is None:
+            return pg.ImageItem.width(self)
+        return self.fullShape()[0 if self.axisOrder == 'col-major' else 1]
+
+    def height(self):
+        if self.pyramid is None:
+            return pg.ImageItem.height(self)
+        return self.fullShape()[1 if self.axisOrder == 'col-major' else 0]
+
+    def updateLevel(self):
+        """Select the pyramid level to display, based on the size of one 
+        full-resolution image pixel on screen."""
+        if self.pyramid is None:
+            return
+        level = self.pyramid.nLevels() - 1
+        vr = self.viewRect()
+        if self.isVisible() and (vr is None or vr.intersects(self.boundingRect())):
+            o = self.mapToDevice(QtCore.QPointF(0, 0))
+            x = self.mapToDevice(QtCore.QPointF(1, 0))
+            y = self.mapToDevice(QtCore.QPointF(0, 1))
+            if o is not None and x is not None and y is not None:
+                px = min(pg.Point(x-o).length(), pg.Point(y-o).length())
+                if px > 0:
+                    level = self.pyramid.chooseLevel(1.0 / px)
+        if level == self.currentLevel:
+            return
+        self.currentLevel = level
+        self.pyramid.release(keep=[level, self.pyramid.nLevels()-1])
+        image = self.pyramid.level(level)
+        if self.frame is not None:
+            image = image[self.frame]
+        if self.image is None or image.dtype != self.image.dtype:
+            self._effectiveLut = None
+        self.image = image
+        self.qimage = None
+        self.update()
+
+    def viewRangeChanged(self):
+        self.updateLevel()
+
+    def viewTransformChanged(self):
+        pg.ImageItem.viewTransformChanged(self)
+        self.updateLevel()
+
+    def paint(self, p, *args):
+        if self.pyramid is None:
+            return pg.ImageItem.paint(self, p, *args)
+        if self.image is None:
+            return
+        if self.qimage is None:
+            self.render()
+            if self.qimage is None:
+                return
+        if self.paintMode is not None:
+            p.setCompositionMode(self.paintMode)
+        ## lower levels are stretched to cover the full-resolution bounds
+        p.drawImage(QtCore.QRectF(0, 0, self.width(), self.height()), self.qimage)
+        if self.border is not None:
+            p.setPen(self.border)
+            p.drawRect(self.boundingRect())
+
+
 class ImageFilterWidget(QtGui.QWidget):
     
     sigStateChanged = QtCore.Signal()
@@ -301,6 +489,10 @@ class ImageFilterWidget(QtGui.QWidget):
                 print "restore!"
                 snode.restoreState(snstate)
         
+    def isActive(self):
+        """Return True if any filter nodes have been added to the flowchart."""
+        return len(self.fc.nodes()) > 2  ## besides Input and Output
+
     def setInput(self, img):
         self.fc.setInput(dataIn=img)
         
@@ -28,6 +28,7 @@ import acq4.filetypes as filetypes
 from acq4.util.debug import *
 import copy
 import acq4.util.advancedTypes as advancedTypes
+from acq4.util.SequenceContainer import SequenceContainer
 
 
 def abspath(fileName):
@@ -82,14 +83,20 @@ class DataManager(QtCore.QObject):
         with self.lock:
             dirName = os.path.abspath(dirName)
             if not self._cacheHasName(dirName):
-                self._addHandle(dirName, DirHandle(dirName, self, create=create))
+                handle = self._sequenceHandle(dirName)
+                if handle is None:
+                    handle = DirHandle(dirName, self, create=create)
+                self._addHandle(dirName, handle)
             return self._getCache(dirName)
         
     def getFileHandle(self, fileName):
         with self.lock:
             fileName = os.path.abspath(fileName)
             if not self._cacheHasName(fileName):
-                self._addHandle(fileName, FileHandle(fileName, self))
+                handle = self._sequenceHandle(fileName)
+                if handle is None:
+                    handle = FileHandle(fileName, self)
+                self._addHandle(fileName, handle)
             return self._getCache(fileName)
         
     def getHandle(self, fileName):
@@ -102,6 +109,21 @@ class DataManager(QtCore.QObject):
         else:
             return self.getFileHandle(fileName)
         
+    def _sequenceHandle(self, fileName):
+        """Return a handle for a trial directory (or a file within a trial) that
+        is stored in a sequence container, or None if fileName is not such a path."""
+        parent, name = os.path.split(fileName)
+        for seqDir, trial, trialFile in [(parent, name, None), (os.path.dirname(parent), os.path.basename(parent), name)]:
+            if not os.path.isfile(os.path.join(seqDir, SequenceContainer.fileName)):
+                continue
+            container = self.getDirHandle(seqDir).sequenceContainer()
+            if trialFile is None and container.hasTrial(trial):
+                return TrialDirHandle(fileName, self, container, trial)
+            if trialFile is not None and container.hasFile(trial, trialFile):
+                return TrialFileHandle(fileName, self, container, trial)
+            return None
+        return None
+
     def cleanup(self):
         """Attempt to free memory by allowing python to collect any unused handles."""
         import gc
@@ -115,7 +137,8 @@ class DataManager(QtCore.QObject):
         """Cache a handle and watch it for changes"""
         self._setCache(fileName, handle)
         ## make sure all file handles belong to the main GUI thread
-        app = QtGui.QApplication.instance()
+        ## (QCoreApplication: QtGui.QApplication is unavailable in forked worker processes)
+        app = QtCore.QCoreApplication.instance()
         if app is not None:
             handle.moveToThread(app.thread())
         ## No signals; handles should explicitly inform the manager of changes
@@ -434,6 +457,7 @@ class DirHandle(FileHandle):
         self.lsCache = {}  # sortMode: [files...]
         self.cTimeCache = {}
         self._indexFileExists = False
+        self._sequenceContainer = None
         
         if not os.path.isdir(self.path):
             if create:
@@ -508,8 +532,17 @@ class DirHandle(FileHandle):
         """Return a list of string names for all sub-directories."""
         with self.lock:
             ls = self.ls()
-            subdirs = filter(lambda d: os.path.isdir(os.path.join(self.name(), d)), ls)
+            container = self.sequenceContainer()
+            subdirs = filter(lambda d: os.path.isdir(os.path.join(self.name(), d)) or (container is not None and container.hasTrial(d)), ls)
             return subdirs
+
+    def sequenceContainer(self):
+        """Return the SequenceContainer holding the trials stored in this
+        directory, or None if the directory has no container."""
+        with self.lock:
+            if self._sequenceContainer is None and os.path.isfile(os.path.join(self.path, SequenceContainer.fileName)):
+                self._sequenceContainer = SequenceContainer.open(self)
+            return self._sequenceContainer
     
     def incrementFileName(self, fileName, useExt=True):
         """Given fileName.ext, finds the next available fileName_NNN.ext"""
@@ -578,7 +611,10 @@ class DirHandle(FileHandle):
         return fh
         
     def dirExists(self, dirName):
-        return os.path.isdir(os.path.join(self.path, dirName))
+        if os.path.isdir(os.path.join(self.path, dirName)):
+            return True
+        container = self.sequenceContainer()
+        return container is not None and container.hasTrial(dirName)
             
     def ls(self, normcase=False, sortMode='date', useCache=False):
         """Return a list of all files in the directory.
@@ -596,7 +632,9 @@ class DirHandle(FileHandle):
                 ret = files[:]
                 return ret
     
-    def _updateLsCache(self, sortMode):
+    def _listFiles(self):
+        """Return an unsorted list of the files in this directory, with trials
+        stored in a sequence container in place of the container file."""
         try:
             files = os.listdir(self.name())
         except:
@@ -605,6 +643,13 @@ class DirHandle(FileHandle):
         for i in ['.index', '.log']:
             if i in files:
                 files.remove(i)
+        if SequenceContainer.fileName in files:
+            files.remove(SequenceContainer.fileName)
+            files.extend([t for t in self.sequenceContainer().trialNames() if t not in files])
+        return files
+
+    def _updateLsCache(self, sortMode):
+        files = self._listFiles()
         
         if sortMode == 'date':
             ## Sort files by creation time
@@ -634,7 +679,7 @@ class DirHandle(FileHandle):
             
             ## try getting time directly from file
             try:
-                t = self[fileName].info()['__timestamp__']
+                return self[fileName].info()['__timestamp__']
             except:
                 pass
                     
@@ -804,7 +849,10 @@ class DirHandle(FileHandle):
             except:
                 print self.path, name
                 raise
-            return os.path.exists(fn)
+            if os.path.exists(fn):
+                return True
+            container = self.sequenceContainer()
+            return container is not None and container.exists(name)
 
     def _setFileInfo(self, fileName, info=None, **args):
         """Set or update meta-information array for fileName. If merge is false, the info dict is completely overwritten."""
@@ -880,4 +928,164 @@ class DirHandle(FileHandle):
         self.emitChanged('children')
 
 
+class TrialHandle(object):
+    """Behavior shared by handles for data stored in a SequenceContainer."""
+
+    def move(self, newDir):
+        raise Exception("%s is stored in a sequence container and can not be moved." % self.name())
+
+    def rename(self, newName):
+        raise Exception("%s is stored in a sequence container and can not be renamed." % self.name())
+
+    def delete(self):
+        raise Exception("%s is stored in a sequence container and can not be deleted." % self.name())
+
+    def _parentMoved(self, oldDir, newDir):
+        ## there may be nothing on disk at this path, so skip the existence check in FileHandle
+        prefix = os.path.join(oldDir, '')
+        self.path = os.path.join(newDir, self.path[len(prefix):])
+        self.parentDir = None
+        self.emitChanged('parent')
+
+
+class TrialDirHandle(TrialHandle, DirHandle):
+    """Handle for one trial of a task sequence stored in a SequenceContainer.
+
+    The trial behaves like a regular directory: MetaArray files and meta info
+    are kept in the container, and anything the container can not hold is
+    written to a real directory at the same path (created when first needed)
+    whose contents are merged into this one.
+    """
+    def __init__(self, path, manager, container, trial):
+        FileHandle.__init__(self, path, manager)
+        self.container = container
+        self.trial = trial
+        self._index = None
+        self.lsCache = {}
+        self.cTimeCache = {}
+        self._sequenceContainer = None
+        self._indexFileExists = os.path.isfile(self._indexFile())
+
+    def _makeDir(self):
+        """Create the real directory and index for data that does not go into the container."""
+        with self.lock:
+            if not os.path.isdir(self.path):
+                os.mkdir(self.path)
+            if not self._indexFileExists:
+                self._writeIndex(OrderedDict([('.', {})]))
+
+    def _listFiles(self):
+        files = self.container.fileNames(self.trial)
+        if os.path.isdir(self.path):
+            files.extend([f for f in DirHandle._listFiles(self) if f not in files])
+        return files
+
+    def _getFileCTime(self, fileName):
+        info = self._fileInfo(fileName)
+        if '__timestamp__' in info:
+            return info['__timestamp__']
+        return os.path.getctime(os.path.join(self.name(), fileName))
+
+    def _indexedInfo(self, file):
+        ## info kept in the index of the real directory, if there is one
+        if not self._indexFileExists:
+            return {}
+        return self._readIndex().get(file, {})
+
+    def _fileInfo(self, file):
+        with self.lock:
+            if file == '.':
+                info = self.container.trialInfo(self.trial)
+            elif self.container.hasFile(self.trial, file):
+                info = self.container.fileInfo(self.trial, file)
+            else:
+                return self._indexedInfo(file)
+            info.update(self._indexedInfo(file))
+            return info
+
+    def _setFileInfo(self, fileName, info=None, **args):
+        if info is None:
+            info = args
+        with self.lock:
+            if fileName == '.':
+                stored = self.container.setTrialInfo(self.trial, info)
+            elif self.container.hasFile(self.trial, fileName):
+                stored = self.container.setFileInfo(self.trial, fileName, info)
+            else:
+                stored = False
+            if stored:
+                self.emitChanged('meta', fileName)
+            else:
+                self._makeDir()
+                DirHandle._setFileInfo(self, fileName, info)
+
+    def isManaged(self, fileName=None):
+        if fileName is None or self.container.hasFile(self.trial, fileName):
+            return True
+        return DirHandle.isManaged(self, fileName)
+
+    def isFile(self, fileName=None):
+        if fileName is not None and self.container.hasFile(self.trial, fileName):
+            return True
+        return DirHandle.isFile(self, fileName)
+
+    def exists(self, name=None):
+        if self.path is None:
+            return False
+        if name is None:
+            return self.container.hasTrial(self.trial)
+        return self.container.hasFile(self.trial, name) or os.path.exists(os.path.join(self.path, name))
+
+    def writeFile(self, obj, fileName, info=None, autoIncrement=False, fileType=None, **kwargs):
+        if not autoIncrement and fileType in (None, 'MetaArray') and len(kwargs) == 0:
+            name = self.container.storeFile(self.trial, fileName, obj, info)
+            if name is not None:
+                self._childChanged()
+                self.emitChanged('children', name)
+                return self[name]
+        self._makeDir()
+        fh = DirHandle.writeFile(self, obj, fileName, info=info, autoIncrement=autoIncrement, fileType=fileType, **kwargs)
+        if isinstance(fh, TrialFileHandle):
+            ## an earlier version of this file was stored in the container; the real file replaces it
+            with self.manager.lock:
+                self.manager._delCache(fh.name())
+            fh = self[fh.shortName()]
+        return fh
+
+    def mkdir(self, name, autoIncrement=False, info=None):
+        self._makeDir()
+        return DirHandle.mkdir(self, name, autoIncrement=autoIncrement, info=info)
+
+    def createFile(self, fileName, info=None, autoIncrement=False):
+        self._makeDir()
+        return DirHandle.createFile(self, fileName, info=info, autoIncrement=autoIncrement)
+
+    def indexFile(self, fileName, info=None, protect=False):
+        self._makeDir()
+        return DirHandle.indexFile(self, fileName, info=info, protect=protect)
+
+    def forget(self, fileName):
+        if self.container.hasFile(self.trial, fileName):
+            raise Exception("%s is stored in a sequence container and can not be removed from the index." % fileName)
+        if self._indexFileExists:
+            DirHandle.forget(self, fileName)
+
+
+class TrialFileHandle(TrialHandle, FileHandle):
+    """Handle for a MetaArray file stored in a SequenceContainer (see TrialDirHandle)."""
+    def __init__(self, path, manager, container, trial):
+        FileHandle.__init__(self, path, manager)
+        self.container = container
+        self.trial = trial
+
+    def exists(self, name=None):
+        if name is not None:
+            raise Exception("Cannot check for subpath existence on FileHandle.")
+        return self.path is not None and self.container.hasFile(self.trial, self.shortName())
+
+    def read(self, *args, **kargs):
+        self.checkExists()
+        return self.container.readFile(self.trial, self.shortName())
+
+
 dm = DataManager()
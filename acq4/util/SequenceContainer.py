@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+SequenceContainer.py - Store every trial of a task sequence in a single HDF5 file
+
+By default, TaskRunner stores each trial of a sequence in its own directory
+(an index file plus one file per device), which costs several file creations
+and index rewrites per trial and makes loading a large sequence slow. A
+SequenceContainer instead writes all trials into one chunked HDF5 file,
+'sequence.h5', inside the ProtocolSequence directory:
+
+    /trials/info             repr() of the meta info for each trial directory,
+                             indexed by sequence coordinates ('' for trials that
+                             have not been created)
+    /files/NAME/data         one dataset per file name (usually one per device)
+                             with shape = sequence shape + data shape, chunked
+                             so that each trial is one chunk
+    /files/NAME/axes         MetaArray axis info, shared by all trials
+    /files/NAME/info         repr() of the MetaArray info dict of each trial
+    /files/NAME/fileInfo     repr() of the index entry of each trial's file
+                             ('' for trials that have not stored this file)
+
+The DataManager presents the trials as ordinary directories (see
+TrialDirHandle), so code that reads data through DirHandle / FileHandle keeps
+working. Anything the container can not hold (files that are not MetaArrays,
+subdirectories, arrays whose shape, dtype or axes differ from earlier trials,
+or meta info that is not a plain python literal) is written to a real trial
+directory at the same path and merged into the virtual one.
+"""
+import os, time, copy, weakref, threading
+import numpy as np
+from PyQt4 import QtCore
+from acq4.util.Mutex import Mutex
+from acq4.util.metaarray import MetaArray
+from acq4.pyqtgraph.pgcollections import OrderedDict
+
+try:
+    import h5py
+    HAVE_HDF5 = True
+except ImportError:
+    HAVE_HDF5 = False
+
+
+_literalTypes = (basestring, bool, int, long, float, type(None), np.integer, np.floating, np.bool_)
+_literalNamespace = {'OrderedDict': OrderedDict, 'nan': np.nan, 'inf': np.inf}
+
+
+def isLiteral(obj):
+    """Return True if repr(obj) can be restored with readLiteral()."""
+    if isinstance(obj, _literalTypes):
+        return True
+    if type(obj) in (list, tuple):
+        return all([isLiteral(x) for x in obj])
+    if type(obj) in (dict, OrderedDict):
+        return all([isLiteral(k) and isLiteral(v) for k, v in obj.items()])
+    return False
+
+
+def readLiteral(s):
+    return eval(s, dict(_literalNamespace))
+
+
+def axesEqual(a, b):
+    """Return True if the MetaArray axis info lists *a* and *b* are identical."""
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if set(x.keys()) != set(y.keys()):
+            return False
+        for k in x:
+            if isinstance(x[k], np.ndarray) or isinstance(y[k], np.ndarray):
+                if not np.array_equal(x[k], y[k]):
+                    return False
+            elif x[k] != y[k]:
+                return False
+    return True
+
+
+class SequenceContainer(object):
+    """HDF5 file holding the results of every trial in a task sequence.
+
+    Containers are created with SequenceContainer.create() and otherwise
+    obtained from DirHandle.sequenceContainer() / SequenceContainer.open(),
+    which keep a single instance per directory so that the thread writing
+    trials and any readers share the same open file (HDF5 does not allow a
+    file to be opened for writing while it is open elsewhere). Trials are named like the directories TaskRunner creates
+    ('000_003' for sequence coordinates (0, 3)).
+    """
+
+    fileName = 'sequence.h5'
+    version = 1
+
+    ## largest per-trial array that is stored in the container (one chunk per trial)
+    maxTrialBytes = 1024**3
+
+    _instances = weakref.WeakValueDictionary()
+    _instancesLock = threading.Lock()
+
+    @classmethod
+    def open(cls, dirHandle):
+        """Return the container stored in *dirHandle*."""
+        key = os.path.normcase(os.path.abspath(dirHandle.name()))
+        with cls._instancesLock:
+            container = cls._instances.get(key)
+            if container is None:
+                container = cls(dirHandle)
+                cls._instances[key] = container
+            else:
+                container.dirHandle = dirHandle
+            return container
+
+    @classmethod
+    def create(cls, dirHandle, axes, shape):
+        """Create a container in *dirHandle* for a sequence iterating over the
+        parameters listed in *axes*, with shape[i] values for axes[i].
+        """
+        if not HAVE_HDF5:
+            raise Exception("Storing sequences in a single file requires the h5py package.")
+        fileName = os.path.join(dirHandle.name(), cls.fileName)
+        if os.path.exists(fileName):
+            raise Exception("Sequence container %s already exists." % fileName)
+        shape = tuple(shape)
+        f = h5py.File(fileName, 'w')
+        try:
+            f.attrs['SequenceContainer'] = cls.version
+            f.attrs['axes'] = repr(list(axes))
+            f.attrs['shape'] = np.array(shape)
+            f.create_group('files')
+            f.create_dataset('trials/info', shape=shape, dtype=h5py.special_dtype(vlen=str))
+        finally:
+            f.close()
+        dirHandle._childChanged()
+        return dirHandle.sequenceContainer()
+
+    def __init__(self, dirHandle):
+        if not HAVE_HDF5:
+            raise Exception("Reading sequence container %s requires the h5py package." % os.path.join(dirHandle.name(), self.fileName))
+        self.dirHandle = dirHandle
+        self.lock = Mutex(QtCore.QMutex.Recursive)
+        self._h5 = None
+        self._writable = False
+        self._trials = None    ## {trial name: info}, loaded on first use
+        self._written = None   ## {file name: bool array over the sequence}
+        self._axes = {}        ## {file name: MetaArray axis info}
+        self._datasets = {}    ## {(file name, dataset name): h5py dataset} while the file is open
+        ## Trial info is usually updated several times per trial (see Manager.Task.stop), and
+        ## rewriting a variable-length string in HDF5 is slow, so changes are kept here and
+        ## written by flush().
+        self._pendingTrials = set()
+        f = self._file()
+        self.axes = readLiteral(f.attrs['axes'])
+        self.shape = tuple([int(n) for n in f.attrs['shape']])
+
+    def path(self):
+        return os.path.join(self.dirHandle.name(), self.fileName)
+
+    def _file(self, write=False):
+        """Return the open HDF5 file, reopening it for writing if needed."""
+        with self.lock:
+            if self._h5 is None or (write and not self._writable):
+                self._closeFile()
+                self._h5 = h5py.File(self.path(), 'a' if write else 'r')
+                self._writable = write
+            return self._h5
+
+    def flush(self):
+        """Write pending trial info and flush the HDF5 file to disk."""
+        with self.lock:
+            if len(self._pendingTrials) > 0:
+                info = self._file(write=True)['trials/info']
+                for name in self._pendingTrials:
+                    info[self.trialIndex(name)] = repr(self._trials[name])
+                self._pendingTrials = set()
+            if self._writable:
+                self._h5.flush()
+
+    def close(self):
+        """Close the HDF5 file. It is reopened automatically when needed."""
+        with self.lock:
+            self.flush()
+            self._closeFile()
+
+    def _closeFile(self):
+        if self._h5 is not None:
+            self._datasets = {}
+            self._h5.close()
+            self._h5 = None
+            self._writable = False
+
+    def trialName(self, index):
+        return '_'.join(['%03d' % i for i in index])
+
+    def trialIndex(self, name):
+        """Return the sequence coordinates of trial *name*, or None if *name*
+        does not name a trial in this sequence."""
+        try:
+            index = tuple([int(x) for x in name.split('_')])
+        except ValueError:
+            return None
+        if len(index) != len(self.shape) or self.trialName(index) != name:
+            return None
+        for i, n in zip(index, self.shape):
+            if i < 0 or i >= n:
+                return None
+        return index
+
+    def _dataset(self, fileName, name, write=False):
+        f = self._file(write)
+        key = (fileName, name)
+        if key not in self._datasets:
+            self._datasets[key] = f['files'][fileName][name]
+        return self._datasets[key]
+
+    def _trialTable(self):
+        if self._trials is None:
+            info = self._file()['trials/info'][...]
+            self._trials = {}
+            for index in np.ndindex(*self.shape):
+                if info[index]:
+                    self._trials[self.trialName(index)] = readLiteral(info[index])
+        return self._trials
+
+    def _fileTable(self):
+        if self._written is None:
+            self._written = {}
+            for name in self._file()['files']:
+                fileInfo = self._dataset(name, 'fileInfo')[...]
+                self._written[str(name)] = np.array([len(x) > 0 for x in fileInfo.flat], dtype=bool).reshape(self.shape)
+        return self._written
+
+    def _fileAxes(self, fileName):
+        if fileName not in self._axes:
+            self._axes[fileName] = MetaArray.readHDF5Meta(self._file()['files'][fileName]['axes'])
+        return self._axes[fileName]
+
+    def trialNames(self):
+        """Return the names of all trials in the container, in sequence order."""
+        with self.lock:
+            return sorted(self._trialTable().keys(), key=self.trialIndex)
+
+    def hasTrial(self, name):
+        with self.lock:
+            return name in self._trialTable()
+
+    def exists(self, name):
+        """Return True if *name* (a trial, or trial/file) is stored in the container."""
+        parts = name.strip(os.path.sep).split(os.path.sep)
+        if len(parts) == 1:
+            return self.hasTrial(parts[0])
+        return len(parts) == 2 and self.hasFile(parts[0], parts[1])
+
+    def trialInfo(self, name):
+        with self.lock:
+            return self._trialTable()[name].copy()
+
+    def setTrialInfo(self, name, info):
+        """Update the meta info of trial *name*, creating the trial if needed.
+        Return False if *info* can not be stored in the container."""
+        with self.lock:
+            index = self.trialIndex(name)
+            if index is None:
+                raise ValueError('"%s" is not a trial name for a sequence of shape %s.' % (name, self.shape))
+            trials = self._trialTable()
+            newInfo = OrderedDict(trials.get(name, {}))
+            newInfo.update(info)
+            if not isLiteral(newInfo):
+                return False
+            trials[name] = newInfo
+            self._pendingTrials.add(name)
+            return True
+
+    def mkdir(self, name, autoIncrement=False, info=None):
+        """Create trial *name* and return its DirHandle.
+
+        This mirrors DirHandle.mkdir() so that the container can be used in
+        place of the sequence directory when TaskRunner generates tasks.
+        """
+        if info is None:
+            info = {}
+        info = info.copy()
+        info['__timestamp__'] = time.time()
+        with self.lock:
+            if self.hasTrial(name):
+                raise Exception("Trial %s already exists in %s." % (name, self.path()))
+            stored = self.setTrialInfo(name, info)
+            if not stored:
+                self.setTrialInfo(name, {'__timestamp__': info['__timestamp__']})
+        dh = self.dirHandle[name]
+        if not stored:
+            dh.setInfo(info)
+        self.dirHandle._childChanged()
+        self.dirHandle.emitChanged('children', dh.name())
+        return dh
+
+    def fileNames(self, trial):
+        """Return the names of the files stored in the container for *trial*."""
+        with self.lock:
+            index = self.trialIndex(trial)
+            return sorted([name for name, written in self._fileTable().items() if written[index]])
+
+    def hasFile(self, trial, fileName):
+        with self.lock:
+            index = self.trialIndex(trial)
+            written = self._fileTable().get(fileName)
+            return index is not None and written is not None and bool(written[index])
+
+    def fileInfo(self, trial, fileName):
+        with self.lock:
+            return readLiteral(self._dataset(fileName, 'fileInfo')[self.trialIndex(trial)])
+
+    def setFileInfo(self, trial, fileName, info):
+        """Update the meta info for a stored file. Return False if *info* can
+        not be stored in the container."""
+        with self.lock:
+            newInfo = self.fileInfo(trial, fileName)
+            newInfo.update(info)
+            if not isLiteral(newInfo):
+                return False
+            self._dataset(fileName, 'fileInfo', write=True)[self.trialIndex(trial)] = repr(newInfo)
+            return True
+
+    def storeFile(self, trial, fileName, data, info=None):
+        """Store *data* (a MetaArray or ndarray) as *fileName* in *trial*.
+
+        Return the name of the stored file ('.ma' is appended as by the
+        MetaArray file type), or None if the data can not be stored in the
+        container and must be written to a real file instead.
+        """
+        if isinstance(data, np.ndarray):
+            data = MetaArray(data)
+        if not isinstance(data, MetaArray):
+            return None
+        if not fileName.endswith('.ma'):
+            fileName = fileName + '.ma'
+        if '/' in fileName or os.path.sep in fileName:
+            return None
+        if os.path.exists(os.path.join(self.dirHandle.name(), trial, fileName)):
+            return None
+
+        info = {} if info is None else info.copy()
+        info.setdefault('__object_type__', 'MetaArray')
+        info.setdefault('__timestamp__', time.time())
+        axes = data.infoCopy()
+        extra = axes.pop(-1)
+        if not (isLiteral(extra) and isLiteral(info)):
+            return None
+        arr = data.asarray()
+
+        with self.lock:
+            index = self.trialIndex(trial)
+            if index is None or not self.hasTrial(trial):
+                return None
+            f = self._file(write=True)
+            written = self._fileTable()
+            if fileName not in written:
+                if arr.size == 0 or arr.nbytes > self.maxTrialBytes:
+                    return None
+                grp = f['files'].create_group(fileName)
+                grp.create_dataset('data', shape=self.shape + arr.shape, dtype=arr.dtype,
+                                   chunks=(1,) * len(self.shape) + arr.shape)
+                grp.create_dataset('info', shape=self.shape, dtype=h5py.special_dtype(vlen=str))
+                grp.create_dataset('fileInfo', shape=self.shape, dtype=h5py.special_dtype(vlen=str))
+                data.writeHDF5Meta(grp, 'axes', axes)
+                written[fileName] = np.zeros(self.shape, dtype=bool)
+                self._axes[fileName] = axes
+            else:
+                ds = self._dataset(fileName, 'data', write=True)
+                if ds.shape[len(self.shape):] != arr.shape or ds.dtype != arr.dtype or not axesEqual(self._fileAxes(fileName), axes):
+                    ## an earlier trial's version of this file can not be replaced in the container
+                    if written[fileName][index]:
+                        self._dataset(fileName, 'fileInfo', write=True)[index] = ''
+                        written[fileName][index] = False
+                    return None
+
+            self._dataset(fileName, 'data', write=True)[index] = arr
+            self._dataset(fileName, 'info', write=True)[index] = repr(extra)
+            self._dataset(fileName, 'fileInfo', write=True)[index] = repr(info)
+            written[fileName][index] = True
+            self.flush()
+            return fileName
+
+    def readFile(self, trial, fileName):
+        """Return the MetaArray stored as *fileName* in *trial*."""
+        with self.lock:
+            index = self.trialIndex(trial)
+            arr = self._dataset(fileName, 'data')[index]
+            extra = readLiteral(self._dataset(fileName, 'info')[index])
+            axes = copy.deepcopy(self._fileAxes(fileName))
+        return MetaArray(arr, info=axes + [extra])
+
+    def readSequence(self, fileName):
+        """Return a MetaArray containing *fileName* from all trials, with one
+        leading axis per sequence parameter.
+
+        Trials that did not store the file are zero-filled; extra info
+        'stored' is a boolean array marking the trials that did.
+        """
+        with self.lock:
+            arr = self._dataset(fileName, 'data')[...]
+            written = self._fileTable()[fileName].copy()
+            axes = copy.deepcopy(self._fileAxes(fileName))
+        seqAxes = []
+        for name, n in zip(self.axes, self.shape):
+            if isinstance(name, tuple):
+                name = '.'.join(name)
+            seqAxes.append({'name': name, 'values': np.arange(n)})
+        return MetaArray(arr, info=seqAxes + axes + [{'stored': written}])
@@ -115,7 +115,7 @@ class CLibrary:
         
         self._lib_ = lib
         self._headers_ = headers
-        self._defs_ = headers.defs
+        self._defs_ = headers.defs  ## filled in by headers.resolve() if the headers were created with lazy=True
         if prefix is None:
             self._prefix_ = []
         elif type(prefix) is list:
@@ -143,6 +143,7 @@ class CLibrary:
         return [name] + [p + name for p in self._prefix_]
 
     def _mkObj_(self, typ, name):
+        self._headers_.resolve()
         names = self._allNames_(name)
         
         for n in names:
@@ -185,6 +186,7 @@ class CLibrary:
         """Used to retrieve any type of definition from the headers. Searches for the name in this order:
         values, functions, types, structs, unions, enums."""
         if name not in self._allObjs_:
+            self._headers_.resolve()
             names = self._allNames_(name)
             for k in ['values', 'functions', 'types', 'structs', 'unions', 'enums', None]:
                 if k is None:
@@ -202,6 +204,7 @@ class CLibrary:
 
     def __getitem__(self, name):
         """Used to retrieve a specific dictionary from the headers."""
+        self._headers_.resolve()
         return self._defs_[name]
         
     def __repr__(self):
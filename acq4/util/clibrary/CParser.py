@@ -8,12 +8,18 @@ Used for extracting data such as macro definitions, variables, typedefs, and fun
 signatures from C files (preferrably header files).
 """
 
-import sys, re, os
+import sys, re, os, threading
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 __all__ = ['winDefs', 'CParser']
 
+_winDefs = {}  ## shared parsers returned by winDefs(), keyed by architecture
 
-def winDefs(verbose=False, architecture=None):
+
+def winDefs(verbose=False, architecture=None, lazy=False):
     """Convenience function. Returns a parser which loads a selection of windows headers included with 
     CParser. These definitions can either be accessed directly or included before parsing
     another file like this:
@@ -29,7 +35,12 @@ def winDefs(verbose=False, architecture=None):
     *architecture*  Specify '32bit' or '64bit' to get an headers parsed as 
                     either 32 or 64-bit. If unspecified, we use sys.maxsize to 
                     determine whether to interpret headers for 32 or 64 bits.
+    *lazy*          If True, the definitions are not loaded until they are first
+                    needed (see CParser.resolve). Default is False.
     ==============  ==================================================================
+    
+    The same parser is returned for every call with the same architecture, so
+    it should not be modified.
     """
     headerFiles = ['WinNt.h', 'WinDef.h', 'WinBase.h', 'BaseTsd.h', 'WTypes.h', 'WinUser.h']
 
@@ -50,14 +61,24 @@ def winDefs(verbose=False, architecture=None):
     else:
         raise Exception("Not sure how to return headers for '%s' architecture; valid arguments are '32bit', '64bit', or None." % architecture)
 
+    if architecture in _winDefs:
+        p = _winDefs[architecture]
+        if not lazy:
+            p.resolve()
+        return p
+
     d = os.path.dirname(__file__)
     p = CParser(
         [os.path.join(d, 'headers', h) for h in headerFiles],
         types={'__int64': ('long long')},
         macros=macros,
-        processAll=False
+        cache=os.path.join(d, 'headers', cache),
+        verbose=verbose,
+        lazy=True,
     )
-    p.processAll(cache=os.path.join(d, 'headers', cache), noCacheWarning=True, verbose=verbose)
+    _winDefs[architecture] = p
+    if not lazy:
+        p.resolve()
     return p
 
 
@@ -90,7 +111,7 @@ class CParser():
     
     cacheVersion = 22    ## increment every time cache structure or parsing changes to invalidate old cache files.
     
-    def __init__(self, files=None, replace=None, copyFrom=None, processAll=True, cache=None, checkCache=False, verbose=False, **args):
+    def __init__(self, files=None, replace=None, copyFrom=None, processAll=True, cache=None, checkCache=False, verbose=False, lazy=False, **args):
         """Create a C parser object fiven a file or list of files. Files are read to memory and operated
         on from there.
         
@@ -99,6 +120,8 @@ class CParser():
                format is {'searchStr': 'replaceStr', ...}
             *cache* specifies a cache file where parsed definitions should be stored.
             *checkCache* specifies whether to attempt to reparse if it appears the header file is newer.
+            *lazy* defers copying definitions and processing (reading the cache or
+               parsing) until the definitions are first needed; see resolve().
             Extra parameters may be used to specify the starting state of the parser. For example,
             one could provide a set of missing type declarations by
                 types={'UINT': ('unsigned int'), 'STRING': ('char', 1)}
@@ -129,6 +152,8 @@ class CParser():
         
         self.fileOrder = []
         self.files = {}
+        self.fileReplace = {}  ## replacements to make when each file is read (see readFile)
+        self.cacheFileOrder = None  ## file order recorded in the last cache loaded
         self.packList = {}  ## list describing struct packing rules as defined by #pragma pack
         if files is not None:
             if type(files) is str:
@@ -151,15 +176,33 @@ class CParser():
             for k in args[t].keys():
                 self.addDef(t, k, args[t][k])
         
-        # Import from other CParsers if specified
-        if copyFrom is not None:
-            if type(copyFrom) not in [list, tuple]:
-                copyFrom = [copyFrom]
-            for p in copyFrom:
-                self.importDict(p.fileDefs, p.fileOrder)
-                
-        if processAll:
-            self.processAll(cache=cache, verbose=verbose, checkCache=checkCache)
+        self._pending = (copyFrom, processAll, {'cache': cache, 'verbose': verbose, 'checkCache': checkCache})
+        self._resolveLock = threading.Lock()
+        if not lazy:
+            self.resolve()
+    
+    def resolve(self):
+        """Copy definitions from other parsers and process all files, if this was
+        deferred by creating the parser with lazy=True. CLibrary calls this the
+        first time a definition is requested; it does nothing once a call has 
+        succeeded. If processing fails, the exception is raised again by the
+        next call."""
+        with self._resolveLock:
+            if self._pending is None:
+                return
+            copyFrom, processAll, opts = self._pending
+            
+            # Import from other CParsers if specified
+            if copyFrom is not None:
+                if type(copyFrom) not in [list, tuple]:
+                    copyFrom = [copyFrom]
+                for p in copyFrom:
+                    p.resolve()
+                    self.importDict(p.fileDefs, p.fileOrder)
+                    
+            if processAll:
+                self.processAll(**opts)
+            self._pending = None
     
     def processAll(self, cache=None, returnUnparsed=False, printAfterPreprocess=False, noCacheWarning=True, verbose=False, checkCache=False):
         """Remove comments, preprocess, and parse declarations from all files. (operates in memory; does not alter the original files)
@@ -170,10 +213,23 @@ class CParser():
            'returnUnparsed' is passed directly to parseDefs.
            'printAfterPreprocess' is for debugging; prints the result of preprocessing each file."""
         self.verbose = verbose
-        if cache is not None and self.loadCache(cache, checkValidity=checkCache):
-            if verbose:
-                print "Loaded cached definitions; will skip parsing."
-            return  ## cached values loaded successfully, nothing left to do here
+        if cache is not None:
+            ## Parse results are stored in a compact cache next to the requested
+            ## cache file. An older cache found at *cache* is converted on first use.
+            compact = self.compactCacheFile(cache)
+            if self.loadCache(compact, checkValidity=checkCache):
+                if verbose:
+                    print "Loaded cached definitions; will skip parsing."
+                return  ## cached values loaded successfully, nothing left to do here
+            if self.loadCache(cache, checkValidity=checkCache):
+                if verbose:
+                    print "Loaded cached definitions; will skip parsing."
+                try:
+                    self.writeCache(compact, self.cacheFileOrder)
+                except Exception:
+                    if verbose:
+                        print "Could not write cache file '%s'" % compact
+                return
         #else:
             #print "No cache.", cache
             
@@ -183,6 +239,8 @@ class CParser():
             print "Parsing C header files (no valid cache found). This could take several minutes..."
         for f in self.fileOrder:
             #fn = os.path.basename(f)
+            if self.files.get(f, None) is None:
+                self.readFile(f)
             if self.files[f] is None:
                 ## This means the file could not be loaded and there was no cache.
                 raise Exception('Could not find header file "%s" or a suitable cache file.' % f)
@@ -201,10 +259,17 @@ class CParser():
         
         if cache is not None:
             if verbose:
-                print "Writing cache file '%s'" % cache
-            self.writeCache(cache)
+                print "Writing cache file '%s'" % compact
+            self.writeCache(compact)
             
         return results
+
+    @classmethod
+    def compactCacheFile(cls, cacheFile):
+        """Return the name of the compact cache file written for *cacheFile*.
+        The name includes cacheVersion, so caches written by other versions of
+        this module are never read."""
+        return '%s.v%d.cache' % (os.path.splitext(cacheFile)[0], cls.cacheVersion)
         
             
     def loadCache(self, cacheFile, checkValidity=False):
@@ -242,35 +307,43 @@ class CParser():
                     canParse = False
         
         try:
-            ## read cache file
-            import pickle
-            cache = pickle.load(open(cacheFile, 'rb'))
-            
-            ## make sure __init__ options match (unless we can't parse the headers anyway)
-            if checkValidity:
-                if cache['opts'] != self.initOpts:
-                    if self.verbose:
-                        print "Cache file is not valid--created using different initialization options."
+            ## read cache file. Compact caches (see writeCache) begin with a small
+            ## header so that they can be validated before the definitions are read.
+            fd = open(cacheFile, 'rb')
+            try:
+                cache = pickle.load(fd)
+                compact = 'fileDefs' not in cache
+                
+                ## make sure __init__ options match (unless we can't parse the headers anyway)
+                if checkValidity or compact:
+                    if checkValidity and cache['opts'] != self.initOpts:
+                        if self.verbose:
+                            print "Cache file is not valid--created using different initialization options."
+                            print cache['opts']
+                            print self.initOpts
+                        if canParse:
+                            return False
+                        elif self.verbose:
+                            print "However, can't parse header files; will attempt to use the cache anyway."
+                    elif checkValidity and self.verbose:
+                        print "Cache init opts are OK:"
                         print cache['opts']
-                        print self.initOpts
-                    if canParse:
-                        return False
-                    elif self.verbose:
-                        print "However, can't parse header files; will attempt to use the cache anyway."
-                elif self.verbose:
-                    print "Cache init opts are OK:"
-                    print cache['opts']
-                if cache['version'] < self.cacheVersion:
-                    if self.verbose:
-                        print "Cache file is not valid--cache format has changed."
-                    if canParse:
-                        return False
-                    elif self.verbose:
-                        print "However, can't parse header files; will attempt to use the cache anyway."
-
+                    if cache['version'] < self.cacheVersion or (compact and cache['version'] != self.cacheVersion):
+                        if self.verbose:
+                            print "Cache file is not valid--cache format has changed."
+                        if canParse or compact:
+                            return False
+                        elif self.verbose:
+                            print "However, can't parse header files; will attempt to use the cache anyway."
+                
+                if compact:
+                    cache.update(pickle.load(fd))
+            finally:
+                fd.close()
                 
             ## import all parse results
             self.importDict(cache['fileDefs'], cache['fileOrder'])
+            self.cacheFileOrder = cache['fileOrder']
             return True
         except:
             print "Warning--cache read failed:"
@@ -282,27 +355,31 @@ class CParser():
         same as CParser.fileDefs. Used internally; does not need to be called
         manually."""
         for f in order:
-            f = os.path.split(f)[1]
+            f = re.split(r'[\\/]', f)[-1]  ## caches may hold paths from other platforms
             self.currentFile = f
             for k in self.dataList:
                 for n in data[f][k]:
                     self.addDef(k, n, data[f][k][n])
 
-    def writeCache(self, cacheFile):
-        """Store all parsed declarations to cache. Used internally."""
-        cache = {}
-        cache['opts'] = self.initOpts
-        cache['fileDefs'] = self.fileDefs
-        cache['fileOrder'] = self.fileOrder
-        cache['version'] = self.cacheVersion
-        #for k in self.dataList:
-            #cache[k] = getattr(self, k)
-        import pickle
-        pickle.dump(cache, open(cacheFile, 'wb'))
+    def writeCache(self, cacheFile, fileOrder=None):
+        """Store all parsed declarations to cache. Used internally.
+        The file holds two binary pickles: a header with the cache version and
+        initialization options, then the definitions.
+        *fileOrder* defaults to the files parsed by this CParser."""
+        if fileOrder is None:
+            fileOrder = self.fileOrder
+        header = {'opts': self.initOpts, 'version': self.cacheVersion}
+        defs = {'fileDefs': self.fileDefs, 'fileOrder': [re.split(r'[\\/]', f)[-1] for f in fileOrder]}
+        fd = open(cacheFile, 'wb')
+        try:
+            pickle.dump(header, fd, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(defs, fd, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fd.close()
 
     def loadFile(self, file, replace=None):
-        """Read a file, make replacements if requested. Called by __init__, should
-        not be called manually."""
+        """Add a file to be parsed. The file is only read when it needs to be
+        parsed (see readFile). Called by __init__, should not be called manually."""
         if not os.path.isfile(file):
             ## Not a fatal error since we might be able to function properly if there is a cache file..
             #raise Exception("File %s not found" % file)
@@ -310,18 +387,24 @@ class CParser():
             self.files[file] = None
             return False
             
+        self.files[file] = None
+        self.fileReplace[file] = replace
+        self.fileOrder.append(file)
+        bn = os.path.basename(file)
+        self.initOpts['replace'][bn] = replace
+        self.initOpts['files'].append(bn) # only interested in the file names; the directory may change between systems.
+        return True
+    
+    def readFile(self, file):
+        """Read a file added by loadFile, make replacements if requested."""
         fd = open(file, 'rU')  ## U causes all newline types to be converted to \n
         self.files[file] = fd.read()
         fd.close()
         
+        replace = self.fileReplace.get(file, None)
         if replace is not None:
             for s in replace:
                 self.files[file] = re.sub(s, replace[s], self.files[file])
-        self.fileOrder.append(file)
-        bn = os.path.basename(file)
-        self.initOpts['replace'][bn] = replace
-        self.initOpts['files'].append(bn) # only interested in the file names; the directory may change between systems.
-        return True
     
 
 
@@ -1097,6 +1180,7 @@ class CParser():
     def printAll(self, file=None):
         """Print everything parsed from files. Useful for debugging."""
         from pprint import pprint
+        self.resolve()
         for k in self.dataList:
             print "============== %s ==================" % k
             if file is None:
@@ -1139,6 +1223,7 @@ class CParser():
 
     def evalType(self, typ):
         """evaluate a named type into its fundamental type"""
+        self.resolve()
         used = []
         while True:
             if self.isFundType(typ):
@@ -1158,6 +1243,7 @@ class CParser():
 
     def find(self, name):
         """Search all definitions for the given name"""
+        self.resolve()
         res = []
         for f in self.fileDefs:
             fd = self.fileDefs[f]
@@ -1177,7 +1263,9 @@ class CParser():
     def findText(self, text):
         """Search all file strings for text, return matching lines."""
         res = []
-        for f in self.files:
+        for f in self.fileOrder:
+            if self.files[f] is None:
+                self.readFile(f)
             l = self.files[f].split('\n')
             for i in range(len(l)):
                 if text in l[i]:
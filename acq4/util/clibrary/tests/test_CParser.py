@@ -0,0 +1,19 @@
+import os, shutil, tempfile
+import pytest
+from acq4.util.clibrary.CParser import CParser
+
+
+def test_lazyResolveFailure():
+    ## a lazy parser whose header disappears before it is resolved, with no
+    ## cache to fall back on, must fail every time it is resolved
+    path = tempfile.mkdtemp()
+    try:
+        header = os.path.join(path, 'missing.h')
+        open(header, 'w').write('int x;\n')
+        p = CParser(header, cache=os.path.join(path, 'missing.cache'), lazy=True)
+        os.remove(header)
+        for i in range(2):
+            with pytest.raises(IOError):
+                p.resolve()
+    finally:
+        shutil.rmtree(path)
@@ -18,8 +18,8 @@ class EventFitter(CtrlNode):
     nodeName = "EventFitter"
     uiTemplate = [
         ('multiFit', 'check', {'value': False}),
-        #('parallel', 'check', {'value': False}),
-        #('nProcesses', 'spin', {'value': 1, 'min': 1, 'int': True}),
+        ('batchFit', 'check', {'value': False, 'tip': 'Fit all events together using a vectorized solver (much faster for many events; may find different minima than serial fits)'}),
+        ('nProcesses', 'intSpin', {'value': 1, 'min': 1, 'max': 64, 'tip': 'Number of processes to distribute batch fits across'}),
         ('plotFits', 'check', {'value': True}),
         ('plotGuess', 'check', {'value': False}),
         ('plotEvents', 'check', {'value': False}),
@@ -36,25 +36,6 @@ class EventFitter(CtrlNode):
         self.plotItems = []
         self.selectedFit = None
         self.deletedFits = []
-        self.pool = None  ## multiprocessing pool
-        self.poolSize = 0
-        #self.ctrls['parallel'].toggled.connect(self.setupPool)
-        #self.ctrls['nProcesses'].valueChanged.connect(self.setupPool)
-    
-    #def setupPool(self):
-        #import multiprocessing as mp
-        #if self.ctrls['parallel'].isChecked():
-            #nProc = self.ctrls['nProcesses'].value()
-            #if self.pool is not None and self.poolSize != nProc:
-                #self.pool.terminate()
-                #self.pool = None
-            #if self.pool is None:
-                #self.pool = mp.Pool(processes=nProc)
-                #self.poolSize = nProc
-        #else:
-            #if self.pool is not None:
-                #self.pool.terminate()
-                #self.pool = None
     
     def process(self, waveform, events, display=True):
         self.deletedFits = []
@@ -71,10 +52,10 @@ class EventFitter(CtrlNode):
             'dt': dt, 'tau': tau, 'multiFit': self.ctrls['multiFit'].isChecked(),
             'waveform': waveform.view(np.ndarray),
             'tvals': waveform.xvals('Time'),
+            'batchFit': self.ctrls['batchFit'].isChecked(),
+            'workers': self.ctrls['nProcesses'].value(),
         }
         
-        
-        #if not self.ctrls['parallel'].isChecked():
         output = processEventFits(events, startEvent=0, stopEvent=len(events), opts=opts)
         guesses = output['guesses']
         eventData = output['eventData']
@@ -82,36 +63,6 @@ class EventFitter(CtrlNode):
         xVals = output['xVals']
         yVals = output['yVals']
         output = output['output']
-        #else:
-            #print "parallel:", self.pool, self.poolSize
-            #results = []
-            #nProcesses = self.ctrls['nProcesses'].value()
-            #evPerProcess = int(len(events) / nProcesses)
-            #start = 0
-            #for i in range(nProcesses):
-                #stop = start + evPerProcess
-                #if stop > len(events):
-                    #stop = len(events)
-                #args = (events, start, stop, opts)
-                #results.append(self.pool.apply_async(processEventFits, args))
-                #print "started process", start, stop
-                #start = stop
-            #data = []
-            #guesses = []
-            #eventData = []
-            #indexes = []
-            #xVals = []
-            #yVals = []
-            #for res in results:  ## reconstruct results here
-                #print "getting result", res
-                #output = res.get(10)
-                #data.append(output['output'])
-                #guesses.extend(output['guesses'])
-                #eventData.extend(output['eventData'])
-                #indexes.extend(output['indexes'])
-                #xVals.extend(output['xVals'])
-                #yVals.extend(output['yVals'])
-            #output = np.concatenate(data)
             
         for i in range(len(indexes)):            
             if display and self['plot'].isConnected():
@@ -200,11 +151,16 @@ class EventFitter(CtrlNode):
         
 def processEventFits(events, startEvent, stopEvent, opts):
     ## This function does all the processing work for EventFitter.
+    ## Events are first sliced out of the waveform and given initial guesses,
+    ## then each event is fit serially with functions.fitPsp, or all fits are 
+    ## computed together by functions.fitPspBatch if opts['batchFit'] is True.
     dt = opts['dt']
     origTau = opts['tau']
     multiFit = opts['multiFit']
     waveform = opts['waveform']
     tvals = opts['tvals']
+    batchFit = opts.get('batchFit', False)
+    workers = opts.get('workers', 1)
     
     nFields = len(events.dtype.fields)
     
@@ -220,8 +176,6 @@ def processEventFits(events, startEvent, stopEvent, opts):
         ('fitLengthOverDecay', float),
     ])
     
-    offset = 0 ## not all input events will produce output events; offset keeps track of the difference.
-
     outputState = {
         'guesses': [],
         'eventData': [], 
@@ -229,6 +183,9 @@ def processEventFits(events, startEvent, stopEvent, opts):
         'xVals': [],
         'yVals': []
     }
+    allTimes = []
+    allYVals = []
+    allBounds = []
     
     for i in range(startEvent, stopEvent):
         start = events[i]['time']
@@ -258,7 +215,6 @@ def processEventFits(events, startEvent, stopEvent, opts):
         times = tvals[startIndex:stopIndex]
         #print i, startIndex, stopIndex, dt
         if len(times) < 4:  ## PSP fit requires at least 4 points; skip this one
-            offset += 1
             continue
         
         ## reconvolve this chunk of the signal if it was previously deconvolved
@@ -315,31 +271,36 @@ def processEventFits(events, startEvent, stopEvent, opts):
             sorted((dt*0.5, guessDecay)),
             sorted((dt*0.5, guessDecay * 50.))
         ]
-        yVals = eventData.view(np.ndarray)
-        
-        fit = functions.fitPsp(times, yVals, guess=guess, bounds=bounds, multiFit=multiFit)
         
-        computed = functions.pspFunc(fit, times)
+        outputState['guesses'].append(guess)
+        outputState['eventData'].append(eventData)
+        outputState['indexes'].append(i)
+        allTimes.append(times)
+        allYVals.append(eventData.view(np.ndarray))
+        allBounds.append(bounds)
+        
+    if batchFit:
+        fits = functions.fitPspBatch(allTimes, allYVals, outputState['guesses'], allBounds, multiFit=multiFit, workers=workers)
+    else:
+        fits = [functions.fitPsp(allTimes[j], allYVals[j], guess=list(outputState['guesses'][j]), bounds=allBounds[j], multiFit=multiFit) for j in range(len(allTimes))]
+        
+    for j, i in enumerate(outputState['indexes']):
+        fit = fits[j]
+        times = allTimes[j]
+        yVals = allYVals[j]
+        computed = functions.pspFunc(list(fit), times)
         peakTime = functions.pspMaxTime(fit[2], fit[3])
         diff = (yVals - computed)
         err = (diff**2).sum()
         fracError = diff.std() / computed.std()
         lengthOverDecay = (times[-1] - fit[1]) / fit[3]  # ratio of (length of data that was fit : decay constant)
-        output[i-offset] = tuple(events[i]) + tuple(fit) + (peakTime, err, fracError, lengthOverDecay)
+        output[j] = tuple(events[i]) + tuple(fit) + (peakTime, err, fracError, lengthOverDecay)
         #output['fitTime'] += output['time']
-            
-        #print fit
-        #self.events.append(eventData)
         
-        outputState['guesses'].append(guess)
-        outputState['eventData'].append(eventData)
-        outputState['indexes'].append(i)
         outputState['xVals'].append(times)
         outputState['yVals'].append(computed)
-        
 
-    if offset > 0:
-        output = output[:-offset]
+    output = output[:len(outputState['indexes'])]
         
     outputState['output'] = output
         
@@ -1202,7 +1163,11 @@ class RemoveDirect(CtrlNode):
             )
             
         if self.ctrls['subtractDirect'].isChecked():
-            out = metaarray.MetaArray(data-y, info=data.infoCopy())
+            if self.ownsInput('data') and data.dtype.kind == 'f':
+                data.view(np.ndarray)[:] -= y
+                out = data
+            else:
+                out = data.withData(data.view(np.ndarray) - y)
             fitParams['directFitSubtracted'] = True
         else:
             out = data
@@ -265,6 +265,228 @@ def fitPsp(x, y, guess, bounds=None, risePower=2.0, multiFit=False):
     return fit
 
 
+def pspBatchFunc(v, x, risePower=2.0, jacobian=False):
+    """Evaluate the un-normalized PSP model used by fitPsp for many events at once.
+    
+    v is an (nEvents, 4) array of [amplitude, x offset, rise tau, decay tau] and x
+    is an (nEvents, nPts) array of sample times. Returns an (nEvents, nPts) array 
+    of v[0] * pspInnerFunc(x-v[1], |v[2]|, |v[3]|). If *jacobian* is True, 
+    also return the (nEvents, nPts, 4) array of partial derivatives with respect 
+    to each parameter.
+    """
+    amp = v[:, 0:1]
+    rise = np.abs(v[:, 2:3])
+    decay = np.abs(v[:, 3:4])
+    u = x - v[:, 1:2]
+    mask = u >= 0
+    u = np.where(mask, u, 0)
+    riseExp = np.exp(-u / rise)
+    decayExp = np.exp(-u / decay)
+    R = 1.0 - riseExp
+    g = R**risePower * decayExp * mask
+    out = amp * g
+    if not jacobian:
+        return out
+    
+    ## d/du [(1-exp(-u/rise))**p]
+    dRise = risePower * R**(risePower-1) * riseExp * decayExp * mask
+    jac = np.empty(x.shape + (4,), dtype=out.dtype)
+    jac[..., 0] = g
+    jac[..., 1] = -amp * (dRise / rise - g / decay)
+    jac[..., 2] = -amp * dRise * u / rise**2 * np.sign(v[:, 2:3])
+    jac[..., 3] = amp * g * u / decay**2 * np.sign(v[:, 3:4])
+    return out, jac
+
+
+def _lmPspBatch(x, y, w, guess, lower, upper, risePower, ftol, maxIter=200):
+    """Levenberg-Marquardt solver for many simultaneous, independent PSP fits.
+    
+    All arrays have one row per fit; *w* is 1 for valid samples and 0 for padding.
+    As with fitPsp, parameters are clipped to their bounds at every step.
+    """
+    nFit = len(guess)
+    v = np.clip(guess, lower, upper)
+    ## solve for parameters scaled by the magnitude of the initial guess; 
+    ## amplitudes and time constants differ by many orders of magnitude.
+    scale = np.abs(guess)
+    scale[scale == 0] = 1.0
+    res = (y - pspBatchFunc(v, x, risePower)) * w
+    cost = (res**2).sum(axis=1)
+    lam = np.ones(nFit)  ## start with short, gradient-like steps (as leastsq's factor=0.1 does)
+    active = np.ones(nFit, dtype=bool)
+    diagInds = np.arange(4)
+    
+    for i in range(maxIter):
+        idx = np.argwhere(active)[:, 0]
+        if len(idx) == 0:
+            break
+        vi = v[idx]
+        f, jac = pspBatchFunc(vi, x[idx], risePower, jacobian=True)
+        jac *= w[idx][..., np.newaxis] * scale[idx][:, np.newaxis, :]
+        A = np.einsum('eni,enj->eij', jac, jac)
+        g = np.einsum('eni,en->ei', jac, res[idx])
+        diag = A[:, diagInds, diagInds]
+        diag = np.maximum(diag, diag.max(axis=1)[:, np.newaxis] * 1e-12 + 1e-300)
+        damped = A.copy()
+        damped[:, diagInds, diagInds] += lam[idx, np.newaxis] * diag
+        try:
+            step = np.linalg.solve(damped, g[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.array([np.linalg.lstsq(damped[j], g[j], rcond=None)[0] for j in range(len(idx))])
+        ## reduction in cost predicted by the linearized model
+        predicted = 2 * (step * g).sum(axis=1) - np.einsum('ei,eij,ej->e', step, A, step)
+        vNew = np.clip(vi + step * scale[idx], lower[idx], upper[idx])
+        resNew = (y[idx] - pspBatchFunc(vNew, x[idx], risePower)) * w[idx]
+        costNew = (resNew**2).sum(axis=1)
+        
+        better = costNew < cost[idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reduction = (cost[idx] - costNew) / cost[idx]
+            predicted /= cost[idx]
+        acc = idx[better]
+        v[acc] = vNew[better]
+        res[acc] = resNew[better]
+        cost[acc] = costNew[better]
+        lam[acc] *= 0.1
+        lam[idx[~better]] *= 10.
+        
+        ## converged when both the actual and predicted relative reductions are small (as in MINPACK)
+        done = (better & ~(reduction > ftol) & ~(predicted > ftol)) | (lam[idx] > 1e10) | ~np.isfinite(costNew)
+        active[idx[done]] = False
+    
+    return v, cost
+
+
+def _fitPspBatchChunk(x, y, w, guess, lower, upper, risePower, multiFit):
+    fit, err = _lmPspBatch(x, y, w, guess, lower, upper, risePower, ftol=1e-2)
+    
+    if multiFit:
+        ## same brute-force search as fitPsp, but all re-fits are solved together.
+        factors = []
+        for da in [0.5, 1.0, 2.0]:
+            for dt in [0.5, 1.0, 2.0]:
+                for dr in [0.5, 1.0, 2.0]:
+                    for do in [0.002, .0, 0.002]:
+                        if da == 1.0 and dt == 1.0 and dr == 1.0 and do == 0.0:
+                            continue
+                        factors.append((da, do, dr, dt))
+        factors = np.array(factors)
+        nTry = len(factors)
+        rep = lambda a: np.repeat(a, nTry, axis=0)
+        guess2 = rep(fit)
+        guess2[:, 0] *= np.tile(factors[:, 0], len(fit))
+        guess2[:, 1] += np.tile(factors[:, 1], len(fit))
+        guess2[:, 2] *= np.tile(factors[:, 2], len(fit))
+        guess2[:, 3] *= np.tile(factors[:, 3], len(fit))
+        fit2, err2 = _lmPspBatch(rep(x), rep(y), rep(w), guess2, rep(lower), rep(upper), risePower, ftol=1e-1)
+        fit2 = fit2.reshape(len(fit), nTry, 4)
+        err2 = err2.reshape(len(fit), nTry)
+        best = np.argmin(err2, axis=1)
+        improved = err2[np.arange(len(fit)), best] < err
+        fit[improved] = fit2[np.arange(len(fit)), best][improved]
+    
+    ## fits that end on (or within 0.1% of the range of) a bound may be stuck there; see fitPspBatch
+    with np.errstate(invalid='ignore'):
+        span = upper - lower
+        tol = 1e-3 * np.where(np.isfinite(span), span, 0)
+        atBound = ((fit - lower <= tol) | (upper - fit <= tol)).any(axis=1)
+    
+    fit[:, 2:] = np.abs(fit[:, 2:])
+    maxX = fit[:, 2] * np.log(1 + (fit[:, 3]*risePower / fit[:, 2]))
+    maxVal = (1.0 - np.exp(-maxX / fit[:, 2]))**risePower * np.exp(-maxX / fit[:, 3])
+    fit[:, 0] *= maxVal
+    return fit, atBound
+
+
+def fitPspBatch(xs, ys, guesses, bounds=None, risePower=2.0, multiFit=False, batchSize=256, workers=1, refitBounded=True):
+    """Fit many PSPs at once.
+    
+    This produces results equivalent (within fit tolerance) to calling 
+    fitPsp(xs[i], ys[i], guesses[i], bounds[i], risePower, multiFit) for each 
+    event, but is much faster for large numbers of events: events are sorted
+    by length and grouped into batches (shorter events are zero-weighted past 
+    their end), and each batch is solved in a single vectorized Levenberg-Marquardt
+    iteration using the analytic Jacobian of the PSP function.
+    
+    ============  ================================================================
+    **Arguments:**
+    xs, ys        Lists of 1D arrays with the time and data values for each event
+    guesses       List of initial guesses [amp, xoffset, rise, fall] per event
+    bounds        List of [[min, max], ...] bounds per event (None values mean
+                  unbounded). If None, the default bounds of fitPsp are used.
+    batchSize     Maximum number of events solved together
+    workers       Number of processes to distribute batches across. Uses
+                  pyqtgraph.multiprocess.Parallelize (serial where fork() is not
+                  available).
+    refitBounded  If True, events whose batched fit ends on one of its bounds
+                  are also fit with fitPsp, and the fit with the lower error is
+                  kept. Bounds are enforced by clipping, which can leave the
+                  batched solver stuck at a bound far from the best fit.
+    ============  ================================================================
+    
+    Returns an (nEvents, 4) array of fit parameters, in the same format as fitPsp.
+    """
+    nEv = len(xs)
+    fits = np.empty((nEv, 4))
+    if nEv == 0:
+        return fits
+    
+    lower = np.empty((nEv, 4))
+    upper = np.empty((nEv, 4))
+    lower[:] = -np.inf
+    upper[:] = np.inf
+    if bounds is None:
+        ## fitPsp's default bounds list repeats a single [min, max] pair, so
+        ## its default lower bound of -2e-3 applies to every parameter.
+        lower[:] = -2e-3
+    else:
+        for i, b in enumerate(bounds):
+            for j in range(4):
+                if b[j][0] is not None:
+                    lower[i, j] = b[j][0]
+                if b[j][1] is not None:
+                    upper[i, j] = b[j][1]
+    guesses = np.array(guesses, dtype=float)
+    atBound = np.zeros(nEv, dtype=bool)
+    
+    lengths = np.array([len(x) for x in xs])
+    order = np.argsort(lengths, kind='mergesort')
+    batches = [order[i:i+batchSize] for i in range(0, nEv, batchSize)]
+    
+    def runBatch(inds):
+        nPts = lengths[inds].max()
+        x = np.zeros((len(inds), nPts))
+        y = np.zeros((len(inds), nPts))
+        w = np.zeros((len(inds), nPts))
+        for j, i in enumerate(inds):
+            n = lengths[i]
+            x[j, :n] = xs[i]
+            x[j, n:] = xs[i][-1]
+            y[j, :n] = ys[i]
+            w[j, :n] = 1
+        return _fitPspBatchChunk(x, y, w, guesses[inds], lower[inds], upper[inds], risePower, multiFit)
+        
+    if workers > 1 and len(batches) > 1:
+        from acq4.pyqtgraph.multiprocess import Parallelize
+        results = []
+        with Parallelize(tasks=range(len(batches)), workers=workers, results=results) as tasker:
+            for i in tasker:
+                tasker.results.append((i, runBatch(batches[i])))
+        for i, (fit, bounded) in results:
+            fits[batches[i]] = fit
+            atBound[batches[i]] = bounded
+    else:
+        for inds in batches:
+            fits[inds], atBound[inds] = runBatch(inds)
+    
+    if refitBounded:
+        for i in np.argwhere(atBound)[:, 0]:
+            fit = fitPsp(xs[i], ys[i], list(guesses[i]), None if bounds is None else [list(b) for b in bounds[i]], risePower, multiFit)
+            err = ((ys[i] - pspFunc(list(fit), xs[i], risePower))**2).sum()
+            if err < ((ys[i] - pspFunc(list(fits[i]), xs[i], risePower))**2).sum():
+                fits[i] = fit
+    return fits
+
 
 
 def doublePspFunc(v, x, risePower=2.0):
@@ -1869,31 +2091,123 @@ def mode(data, bins=None):
     return mode
     
 def modeFilter(data, window=500, step=None, bins=None):
-    """Filter based on histogram-based mode function"""
+    """Filter based on histogram-based mode function.
+    
+    The mode (see mode()) is measured in windows of *window* samples starting every
+    *step* samples (default is window/2), and interpolated linearly between windows.
+    For float64 and integer data, all complete windows are histogrammed at once
+    (see windowModes); the result is the same as calling mode() on each window."""
     d1 = data.view(np.ndarray)
-    vals = []
     l2 = int(window/2.)
     if step is None:
         step = l2
-    i = 0
-    while True:
-        if i > len(data)-step:
-            break
-        vals.append(mode(d1[i:i+window], bins))
-        i += step
-            
-    chunks = [np.linspace(vals[0], vals[0], l2)]
-    for i in range(len(vals)-1):
-        chunks.append(np.linspace(vals[i], vals[i+1], step))
-    remain = len(data) - step*(len(vals)-1) - l2
-    chunks.append(np.linspace(vals[-1], vals[-1], remain))
-    d2 = np.hstack(chunks)
+    
+    if d1.dtype.kind not in 'fiu' or (d1.dtype.kind == 'f' and d1.dtype != np.float64) or not np.isscalar(step):
+        ## histograms are computed in the data type; keep the original loop for other types
+        vals = []
+        i = 0
+        while True:
+            if i > len(data)-step:
+                break
+            vals.append(mode(d1[i:i+window], bins))
+            i += step
+                
+        chunks = [np.linspace(vals[0], vals[0], l2)]
+        for i in range(len(vals)-1):
+            chunks.append(np.linspace(vals[i], vals[i+1], step))
+        remain = len(data) - step*(len(vals)-1) - l2
+        chunks.append(np.linspace(vals[-1], vals[-1], remain))
+        d2 = np.hstack(chunks)
+    else:
+        starts = np.arange(0, len(d1)-step+1, step)
+        vals = windowModes(d1, starts, window, bins)
+        
+        ## linear interpolation between windows, computed as np.linspace(vals[i], vals[i+1], step)
+        a = vals[:-1, np.newaxis]
+        delta = vals[1:, np.newaxis] - a
+        if step > 1:
+            div = step - 1
+            y = np.arange(step, dtype=float)[np.newaxis, :]
+            inc = delta / div
+            ramps = np.where(inc == 0, y / div * delta, y * inc) + a
+            ramps[:, -1] = vals[1:]
+        else:
+            ramps = a[:, :step]
+        remain = len(data) - step*(len(vals)-1) - l2
+        d2 = np.hstack([np.linspace(vals[0], vals[0], l2), ramps.ravel(), np.linspace(vals[-1], vals[-1], remain)])
     
     if (hasattr(data, 'implements') and data.implements('MetaArray')):
         return MetaArray(d2, info=data.infoCopy())
     return d2
     
-
+def windowModes(data, starts, window, bins=None, chunkSize=2**16):
+    """Return mode(data[i:i+window], bins) for each i in *starts* (increasing).
+    
+    Windows that fit entirely in data are processed together through a strided view,
+    about chunkSize samples at a time: the edges of each window's histogram are computed
+    as np.histogram computes them, and each sample is assigned to the bin between
+    the edges that surround it. Windows truncated by the end of data are
+    passed to mode()."""
+    data = np.ascontiguousarray(data)
+    starts = np.asarray(starts, dtype=int)
+    vals = np.empty(len(starts))
+    nFull = np.searchsorted(starts, len(data) - window, side='right') if window > 0 else 0
+    if bins is None:
+        nBins = max(2, int(window/10.))
+    elif np.isscalar(bins):
+        nBins = int(bins)
+    else:
+        nFull = 0  ## non-uniform bins
+        
+    if nFull > 0:
+        if starts[0] < 0:
+            raise ValueError("Window starts must not be negative.")
+        stride = data.strides[0]
+        windows = np.lib.stride_tricks.as_strided(data, shape=(len(data)-window+1, window), strides=(stride, stride))
+        binIndex = np.arange(nBins+1, dtype=float)[np.newaxis, :]
+        rowsPerChunk = max(1, chunkSize // window)
+        for r0 in range(0, nFull, rowsPerChunk):
+            r1 = min(nFull, r0 + rowsPerChunk)
+            x = windows[starts[r0:r1]].astype(np.float64)
+            nRows = r1 - r0
+            
+            ## histogram range (see np.histogram)
+            first = x.min(axis=1)
+            last = x.max(axis=1)
+            if not (np.all(np.isfinite(first)) and np.all(np.isfinite(last))):
+                raise ValueError("autodetected range of window is not finite")
+            same = first == last
+            first[same] -= 0.5
+            last[same] += 0.5
+            
+            ## bin edges, computed as np.linspace(first, last, nBins+1)
+            delta = (last - first)[:, np.newaxis]
+            inc = delta / nBins
+            edges = np.where(inc == 0, binIndex / nBins * delta, binIndex * inc) + first[:, np.newaxis]
+            edges[:, -1] = last
+            
+            ## bin index of each sample; bins include their left edge, the last bin also its right edge
+            ind = ((x - first[:, np.newaxis]) * (nBins / (last - first))[:, np.newaxis]).astype(np.intp)
+            np.clip(ind, 0, nBins-1, out=ind)
+            offset = (np.arange(nRows) * (nBins+1))[:, np.newaxis]
+            flatEdges = edges.ravel()
+            while True:
+                below = x < flatEdges[offset + ind]
+                above = (x >= flatEdges[offset + ind + 1]) & (ind != nBins-1)
+                if not (below.any() or above.any()):
+                    break
+                ind -= below
+                ind += above
+            
+            counts = np.bincount((ind + (np.arange(nRows) * nBins)[:, np.newaxis]).ravel(), minlength=nRows*nBins)
+            peak = counts.reshape(nRows, nBins).argmax(axis=1)
+            rows = np.arange(nRows)
+            vals[r0:r1] = 0.5 * (edges[rows, peak] + edges[rows, peak+1])
+            
+    for i in range(nFull, len(starts)):
+        vals[i] = mode(data[starts[i]:starts[i]+window], bins)
+    return vals
+    
 
 def histogramDetrend(data, window=500, bins=50, threshold=3.0):
     """Linear detrend. Works by finding the most common value at the beginning and end of a trace, excluding outliers."""
@@ -27,6 +27,8 @@ import acq4.util.units as units
 
 class StimGenerator(QtGui.QWidget):
     
+    cacheSize = 200 * 1024**2   ## maximum total size (bytes) of cached waveforms
+    
     sigDataChanged = QtCore.Signal()        ## Emitted when the output of getSingle() is expected to have changed
     sigStateChanged = QtCore.Signal()       ## Emitted when the output of saveState() is expected to have changed
     sigParametersChanged = QtCore.Signal()  ## Emitted when the sequence parameter space has changed
@@ -48,10 +50,11 @@ class StimGenerator(QtGui.QWidget):
         
         self.pSpace = None    ## cached sequence parameter space
         
-        self.cache = {}       ## cached waveforms
-        self.cacheRate = None
-        self.cacheNPts = None
-
+        self.cache = OrderedDict()  ## cached waveforms {(rate, nPts, params): (waveform, message)}, least recently used first
+        self.cacheBytes = 0
+        
+        self._compiled = None  ## (function string, code object, exec flag)
+        self._nsCache = None   ## ((rate, nPts), namespace, fixed names, waveform function args)
         
         
         self.meta = {  ## holds some extra information about signals (units, expected scale and range, etc)
@@ -148,7 +151,9 @@ class StimGenerator(QtGui.QWidget):
         self.stimParams.setMeta(axis, self.meta[axis])
 
     def clearCache(self):
-        self.cache = {}
+        self.cache = OrderedDict()
+        self.cacheBytes = 0
+        self._nsCache = None
     
     def functionString(self):
         return str(self.ui.functionText.toPlainText())
@@ -376,31 +381,137 @@ class StimGenerator(QtGui.QWidget):
         if params is None:
             params = {}
             
-        if self.cacheRate != rate or self.cacheNPts != nPts:
-            self.clearCache()
-            
-        paramKey = tuple(params.items())
-        if paramKey in self.cache:
-            return self.cache[paramKey]
-            
-        self.cacheRate = rate
-        self.cacheNPts = nPts
+        key = (rate, nPts, tuple(sorted(params.items())))
+        ret, message = self._cacheGet(key)
+        if ret is not None:
+            return ret
+        
+        ret, message = self._evaluate(rate, nPts, params)
+        self.setError(message)
+        self._cacheSet(key, ret, message)
+        return ret
+    
+    def getSequenceArray(self, rate, nPts):
+        """
+        Return an array of shape (nSeq, nPts) containing the waveforms for every
+        point in the parameter space, or None if the function does not generate 
+        a waveform.
+        
+        Rows iterate over the parameters returned by listSequences(), with the
+        last parameter varying fastest. Waveforms are cached exactly as with
+        getSingle(), so subsequent calls to getSingle() for any point in the
+        sequence are served from the cache. The returned array is a copy and
+        may be modified by the caller.
+        """
+        seq = self.listSequences()
+        names = list(seq.keys())
+        shape = tuple([len(seq[k]) for k in names])
+        nSeq = int(np.prod(shape))  # 1 if there are no sequence parameters
+        
+        block = None
+        message = None
+        for i, ind in enumerate(np.ndindex(*shape)):
+            params = dict(zip(names, ind))
+            key = (rate, nPts, tuple(sorted(params.items())))
+            wave, msg = self._cacheGet(key)
+            if wave is None:
+                wave, msg = self._evaluate(rate, nPts, params)
+                if wave is None:
+                    return None
+                self._cacheSet(key, wave, msg)
+            if msg is not None:
+                message = msg
+            if block is None:
+                block = np.empty((nSeq, nPts), dtype=wave.dtype)
+            block[i] = wave
+        self.setError(message)
+        return block
+    
+    def _cacheGet(self, key):
+        ## return a cached (waveform, message) and mark it as most recently used.
+        ## Returns (None, None) if the key is not cached.
+        item = self.cache.pop(key, None)
+        if item is None:
+            return None, None
+        self.cache[key] = item
+        return item
+    
+    def _cacheSet(self, key, wave, message=None):
+        ## add a waveform and the message generated with it to the cache, 
+        ## discarding the least recently used waveforms if the cache is too large.
+        if wave is None:
+            return
+        self.cache[key] = (wave, message)
+        self.cacheBytes += wave.nbytes
+        while self.cacheBytes > self.cacheSize and len(self.cache) > 1:
+            k, (w, m) = self.cache.popitem(last=False)
+            self.cacheBytes -= w.nbytes
+    
+    def _compiledFunction(self):
+        ## Return the function string compiled to a code object, and whether the code
+        ## must be run with exec(). Compilation is repeated only when the function
+        ## string has changed.
+        fn = self.functionString()
+        if self._compiled is None or self._compiled[0] != fn:
+            code = None
+            isFunc = False
+            if fn.strip() != '':
+                try:  # first try eval() without line breaks for backward compatibility
+                    code = compile(fn.replace('\n', ''), '<stimulus>', 'eval')
+                except SyntaxError:  # next try exec() as contents of a function
+                    try:
+                        run = "\noutput=fn()\n"
+                        src = "def fn():\n" + "\n".join(["    "+l for l in fn.split('\n')]) + run
+                        code = compile(src, '<stimulus>', 'exec')
+                        isFunc = True
+                    except SyntaxError as err:
+                        err.lineno -= 1
+                        raise err
+            self._compiled = (fn, code, isFunc)
+        return self._compiled[1:]
+    
+    def _namespace(self, rate, nPts):
+        ## Return the evaluation namespace for the given rate and nPts (excluding
+        ## sequence parameters), the names that may not be overridden by sequence
+        ## parameters, and the argument dict passed to all waveform functions.
+        ## These are rebuilt only when rate, nPts, or the extra parameters change.
+        if self._nsCache is None or self._nsCache[0] != (rate, nPts):
+            ## create namespace with generator functions. 
+            ##   - iterates over all functions provided in waveforms module
+            ##   - wrap each function to automatically provide rate and nPts arguments
+            ns = {}
+            arg = {'rate': rate, 'nPts': nPts}
+            ns.update(arg)  ## copy rate and nPts to eval namespace
+            for i in dir(waveforms):
+                obj = getattr(waveforms, i)
+                if type(obj) is types.FunctionType:
+                    ns[i] = self.makeWaveFunction(i, arg)
             
-        ## create namespace with generator functions. 
-        ##   - iterates over all functions provided in waveforms module
-        ##   - wrap each function to automatically provide rate and nPts arguments
-        ns = {}
-        #arg = {'rate': rate * self.timeScale, 'nPts': nPts}
-        arg = {'rate': rate, 'nPts': nPts}
-        ns.update(arg)  ## copy rate and nPts to eval namespace
-        for i in dir(waveforms):
-            obj = getattr(waveforms, i)
-            if type(obj) is types.FunctionType:
-                ns[i] = self.makeWaveFunction(i, arg)
+            ## units, extra parameters and numpy take precedence over sequence parameters
+            fixed = {}
+            fixed.update(units.allUnits)
+            fixed.update(self.extraParams)
+            fixed['np'] = np
+            ns.update(fixed)
+            self._nsCache = ((rate, nPts), ns, fixed, arg)
+        return self._nsCache[1:]
+    
+    def _evaluate(self, rate, nPts, params):
+        ## Evaluate the function for one point in the parameter space.
+        ## Returns the waveform (or None) and the message generated by waveform functions.
+        code, isFunc = self._compiledFunction()
+        if code is None:
+            return np.zeros(nPts) + self.offset, None
+        
+        base, fixed, arg = self._namespace(rate, nPts)
+        ns = base.copy()
+        arg.pop('message', None)
         
         ## add current sequence parameter values into namespace
         seq = self.paramSpace() # -- this is where the Laser bug was happening -- seq becomes 'Pulse_sum', but params was {'power.Pulse_sum': x}, so the default value is always used instead (fixed by removing 'power.' before the params are sent to stimGenerator, but perhaps there is a better place to fix this)
         for k in seq:
+            if k in fixed:
+                continue
             if k in params:  ## select correct value from sequence list
                 try:
                     ns[k] = float(seq[k][1][params[k]])
@@ -410,54 +521,20 @@ class StimGenerator(QtGui.QWidget):
             else:  ## just use single value
                 ns[k] = float(seq[k][0])
 
-        ## add units into namespace
-        ns.update(units.allUnits)
-        
-        ## add extra parameters to namespace
-        ns.update(self.extraParams)
-
         ## evaluate and return
-        fn = self.functionString()
-        
-        ## build global namespace with numpy imported
-        #gns = {}
-        ns['np'] = np
-        
-        #print "function: '%s'" % fn
-        if fn.strip() == '':
-            ret = np.zeros(nPts)
+        if isFunc:
+            lns = {}
+            exec(code, ns, lns)
+            ret = lns['output']
         else:
-            try:  # first try eval() without line breaks for backward compatibility
-                ret = eval(fn.replace('\n', ''), ns, {})
-            except SyntaxError:  # next try exec() as contents of a function
-                try:
-                    run = "\noutput=fn()\n"
-                    code = "def fn():\n" + "\n".join(["    "+l for l in fn.split('\n')]) + run
-                    #print "--- Code: ---"
-                    #print code
-                    #print "-------------"
-                    lns = {}
-                    exec(code, ns, lns)
-                    ret = lns['output']
-                except SyntaxError as err:
-                    err.lineno -= 1
-                    raise err
-                
+            ret = eval(code, ns, {})
             
         if isinstance(ret, ndarray):
-            #ret *= self.scale
             ret += self.offset
-            #print "===eval===", ret.min(), ret.max(), self.scale
         elif ret is not None:
             raise TypeError("Function must return ndarray or None.")
         
-        if 'message' in arg:
-            self.setError(arg['message'])
-        else:
-            self.setError()
-            
-        self.cache[paramKey] = ret
-        return ret
+        return ret, arg.get('message', None)
         
     def makeWaveFunction(self, name, arg):
         ## Creates a copy of a wave function (such as steps or pulses) with the first parameter filled in
@@ -38,17 +38,29 @@ def pulse(params, times, widths, values, base=0.0):
         widths = [widths] * len(times)
     if not isList(values):
         values = [values] * len(times)
-        
+    
+    t1 = (numpy.asarray(times, dtype=float) * rate).astype(int)
+    wid = (numpy.asarray(widths, dtype=float) * rate).astype(int)
+    if len(wid) < len(t1) or len(values) < len(t1):
+        raise Exception("widths and values must have the same length as times")
+    wid = wid[:len(t1)]
+    
+    ## report a problem with the last pulse that has one
+    tooShort = wid == 0
+    tooLong = t1 + wid >= nPts
+    bad = numpy.argwhere(tooShort | tooLong)
+    if len(bad) > 0:
+        i = bad[-1, 0]
+        if tooLong[i]:
+            params['message'] = "WARNING: Function is longer than generated waveform."
+        else:
+            params['message'] = "WARNING: Pulse width %f is too short for rate %f" % (widths[i], rate)
+    
     d = numpy.empty(nPts)
     d[:] = base
-    for i in range(len(times)):
-        t1 = int(times[i] * rate)
-        wid = int(widths[i] * rate)
-        if wid == 0:
-            params['message'] = "WARNING: Pulse width %f is too short for rate %f" % (widths[i], rate)
-        if t1+wid >= nPts:
-            params['message'] = "WARNING: Function is longer than generated waveform."
-        d[t1:t1+wid] = values[i]
+    ## pulses are filled in order; later pulses overwrite earlier ones
+    for a, b, v in zip(t1.tolist(), (t1+wid).tolist(), values):
+        d[a:b] = v
     return d
 
 def steps(params, times, values, base=0.0):
@@ -59,19 +71,24 @@ def steps(params, times, values, base=0.0):
     if not isList(values):
         raise Exception('values argument must be a list')
     
+    t = (numpy.asarray(times, dtype=float) * rate).astype(int)
+    
+    ## report a problem with the last step that has one
+    tooShort = t[1:] == t[:-1]
+    tooLong = t[1:] >= nPts
+    bad = numpy.argwhere(tooShort | tooLong)
+    if len(bad) > 0:
+        i = bad[-1, 0]
+        if tooLong[i]:
+            params['message'] = "WARNING: Function is longer than generated waveform."
+        else:
+            params['message'] = "WARNING: Step width %f is too short for rate %f" % (times[i+1]-times[i], rate)
+    
     d = numpy.empty(nPts)
     d[:] = base
-    for i in range(1, len(times)):
-        t1 = int(times[i-1] * rate)
-        t2 = int(times[i] * rate)
-        
-        if t1 == t2:
-            params['message'] = "WARNING: Step width %f is too short for rate %f" % (times[i]-times[i-1], rate)
-        if t2 >= nPts:
-            params['message'] = "WARNING: Function is longer than generated waveform."
-        d[t1:t2] = values[i-1]
-    last = int(times[-1] * rate)
-    d[last:] = values[-1]
+    for a, b, v in zip(t[:-1].tolist(), t[1:].tolist(), values):
+        d[a:b] = v
+    d[t[-1]:] = values[-1]
     return d
     
 def sineWave(params, period, amplitude=1.0, phase=0.0, start=0.0, stop=None, base=0.0):
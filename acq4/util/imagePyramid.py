@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-resolution image pyramids for large image files.
+
+An ImagePyramid holds successively 2x-downsampled copies of an image (or image
+stack) read from a FileHandle. The downsampled levels are built the first time
+a file is opened and cached to disk, so that viewers such as the MosaicEditor
+canvas can display hundreds of camera tiles by loading only the level that
+matches the current zoom. The full-resolution data is read from the original
+file only when it is requested.
+
+Cached levels are stored in a per-file directory beneath cacheDir(), keyed by
+the file's path, size and modification time; a modified file gets a new
+pyramid automatically.
+"""
+from __future__ import division
+import os, json, hashlib, tempfile, threading
+import numpy as np
+import acq4.util.debug as debug
+
+
+_cacheDir = None
+
+
+def cacheDir():
+    """Return the directory where image pyramids are cached.
+
+    By default this is 'imageCache' in the acq4 application data directory, or
+    in the system temporary directory if no Manager is running.
+    """
+    if _cacheDir is not None:
+        return _cacheDir
+    try:
+        from acq4.Manager import getManager
+        return os.path.join(getManager()._appDataDir(), 'imageCache')
+    except Exception:
+        return os.path.join(tempfile.gettempdir(), 'acq4-imageCache')
+
+
+def setCacheDir(path):
+    """Set the directory where image pyramids are cached (None restores the
+    default location)."""
+    global _cacheDir
+    _cacheDir = path
+
+
+def spatialAxes(shape):
+    """Return the indexes of the two spatial axes of an image with *shape*.
+
+    As in ImageCanvasItem, a 3D array whose last axis has length <= 4 is a
+    color image; otherwise the first axis of a 3D or 4D array is time.
+    """
+    if len(shape) == 2 or (len(shape) == 3 and shape[2] <= 4):
+        return (0, 1)
+    return (1, 2)
+
+
+def downsample2x(data, axes):
+    """Average 2x2 blocks of *data* along the two *axes*, keeping its dtype.
+    A trailing odd row or column is discarded."""
+    out = data
+    for ax in axes:
+        n = out.shape[ax] // 2
+        sl = [slice(None)] * out.ndim
+        sl[ax] = slice(0, n*2)
+        out = out[tuple(sl)]
+        shape = out.shape[:ax] + (n, 2) + out.shape[ax+1:]
+        out = out.reshape(shape).mean(axis=ax+1, dtype=np.float32 if out.dtype.itemsize < 8 else np.float64)
+    if data.dtype.kind in 'iub':
+        out = np.round(out)
+    return out.astype(data.dtype)
+
+
+class ImagePyramid(object):
+    """Multi-resolution levels of the image stored in *fileHandle*.
+
+    ============  ==============================================================
+    **Arguments:**
+    fileHandle    FileHandle of an image or MetaArray file
+    minSize       Downsampling stops once the largest spatial dimension of a
+                  level is <= minSize.
+    cache         If True, levels are read from (and written to) cacheDir().
+                  Otherwise they are computed from the full data and kept in
+                  memory.
+    ============  ==============================================================
+
+    Level 0 is the full-resolution data; each subsequent level halves both
+    spatial dimensions. Levels are loaded on request by level(), and may be
+    dropped again with release().
+    """
+    ## increment if the cache format changes
+    _cacheVersion = 1
+
+    def __init__(self, fileHandle, minSize=128, cache=True):
+        self.handle = fileHandle
+        self.minSize = minSize
+        self.cache = cache
+        self.lock = threading.RLock()
+        self._levels = {}     ## level index: array, for loaded levels
+        self._cachePath = None
+
+        meta = self._readCacheMeta() if cache else None
+        if meta is None:
+            meta = self._build()
+        self.shape = tuple(meta['shape'])
+        self.dtype = np.dtype(str(meta['dtype']))
+        self.axes = tuple(meta['axes'])
+        self.levelShapes = [tuple(s) for s in meta['levels']]
+
+    def nLevels(self):
+        return len(self.levelShapes)
+
+    def level(self, i):
+        """Return the array for level *i*, loading it if needed."""
+        with self.lock:
+            if i not in self._levels:
+                if i == 0:
+                    self._levels[0] = self._readFullRes()
+                else:
+                    self._levels[i] = np.load(self._levelFile(i))
+            return self._levels[i]
+
+    def release(self, keep=()):
+        """Drop all loaded levels except those listed in *keep*.
+        Levels that could not be cached are never dropped (except level 0)."""
+        with self.lock:
+            for i in list(self._levels.keys()):
+                if i not in keep and (self.cache or i == 0):
+                    del self._levels[i]
+
+    def chooseLevel(self, downsample):
+        """Return the index of the coarsest level whose resolution is at least
+        1/*downsample* of the full-resolution image."""
+        if downsample <= 1:
+            return 0
+        i = int(np.floor(np.log2(downsample)))
+        return max(0, min(i, self.nLevels() - 1))
+
+    def statsLevel(self, maxPixels=2**16):
+        """Return the finest level containing no more than *maxPixels* pixels
+        per image (or the coarsest level, if all are larger).
+
+        This is meant for computing histograms and other global statistics
+        without reading the full-resolution data."""
+        for i, shape in enumerate(self.levelShapes):
+            if shape[self.axes[0]] * shape[self.axes[1]] <= maxPixels:
+                return self.level(i)
+        return self.level(self.nLevels() - 1)
+
+    def _readFullRes(self):
+        data = self.handle.read()
+        if hasattr(data, 'implements') and data.implements('MetaArray'):
+            data = data.asarray()
+        return np.asarray(data)
+
+    def _cacheKey(self):
+        fname = os.path.abspath(self.handle.name())
+        st = os.stat(fname)
+        key = "%s:%d:%r:%d" % (fname, st.st_size, st.st_mtime, self._cacheVersion)
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def _levelFile(self, i):
+        return os.path.join(self._cachePath, 'level%d.npy' % i)
+
+    def _readCacheMeta(self):
+        self._cachePath = os.path.join(cacheDir(), self._cacheKey())
+        metaFile = os.path.join(self._cachePath, 'meta.json')
+        if not os.path.isfile(metaFile):
+            return None
+        try:
+            with open(metaFile, 'r') as fh:
+                return json.load(fh)
+        except Exception:
+            debug.printExc("Error reading image pyramid cache for %s:" % self.handle.name())
+            return None
+
+    def _build(self):
+        """Compute all levels from the full-resolution data and write them to
+        the cache. The full data is released afterward."""
+        data = self._readFullRes()
+        axes = spatialAxes(data.shape)
+        levels = {0: data}
+        shapes = [data.shape]
+        img = data
+        while max(img.shape[axes[0]], img.shape[axes[1]]) > self.minSize and min(img.shape[axes[0]], img.shape[axes[1]]) >= 2:
+            img = downsample2x(img, axes)
+            levels[len(shapes)] = img
+            shapes.append(img.shape)
+        meta = {'shape': data.shape, 'dtype': data.dtype.str, 'axes': axes, 'levels': shapes}
+
+        if self.cache:
+            try:
+                self._writeCache(levels, meta)
+                del levels[0]
+                self._levels = {}
+                return meta
+            except Exception:
+                debug.printExc("Could not write image pyramid cache for %s:" % self.handle.name())
+                self.cache = False
+        ## levels could not be cached; keep them in memory (the full data can be re-read)
+        del levels[0]
+        self._levels = levels
+        return meta
+
+    def _writeCache(self, levels, meta):
+        if not os.path.isdir(self._cachePath):
+            os.makedirs(self._cachePath)
+        for i in range(1, len(meta['levels'])):
+            np.save(self._levelFile(i), levels[i])
+        ## meta file is written last; its presence marks the cache as complete
+        tmp = os.path.join(self._cachePath, 'meta.json.tmp')
+        with open(tmp, 'w') as fh:
+            json.dump(meta, fh)
+        os.rename(tmp, os.path.join(self._cachePath, 'meta.json'))
@@ -1,6 +1,10 @@
 import tempfile, shutil, atexit, os
+import numpy as np
+import pytest
 import acq4.util.DataManager as dm
 from acq4.util.DirTreeWidget import DirTreeWidget
+from acq4.util.SequenceContainer import SequenceContainer, HAVE_HDF5, readLiteral
+from acq4.util.metaarray import MetaArray, axis
 import acq4.pyqtgraph as pg
 
 app = pg.mkQApp()
@@ -73,4 +77,153 @@ def test_datamanager():
     assert dw.topLevelItemCount() == 1
 
 
-
+def makeRecording(amp, nPts=100):
+    data = np.empty((2, nPts), dtype=np.float32)
+    data[0] = amp
+    data[1] = -65e-3
+    info = [
+        axis(name='Channel', cols=[('primary', 'A'), ('command', 'V')]),
+        axis(name='Time', units='s', values=np.arange(nPts) * 1e-4),
+        {'DAQ': {'primary': {'rate': 10000., 'numPts': nPts}}},
+    ]
+    return MetaArray(data, info=info)
+
+
+def makeSequence(name, nTrials):
+    seqDir = dm.getDirHandle(root).mkdir(name, info={'dirType': 'ProtocolSequence'})
+    container = SequenceContainer.create(seqDir, [('Clamp1', 'amp')], [nTrials])
+    for i in range(nTrials):
+        trial = container.mkdir('%03d' % i, info={('Clamp1', 'amp'): i, 'dirType': 'Protocol'})
+        trial.writeFile(makeRecording(i * 1e-12), 'Clamp1')
+    return seqDir, container
+
+
+def reopen(dirHandle):
+    ## discard cached handles so that everything is read back from disk
+    name = dirHandle.name()
+    dirHandle.sequenceContainer().close()
+    dm.dm.cache.clear()
+    SequenceContainer._instances.clear()
+    return dm.getDirHandle(name)
+
+
+@pytest.mark.skipif(not HAVE_HDF5, reason="sequence containers require h5py")
+def test_sequence_roundtrip():
+    seqDir, container = makeSequence('sequence_roundtrip', 3)
+    
+    # trials are stored in the container only
+    assert sorted(os.listdir(seqDir.name())) == ['.index', SequenceContainer.fileName]
+    trial = seqDir['001']
+    assert isinstance(trial, dm.TrialDirHandle)
+    assert isinstance(trial['Clamp1.ma'], dm.TrialFileHandle)
+    
+    # read back through new handles
+    seqDir = reopen(seqDir)
+    assert seqDir.subDirs() == ['000', '001', '002']
+    assert seqDir.dirExists('002') and seqDir.exists('002/Clamp1.ma')
+    assert not seqDir.exists('003')
+    for i, name in enumerate(seqDir.subDirs()):
+        trial = seqDir[name]
+        assert trial.isDir()
+        assert trial.info()[('Clamp1', 'amp')] == i
+        assert trial.info()['dirType'] == 'Protocol'
+        assert trial.ls() == ['Clamp1.ma']
+        fh = trial['Clamp1.ma']
+        assert fh.isFile() and fh.exists()
+        data = fh.read()
+        expected = makeRecording(i * 1e-12)
+        assert np.all(data.asarray() == expected.asarray())
+        assert data.dtype == np.float32
+        assert data.axisValues('Time').tolist() == expected.axisValues('Time').tolist()
+        assert data.infoCopy(-1)['DAQ']['primary']['rate'] == 10000.
+        
+    # the whole sequence can be read as one array
+    seq = seqDir.sequenceContainer().readSequence('Clamp1.ma')
+    assert seq.shape == (3, 2, 100)
+    assert seq['Clamp1.amp':2, 'Channel':'primary'][0] == np.float32(2e-12)
+    seqDir.sequenceContainer().close()
+
+
+@pytest.mark.skipif(not HAVE_HDF5, reason="sequence containers require h5py")
+def test_sequence_info():
+    seqDir, container = makeSequence('sequence_info', 2)
+    container.flush()
+    trial = seqDir['001']
+    
+    # trial info updates are kept in memory until the container is flushed
+    trial.setInfo({'startTime': 5.0})
+    trial.setInfo({'stopTime': 6.0})
+    assert trial.info()['startTime'] == 5.0
+    stored = readLiteral(container._file()['trials/info'][1])
+    assert 'startTime' not in stored
+    container.flush()
+    stored = readLiteral(container._file()['trials/info'][1])
+    assert stored['startTime'] == 5.0 and stored['stopTime'] == 6.0
+    assert stored[('Clamp1', 'amp')] == 1
+    
+    # file info is stored in the container as well
+    trial['Clamp1.ma'].setInfo({'note': 'ok'})
+    
+    trial = reopen(seqDir)['001']
+    assert trial.info()['stopTime'] == 6.0
+    assert trial['Clamp1.ma'].info()['note'] == 'ok'
+    assert not os.path.exists(trial.name())
+    trial.parent().sequenceContainer().close()
+
+
+@pytest.mark.skipif(not HAVE_HDF5, reason="sequence containers require h5py")
+def test_sequence_fallback():
+    seqDir, container = makeSequence('sequence_fallback', 2)
+    trial = seqDir['000']
+    
+    # info that can not be stored in the container goes to a real directory index
+    trial.setInfo({'waveform': np.arange(3)})
+    assert os.path.isdir(trial.name())
+    
+    # so do writes the container does not handle
+    fh = trial.writeFile(makeRecording(1.0, nPts=50), 'Clamp2.ma', autoIncrement=True)
+    assert not isinstance(fh, dm.TrialFileHandle)
+    assert os.path.isfile(fh.name())
+    clamp2 = fh.shortName()
+    sub = trial.mkdir('images')
+    assert os.path.isdir(sub.name())
+    
+    # a file that no longer matches the sequence replaces the stored version
+    fh = seqDir['001'].writeFile(makeRecording(1.0, nPts=50), 'Clamp1')
+    assert not isinstance(fh, dm.TrialFileHandle)
+    assert os.path.isfile(os.path.join(seqDir.name(), '001', 'Clamp1.ma'))
+    
+    seqDir = reopen(seqDir)
+    trial = seqDir['000']
+    assert isinstance(trial, dm.TrialDirHandle)
+    assert trial.info()[('Clamp1', 'amp')] == 0
+    assert trial.info()['waveform'].tolist() == [0, 1, 2]
+    assert trial[clamp2].read().shape == (2, 50)
+    assert trial['Clamp1.ma'].read().shape == (2, 100)
+    assert trial['images'].isDir()
+    assert seqDir['001']['Clamp1.ma'].read().shape == (2, 50)
+    assert not seqDir.sequenceContainer().hasFile('001', 'Clamp1.ma')
+    seqDir.sequenceContainer().close()
+
+
+@pytest.mark.skipif(not HAVE_HDF5, reason="sequence containers require h5py")
+def test_sequence_ls():
+    seqDir, container = makeSequence('sequence_ls', 3)
+    seqDir['001'].writeFile(makeRecording(1.0, nPts=50), 'Clamp2')
+    seqDir['001'].mkdir('images')
+    seqDir.mkdir('notes')
+    
+    seqDir = reopen(seqDir)
+    
+    # trials replace the container file, and trials that also have a real
+    # directory are listed once
+    assert sorted(seqDir.ls()) == ['000', '001', '002', 'notes']
+    assert sorted(seqDir.subDirs()) == ['000', '001', '002', 'notes']
+    
+    # container files and real files are merged within a trial
+    trial = seqDir['001']
+    assert sorted(trial.ls()) == ['Clamp1.ma', 'Clamp2.ma', 'images']
+    assert trial.subDirs() == ['images']
+    assert seqDir['002'].ls() == ['Clamp1.ma']
+    assert seqDir['002'].subDirs() == []
+    seqDir.sequenceContainer().close()
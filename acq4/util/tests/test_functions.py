@@ -0,0 +1,83 @@
+import numpy as np
+import acq4.util.functions as fn
+
+
+def modeFilterLoop(data, window=500, step=None, bins=None):
+    ## reference: modeFilter computed one window at a time
+    vals = []
+    l2 = int(window/2.)
+    if step is None:
+        step = l2
+    i = 0
+    while True:
+        if i > len(data)-step:
+            break
+        vals.append(fn.mode(data[i:i+window], bins))
+        i += step
+    chunks = [np.linspace(vals[0], vals[0], l2)]
+    for i in range(len(vals)-1):
+        chunks.append(np.linspace(vals[i], vals[i+1], step))
+    remain = len(data) - step*(len(vals)-1) - l2
+    chunks.append(np.linspace(vals[-1], vals[-1], remain))
+    return np.hstack(chunks)
+
+
+def test_modeFilter():
+    rng = np.random.RandomState(0)
+    n = 5003
+    traces = [
+        rng.normal(size=n),
+        np.round(rng.normal(size=n) * 5) / 5.,   # quantized: many samples on bin edges
+        np.cumsum(rng.normal(size=n)) * 1e-12,
+        rng.randint(-5, 5, size=n).astype(np.int16),
+        np.concatenate([rng.normal(size=2000), np.ones(1500), rng.normal(size=n-3500)]),
+        rng.normal(size=n).astype(np.float32),
+    ]
+    for data in traces:
+        for window, step, bins in [(500, None, None), (100, 60, None), (37, 18, 7), (1000, 1000, 50), (10, 3, 2)]:
+            ref = modeFilterLoop(data, window, step, bins)
+            out = fn.modeFilter(data, window, step, bins)
+            assert out.dtype == ref.dtype
+            assert out.shape == ref.shape
+            assert np.all(out == ref)
+
+
+def test_windowModes():
+    rng = np.random.RandomState(1)
+    data = np.cumsum(rng.normal(size=3000))
+    starts = np.arange(0, 3000, 70)   # last windows extend past the end of data
+    for window, bins in [(200, None), (200, 13), (5, None)]:
+        vals = fn.windowModes(data, starts, window, bins, chunkSize=1000)
+        ref = [fn.mode(data[i:i+window], bins) for i in starts]
+        assert np.all(vals == ref)
+
+
+def makePspEvents(rng, n, dt=1e-4):
+    ## synthetic events with the guesses and bounds generated by EventFitter
+    xs, ys, guesses, bounds = [], [], [], []
+    for i in range(n):
+        nPts = rng.randint(30, 200)
+        t = np.arange(nPts) * dt + 0.1 * i
+        amp = -rng.uniform(10e-12, 80e-12)
+        v = [amp, t[0] + rng.uniform(0, 1e-3), rng.uniform(0.3e-3, 1e-3), rng.uniform(3e-3, 10e-3)]
+        xs.append(t)
+        ys.append(fn.pspFunc(v, t) + rng.normal(scale=2e-12, size=nPts))
+        guess = [amp * 2, t[0], nPts * dt / 4., nPts * dt / 2.]
+        guesses.append(guess)
+        bounds.append([
+            sorted((guess[0] * 0.1, guess[0])),
+            sorted((guess[1] - min(guess[2], 0.01), guess[1] + guess[2] * 2)),
+            sorted((dt * 0.5, guess[3])),
+            sorted((dt * 0.5, guess[3] * 50.)),
+        ])
+    return xs, ys, guesses, bounds
+
+
+def test_fitPspBatch():
+    rng = np.random.RandomState(0)
+    xs, ys, guesses, bounds = makePspEvents(rng, 100)
+    err = lambda fits: np.array([((ys[i] - fn.pspFunc(list(fits[i]), xs[i]))**2).sum() for i in range(len(xs))])
+    for b in [bounds, None]:
+        serial = [fn.fitPsp(xs[i], ys[i], list(guesses[i]), None if b is None else [list(x) for x in b[i]]) for i in range(len(xs))]
+        batch = fn.fitPspBatch(xs, ys, guesses, b, batchSize=32)
+        assert np.all(err(batch) < err(serial) * 1.1)
@@ -0,0 +1,137 @@
+"""
+Benchmark for assembling the per-trial result of DAQGenericTask.getResult.
+
+A DAQGeneric device is set up the way a patch clamp is configured (primary
+and secondary inputs plus the command output, each with its own scale and
+offset) and its task is given simulated DAQ tasks that return fresh channel
+data for every trial, as NiDAQ.Task.getData does. We time repeated calls to:
+
+  legacy      previous getResult (mapFromDaq copies, np.concatenate and a
+              new time axis for every trial)
+  current     DAQGenericTask.getResult (mapping written in place into one
+              preallocated array; time values reused between trials)
+
+and report the per-trial time and the number of bytes allocated for
+arrays other than the returned channel data.
+
+Usage:  python tools/benchmarks/daqGenericResult.py [rate] [duration] [nTrials]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+from collections import OrderedDict
+import numpy as np
+from acq4.util.Mutex import Mutex
+from acq4.util.metaarray import MetaArray, axis
+from acq4.devices.DAQGeneric.DAQGeneric import DAQGeneric, DAQGenericTask
+
+CHANNELS = OrderedDict([
+    ('primary', {'device': 'DAQ', 'channel': '/Dev1/ai0', 'type': 'ai', 'units': 'A', 'scale': 2e-9, 'offset': -1e-3}),
+    ('secondary', {'device': 'DAQ', 'channel': '/Dev1/ai1', 'type': 'ai', 'units': 'V', 'scale': 0.1, 'offset': 2e-3}),
+    ('command', {'device': 'DAQ', 'channel': '/Dev1/ao0', 'type': 'ao', 'units': 'V', 'scale': 50.0, 'offset': 0.0}),
+])
+
+
+class SimDaqTask(object):
+    """Returns newly allocated channel data on every call, like NiDAQ.Task.getData."""
+    def __init__(self, rate, nPts):
+        self.rate = rate
+        self.nPts = nPts
+        self.data = {}
+        for i, ch in enumerate(CHANNELS.values()):
+            self.data[ch['channel']] = np.random.normal(size=nPts) + i
+
+    def getData(self, channel):
+        info = OrderedDict([('rate', self.rate), ('numPts', self.nPts), ('startTime', time.time())])
+        return {'data': self.data[channel].copy(), 'info': info}
+
+
+class SimParentTask(object):
+    pass
+
+
+def makeTask(rate, nPts):
+    dev = DAQGeneric.__new__(DAQGeneric)
+    dev._DGLock = Mutex(Mutex.Recursive)
+    dev._DGConfig = OrderedDict([(ch, conf.copy()) for ch, conf in CHANNELS.items()])
+    cmd = dict([(ch, {'record': True}) for ch in CHANNELS])
+    cmd['command']['command'] = np.zeros(nPts)
+    parent = SimParentTask()
+    task = DAQGenericTask(dev, cmd, parent)
+    task._parent = parent  ## DeviceTask only keeps a weak reference
+    daqTask = SimDaqTask(rate, nPts)
+    task.daqTasks = dict([(ch, daqTask) for ch in CHANNELS])
+    task.bufferedChannels = list(CHANNELS.keys())
+    task.holdingVals = {'command': 0.0}
+    task.mapping = dev.getMapping(chans=CHANNELS.keys())
+    return task
+
+
+def legacyGetResult(self):
+    """Previous implementation of DAQGenericTask.getResult."""
+    result = {}
+    for ch in self.bufferedChannels:
+        result[ch] = self.daqTasks[ch].getData(self.dev._DGConfig[ch]['channel'])
+        result[ch]['data'] = self.mapping.mapFromDaq(ch, result[ch]['data']) ## scale/offset/invert
+        result[ch]['units'] = self.getChanUnits(ch)
+
+    meta = result[result.keys()[0]]['info']
+    rate = meta['rate']
+    nPts = meta['numPts']
+    timeVals = np.linspace(0, float(nPts-1) / float(rate), nPts)
+    chanList = [np.atleast_2d(result[x]['data']) for x in result]
+    cols = [(x, result[x]['units']) for x in result]
+    arr = np.concatenate(chanList)
+
+    daqState = OrderedDict()
+    for ch in self.dev._DGConfig:
+        if ch in result:
+            daqState[ch] = result[ch]['info']
+        else:
+            daqState[ch] = {}
+        if self.dev._DGConfig[ch]['type'] in ['ao', 'do']:
+            daqState[ch]['holding'] = self.holdingVals[ch]
+
+    info = [axis(name='Channel', cols=cols), axis(name='Time', units='s', values=timeVals)] + [{'DAQ': daqState}]
+    protInfo = self._DAQCmd.copy()
+    for ch in protInfo:
+        protInfo[ch] = protInfo[ch].copy()
+        protInfo[ch].pop('command', None)
+        protInfo[ch].pop('lowLevelConf', None)
+    info[-1]['Protocol'] = protInfo
+    return MetaArray(arr, info=info)
+
+
+def timeit(fn, n):
+    fn()
+    start = time.time()
+    for i in range(n):
+        result = fn()
+    return result, (time.time() - start) / n
+
+
+if __name__ == '__main__':
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 100e3
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    nTrials = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    np.random.seed(0)
+    nPts = int(rate * duration)
+    task = makeTask(rate, nPts)
+    nChan = len(CHANNELS)
+    chanBytes = nPts * 8
+
+    legacy, tLegacy = timeit(lambda: legacyGetResult(task), nTrials)
+    current, tCurrent = timeit(task.getResult, nTrials)
+
+    ## both methods must produce the same result
+    assert np.array_equal(legacy.asarray(), current.asarray())
+    assert np.array_equal(legacy.xvals('Time'), current.xvals('Time'))
+    assert legacy.listColumns() == current.listColumns()
+
+    ## allocations besides the returned channel data: (data + offset) and the
+    ## scaled copy of each channel, plus a new time axis
+    legacyTemp = (2 * nChan + 1) * chanBytes
+    print("%d channels x %d samples (%0.1f MB per result)" % (nChan, nPts, nChan * chanBytes / 1e6))
+    print("    legacy   %8.2f ms/trial   %6.1f MB extra" % (tLegacy * 1e3, legacyTemp / 1e6))
+    print("    current  %8.2f ms/trial   %6.1f MB extra   %5.1fx" % (tCurrent * 1e3, 0, tLegacy / tCurrent))
@@ -0,0 +1,71 @@
+"""
+Benchmark for reading acquired data from the NiDAQ driver.
+
+A SuperTask is created on the mock NiDAQ (drivers/nidaq/mock.py) with two AI
+channels and one DI line sampled at 100 kHz for 1 s. We then collect the
+data of repeated runs with SuperTask.read (called by getResult after each
+task):
+
+  allocate    previous behavior: each Task.read allocates a new buffer
+  reuse       SuperTask.setReuseReadBuffers(True): each input task reads into
+              the buffer allocated when the clocks were configured
+
+For each variant we report the time per read and the number of read
+buffers allocated over all runs (1 per input task means that nothing was
+allocated in steady state). Data read by both variants must be identical.
+
+The mock tasks are not started here; read() returns immediately.
+
+Usage:  python tools/benchmarks/daqRead.py [nRuns]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+from acq4.drivers.nidaq.mock import NIDAQ
+
+RATE = 100e3
+NPTS = 100000
+
+
+def makeSuperTask(reuse):
+    st = NIDAQ.createSuperTask()
+    trace = np.random.normal(size=NPTS)
+    st.addChannel('/Dev1/ai0', 'ai', mockFunc=lambda: trace)
+    st.addChannel('/Dev1/ai1', 'ai')
+    st.addChannel('/Dev1/port0/line0', 'di', mockFunc=lambda: trace > 0)
+    st.setReuseReadBuffers(reuse)
+    st.configureClocks(rate=RATE, nPts=NPTS)
+    return st
+
+
+def run(st, nRuns):
+    """Read nRuns results; return (last result, time per read, buffers allocated)."""
+    prev = {}
+    nBuffers = 0
+    start = time.time()
+    for i in range(nRuns):
+        res = st.read()
+        for k, (data, nPts) in res.items():
+            if data is not prev.get(k):
+                nBuffers += 1
+            prev[k] = data
+    return res, (time.time() - start) / nRuns, nBuffers
+
+
+if __name__ == '__main__':
+    nRuns = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    np.random.seed(0)
+    stAlloc = makeSuperTask(False)
+    np.random.seed(0)
+    stReuse = makeSuperTask(True)
+    ref, tAlloc, nAlloc = run(stAlloc, nRuns)
+    res, tReuse, nReuse = run(stReuse, nRuns)
+    for k in ref:
+        assert ref[k][1] == res[k][1]
+        assert ref[k][0].dtype == res[k][0].dtype
+        assert np.all(ref[k][0] == res[k][0])
+    print("%d runs, %d input tasks, %d samples per channel" % (nRuns, len(ref), NPTS))
+    print("    allocate  %7.3f ms/read   %4d buffers" % (tAlloc * 1e3, nAlloc))
+    print("    reuse     %7.3f ms/read   %4d buffers   %5.2fx" % (tReuse * 1e3, nReuse, tAlloc / tReuse))
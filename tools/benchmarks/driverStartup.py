@@ -0,0 +1,102 @@
+"""
+Benchmark for loading C header definitions at driver startup.
+
+The mock NiDAQ driver (drivers/nidaq/mock.py) is imported in a fresh
+interpreter, as Manager.loadDevice does, and its header definitions are then
+used for the first time by creating a SuperTask with one AI channel:
+
+  legacy      previous behavior: the cache is validated and loaded with the
+              pure-python pickle module while the driver is imported
+  cold        the compact cache (CParser.compactCacheFile) does not exist yet;
+              on first use the shipped cache is loaded and the compact cache
+              is written
+  warm        the compact cache exists; on first use it is loaded
+
+For each variant we report the time to import the driver and the time until
+the first SuperTask is configured (the best of several runs). The definitions
+loaded from both caches must be identical.
+
+Parsing the headers themselves (no cache at all) requires pyparsing and takes
+several minutes; it is not measured here.
+
+Usage:  python tools/benchmarks/driverStartup.py [nRuns]
+"""
+import os, sys, subprocess
+path = os.path.dirname(os.path.abspath(__file__))
+root = os.path.abspath(os.path.join(path, '..', '..'))
+sys.path.insert(0, root)
+
+from acq4.util.clibrary.CParser import CParser
+import acq4.drivers.nidaq as nidaqPkg
+
+cacheFile = os.path.join(os.path.dirname(nidaqPkg.__file__), 'NIDAQmx_headers_%s.cache' % sys.platform)
+
+## Each run prints (import time, first use time)
+LEGACY = """
+import sys, time
+sys.path.insert(0, %(root)r)
+start = time.time()
+import pickle
+import acq4.util.clibrary as clibrary
+import acq4.drivers.nidaq.mock as mock
+DEFS = clibrary.CParser(mock.headerFiles, types={'__int64': ('long long')}, processAll=False)
+cache = pickle.load(open(mock.cacheFile, 'rb'))
+DEFS.importDict(cache['fileDefs'], cache['fileOrder'])
+mock.NIDAQ.lib = clibrary.CLibrary(None, DEFS, prefix='DAQmx_')
+tImport = time.time() - start
+st = mock.NIDAQ.createSuperTask()
+st.addChannel('/Dev1/ai0', 'ai')
+print(repr((tImport, time.time() - start - tImport)))
+"""
+
+CURRENT = """
+import sys, time
+sys.path.insert(0, %(root)r)
+start = time.time()
+import acq4.drivers.nidaq.mock as mock
+tImport = time.time() - start
+st = mock.NIDAQ.createSuperTask()
+st.addChannel('/Dev1/ai0', 'ai')
+print(repr((tImport, time.time() - start - tImport)))
+"""
+
+
+def run(code, nRuns, setup=None):
+    times = []
+    for i in range(nRuns):
+        if setup is not None:
+            setup()
+        out = subprocess.check_output([sys.executable, '-c', code % {'root': root}])
+        times.append(eval(out.strip().split('\n')[-1]))
+    return min(t[0] for t in times), min(t[1] for t in times)
+
+
+def removeCompactCache():
+    compact = CParser.compactCacheFile(cacheFile)
+    if os.path.exists(compact):
+        os.remove(compact)
+
+
+def loadDefs(cacheFile):
+    p = CParser(processAll=False)
+    p.verbose = False
+    assert p.loadCache(cacheFile)
+    return p
+
+
+if __name__ == '__main__':
+    nRuns = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [
+        ('legacy', run(LEGACY, nRuns)),
+        ('cold', run(CURRENT, nRuns, setup=removeCompactCache)),
+        ('warm', run(CURRENT, nRuns)),
+    ]
+    ref = loadDefs(cacheFile)
+    defs = loadDefs(CParser.compactCacheFile(cacheFile))
+    assert ref.defs == defs.defs and ref.fileDefs == defs.fileDefs
+
+    print("%s, %d definitions, best of %d runs" % (os.path.basename(cacheFile), sum(map(len, ref.defs.values())), nRuns))
+    tLegacy = sum(results[0][1])
+    for name, (tImport, tUse) in results:
+        print("    %-7s import %7.3f s   first use %7.3f s   total %7.3f s   %5.2fx" % (
+            name, tImport, tUse, tImport + tUse, tLegacy / (tImport + tUse)))
@@ -0,0 +1,88 @@
+"""
+Benchmark for file previews in the DataManager module (FileDataView).
+
+Two large synthetic MetaArray files of the given size are written to a
+temporary directory:
+
+  camera      512 x 512 uint16 frames (Time, X, Y)
+  trace       2 float32 channels with time values (Channel, Time)
+
+For each file we time:
+
+  read        FileHandle.read() with all data loaded, as FileDataView did in
+              the GUI thread when the file was selected (files over 500 MB
+              were opened lazily, then read in full by the plot / image view)
+  preview     MetaArray.readPartial with FileDataView's default limit
+              (metadata, first frame / decimated trace)
+  abort       a full readPartial that is aborted 50 ms after it starts, as
+              happens when a newer file is selected; we report the time until
+              it returns
+
+The page cache is not dropped between runs, so 'read' is a lower bound for
+files on network drives or cold disks.
+
+Usage:  python tools/benchmarks/filePreview.py [sizeMB]
+"""
+import os, sys, time, tempfile, shutil, threading
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import acq4.util.DataManager as DataManager
+from acq4.util.metaarray import MetaArray
+from acq4.filetypes.MetaArray import MetaArray as MetaArrayType
+
+MAX_POINTS = 2**22  ## FileDataView default maxPreviewPoints
+
+
+def makeCamera(dh, nBytes):
+    nFrames = max(1, nBytes // (512 * 512 * 2))
+    info = [{'name': 'Time', 'units': 's', 'values': np.arange(nFrames) * 0.01}, {'name': 'X'}, {'name': 'Y'}, {}]
+    data = MetaArray((nFrames, 512, 512), dtype=np.uint16, info=info)
+    for i in range(0, nFrames, 100):
+        data.asarray()[i:i+100] = np.random.randint(0, 4096, size=(min(100, nFrames-i), 512, 512))
+    return dh.writeFile(data, 'camera.ma')
+
+
+def makeTrace(dh, nBytes):
+    nPts = max(1, nBytes // 8)
+    info = [{'name': 'Channel', 'cols': [{'name': 'primary', 'units': 'A'}, {'name': 'secondary', 'units': 'V'}]},
+            {'name': 'Time', 'units': 's', 'values': np.arange(nPts) * 1e-5}, {}]
+    data = MetaArray(np.random.normal(size=(2, nPts)).astype(np.float32), info=info)
+    return dh.writeFile(data, 'trace.ma')
+
+
+def timeit(fn):
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+
+def abortedRead(fh):
+    flag = threading.Event()
+    timer = threading.Timer(0.05, flag.set)
+    timer.start()
+    ret, t = timeit(lambda: MetaArrayType.readPartial(fh, None, abort=flag.is_set))
+    timer.cancel()
+    return ret, t
+
+
+if __name__ == '__main__':
+    sizeMB = float(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    np.random.seed(0)
+    tmp = tempfile.mkdtemp()
+    try:
+        dh = DataManager.getDirHandle(tmp)
+        print("%d MB files, preview limit %d values" % (sizeMB, MAX_POINTS))
+        for name, make in [('camera', makeCamera), ('trace', makeTrace)]:
+            fh = make(dh, int(sizeMB * 1e6))
+            full, tRead = timeit(lambda: fh.read(readAllData=True))
+            (prev, complete), tPrev = timeit(lambda: MetaArrayType.readPartial(fh, MAX_POINTS))
+            ret, tAbort = abortedRead(fh)
+            assert not complete and np.prod(prev.shape) <= MAX_POINTS
+            assert ret is None
+            print("    %-7s %-18s read %7.3f s   preview %7.3f s %-16s   abort %7.3f s" % (
+                name, str(full.shape), tRead, tPrev, str(prev.shape), tAbort))
+            del full
+    finally:
+        shutil.rmtree(tmp)
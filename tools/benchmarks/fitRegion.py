@@ -0,0 +1,81 @@
+"""
+Benchmark for Fitting.FitRegion: per-trace leastsq versus the batched
+FitRegionBatch, on synthetic families of sweeps like those fit by IVCurve.
+
+Each family has one trace per sweep, with amplitudes and time constants that
+change smoothly from sweep to sweep. We report traces/s for both methods and
+compare the batched fit error against the per-trace fits.
+
+Usage:  python tools/benchmarks/fitRegion.py [nTraces] [nPoints] [nWorkers]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+from acq4.analysis.tools import Fitting
+
+
+## true parameters, initial guess, index of the amplitude and indices of the time constants
+FAMILIES = {
+    'exp0':   ([2.0, 20.0], [1.0, 5.0], 0, [1]),
+    'exp1':   ([-60.0, 3.0, 15.0], [-50.0, 1.0, 5.0], 1, [2]),
+    'expsum': ([0.0, -0.5, 200.0, -0.25, 450.0], [0.0, -1.0, 150.0, -0.25, 350.0], 1, [2, 4]),
+    'exp2':   ([0.0, -0.5, 200.0, -0.25, 450.0], [0.0, -1.0, 150.0, -0.25, 350.0], 1, [2, 4]),
+    'boltz':  ([0.0, 1.0, -50.0, -5.0], [0.0, 0.5, -60.0, -7.0], 1, [3]),
+}
+
+
+def makeFamily(fitFunc, nTraces, nPts, noise):
+    """Return (t, traces, guess) for a family of sweeps generated by fitFunc."""
+    f = Fitting.Fitting().fitfuncmap[fitFunc]
+    true, guess, amp, taus = FAMILIES[fitFunc]
+    t = np.linspace(f[4][0], f[4][1], nPts)
+    traces = np.empty((nTraces, len(t)))
+    for i in range(nTraces):
+        s = float(i) / max(1, nTraces - 1)
+        ## amplitudes scale with the sweep; time constants drift
+        p = np.array(true, dtype=float)
+        p[amp] *= 0.2 + 1.6 * s
+        p[taus] *= 0.7 + 0.6 * s
+        y = f[0](p, t, C=f[7])
+        traces[i] = y + np.random.normal(scale=noise * np.abs(y - y[-1]).max(), size=len(t))
+    return t, traces, guess
+
+
+def bench(fitFunc, nTraces, nPts, workers, noise=0.01):
+    t, traces, guess = makeFamily(fitFunc, nTraces, nPts, noise)
+    fits = Fitting.Fitting()
+    whichdata = range(nTraces)
+    func = fits.fitfuncmap[fitFunc]
+
+    start = time.time()
+    serial = fits.FitRegion(whichdata, 0, t, traces, dataType='2d', fitFunc=fitFunc, fitPars=guess)[0]
+    tSerial = time.time() - start
+    errSerial = []
+    for i, p in enumerate(serial):
+        tx, ty = fits.getClipData(t, traces[i], t.min(), t.max())  # the window FitRegion fits
+        errSerial.append(((ty - func[0](p, tx, C=func[7]))**2).sum())
+
+    start = time.time()
+    batch = fits.FitRegionBatch(whichdata, 0, t, traces, dataType='2d', fitFunc=fitFunc, fitPars=guess,
+                                workers=workers, batchSize=max(1, nTraces // workers))[0]
+    tBatch = time.time() - start
+    ratio = fits.fitSum2Errs / np.array(errSerial)
+    if '-v' in sys.argv:
+        for i in np.argwhere((ratio > 1.01) | (ratio < 0.99))[:, 0]:
+            print("    trace %d  ratio %0.3f\n      leastsq %s\n      batch   %s" % (i, ratio[i], serial[i], batch[i]))
+
+    print("%-8s  leastsq: %8.1f traces/s   batch: %8.1f traces/s (%0.1fx)   error ratio median %0.4f  "
+          "worse by >1%%: %d  better by >1%%: %d" % (
+          fitFunc, nTraces / tSerial, nTraces / tBatch, tSerial / tBatch,
+          np.median(ratio), (ratio > 1.01).sum(), (ratio < 0.99).sum()))
+
+
+if __name__ == '__main__':
+    nTraces = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    nPts = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    nWorkers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    np.random.seed(0)
+    for fitFunc in sorted(FAMILIES.keys()):
+        bench(fitFunc, nTraces, nPts, nWorkers)
@@ -0,0 +1,63 @@
+"""
+Time and memory profile of the Photostim detector flowchart on a long trace,
+with memoization disabled (as in batch processing).
+
+Each configuration runs in its own subprocess so that peak memory can be
+compared:
+
+  legacy   every node result receives a deep copy of the MetaArray meta info,
+           and no node works in place (the behavior before MetaArray.withData
+           and Node.ownsInput were introduced)
+  shared   meta info is shared between node results; no in-place operations
+  inplace  meta info is shared and nodes that own their input modify it in place
+
+We report the time per Flowchart.process() call and the increase in peak
+resident memory over the memory used by the input data.
+
+Usage:  python tools/benchmarks/flowchartMemory.py [duration_s] [nIter] [fcFile]
+"""
+import os, sys, time, resource, subprocess
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+fcPath = os.path.join(path, '..', '..', 'acq4', 'analysis', 'modules', 'Photostim', 'detector_fc')
+
+
+def maxRss():
+    ## kB on linux, bytes on OSX
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / 1024. if sys.platform == 'darwin' else r
+
+
+def run(mode, duration, nIter, fcFile):
+    from acq4.pyqtgraph.flowchart.Node import Node
+    from acq4.util.metaarray import MetaArray
+    import flowchartProcess
+
+    if mode == 'legacy':
+        MetaArray.withData = lambda self, data: MetaArray(data, info=self.infoCopy())
+        origInfoCopy = MetaArray.infoCopy
+        MetaArray.infoCopy = lambda self, axis=None, deep=True: origInfoCopy(self, axis)
+    if mode in ('legacy', 'shared'):
+        Node.ownsInput = lambda self, name: False
+
+    fh = flowchartProcess.FakeFile(flowchartProcess.makeTrace(duration=duration))
+    fc = flowchartProcess.loadChart(fcFile)
+    fc.setMemoization(False)
+    base = maxRss()
+    start = time.time()
+    for i in range(nIter):
+        fc.process(dataIn=fh)
+    dt = (time.time() - start) / nIter
+    print("%-8s  %8.1f ms/call   peak memory +%8.1f MB" % (mode, dt * 1e3, (maxRss() - base) / 1024.))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run(sys.argv[2], float(sys.argv[3]), int(sys.argv[4]), sys.argv[5])
+        sys.exit(0)
+    duration = sys.argv[1] if len(sys.argv) > 1 else '10.0'
+    nIter = sys.argv[2] if len(sys.argv) > 2 else '5'
+    fcFile = sys.argv[3] if len(sys.argv) > 3 else os.path.join(fcPath, 'default.fc')
+    print("%s, %s s trace, %s iterations" % (os.path.basename(fcFile), duration, nIter))
+    for mode in ('legacy', 'shared', 'inplace'):
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), '--run', mode, duration, nIter, fcFile], cwd=path)
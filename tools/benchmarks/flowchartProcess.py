@@ -0,0 +1,107 @@
+"""
+Benchmark for Flowchart.process() using the detector_fc and analysis_fc
+flowcharts bundled with the Photostim module.
+
+Each chart is processed repeatedly with a synthetic clamp recording. We report
+the time per call with memoization disabled, with memoization enabled and
+identical input, and with memoization enabled after changing a parameter on the
+last CtrlNode in the processing order (only the downstream subgraph is
+re-executed). Only nodes that provide a state key (e.g. CtrlNodes with
+memoizable = True) are skipped.
+
+Usage:  python tools/benchmarks/flowchartProcess.py [nIter]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import acq4.pyqtgraph as pg
+from acq4.pyqtgraph.flowchart.library.common import CtrlNode
+import acq4.util.flowchart as flowchart
+from acq4.util.metaarray import MetaArray
+
+app = pg.mkQApp()
+fcPath = os.path.join(path, '..', '..', 'acq4', 'analysis', 'modules', 'Photostim')
+
+
+class FakeFile(object):
+    """Stands in for a FileHandle; the detector charts call input.read()."""
+    def __init__(self, data):
+        self.data = data
+    def read(self):
+        return self.data
+
+
+def makeTrace(duration=0.5, rate=20e3):
+    nPts = int(duration * rate)
+    t = np.arange(nPts) / rate
+    data = np.random.normal(size=(2, nPts), scale=5e-12)
+    for evt in np.random.uniform(0.11, duration, size=10):
+        ind = int(evt * rate)
+        x = t[:nPts-ind]
+        data[0, ind:] -= 50e-12 * (np.exp(-x / 10e-3) - np.exp(-x / 1e-3))
+    info = [
+        {'name': 'Channel', 'cols': [{'name': 'primary', 'units': 'A'}, {'name': 'command', 'units': 'V'}]},
+        {'name': 'Time', 'units': 's', 'values': t},
+        {'ClampState': {'mode': 'VC'}}
+    ]
+    return MetaArray(data, info=info)
+
+
+def timeit(fn, n):
+    start = time.time()
+    for i in range(n):
+        fn()
+    return (time.time() - start) / n
+
+
+def lastCtrlNode(fc):
+    nodes = [op[1] for op in fc.compileProcessPlan() if op[0] == 'p' and isinstance(op[1], CtrlNode)]
+    return nodes[-1] if len(nodes) > 0 else None
+
+
+def loadChart(fcFile):
+    fc = flowchart.Flowchart()
+    fc.restoreState(pg.configfile.readConfigFile(fcFile), clear=True)
+    return fc
+
+
+def bench(fcFile, args, nIter):
+    fc = loadChart(fcFile)
+
+    fc.setMemoization(False)
+    tCold = timeit(lambda: fc.process(**args), nIter)
+
+    fc.setMemoization(True)
+    fc.process(**args)
+    tWarm = timeit(lambda: fc.process(**args), nIter)
+
+    node = lastCtrlNode(fc)
+    tLate = None
+    if node is not None:
+        ## modify the node's state so that it no longer matches the memo
+        key = [0]
+        def changeAndProcess():
+            key[0] += 1
+            node.stateKey = lambda: key[0]
+            fc.process(**args)
+        tLate = timeit(changeAndProcess, nIter)
+
+    print("%-60s  full: %7.2f ms   memo: %7.2f ms   late change (%s): %s" % (
+        os.path.relpath(fcFile, fcPath), tCold*1e3, tWarm*1e3,
+        None if node is None else node.name(),
+        'n/a' if tLate is None else '%7.2f ms' % (tLate*1e3)))
+
+
+if __name__ == '__main__':
+    nIter = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    fh = FakeFile(makeTrace())
+    for f in sorted(os.listdir(os.path.join(fcPath, 'detector_fc'))):
+        bench(os.path.join(fcPath, 'detector_fc', f), {'dataIn': fh}, nIter)
+
+    ## analysis charts take the output of the default detector chart as input
+    detected = loadChart(os.path.join(fcPath, 'detector_fc', 'default.fc')).process(dataIn=fh)
+    args = {'events': detected['events'], 'regions': detected['regions'], 'fileHandle': fh}
+    for f in sorted(os.listdir(os.path.join(fcPath, 'analysis_fc'))):
+        bench(os.path.join(fcPath, 'analysis_fc', f), args, nIter)
@@ -0,0 +1,74 @@
+"""
+Benchmark for the MockClamp Hodgkin-Huxley simulator (acq4/devices/MockClamp/hhSim.py).
+
+Single sweeps (500 ms at 10 kHz, as MockClamp runs them):
+
+  ic          current clamp, 300 pA step (repetitive spiking)
+  vc          voltage clamp, step from -65 to -10 mV
+
+are simulated with runSim (odeint, the reference) and with runSimFast at
+several integration steps. We report time per sweep and the error against the
+reference in the recorded signal (Vm for ic, electrode current for vc) as
+maximum and RMS deviation. Spike timing differences dominate the ic maximum.
+
+Batches: an IV family of N current-clamp sweeps is simulated with one
+runSimFast call, and with one call per sweep.
+
+Usage:  python tools/benchmarks/hhSim.py [nSweeps]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..', 'acq4', 'devices', 'MockClamp'))
+
+import numpy as np
+import hhSim
+
+DT = 0.1      # ms
+NPTS = 5000
+
+
+def stepCommand(mode, amp):
+    cmd = np.zeros(NPTS) + (-65e-3 if mode == 'vc' else 0.)
+    cmd[1000:4000] = amp
+    return cmd
+
+
+def timeit(fn):
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+
+def error(a, b):
+    d = np.abs(a - b)
+    return d.max(), np.sqrt((d**2).mean())
+
+
+if __name__ == '__main__':
+    nSweeps = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    init = hhSim.initState
+
+    print("single sweep, %d samples at %g ms" % (NPTS, DT))
+    for mode, amp, col, units in [('ic', 0.3e-9, 3, ('mV', 1e3)), ('vc', -10e-3, 1, ('pA', 1e12))]:
+        cmd = stepCommand(mode, amp)
+        ref, tRef = timeit(lambda: hhSim.runSim(init, mode=mode, cmd=cmd, dt=DT, dur=DT*NPTS))
+        rng = np.ptp(ref[:, col]) * units[1]
+        print("  %s   odeint          %7.3f s   (signal range %0.1f %s)" % (mode, tRef, rng, units[0]))
+        for step in (0.1, 0.05, 0.025):
+            res, t = timeit(lambda: hhSim.runSimFast(init, mode=mode, cmd=cmd, dt=DT, dur=DT*NPTS, step=step))
+            emax, erms = error(res[:, col], ref[:, col])
+            print("       fast %5.3f ms   %7.3f s   %5.1fx   error max %7.2f %s  rms %6.3f %s" % (
+                step, t, tRef / t, emax * units[1], units[0], erms * units[1], units[0]))
+
+    amps = np.linspace(-0.2e-9, 0.4e-9, nSweeps)
+    cmds = np.zeros((nSweeps, NPTS))
+    cmds[:, 1000:4000] = amps[:, np.newaxis]
+    batch, tBatch = timeit(lambda: hhSim.runSimFast(init, mode='ic', cmd=cmds, dt=DT, dur=DT*NPTS))
+    nLoop = min(nSweeps, 8)
+    loop, tLoop = timeit(lambda: [hhSim.runSimFast(init, mode='ic', cmd=c, dt=DT, dur=DT*NPTS) for c in cmds[:nLoop]])
+    tLoop *= float(nSweeps) / nLoop
+    for i in range(nLoop):
+        assert np.allclose(batch[i], loop[i])
+    print("IV family, %d sweeps" % nSweeps)
+    print("  one call per sweep  %7.3f s  (%0.1f ms/sweep)" % (tLoop, tLoop / nSweeps * 1e3))
+    print("  batched             %7.3f s  (%0.1f ms/sweep)   %5.1fx" % (tBatch, tBatch / nSweeps * 1e3, tLoop / tBatch))
@@ -0,0 +1,229 @@
+"""
+Benchmark and accuracy check for the Patch module's membrane test analysis.
+
+Test pulse sweeps are simulated with the MockClamp Hodgkin-Huxley model in
+voltage and current clamp, using the default Patch module parameters. Each
+sweep is analyzed by:
+
+  leastsq   analyzeLeastSq(), the previous PatchThread.analyze
+  single    MembraneTestAnalyzer.analyze(), one sweep per call
+  batch     MembraneTestAnalyzer.analyzeBatch(), all sweeps in one call
+            (as for several clamps recording together)
+
+We report sweeps/s for each, and the median and maximum relative difference
+of each result between the analyzer and analyzeLeastSq. The exponential fit
+error (sum of absolute residuals) is listed as well; where the fits differ,
+a lower error means the fit is closer to the least-squares optimum.
+
+Usage:  python tools/benchmarks/membraneTest.py [nSweeps]
+"""
+from __future__ import division
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import scipy.optimize
+from acq4.util.metaarray import MetaArray
+from acq4.devices.MockClamp import hhSim
+from acq4.modules.Patch.MembraneTest import MembraneTestAnalyzer, NUDGE, expFn, _bridge
+
+PARAMS = {
+    'rate': 400000, 'downsample': 10, 'drawFit': True,
+    'vcHolding': -65e-3, 'vcPulse': -10e-3,
+    'icHolding': 0.0, 'icPulse': -30e-12,
+}
+MODES = {
+    'vc': {'mode': 'vc', 'delayTime': 10e-3, 'pulseTime': 10e-3},
+    'ic': {'mode': 'ic', 'delayTime': 30e-3, 'pulseTime': 150e-3},
+}
+KEYS = ['inputResistance', 'accessResistance', 'capacitance', 'restingPotential', 'restingCurrent', 'fitError']
+
+
+def makeParams(mode):
+    params = PARAMS.copy()
+    params.update(MODES[mode])
+    params['recordTime'] = params['delayTime'] * 2.0 + params['pulseTime']
+    return params
+
+
+def sweep(params):
+    """Simulate one test pulse and return it as recorded by the clamp device."""
+    rate = params['rate'] / float(params['downsample'])
+    t = np.arange(int(params['recordTime'] * rate)) / rate
+    mode = params['mode']
+    cmd = np.ones(len(t)) * params[mode+'Holding']
+    cmd[(t >= params['delayTime']) & (t < params['delayTime'] + params['pulseTime'])] += params[mode+'Pulse']
+    primary = hhSim.run({'dt': 1.0 / rate, 'mode': mode, 'data': cmd})
+    info = [
+        {'name': 'Channel', 'cols': [{'name': 'command'}, {'name': 'primary'}]},
+        {'name': 'Time', 'values': t},
+        {'ClampState': {'ClampParams': {'BridgeBalResist': 0, 'BridgeBalEnabled': False}}},
+    ]
+    return MetaArray(np.vstack([cmd, primary]), info=info)
+
+
+def analyzeLeastSq(data, params):
+    """Analyze one test pulse sweep using scipy.optimize.leastsq.
+
+    This is the original PatchThread analysis, kept here as the reference
+    for MembraneTestAnalyzer."""
+    ## Extract specific time segments
+    nudge = NUDGE
+    base = data['Time': 0.0:(params['delayTime']-nudge)]
+    pulse = data['Time': params['delayTime']+nudge:params['delayTime']+params['pulseTime']-nudge]
+    pulseEnd = data['Time': params['delayTime']+(params['pulseTime']*2./3.):params['delayTime']+params['pulseTime']-nudge]
+
+    # predictions
+    ar = 10e6
+    ir = 200e6
+    if params['mode'] == 'vc':
+        ari = params['vcPulse'] / ar
+        iri = params['vcPulse'] / ir
+        pred1 = [ari, ari-iri, 1e-3]
+    else:
+        bridge = _bridge(data)
+        arv = params['icPulse'] * ar - bridge
+        irv = params['icPulse'] * ir
+        pred1 = [arv, -irv, 10e-3]
+
+    # Fit exponential to pulse and post-pulse traces
+    tVals1 = pulse.xvals('Time')-params['delayTime']
+
+    baseMean = base['primary'].mean()
+    fit1 = scipy.optimize.leastsq(
+        lambda v, t, y: y - expFn(v, t), pred1,
+        args=(tVals1, pulse['primary'].view(np.ndarray) - baseMean),
+        maxfev=200, full_output=1)
+
+    ## fit again using shorter data
+    ## this should help to avoid fitting against h-currents
+    tau4 = fit1[0][2]*10
+    t0 = pulse.xvals('Time')[0]
+    shortPulse = pulse['Time': t0:t0+tau4]
+    if shortPulse.shape[0] > 10:  ## but only if we can get enough samples from this
+        tVals2 = shortPulse.xvals('Time')-params['delayTime']
+        fit1 = scipy.optimize.leastsq(
+            lambda v, t, y: y - expFn(v, t), pred1,
+            args=(tVals2, shortPulse['primary'].view(np.ndarray) - baseMean),
+            maxfev=200, full_output=1)
+
+    err = abs(fit1[2]['fvec']).sum()
+    fit1 = fit1[0]
+    (fitOffset, fitAmp, fitTau) = fit1
+
+    ## Handle analysis differently depenting on clamp mode
+    if params['mode'] == 'vc':
+        iBase = base['Channel': 'primary'].asarray()
+        iPulse = pulse['Channel': 'primary']
+        iPulseEnd = pulseEnd['Channel': 'primary']
+        vBase = base['Channel': 'command'].asarray()
+        vPulse = pulse['Channel': 'command']
+        vStep = vPulse.mean() - vBase.mean()
+        sign = [-1, 1][vStep > 0]
+
+        iBaseMean = iBase.mean()
+        iPulseEndMean = iPulseEnd.asarray().mean()
+        iStep = sign * max(1e-15, sign * (iPulseEndMean - iBaseMean))
+        iRes = vStep / iStep
+
+        ## From Santos-Sacchi 1993
+
+        ## 1. compute charge transfered during the charging phase
+        pTimes = pulse.xvals('Time')
+        iCapEnd = pTimes[-1]
+        iCap = iPulse['Time':pTimes[0]:iCapEnd] - iPulseEndMean
+        ## Instead, we will use the fit to guess how much charge transfer there would have been
+        ## if the charging curve had gone all the way back to the beginning of the pulse
+        iCap = expFn((fit1[1],fit1[1],fit1[2]), np.linspace(0, iCapEnd-pTimes[0], iCap.shape[0]))
+        Q = sum(iCap) * (iCapEnd - pTimes[0]) / iCap.shape[0]
+
+        Rin = iRes
+        Vc = vStep
+        Rs_denom = (Q * Rin + fitTau * Vc)
+        if Rs_denom != 0.0:
+            Rs = (Rin * fitTau * Vc) / Rs_denom
+            Rm = Rin - Rs
+            Cm = (Rin**2 * Q) / (Rm**2 * Vc)
+        else:
+            Rs = 0
+            Rm = 0
+            Cm = 0
+        aRes = Rs
+        cap = Cm
+
+    if params['mode'] == 'ic':
+        iBase = base['Channel': 'command'].asarray()
+        iPulse = pulse['Channel': 'command']
+        vBase = base['Channel': 'primary'].asarray()
+        iStep = iPulse.mean() - iBase.mean()
+
+        if iStep >= 0:
+            vStep = max(1e-5, -fitAmp)
+        else:
+            vStep = min(-1e-5, -fitAmp)
+        if iStep == 0:
+            iStep = 1e-14
+        iRes = (vStep / iStep)
+        aRes = (fitOffset / iStep) + bridge
+        cap = fitTau / iRes
+
+    rmp = vBase.mean()
+    rmps = vBase.std()
+    rmc = iBase.mean()
+    rmcs = iBase.std()
+
+    ## Compute values for fit trace to be plotted over raw data
+    if params['drawFit']:
+        fitTrace = MetaArray((data.shape[1],), info=[{'name': 'Time', 'values': data.xvals('Time')}])
+        if params['mode'] == 'vc':
+            fitTrace[:] = rmc
+        else:
+            fitTrace[:] = rmp
+        ## slices from fitTrace must exactly match slices from data at the beginning of the function.
+        fitTrace['Time': params['delayTime']+nudge:params['delayTime']+params['pulseTime']-nudge] = expFn(fit1, tVals1)+baseMean
+    else:
+        fitTrace = None
+
+    return {
+        'inputResistance': iRes,
+        'accessResistance': aRes,
+        'capacitance': cap,
+        'restingPotential': rmp, 'restingPotentialStd': rmps,
+        'restingCurrent': rmc, 'restingCurrentStd': rmcs,
+        'fitError': err,
+        'fitTrace': fitTrace
+    }
+
+
+def timeit(fn):
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+
+def bench(mode, nSweeps):
+    params = makeParams(mode)
+    sweeps = [sweep(params) for i in range(nSweeps)]
+    analyzer = MembraneTestAnalyzer(params)
+    ref, tRef = timeit(lambda: [analyzeLeastSq(s, params) for s in sweeps])
+    single, tSingle = timeit(lambda: [analyzer.analyze(s) for s in sweeps])
+    batch, tBatch = timeit(lambda: analyzer.analyzeBatch(sweeps))
+
+    print("%s:  leastsq %7.1f sweeps/s   single %7.1f sweeps/s   batch %7.1f sweeps/s" % (
+        mode.upper(), nSweeps / tRef, nSweeps / tSingle, nSweeps / tBatch))
+    for k in KEYS:
+        r = np.array([x[k] for x in ref])
+        f = np.array([x[k] for x in single])
+        b = np.array([x[k] for x in batch])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel = np.where(f == r, 0, np.abs(f - r) / np.abs(r))
+        print("    %-18s  leastsq %11.4g   analyzer %11.4g   rel. diff median %.1e  max %.1e%s" % (
+            k, np.median(r), np.median(f), np.median(rel), np.max(rel),
+            '' if np.allclose(b, f) else '   (batch differs!)'))
+
+
+if __name__ == '__main__':
+    nSweeps = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    for mode in ('vc', 'ic'):
+        bench(mode, nSweeps)
@@ -0,0 +1,134 @@
+"""
+Benchmark for frame generation in the MockCamera device.
+
+A sensor of the given size looks at a mandelbrot specimen with 20 mock cells in
+view. We time the generation of a single frame with:
+
+  legacy      previous MockCamera.newFrames (fresh noise copy, background
+              crop and scale, and a Python loop over the cells every frame)
+  current     MockFrameGenerator.render (window of a uint16 noise bank added
+              to the cached frame background; cells added from precomputed
+              footprints)
+
+Then the generator is run at the requested frame rate for a few seconds and
+polled the way Camera.AcquireThread polls newFrames (every 1 ms). We report
+the frame rate delivered and the number of frames dropped from the ring
+buffer (gaps in the frame ids).
+
+Usage:  python tools/benchmarks/mockCamera.py [width] [height] [fps] [duration]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+from acq4.devices.MockCamera.mock_camera import MockFrameGenerator, makeNoise, mockCells, mandelbrot
+
+CENTER = (-1.5e-3, 4.4e-3)   ## center of the field of view (m)
+PIXEL = 0.5e-6               ## sensor pixel size (m)
+EXPOSURE = 1e-3
+
+
+def sensorTransform(w, h):
+    """Map global coordinates to sensor pixels, with CENTER in the middle of the sensor."""
+    s = 1.0 / PIXEL
+    return np.array([[s, 0, w / 2. - CENTER[0] * s], [0, s, h / 2. - CENTER[1] * s]])
+
+
+def legacyFrame(noise, background, cells, transform, exp, dt):
+    """Previous per-frame work done by MockCamera.newFrames (full sensor, no binning)."""
+    shape = background.shape
+    n = shape[0] * shape[1]
+    s = np.random.randint(len(noise)-n)
+    data = noise[s:s+n]
+    data.shape = shape
+    data = np.abs(data)
+    data += background * (exp * 10)
+
+    spikes = np.random.poisson(min(dt, 0.4) * cells['rate'])
+    cells['value'] *= np.exp(-dt / cells['decayTau'])
+    cells['value'] = np.clip(cells['value'] + spikes * 0.2, 0, 1)
+    data[data<0] = 0
+
+    px = PIXEL
+    for cell in cells:
+        w = cell['size'] / px
+        x = transform[0, 0] * cell['x'] + transform[0, 1] * cell['y'] + transform[0, 2]
+        y = transform[1, 0] * cell['x'] + transform[1, 1] * cell['y'] + transform[1, 2]
+        start = (int(x), int(y))
+        stop = (int(start[0]+w), int(start[1]+w))
+        val = cell['intensity'] * cell['value'] * exp
+        data[max(0,start[0]):max(0,stop[0]), max(0,start[1]):max(0,stop[1])] += val
+    return data.astype(np.uint16)
+
+
+def timeit(fn, n):
+    fn()
+    start = time.time()
+    for i in range(n):
+        fn()
+    return (time.time() - start) / n
+
+
+def stream(gen, duration):
+    """Poll *gen* for *duration* seconds; return (frames received, frames dropped)."""
+    received = 0
+    dropped = 0
+    lastId = None
+    start = time.time()
+    gen.start(start)
+    while True:
+        now = time.time()
+        if now - start > duration:
+            break
+        frames = gen.newFrames(now)
+        if len(frames) > 0:
+            if lastId is not None:
+                dropped += frames[0]['id'] - lastId - 1
+            for i in range(1, len(frames)):
+                dropped += frames[i]['id'] - frames[i-1]['id'] - 1
+            lastId = frames[-1]['id']
+            received += len(frames)
+        time.sleep(1e-3)
+    return received, dropped
+
+
+if __name__ == '__main__':
+    w = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    h = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+    fps = float(sys.argv[3]) if len(sys.argv) > 3 else 200.
+    duration = float(sys.argv[4]) if len(sys.argv) > 4 else 5.
+    np.random.seed(0)
+
+    bg = mandelbrot(w=w, h=h, maxIter=60).astype(np.float32)
+    tr = sensorTransform(w, h)
+    cells = mockCells(20, center=CENTER)
+    gen = MockFrameGenerator(cells.copy())
+    gen.setBackground(bg, tr)
+    gen.configure((0, 0, w, h), (1, 1), EXPOSURE, fps)
+    gen.prepare()
+
+    ## with cells at rest, both methods draw the same image apart from noise
+    ## (the generator rounds the background to integers once, so allow 1 count)
+    noise = np.random.normal(size=10000000, loc=100, scale=10)
+    gen.cells['value'] = 0.5
+    gen.updateCells(0)
+    legacyCells = gen.cells.copy()
+    gen.noise[:] = 100
+    noise[:] = 100
+    diff = gen.render().astype(int) - legacyFrame(noise, bg, legacyCells, tr, EXPOSURE, 0)
+    assert np.abs(diff).max() <= 1
+    noise = np.random.normal(size=10000000, loc=100, scale=10)
+    gen.noise = makeNoise(max(4000000, 2*w*h))
+    nVisible = len(np.unique(gen.cellPixCell))
+
+    n = 200
+    tLegacy = timeit(lambda: legacyFrame(noise, bg, legacyCells, tr, EXPOSURE, 1. / fps), n)
+    tCurrent = timeit(lambda: (gen.updateCells(1. / fps), gen.render()), n)
+    print("%dx%d frames, %d cells in view" % (w, h, nVisible))
+    print("    legacy   %7.3f ms/frame   (max %6.0f fps)" % (tLegacy * 1e3, 1. / tLegacy))
+    print("    current  %7.3f ms/frame   (max %6.0f fps)   %5.1fx" % (tCurrent * 1e3, 1. / tCurrent, tLegacy / tCurrent))
+
+    received, dropped = stream(gen, duration)
+    print("streaming at %g fps for %g s:" % (fps, duration))
+    print("    received %d frames (%0.1f fps), dropped %d" % (received, received / duration, dropped))
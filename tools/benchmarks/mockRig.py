@@ -0,0 +1,236 @@
+"""
+End-to-end benchmark of the task loop on a rig made only of mock devices.
+
+A Manager is started headless from a configuration containing the mock
+NiDAQ (drivers/nidaq/mock.py), a MockClamp, a MockStage with a Microscope
+and a MockCamera. We then run:
+
+  runTask       single clamp sweeps, executed as Manager.runTask does
+                (blocking execute, then getResult)
+  sequence      a TaskRunner-style sequence with the clamp and the camera:
+                one prepared task reused for every trial, executed without
+                blocking and polled with isDone; results are stored in a
+                new directory for each trial and then read back
+  camera        continuous camera acquisition at the configured frame rate
+
+For each task run, the phases recorded in Task.phaseTimes (reserve,
+configure, start, wait, stop, getResult, storeResult) are collected together
+with the time spent creating/updating the task, polling isDone, and reading
+stored results back. We report the median, mean and max of each phase in
+seconds. For the camera we report the frames received, the frame rate and
+the number of dropped frames.
+
+The report is written as JSON (to stdout, or to the given file) so that it can
+be compared between versions.
+
+Usage:  python tools/benchmarks/mockRig.py [nTrials] [output.json]
+"""
+import os, sys, time, tempfile, shutil, json, platform
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+from collections import OrderedDict
+import numpy as np
+import acq4.pyqtgraph as pg
+from acq4.pyqtgraph.Qt import QtGui
+
+SWEEP_DURATION = 0.1
+CAMERA_DURATION = 5.0
+
+CONFIG = """
+devices:
+    DAQ:
+        driver: 'NiDAQ'
+        mock: True
+        defaultAIMode: 'NRSE'
+    Clamp1:
+        driver: 'MockClamp'
+        simulator: 'builtin'
+        Command:
+            device: 'DAQ'
+            channel: '/Dev1/ao0'
+            type: 'ao'
+        ScaledSignal:
+            device: 'DAQ'
+            channel: '/Dev1/ai5'
+            mode: 'NRSE'
+            type: 'ai'
+        icHolding: 0.0
+        vcHolding: -65e-3
+    Stage:
+        driver: 'MockStage'
+    Microscope:
+        driver: 'Microscope'
+        parentDevice: 'Stage'
+        objectives:
+            0:
+                5x:
+                    name: '5x'
+                    scale: 1.0 / 5.0
+    Camera:
+        driver: 'MockCamera'
+        parentDevice: 'Microscope'
+        transform:
+            pos: (0, 0)
+            scale: (5*2.581e-6, -5*2.581e-6)
+            angle: 0
+        exposeChannel:
+            device: 'DAQ'
+            channel: '/Dev1/port0/line0'
+            type: 'di'
+        sensorSize: (1024, 1024)
+        frameRate: 100
+        defaults:
+            exposure: 5e-3
+"""
+
+
+def clampCommand(amplitude, rate=100000):
+    numPts = int(SWEEP_DURATION * rate)
+    holding = -65e-3
+    cmdData = np.empty(numPts)
+    cmdData[:] = holding
+    start = numPts // 3
+    cmdData[start:start*2] = holding + amplitude
+    return {
+        'protocol': {'duration': SWEEP_DURATION},
+        'DAQ': {'rate': rate, 'numPts': numPts},
+        'Clamp1': {'mode': 'vc', 'command': cmdData, 'holding': holding},
+    }
+
+
+def cameraCommand():
+    return {
+        'record': True,
+        'triggerProtocol': False,
+        'params': {'triggerMode': 'Normal'},
+        'channels': {'exposure': {'record': True}},
+    }
+
+
+def summarize(trials):
+    """Return {phase: {'median', 'mean', 'max'}} for a list of {phase: seconds} dicts."""
+    phases = OrderedDict()
+    for trial in trials:
+        for phase in trial:
+            phases.setdefault(phase, []).append(trial[phase])
+    out = OrderedDict()
+    for phase, times in phases.items():
+        times = np.array(times)
+        out[phase] = OrderedDict([('median', np.median(times)), ('mean', times.mean()), ('max', times.max())])
+    return out
+
+
+def runTaskBench(man, nTrials):
+    trials = []
+    for i in range(nTrials + 1):
+        start = time.time()
+        task = man.createTask(clampCommand(-10e-3))
+        created = time.time()
+        task.execute()
+        task.getResult()
+        if i == 0:  ## first run includes device setup
+            continue
+        phases = OrderedDict([('create', created - start)])
+        phases.update(task.phaseTimes)
+        phases['total'] = time.time() - start
+        trials.append(phases)
+    return OrderedDict([('name', 'runTask'), ('trials', nTrials), ('duration', SWEEP_DURATION),
+                        ('phases', summarize(trials))])
+
+
+def sequenceBench(man, nTrials):
+    seqDir = man.getBaseDir().mkdir('sequence', autoIncrement=True)
+    task = None
+    trials = []
+    for i in range(nTrials):
+        start = time.time()
+        cmd = clampCommand(-10e-3 * (1 + (i % 5)))
+        cmd['Camera'] = cameraCommand()
+        dh = seqDir.mkdir('%03d' % i, info={'dirType': 'Protocol'})
+        cmd['protocol']['storeData'] = True
+        cmd['protocol']['storageDir'] = dh
+        cmd['protocol']['timeout'] = None
+        task = man.prepareTask(cmd, task)
+        created = time.time()
+
+        ## execute and poll as TaskRunner does
+        task.execute(block=False)
+        started = time.time()
+        endTime = task.startTime + SWEEP_DURATION
+        polls = 0
+        while not task.isDone():
+            polls += 1
+            time.sleep(np.clip((endTime - time.time()) * 0.5, 1e-3, 20e-3))
+        done = time.time()
+        task.getResult()
+        stored = time.time()
+
+        for name in dh.ls():
+            fh = dh[name]
+            if fh.isFile():
+                fh.read()
+
+        phases = OrderedDict([('create', created - start)])
+        phases.update(task.phaseTimes)
+        phases['isDone'] = done - started
+        phases['isDonePolls'] = polls
+        phases['readResult'] = time.time() - stored
+        phases['total'] = time.time() - start
+        trials.append(phases)
+
+    man.getDevice('Camera').stop(block=True)
+    return OrderedDict([('name', 'sequence'), ('trials', nTrials), ('duration', SWEEP_DURATION),
+                        ('phases', summarize(trials))])
+
+
+def cameraBench(man, duration):
+    cam = man.getDevice('Camera')
+    frames = []
+    def newFrame(frame):
+        frames.append(frame.info()['id'])
+    cam.acqThread.connectCallback(newFrame)
+    cam.start(block=True)
+    start = time.time()
+    while time.time() - start < duration:
+        QtGui.QApplication.processEvents()
+        time.sleep(5e-3)
+    cam.stop(block=True)
+    cam.acqThread.disconnectCallback(newFrame)
+    ids = np.array(frames)
+    dropped = int((np.diff(ids) - 1).sum()) if len(ids) > 1 else 0
+    return OrderedDict([('name', 'camera'), ('duration', duration), ('sensorSize', list(cam.getParam('sensorSize'))),
+                        ('frameRate', cam.frameRate()), ('frames', len(frames)), ('fps', len(frames) / duration),
+                        ('dropped', dropped)])
+
+
+if __name__ == '__main__':
+    nTrials = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    output = sys.argv[2] if len(sys.argv) > 2 else None
+    app = pg.mkQApp()
+    tmp = tempfile.mkdtemp()
+    try:
+        cfgFile = os.path.join(tmp, 'default.cfg')
+        open(cfgFile, 'w').write(CONFIG)
+        from acq4 import __version__
+        from acq4.Manager import Manager
+        man = Manager(configFile=cfgFile, argv=[])
+        man.setBaseDir(tmp)
+
+        report = OrderedDict([
+            ('version', __version__),
+            ('python', platform.python_version()),
+            ('numpy', np.__version__),
+            ('platform', platform.platform()),
+            ('time', time.strftime('%Y-%m-%d %H:%M:%S')),
+            ('runs', [runTaskBench(man, nTrials), sequenceBench(man, nTrials), cameraBench(man, CAMERA_DURATION)]),
+        ])
+        man.quit()
+    finally:
+        shutil.rmtree(tmp)
+
+    text = json.dumps(report, indent=2)
+    if output is None:
+        print(text)
+    else:
+        open(output, 'w').write(text)
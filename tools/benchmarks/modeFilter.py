@@ -0,0 +1,62 @@
+"""
+Benchmark for acq4.util.functions.modeFilter.
+
+A drifting, noisy trace (10 kHz) of each length is filtered with the default
+parameters (500-sample windows every 250 samples) by:
+
+  loop        previous implementation (one np.histogram call per window)
+  current     modeFilter (all windows histogrammed at once, see windowModes)
+
+Both must return identical results.
+
+Usage:  python tools/benchmarks/modeFilter.py [maxSeconds]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import acq4.util.functions as fn
+
+RATE = 10000
+
+
+def legacyModeFilter(data, window=500, step=None, bins=None):
+    """Previous modeFilter (one mode() call per window)."""
+    vals = []
+    l2 = int(window/2.)
+    if step is None:
+        step = l2
+    i = 0
+    while True:
+        if i > len(data)-step:
+            break
+        vals.append(fn.mode(data[i:i+window], bins))
+        i += step
+    chunks = [np.linspace(vals[0], vals[0], l2)]
+    for i in range(len(vals)-1):
+        chunks.append(np.linspace(vals[i], vals[i+1], step))
+    remain = len(data) - step*(len(vals)-1) - l2
+    chunks.append(np.linspace(vals[-1], vals[-1], remain))
+    return np.hstack(chunks)
+
+
+def timeit(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    maxSeconds = float(sys.argv[1]) if len(sys.argv) > 1 else 600
+    np.random.seed(0)
+    print("trace length         loop       current")
+    for seconds in [1, 10, 60, 600, 1800]:
+        if seconds > maxSeconds:
+            break
+        n = int(seconds * RATE)
+        data = np.cumsum(np.random.normal(size=n)) * 0.1 + np.random.normal(size=n) * 10
+        ref, tLoop = timeit(lambda: legacyModeFilter(data))
+        out, t = timeit(lambda: fn.modeFilter(data))
+        assert np.all(out == ref)
+        print("%5d s (%8d)  %7.3f s   %7.3f s   %5.1fx" % (seconds, n, tLoop, t, tLoop / t))
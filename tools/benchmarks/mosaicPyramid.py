@@ -0,0 +1,87 @@
+"""
+Benchmark for opening a large mosaic in the MosaicEditor canvas, with and
+without cached image pyramids (ImageCanvasItem.usePyramid).
+
+A grid of synthetic camera tiles is written to a temporary data directory.
+Each configuration runs in its own subprocess, adds every tile to a Canvas,
+auto-ranges the view and renders it once. We report the time to first render
+and the peak resident memory of the process:
+
+  full          every tile is read at full resolution (previous behavior)
+  pyramid-cold  pyramids are built and cached on first open
+  pyramid-warm  pyramids are loaded from the cache
+
+Usage:  python tools/benchmarks/mosaicPyramid.py [nTiles] [tileSize]
+"""
+import os, sys, time, resource, subprocess, tempfile, shutil
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+
+def maxRss():
+    ## kB on linux, bytes on OSX
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / 1024. if sys.platform == 'darwin' else r
+
+
+def makeTiles(dataDir, nTiles, size):
+    import numpy as np
+    import acq4.util.DataManager as DataManager
+    from acq4.util.metaarray import MetaArray
+    dh = DataManager.getDirHandle(dataDir)
+    nCols = int(np.ceil(nTiles**0.5))
+    pxSize = 1e-6
+    x = np.linspace(-1, 1, size)
+    shading = np.exp(-(x[:, None]**2 + x[None, :]**2))
+    for i in range(nTiles):
+        img = (shading * 2000 + np.random.normal(size=(size, size), scale=100, loc=500)).astype(np.uint16)
+        pos = ((i % nCols) * size * pxSize * 0.9, (i // nCols) * size * pxSize * 0.9, 0)
+        tr = {'pos': pos, 'scale': (pxSize, pxSize, 1), 'angle': 0, 'axis': (0, 0, 1)}
+        dh.writeFile(MetaArray(img), 'tile_%03d.ma' % i, info={'transform': tr})
+
+
+def run(mode, dataDir, cacheDir):
+    import acq4.pyqtgraph as pg
+    import acq4.util.DataManager as DataManager
+    from acq4.util import imagePyramid
+    from acq4.util.Canvas.Canvas import Canvas
+    from acq4.util.Canvas.items.ImageCanvasItem import ImageCanvasItem
+
+    app = pg.mkQApp()
+    imagePyramid.setCacheDir(cacheDir)
+    ImageCanvasItem.usePyramid = mode != 'full'
+    dh = DataManager.getDirHandle(dataDir)
+    files = [dh[f] for f in sorted(dh.ls()) if f.endswith('.ma')]
+    canvas = Canvas()
+    canvas.resize(1000, 800)
+    canvas.show()
+    app.processEvents()
+
+    base = maxRss()
+    start = time.time()
+    for fh in files:
+        canvas.addFile(fh)
+    canvas.view.autoRange()
+    canvas.ui.view.repaint()
+    app.processEvents()
+    dt = time.time() - start
+    print("%-13s  %4d tiles   first render: %7.2f s   peak memory: +%8.1f MB" % (
+        mode, len(files), dt, (maxRss() - base) / 1024.))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run(*sys.argv[2:5])
+        sys.exit(0)
+    nTiles = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    tmp = tempfile.mkdtemp()
+    try:
+        dataDir = os.path.join(tmp, 'data')
+        cacheDir = os.path.join(tmp, 'cache')
+        os.makedirs(dataDir)
+        makeTiles(dataDir, nTiles, size)
+        for mode in ('full', 'pyramid-cold', 'pyramid-warm'):
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), '--run', mode, dataDir, cacheDir])
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,118 @@
+"""
+Benchmark for loading and replaying MultiPatch log files.
+
+A synthetic log is generated for several pipettes over a multi-hour session
+(a move every few seconds per pipette, plus other events). We report:
+
+  load       time for MultiPatchLog.read()
+  legacy     positions of all pipettes at random times, looked up one at a
+             time with the previous list-based IrregularTimeSeries
+  state      the same, using MultiPatchLog.state() (one lookup per device)
+  positions  the same, using one vectorized MultiPatchLog.positions() call
+
+Usage:  python tools/benchmarks/multipatchLog.py [hours] [nPipettes] [nLookups]
+"""
+import os, sys, time, json, tempfile, shutil
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+from acq4.modules.MultiPatch.logfile import MultiPatchLog
+
+
+class LegacyTimeSeries(object):
+    """Lookup portion of the previous IrregularTimeSeries (list of events
+    with a 1-second index table)."""
+    def __init__(self, data, resolution=1.0):
+        self.events = []
+        self.index = []
+        self._resolution = resolution
+        self._startTime = data[0][0]
+        for t, v in data:
+            i = int((t - self._startTime) / resolution)
+            dif = i + 1 - len(self.index)
+            if dif > 0:
+                self.index.extend([len(self.events)] * dif)
+            self.index[i] = len(self.events)
+            self.events.append((float(t), v))
+
+    def __getitem__(self, time):
+        events = self.events
+        if time <= self._startTime:
+            return None
+        if time >= events[-1][0]:
+            return events[-1][1]
+        i = self.index[min(int((time - self._startTime) / self._resolution), len(self.index)-1)]
+        if events[i][0] > time:
+            while events[i][0] > time:
+                i -= 1
+        elif events[i][0] < time:
+            while i+1 < len(events) and events[i+1][0] <= time:
+                i += 1
+        else:
+            return events[i][1]
+        t1, v1 = events[i]
+        t2, v2 = events[i+1]
+        s = (time - t1) / (t2 - t1)
+        return tuple([v1[k] * (1.0 - s) + v2[k] * s for k in range(len(v1))])
+
+
+def makeLog(fileName, hours, nPipettes):
+    """Write a synthetic log and return the number of events."""
+    t0 = 1.5e9
+    events = []
+    for i in range(nPipettes):
+        dev = 'Pipette%d' % (i + 1)
+        t = t0 + np.random.uniform(0, 5)
+        pos = np.random.normal(size=3) * 1e-3
+        end = t0 + hours * 3600
+        while t < end:
+            events.append({'device': dev, 'event': 'move_start', 'event_time': t})
+            t += np.random.uniform(0.2, 2)
+            pos = pos + np.random.normal(size=3) * 1e-5
+            events.append({'device': dev, 'event': 'move_stop', 'event_time': t, 'position': list(pos)})
+            if np.random.random() < 0.05:
+                events.append({'device': dev, 'event': 'state_changed', 'event_time': t, 'state': 'bath'})
+            t += np.random.exponential(5)
+    events.sort(key=lambda ev: ev['event_time'])
+    with open(fileName, 'w') as fh:
+        for ev in events:
+            fh.write(json.dumps(ev) + ',\n')
+    return len(events)
+
+
+def timeit(fn):
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 4.0
+    nPipettes = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    nLookups = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    tmp = tempfile.mkdtemp()
+    try:
+        fileName = os.path.join(tmp, 'MultiPatch_000.log')
+        nEvents = makeLog(fileName, hours, nPipettes)
+        log, dt = timeit(lambda: MultiPatchLog(fileName))
+        print("%d events, %d pipettes, %0.1f hours" % (nEvents, nPipettes, hours))
+        print("load       %8.3f s" % dt)
+
+        times = np.random.uniform(log.firstTime(), log.lastTime(), nLookups)
+        devs = log.devices()
+        legacy = dict([(d, LegacyTimeSeries(log._devices[d]['position'].events)) for d in devs])
+        leg, dt = timeit(lambda: [[legacy[d][t] for d in devs] for t in times])
+        print("legacy     %8.3f s   %9.0f lookups/s" % (dt, nLookups * len(devs) / dt))
+        st, dt = timeit(lambda: [log.state(t) for t in times])
+        print("state      %8.3f s   %9.0f lookups/s" % (dt, nLookups * len(devs) / dt))
+        pos, dt = timeit(lambda: log.positions(times))
+        print("positions  %8.3f s   %9.0f lookups/s" % (dt, nLookups * len(devs) / dt))
+
+        ## check that all methods agree
+        for j, d in enumerate(devs):
+            a = np.array([[np.nan] * 3 if x[j] is None else x[j] for x in leg])
+            b = np.array([[np.nan] * 3 if x[d]['position'] is None else x[d]['position'] for x in st])
+            assert np.allclose(a, b, equal_nan=True) and np.allclose(b, pos[d], equal_nan=True)
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,115 @@
+"""
+Benchmark for pyqtgraph.multiprocess.Parallelize task scheduling and result
+transfer.
+
+Scheduling: tasks with uneven cost (busy loops) are run with static
+(round-robin, the previous behavior) and dynamic scheduling:
+
+  lognormal   task durations drawn from a heavy-tailed distribution
+  periodic    every nth task (n = number of workers) is 20x more expensive,
+              so round-robin gives all expensive tasks to one worker
+
+We report the wall time of each, and the ideal time (total work / workers).
+
+Results: each task returns a large array, which is either appended to a
+proxied list (sent back through the pipe) or written into an array created
+with Parallelize.sharedArray().
+
+Repeated maps: Parallelize.map() is called many times on short task lists,
+either forking workers for every call or reusing a persistent WorkerPool.
+
+Usage:  python tools/benchmarks/parallelize.py [workers] [nTasks]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+from acq4.pyqtgraph.multiprocess import Parallelize, WorkerPool
+
+
+def work(duration):
+    ## keep one CPU busy for *duration* seconds
+    stop = time.time() + duration
+    while time.time() < stop:
+        pass
+
+
+def runTasks(durations, workers, schedule):
+    done = []
+    start = time.time()
+    with Parallelize(tasks=list(enumerate(durations)), workers=workers, schedule=schedule, done=done) as tasker:
+        for i, dur in tasker:
+            work(dur)
+            tasker.done.append(i)
+    dt = time.time() - start
+    assert sorted(done) == list(range(len(durations)))
+    return dt
+
+
+def runResults(nTasks, workers, size, shared):
+    start = time.time()
+    if shared:
+        out = Parallelize.sharedArray((nTasks, size))
+        with Parallelize(tasks=range(nTasks), workers=workers, out=out) as tasker:
+            for i in tasker:
+                tasker.out[i] = np.arange(size) * i
+    else:
+        results = []
+        with Parallelize(tasks=range(nTasks), workers=workers, results=results) as tasker:
+            for i in tasker:
+                tasker.results.append((i, np.arange(size) * i))
+        out = np.empty((nTasks, size))
+        for i, r in results:
+            out[i] = r
+    dt = time.time() - start
+    assert np.all(out[:, 1] == np.arange(nTasks))
+    return dt
+
+
+def square(x):
+    return x * x
+
+
+def runMaps(nCalls, nTasks, workers, persistent):
+    start = time.time()
+    if persistent:
+        with WorkerPool(workers=workers) as pool:
+            for i in range(nCalls):
+                out = Parallelize.map(square, range(nTasks), pool=pool)
+    else:
+        for i in range(nCalls):
+            out = Parallelize.map(square, range(nTasks), workers=workers)
+    dt = time.time() - start
+    assert out == [x * x for x in range(nTasks)]
+    return dt
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    nTasks = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    np.random.seed(0)
+    workloads = {
+        'lognormal': np.random.lognormal(sigma=1.5, size=nTasks),
+        'periodic': np.where(np.arange(nTasks) % workers == 0, 20.0, 1.0),
+    }
+    print("%d workers, %d tasks" % (workers, nTasks))
+    for name in ('lognormal', 'periodic'):
+        durations = workloads[name] * (4.0 / workloads[name].sum()) * workers  ## ~4 s of ideal wall time
+        ideal = durations.sum() / workers
+        static = runTasks(durations, workers, 'static')
+        dynamic = runTasks(durations, workers, 'dynamic')
+        print("%-10s ideal %6.2f s   static %6.2f s   dynamic %6.2f s   (%.2fx)" % (
+            name, ideal, static, dynamic, static / dynamic))
+
+    size = 1000000
+    pipe = runResults(nTasks, workers, size, shared=False)
+    shared = runResults(nTasks, workers, size, shared=True)
+    print("results    %d x %d floats:  pipe %6.2f s   shared %6.2f s   (%.1fx)" % (
+        nTasks, size, pipe, shared, pipe / shared))
+
+    nCalls = 200
+    forked = runMaps(nCalls, nTasks, workers, persistent=False)
+    pooled = runMaps(nCalls, nTasks, workers, persistent=True)
+    print("maps       %d x %d tasks:  forked %6.2f s   pool %6.2f s   (%.1fx)" % (
+        nCalls, nTasks, forked, pooled, forked / pooled))
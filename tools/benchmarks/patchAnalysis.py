@@ -0,0 +1,158 @@
+"""
+Benchmark for the Patch module's per-frame analysis handling over a simulated
+2-hour recording at 20 test pulses per second.
+
+Test pulse analysis values resembling those of the MockClamp model cell are
+generated for every frame. At several points in the session we time the work
+done in the GUI thread for one frame (storing the analysis values, updating
+and repainting the six analysis plots, and recording to disk):
+
+  legacy    Python lists, full re-plot of every point, and a one-row
+            MetaArray appended to the file on every frame (the previous
+            PatchWindow behavior)
+  buffered  AnalysisBuffer, decimated plots, and an AnalysisWriter
+            flushing to the file from a background thread
+
+Usage:  python tools/benchmarks/patchAnalysis.py [hours] [rate_Hz]
+"""
+import os, sys, time, tempfile, shutil
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import acq4.pyqtgraph as pg
+from acq4.util.metaarray import MetaArray
+from acq4.modules.Patch.AnalysisBuffer import AnalysisBuffer, AnalysisWriter
+
+app = pg.mkQApp()
+
+UNITS = {
+    'inputResistance': 'Ohm',
+    'accessResistance': 'Ohm',
+    'capacitance': 'F',
+    'restingPotential': 'V',
+    'restingCurrent': 'A',
+    'fitError': '',
+}
+
+
+def analysis(i):
+    """Return analysis values for frame *i* of a slowly drifting model cell."""
+    drift = 1 + 0.1 * np.sin(i * 1e-4)
+    return {
+        'inputResistance': 200e6 * drift + np.random.normal(scale=2e6),
+        'accessResistance': 10e6 / drift + np.random.normal(scale=0.2e6),
+        'capacitance': 20e-12 + np.random.normal(scale=0.2e-12),
+        'restingPotential': -65e-3 + np.random.normal(scale=0.5e-3),
+        'restingCurrent': -20e-12 * drift + np.random.normal(scale=1e-12),
+        'fitError': abs(np.random.normal(scale=1e-3)),
+    }
+
+
+class Window(object):
+    def __init__(self, decimate):
+        self.win = pg.GraphicsLayoutWidget()
+        self.win.resize(800, 1000)
+        self.curves = {}
+        for k in UNITS:
+            p = self.win.addPlot()
+            self.win.nextRow()
+            if decimate:
+                self.curves[k] = p.plot(autoDownsample=True, downsampleMethod='peak', clipToView=True)
+            else:
+                self.curves[k] = p.plot()
+        self.win.show()
+
+    def repaint(self):
+        self.win.repaint()
+        app.processEvents()
+
+
+class Legacy(object):
+    def __init__(self, fileName):
+        self.win = Window(decimate=False)
+        self.fileName = fileName
+        self.data = dict([(k, []) for k in UNITS])
+        self.data['time'] = []
+
+    def fill(self, n, dt):
+        i0 = len(self.data['time'])
+        for i in range(i0, n):
+            vals = analysis(i)
+            for k in UNITS:
+                self.data[k].append(vals[k])
+            self.data['time'].append(i * dt)
+
+    def frame(self, i, dt):
+        vals = analysis(i)
+        for k in UNITS:
+            self.data[k].append(vals[k])
+        self.data['time'].append(i * dt)
+        for k in UNITS:
+            self.win.curves[k].setData(self.data['time'], self.data[k])
+        info = [{'name': 'Time', 'values': self.data['time'][-1:], 'units': 's'},
+                {'name': 'Value', 'cols': [{'name': k, 'units': UNITS[k]} for k in UNITS]}]
+        arr = MetaArray((1, len(UNITS)), dtype=float, info=info)
+        for k in UNITS:
+            arr[:, k] = self.data[k][-1:]
+        arr.write(self.fileName, appendAxis='Time')
+        self.win.repaint()
+
+    def finish(self):
+        pass
+
+
+class Buffered(object):
+    def __init__(self, fileName):
+        self.win = Window(decimate=True)
+        self.data = AnalysisBuffer(UNITS.keys(), units=UNITS)
+        self.fileName = fileName
+        self.writer = None
+
+    def fill(self, n, dt):
+        for i in range(len(self.data), n):
+            self.data.append(i * dt, analysis(i))
+
+    def frame(self, i, dt):
+        self.data.append(i * dt, analysis(i))
+        if self.writer is None:
+            self.data.makeArray().write(self.fileName, appendAxis='Time')
+            self.writer = AnalysisWriter(self.data, self.fileName, start=len(self.data))
+            self.writer.start()
+        for k in UNITS:
+            self.win.curves[k].setData(self.data.time(), self.data.column(k))
+        self.win.repaint()
+
+    def finish(self):
+        self.writer.stop(block=True)
+
+
+def bench(cls, hours, rate, nFrames=20):
+    tmp = tempfile.mkdtemp()
+    try:
+        obj = cls(os.path.join(tmp, 'patch.ma'))
+        dt = 1.0 / rate
+        print(cls.__name__)
+        for minutes in (1, 10, 30, 60, 120):
+            if minutes > hours * 60:
+                break
+            n = int(minutes * 60 * rate)
+            obj.fill(n, dt)
+            times = []
+            for i in range(nFrames):
+                start = time.time()
+                obj.frame(n + i, dt)
+                times.append(time.time() - start)
+            obj.fill(n + nFrames, dt)
+            print("  %4d min (%6d frames):  median frame time %7.2f ms   max %7.2f ms" % (
+                minutes, n, np.median(times) * 1e3, np.max(times) * 1e3))
+        obj.finish()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    for cls in (Legacy, Buffered):
+        bench(cls, hours, rate)
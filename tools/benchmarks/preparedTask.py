@@ -0,0 +1,97 @@
+"""
+Benchmark for repeated task execution with Manager.createTask() versus
+Manager.prepareTask(), using the mock DAQ and MockClamp devices.
+
+A Manager is started with a minimal configuration containing only a mock
+NiDAQ and a MockClamp. We then run test pulse sweeps as the Patch module does
+(and as TaskRunner does for a sequence), and report the achieved sweep rate
+and the time spent per sweep beyond the requested task duration:
+
+  create          a new Task for every sweep (previous behavior)
+  prepare         one Task, updated for every sweep with an identical command
+  prepare-seq     one Task, with a different pulse amplitude on every sweep
+                  (the command waveform is rewritten each time)
+
+Note that the mock clamp simulation runs on every sweep in all modes.
+
+Usage:  python tools/benchmarks/preparedTask.py [nSweeps] [duration_ms]
+"""
+import os, sys, time, tempfile, shutil
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import acq4.pyqtgraph as pg
+
+CONFIG = """
+devices:
+    DAQ:
+        driver: 'NiDAQ'
+        mock: True
+        defaultAIMode: 'NRSE'
+    Clamp1:
+        driver: 'MockClamp'
+        simulator: 'builtin'
+        Command:
+            device: 'DAQ'
+            channel: '/Dev1/ao0'
+            type: 'ao'
+        ScaledSignal:
+            device: 'DAQ'
+            channel: '/Dev1/ai5'
+            mode: 'NRSE'
+            type: 'ai'
+        icHolding: 0.0
+        vcHolding: -65e-3
+"""
+
+
+def makeCommand(duration, amplitude, rate=400000, downsample=10):
+    numPts = int(duration * rate)
+    holding = -65e-3
+    cmdData = np.empty(numPts)
+    cmdData[:] = holding
+    start = int(duration / 3. * rate)
+    cmdData[start:start*2] = holding + amplitude
+    return {
+        'protocol': {'duration': duration},
+        'DAQ': {'rate': rate, 'numPts': numPts, 'downsample': downsample},
+        'Clamp1': {'mode': 'vc', 'command': cmdData, 'holding': holding},
+    }
+
+
+def bench(man, mode, nSweeps, duration):
+    task = None
+    times = []
+    for i in range(nSweeps + 1):
+        amp = -10e-3 * (1 + (i % 5)) if mode == 'prepare-seq' else -10e-3
+        start = time.time()
+        cmd = makeCommand(duration, amp)
+        if mode == 'create':
+            task = man.createTask(cmd)
+        else:
+            task = man.prepareTask(cmd, task)
+        task.execute(processEvents=False)
+        task.getResult()
+        if i > 0:  ## first sweep includes device setup in all modes
+            times.append(time.time() - start)
+    times = np.array(times)
+    print("%-12s  %7.1f sweeps/s   overhead per sweep: median %6.2f ms   max %6.2f ms" % (
+        mode, len(times) / times.sum(), np.median(times - duration) * 1e3, np.max(times - duration) * 1e3))
+
+
+if __name__ == '__main__':
+    nSweeps = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    duration = float(sys.argv[2]) * 1e-3 if len(sys.argv) > 2 else 30e-3
+    app = pg.mkQApp()
+    tmp = tempfile.mkdtemp()
+    try:
+        cfgFile = os.path.join(tmp, 'default.cfg')
+        open(cfgFile, 'w').write(CONFIG)
+        from acq4.Manager import Manager
+        man = Manager(configFile=cfgFile, argv=[])
+        for mode in ('create', 'prepare', 'prepare-seq'):
+            bench(man, mode, nSweeps, duration)
+        man.quit()
+    finally:
+        shutil.rmtree(tmp)
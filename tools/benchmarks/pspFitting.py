@@ -0,0 +1,68 @@
+"""
+Benchmark for PSP event fitting: serial functions.fitPsp versus the batched
+functions.fitPspBatch (with 1 and N worker processes).
+
+Synthetic events with random amplitude, rise and decay are fit with the same
+guesses and bounds that EventFitter generates. We report events/s for each
+method and compare the batched fit quality against the serial fits.
+
+Usage:  python tools/benchmarks/pspFitting.py [nEvents] [nWorkers]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import acq4.util.functions as functions
+
+
+def makeEvents(nEvents, dt=1e-4):
+    xs, ys, guesses, bounds = [], [], [], []
+    for i in range(nEvents):
+        n = np.random.randint(30, 200)
+        t = np.arange(n) * dt + 0.1 * i
+        amp = -np.random.uniform(10e-12, 80e-12)
+        rise = np.random.uniform(0.3e-3, 1e-3)
+        decay = np.random.uniform(3e-3, 10e-3)
+        start = t[0] + np.random.uniform(0, 1e-3)
+        y = functions.pspFunc([amp, start, rise, decay], t) + np.random.normal(scale=2e-12, size=n)
+
+        guessLen = n * dt
+        guess = [amp * 2, t[0], guessLen / 4., guessLen / 2.]
+        bound = [
+            sorted((guess[0] * 0.1, guess[0])),
+            sorted((guess[1] - min(guess[2], 0.01), guess[1] + guess[2] * 2)),
+            sorted((dt * 0.5, guess[3])),
+            sorted((dt * 0.5, guess[3] * 50.)),
+        ]
+        xs.append(t)
+        ys.append(y)
+        guesses.append(guess)
+        bounds.append(bound)
+    return xs, ys, guesses, bounds
+
+
+def fitError(xs, ys, fits):
+    return np.array([((ys[i] - functions.pspFunc(list(fits[i]), xs[i]))**2).sum() for i in range(len(xs))])
+
+
+if __name__ == '__main__':
+    nEvents = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    nWorkers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    np.random.seed(0)
+    xs, ys, guesses, bounds = makeEvents(nEvents)
+
+    start = time.time()
+    serial = np.array([functions.fitPsp(xs[i], ys[i], guess=list(guesses[i]), bounds=bounds[i]) for i in range(nEvents)])
+    tSerial = time.time() - start
+    print("serial fitPsp:          %8.1f events/s" % (nEvents / tSerial))
+
+    for workers in (1, nWorkers):
+        start = time.time()
+        batch = functions.fitPspBatch(xs, ys, guesses, bounds, workers=workers)
+        dt = time.time() - start
+        print("fitPspBatch (%2d procs): %8.1f events/s  (%0.1fx)" % (workers, nEvents / dt, tSerial / dt))
+
+    ratio = fitError(xs, ys, batch) / fitError(xs, ys, serial)
+    print("batch / serial fit error:  median %0.4f   worse by >5%%: %d   better by >5%%: %d" % (
+        np.median(ratio), (ratio > 1.05).sum(), (ratio < 0.95).sum()))
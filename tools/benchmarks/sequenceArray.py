@@ -0,0 +1,96 @@
+"""
+Benchmark for PatchEPhys.buildSequenceArray.
+
+A synthetic protocol sequence is written to a temporary directory the way
+TaskRunner stores it: one directory per point of a 25 x 20 parameter space
+(500 points), each holding a Clamp1.ma recording. We time loading the
+primary channel of every recording into one array with:
+
+  legacy      previous implementation (func and info() called on each
+              directory in turn)
+  serial      buildSequenceArray (indices resolved from the directory names)
+  threads N   buildSequenceArray(..., workers=N)
+
+Local disks usually serve the files from the page cache, which hides the
+per-file open latency that dominates on network drives. A latency (in ms)
+can be given to add a delay to each file read in all variants.
+
+Usage:  python tools/benchmarks/sequenceArray.py [latency_ms] [nPoints]
+"""
+import os, sys, time, tempfile, shutil
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+from collections import OrderedDict
+import acq4.util.DataManager as DataManager
+from acq4.util.metaarray import MetaArray
+from acq4.analysis.dataModels import PatchEPhys
+
+NPTS = 10000
+
+
+def makeSequence(baseDir, nPoints):
+    """Write a 2D sequence of nPoints recordings; return its DirHandle."""
+    n1 = 25
+    n2 = nPoints // n1
+    params = OrderedDict([(('Clamp1', 'amp'), range(n1)), (('Clamp1', 'offset'), range(n2))])
+    seq = DataManager.getDirHandle(baseDir).mkdir('seq', info={'dirType': 'ProtocolSequence', 'sequenceParams': params})
+    info = [{'name': 'Channel', 'cols': [{'name': 'primary', 'units': 'A'}, {'name': 'secondary', 'units': 'V'}]},
+            {'name': 'Time', 'units': 's', 'values': np.arange(NPTS) * 1e-4}, {}]
+    for i in range(n1):
+        for j in range(n2):
+            dh = seq.mkdir('%03d_%03d' % (i, j), info={'dirType': 'Protocol', ('Clamp1', 'amp'): i, ('Clamp1', 'offset'): j})
+            data = MetaArray(np.random.normal(size=(2, NPTS)).astype(np.float32), info=info)
+            dh.writeFile(data, 'Clamp1.ma')
+    return seq
+
+
+def legacyBuild(dh, func):
+    """Previous buildSequenceArray fill loop (join=True, truncate=False)."""
+    params = PatchEPhys.listSequenceParams(dh)
+    subDirs = dh.subDirs()
+    seqShape = tuple([len(p) for p in params.itervalues()])
+    first = func(dh[subDirs[0]])
+    data = np.empty(seqShape + first.shape, first.dtype)
+    for name in subDirs:
+        subd = dh[name]
+        d = func(subd)
+        dhInfo = subd.info()
+        ind = []
+        for k in params:
+            ind.append(dhInfo[k])
+        data[tuple(ind)] = d
+    return data
+
+
+def timeit(fn):
+    DataManager.cleanup()
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    latency = float(sys.argv[1]) * 1e-3 if len(sys.argv) > 1 else 0.
+    nPoints = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    np.random.seed(0)
+
+    def readPrimary(protoDir):
+        if latency > 0:
+            time.sleep(latency)
+        return PatchEPhys.getClampFile(protoDir).read()['Channel': 'primary'].asarray()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        seq = makeSequence(tmp, nPoints)
+        ref, tLegacy = timeit(lambda: legacyBuild(seq, readPrimary))
+        print("%d-point sequence, %d samples per recording, %g ms added latency" % (ref.shape[0] * ref.shape[1], NPTS, latency * 1e3))
+        print("    legacy      %7.3f s" % tLegacy)
+        for workers in [None, 2, 4, 8, 16]:
+            data, t = timeit(lambda: PatchEPhys.buildSequenceArray(seq, readPrimary, workers=workers))
+            assert np.all(data.asarray() == ref)
+            name = 'serial' if workers is None else 'threads %d' % workers
+            print("    %-10s  %7.3f s   %5.1fx" % (name, t, tLegacy / t))
+    finally:
+        shutil.rmtree(tmp)
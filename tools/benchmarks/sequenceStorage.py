@@ -0,0 +1,113 @@
+"""
+Benchmark for storing and loading task sequences with the per-trial directory
+layout and with a single-file SequenceContainer.
+
+A synthetic sequence is written the way Manager.Task stores TaskRunner
+results: for every trial a directory is created with the sequence parameters
+as meta info, the task start time is added with setInfo(), and the clamp
+recording (2 channels, MetaArray, as returned by DAQGeneric) is written with
+writeFile(). The sequence is then loaded back through the DataManager as
+analysis code does (list trials, read each trial's info and data):
+
+  write      time to create and store all trials
+  load       time to read every trial through DirHandle / FileHandle, with
+             an empty handle cache
+  bulk       (container only) SequenceContainer.readSequence(), which returns
+             the whole sequence as one array
+
+Usage:  python tools/benchmarks/sequenceStorage.py [nTrials] [nPts]
+"""
+import os, sys, time, tempfile, shutil
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import acq4.pyqtgraph as pg
+import acq4.util.DataManager as DataManager
+from acq4.util.SequenceContainer import SequenceContainer
+from acq4.util.metaarray import MetaArray, axis
+
+
+def makeRecording(nPts, amp, startTime):
+    data = np.empty((2, nPts), dtype=np.float32)
+    data[0] = np.random.normal(size=nPts) * 10e-12 + amp
+    data[1] = -65e-3
+    info = [
+        axis(name='Channel', cols=[('primary', 'A'), ('command', 'V')]),
+        axis(name='Time', units='s', values=np.arange(nPts) * 1e-4),
+        {'DAQ': {'primary': {'rate': 10000., 'numPts': nPts, 'startTime': startTime, 'downsample': 1}},
+         'Protocol': {'mode': 'vc', 'holding': -65e-3}, 'ClampState': {'mode': 'VC', 'LPF': 2000.}},
+    ]
+    return MetaArray(data, info=info)
+
+
+def dirSize(dirName):
+    return sum([os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(dirName) for f in files])
+
+
+def write(baseDir, layout, nTrials, nPts):
+    seqDir = baseDir.mkdir('sequence_' + layout, info={'dirType': 'ProtocolSequence'})
+    axes = [('Clamp1', 'amp')]
+    if layout == 'hdf5':
+        parent = SequenceContainer.create(seqDir, axes, [nTrials])
+    else:
+        parent = seqDir
+    np.random.seed(0)
+    recordings = [makeRecording(nPts, i * 10e-12, 1.5e9 + i) for i in range(nTrials)]
+    start = time.time()
+    for i in range(nTrials):
+        trial = parent.mkdir('%03d' % i, info={axes[0]: i, 'dirType': 'Protocol'})
+        trial.setInfo({'startTime': time.time()})
+        trial.writeFile(recordings[i], 'Clamp1')
+    if layout == 'hdf5':
+        parent.close()
+    return seqDir.name(), time.time() - start
+
+
+def load(seqPath):
+    DataManager.getDataManager().cache.clear()
+    start = time.time()
+    seqDir = DataManager.getDirHandle(seqPath)
+    data = []
+    for name in seqDir.subDirs():
+        trial = seqDir[name]
+        trial.info()
+        data.append(trial['Clamp1.ma'].read())
+    return data, time.time() - start
+
+
+def bulkLoad(seqPath):
+    DataManager.getDataManager().cache.clear()
+    start = time.time()
+    data = DataManager.getDirHandle(seqPath).sequenceContainer().readSequence('Clamp1.ma')
+    return data, time.time() - start
+
+
+if __name__ == '__main__':
+    nTrials = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    nPts = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    app = pg.mkQApp()
+    tmp = tempfile.mkdtemp()
+    try:
+        baseDir = DataManager.getDirHandle(tmp)
+        baseDir.createIndex()
+        mb = nTrials * 2 * nPts * 4 / 1e6
+        print("%d trials x 2 channels x %d samples (%0.1f MB)" % (nTrials, nPts, mb))
+        results = {}
+        for layout in ('directories', 'hdf5'):
+            seqPath, tWrite = write(baseDir, layout, nTrials, nPts)
+            data, tLoad = load(seqPath)
+            results[layout] = data
+            print("%-12s write %7.3f s (%6.1f trials/s, %6.1f MB/s)   load %7.3f s (%6.1f trials/s)   %7.1f MB on disk" % (
+                layout, tWrite, nTrials / tWrite, mb / tWrite, tLoad, nTrials / tLoad, dirSize(seqPath) / 1e6))
+        bulk, tBulk = bulkLoad(seqPath)
+        print("%-12s                                                bulk %7.3f s (%6.1f trials/s)" % ('', tBulk, nTrials / tBulk))
+
+        ## both layouts must return the same data
+        for a, b in zip(results['directories'], results['hdf5']):
+            assert np.array_equal(a.asarray(), b.asarray())
+            assert np.array_equal(a.xvals('Time'), b.xvals('Time'))
+            assert a.infoCopy(-1) == b.infoCopy(-1)
+        assert np.array_equal(bulk.asarray(), np.array([d.asarray() for d in results['hdf5']]))
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,95 @@
+"""
+Benchmark for spontaneous rate estimation in the MapAnalyzer module.
+
+A synthetic map is generated with the given number of stimulation sites
+(one protocol directory each, 0.5 s pre-stimulus period) and on average 2
+spontaneous events per site. We time, for each step of
+SpontRateAnalyzer.process:
+
+  rate        spontaneous rate and event amplitudes per site
+  mean        'Mean Window' filtering of the rates
+  median      'Median Window' filtering of the rates
+  gaussian    'Gaussian Window' filtering of the rates
+
+with the previous implementation (a boolean mask over all events / sites
+for each site) and the current one (SpontRateAnalyzer.measureSpontRate and
+windowFilter). Results of both must be identical.
+
+Usage:  python tools/benchmarks/spontRate.py [nSites]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+from acq4.analysis.modules.MapAnalyzer.MapAnalyzer import SpontRateAnalyzer
+
+STIM_TIME = 0.495
+WINDOW = 20.
+
+
+def makeMap(nSites):
+    """Return (sites, events) record arrays like those MapAnalyzer passes to SpontRateAnalyzer."""
+    sites = np.zeros(nSites, dtype=[('ProtocolDir', object), ('start', float), ('stop', float)])
+    sites['ProtocolDir'] = ['scan/%05d' % i for i in range(nSites)]
+    sites['start'] = np.cumsum(np.random.uniform(1.0, 3.0, size=nSites))
+    sites['stop'] = sites['start'] + 0.7
+    nEvents = np.random.poisson(2., size=nSites)
+    events = np.zeros(nEvents.sum(), dtype=[('ProtocolDir', object), ('fitTime', float), ('fitAmplitude', float)])
+    events['ProtocolDir'] = np.repeat(sites['ProtocolDir'], nEvents)
+    events['fitTime'] = np.random.uniform(0, 0.7, size=len(events))
+    events['fitAmplitude'] = np.random.normal(-20e-12, 5e-12, size=len(events))
+    events = events[events['fitTime'] < STIM_TIME]
+    return sites, events
+
+
+def legacyRate(sites, events, stimTime):
+    spontRate = []
+    amps = []
+    for site in sites:
+        ev = events[events['ProtocolDir'] == site['ProtocolDir']]
+        spontRate.append(len(ev) / stimTime)
+        amps.extend(ev['fitAmplitude'])
+    return np.array(spontRate), amps
+
+
+def legacyFilter(spontRate, sites, method, window):
+    filtered = np.empty(len(spontRate))
+    for i in xrange(len(spontRate)):
+        now = sites['start'][i]
+        start = now - window
+        stop = now + window
+        if method == 'Median Window':
+            mask = (sites['start'] > start) & (sites['start'] < stop)
+            filtered[i] = np.median(spontRate[mask])
+        if method == 'Mean Window':
+            mask = (sites['start'] > start) & (sites['start'] < stop)
+            filtered[i] = np.mean(spontRate[mask])
+        if method == 'Gaussian Window':
+            filtered[i] = SpontRateAnalyzer.gauss(spontRate, sites['start'], now, window)
+    return filtered
+
+
+def timeit(fn):
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    nSites = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    np.random.seed(0)
+    sites, events = makeMap(nSites)
+    print("%d sites, %d spontaneous events" % (nSites, len(events)))
+
+    (refRate, refAmps), tLegacy = timeit(lambda: legacyRate(sites, events, STIM_TIME))
+    (rate, amps), t = timeit(lambda: SpontRateAnalyzer.measureSpontRate(sites, events, STIM_TIME))
+    assert np.all(rate == refRate)
+    assert np.mean(amps) == np.mean(refAmps) and np.std(amps) == np.std(refAmps)
+    print("    %-9s legacy %8.3f s   current %8.3f s   %7.1fx" % ('rate', tLegacy, t, tLegacy / t))
+
+    for name, method in [('mean', 'Mean Window'), ('median', 'Median Window'), ('gaussian', 'Gaussian Window')]:
+        ref, tLegacy = timeit(lambda: legacyFilter(refRate, sites, method, WINDOW))
+        filtered, t = timeit(lambda: SpontRateAnalyzer.windowFilter(rate, sites['start'], method, WINDOW))
+        assert np.all(filtered == ref)
+        print("    %-9s legacy %8.3f s   current %8.3f s   %7.1fx" % (name, tLegacy, t, tLegacy / t))
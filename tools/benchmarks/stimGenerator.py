@@ -0,0 +1,144 @@
+"""
+Benchmark for generating command waveforms for a whole task sequence with
+StimGenerator.
+
+Two typical protocols are loaded into a StimGenerator widget:
+
+  iv          current-clamp IV: one 500 ms step sequenced over 41 amplitudes
+              (4 s sweeps at 40 kHz)
+  photostim   laser power: a 100-pulse train sequenced over 10 powers and
+              8 pulse widths (2 s sweeps at 100 kHz)
+
+For each we report the time to generate every waveform in the sequence:
+
+  legacy      previous StimGenerator.getSingle (namespace rebuilt and
+              function string evaluated for every point; per-pulse loops)
+  single      getSingle() for every point, empty cache
+  batch       getSequenceArray(), empty cache
+  cached      getSequenceArray() again, after switching to another rate
+              and back
+
+Usage:  python tools/benchmarks/stimGenerator.py
+"""
+import os, sys, time, types
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import numpy as np
+import acq4.pyqtgraph as pg
+import acq4.util.units as units
+from acq4.util.generator import waveforms
+from acq4.util.generator.StimGenerator import StimGenerator
+from acq4.util.SequenceRunner import runSequence
+
+PROTOCOLS = {
+    'iv': (40e3, 4.0, {
+        'advancedMode': True,
+        'function': 'pulse(1000*ms, 500*ms, amp)',
+        'params': {'amp': {'default': '-100*pA', 'sequence': 'range',
+                           'start': '-200*pA', 'stop': '200*pA', 'steps': 41}},
+    }),
+    'photostim': (100e3, 2.0, {
+        'advancedMode': True,
+        'function': 'pulse(times=100*ms + np.linspace(0, 10*ms * 99, 100), widths=width, values=power)',
+        'params': {'power': {'default': '10*mW', 'sequence': 'range',
+                             'start': '1*mW', 'stop': '20*mW', 'steps': 10},
+                   'width': {'default': '1*ms', 'sequence': 'range',
+                             'start': '0.5*ms', 'stop': '4*ms', 'steps': 8}},
+    }),
+}
+
+
+def legacyPulse(params, times, widths, values, base=0.0):
+    nPts = params['nPts']
+    rate = params['rate']
+    if not waveforms.isList(times):
+        times = [times]
+    if not waveforms.isList(widths):
+        widths = [widths] * len(times)
+    if not waveforms.isList(values):
+        values = [values] * len(times)
+    d = np.empty(nPts)
+    d[:] = base
+    for i in range(len(times)):
+        t1 = int(times[i] * rate)
+        wid = int(widths[i] * rate)
+        if wid == 0:
+            params['message'] = "WARNING: Pulse width %f is too short for rate %f" % (widths[i], rate)
+        if t1+wid >= nPts:
+            params['message'] = "WARNING: Function is longer than generated waveform."
+        d[t1:t1+wid] = values[i]
+    return d
+
+
+def legacySingle(sg, rate, nPts, params):
+    """Evaluation part of the previous StimGenerator.getSingle."""
+    ns = {}
+    arg = {'rate': rate, 'nPts': nPts}
+    ns.update(arg)
+    for i in dir(waveforms):
+        obj = getattr(waveforms, i)
+        if type(obj) is types.FunctionType:
+            ns[i] = sg.makeWaveFunction(i, arg)
+    ns['pulse'] = lambda *args, **kwargs: legacyPulse(arg, *args, **kwargs)
+    seq = sg.paramSpace()
+    for k in seq:
+        if k in params:
+            ns[k] = float(seq[k][1][params[k]])
+        else:
+            ns[k] = float(seq[k][0])
+    ns.update(units.allUnits)
+    ns.update(sg.extraParams)
+    ns['np'] = np
+    ret = eval(sg.functionString().replace('\n', ''), ns, {})
+    ret += sg.offset
+    sg.setError(arg.get('message', None))
+    return ret
+
+
+def sequencePoints(sg):
+    ps = sg.listSequences()
+    params = dict([(k, range(len(ps[k]))) for k in ps])
+    points = []
+    runSequence(lambda p: points.append(p), params, list(ps.keys()))
+    return points
+
+
+def timeit(fn):
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+
+def bench(name, rate, duration, state):
+    sg = StimGenerator()
+    sg.loadState(state)
+    nPts = int(rate * duration)
+    points = sequencePoints(sg)
+
+    leg, tLeg = timeit(lambda: [legacySingle(sg, rate, nPts, p) for p in points])
+    sg.clearCache()
+    single, tSingle = timeit(lambda: [sg.getSingle(rate, nPts, p) for p in points])
+    sg.clearCache()
+    batch, tBatch = timeit(lambda: sg.getSequenceArray(rate, nPts))
+    sg.getSequenceArray(rate / 2., nPts / 2)
+    cached, tCached = timeit(lambda: sg.getSequenceArray(rate, nPts))
+
+    ## all methods must generate the same waveforms
+    ref = dict([(tuple(sorted(p.items())), w) for p, w in zip(points, leg)])
+    assert all([np.array_equal(ref[tuple(sorted(p.items()))], w) for p, w in zip(points, single)])
+    names = list(sg.listSequences().keys())
+    for i, ind in enumerate(np.ndindex(*[len(v) for v in sg.listSequences().values()])):
+        assert np.array_equal(ref[tuple(sorted(zip(names, ind)))], batch[i])
+    assert np.array_equal(batch, cached)
+
+    n = len(points)
+    print("%-10s %4d waveforms x %7d samples" % (name, n, nPts))
+    for label, dt in [('legacy', tLeg), ('single', tSingle), ('batch', tBatch), ('cached', tCached)]:
+        print("    %-8s %8.3f s   %8.1f waveforms/s   %5.1fx" % (label, dt, n / dt, tLeg / dt))
+
+
+if __name__ == '__main__':
+    app = pg.mkQApp()
+    for name in ('iv', 'photostim'):
+        bench(name, *PROTOCOLS[name])
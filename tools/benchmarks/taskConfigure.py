@@ -0,0 +1,117 @@
+"""
+Benchmark for device configuration in Manager.Task.execute.
+
+A rig with two patch clamps, a camera, a laser, a scanner and a stage is
+simulated with mock devices whose configure() blocks for a typical hardware
+latency (as driver calls do). All devices except the stage must be configured
+before the DAQ. Like DAQGeneric devices, the clamps and the laser set holding
+values on the DAQ during configure(), which reserves the DAQ device.
+
+We report the time from execute() until all devices have started (reserve,
+configure and start) for:
+
+  serial      devices configured one at a time (the default)
+  parallel    independent devices configured concurrently (parallelConfigure=True)
+
+together with the per-device configure times recorded by the task.
+
+Usage:  python tools/benchmarks/taskConfigure.py [nTrials]
+"""
+import os, sys, time
+path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(path, '..', '..'))
+
+import acq4.pyqtgraph as pg
+from acq4.Manager import Task
+from acq4.devices.Device import Device, DeviceTask
+
+## device name: (configure time, holds DAQ channel, configured before DAQ)
+RIG = {
+    'Clamp1': (25e-3, True, True),
+    'Clamp2': (25e-3, True, True),
+    'Camera': (60e-3, False, True),
+    'Laser': (40e-3, True, True),
+    'Scanner': (15e-3, False, True),
+    'Stage': (10e-3, False, False),
+    'DAQ': (20e-3, False, False),
+}
+
+
+class MockManager(object):
+    def __init__(self):
+        self.devices = {}
+
+    def declareInterface(self, *args):
+        pass
+
+    def getDevice(self, name):
+        return self.devices[name]
+
+    def lockReserv(self):
+        pass
+
+    def unlockReserv(self):
+        pass
+
+
+class MockDevice(Device):
+    def __init__(self, dm, name, configTime, holdsDaq, beforeDaq):
+        Device.__init__(self, dm, {}, name)
+        self.configTime = configTime
+        self.holdsDaq = holdsDaq
+        self.beforeDaq = beforeDaq
+
+    def createTask(self, cmd, parentTask):
+        return MockDeviceTask(self, cmd, parentTask)
+
+    def setChannelValue(self, value):
+        ## like NiDAQ.setChannelValue: requires the device reservation
+        self.reserve(block=True)
+        try:
+            time.sleep(1e-3)
+        finally:
+            self.release()
+
+
+class MockDeviceTask(DeviceTask):
+    def getConfigOrder(self):
+        if self.dev.beforeDaq:
+            return [], ['DAQ']
+        return [], []
+
+    def getPrepTimeEstimate(self):
+        return self.dev.configTime
+
+    def configure(self):
+        if self.dev.holdsDaq:
+            self.dev.dm.getDevice('DAQ').setChannelValue(0.0)
+        time.sleep(self.dev.configTime)
+
+
+def runTrials(dm, nTrials, parallel):
+    cmd = dict([(name, {}) for name in RIG])
+    cmd['protocol'] = {'duration': 0, 'parallelConfigure': parallel}
+    task = Task(dm, cmd)
+    times = []
+    for i in range(nTrials):
+        start = time.time()
+        task.execute(block=False)
+        times.append(time.time() - start)
+        task.stop()
+    return min(times), task.configureTimes
+
+
+if __name__ == '__main__':
+    nTrials = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    app = pg.mkQApp()
+    dm = MockManager()
+    for name, (configTime, holdsDaq, beforeDaq) in RIG.items():
+        dm.devices[name] = MockDevice(dm, name, configTime, holdsDaq, beforeDaq)
+
+    serial, serialTimes = runTrials(dm, nTrials, parallel=False)
+    parallel, parallelTimes = runTrials(dm, nTrials, parallel=True)
+    ideal = max([RIG[n][0] for n in RIG if RIG[n][2]]) + RIG['DAQ'][0]
+    print("%d devices, best of %d trials; critical path %0.1f ms" % (len(RIG), nTrials, ideal * 1e3))
+    print("    serial    %7.1f ms" % (serial * 1e3))
+    print("    parallel  %7.1f ms   %5.1fx" % (parallel * 1e3, serial / parallel))
+    print("    configure order (parallel): " + ", ".join(["%s %0.1f ms" % (n, dt * 1e3) for n, dt in parallelTimes]))